@@ -0,0 +1,174 @@
+"""
+Fail when the queries behind the busiest endpoints stop using an index
+
+Each entry mirrors a query in healthManagement/views.py, serializers.py or
+consumers.py; the ids only shape the SQL, so an empty, migrated database is
+enough. Entries are (name, queryset, allow_sort). The test suite checks
+them (accountant/tests.py); this command checks them against the
+configured database, e.g. after a migration in production.
+
+    python manage.py check_query_plans --verbose
+"""
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from healthManagement.models import (
+    Admission, Appointment, AppointmentEvent, AppointmentSlot, Bed, ClinicalDocument, ClinicDailyStats,
+    DeliveredMedicationTreatment,
+    DoctorDailyStats, DoctorVisit, MedicalRecord, PatientLookupKey, PatientSummary, TestRequest, Treatment, VitalSign,
+    WaitTimeBucket,
+    who_administered,
+)
+from hmsServer.query_plans import plan_problems
+
+
+def hot_queries():
+    now = timezone.now()
+    today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    return [
+        # patient_appointments
+        ('appointments of a patient', Appointment.objects.filter(
+            patient_id=1
+        ).select_related('doctor', 'doctor__profile').order_by('-appointment_date'), False),
+        # PatientAppointmentConsumer / DoctorAppointmentConsumer
+        ('upcoming appointments of a patient', Appointment.objects.filter(
+            patient__email='patient@example.com', appointment_date__gte=today
+        ).order_by('appointment_date'), False),
+        ('upcoming appointments of a doctor', Appointment.objects.filter(
+            doctor__email='doctor@example.com', appointment_date__gte=today
+        ).order_by('appointment_date'), False),
+        # DepartmentAppointmentConsumer: one day, merged across several doctors
+        ('appointments of doctors today', Appointment.objects.filter(
+            doctor__in=[1, 2, 3], appointment_date__gte=today, appointment_date__lte=today + timedelta(days=1)
+        ).order_by('appointment_date'), True),
+        # queue board rebuild (healthManagement/queue_board.py)
+        ('appointments of a department today', Appointment.objects.filter(
+            doctor__profile__department_id=1, appointment_date__gte=today, appointment_date__lt=today + timedelta(days=1)
+        ).order_by(), False),
+        # clinic statistics rollup (healthManagement/clinic_stats.py)
+        ('appointment events after the watermark', AppointmentEvent.objects.filter(
+            pk__gt=1, occurred_at__lt=now
+        ).order_by('pk')[:5000], False),
+        ('stage times of appointments', AppointmentEvent.objects.filter(
+            appointment_id__in=[1, 2, 3], action__in=['patient_available', 'vitals_taken']
+        ).order_by('occurred_at'), True),
+        # get_department_stats
+        ('daily statistics of a department', ClinicDailyStats.objects.filter(
+            department_id=1, date__gte=today.date() - timedelta(days=6), date__lte=today.date()
+        ), False),
+        ('wait times of a department', WaitTimeBucket.objects.filter(
+            department_id=1, date__gte=today.date() - timedelta(days=6), date__lte=today.date()
+        ), False),
+        ('doctor throughput of a department', DoctorDailyStats.objects.filter(
+            department_id=1, date__gte=today.date() - timedelta(days=6), date__lte=today.date()
+        ).order_by(), False),
+        # reminder scheduler window (healthManagement/reminders.py)
+        ('appointments due a reminder', Appointment.objects.filter(
+            appointment_date__gt=now + timedelta(hours=1), appointment_date__lte=now + timedelta(hours=24)
+        ).exclude(status__in=['cancelled', 'completed']).order_by('appointment_date')[:1000], False),
+        # free slots of a department / doctor (healthManagement/slots.py)
+        ('free slots of a department', AppointmentSlot.objects.filter(
+            department_id=1, is_available=True, start__gt=now
+        ).order_by('start', 'pk')[:10], False),
+        ('free slots of a doctor', AppointmentSlot.objects.filter(
+            doctor_id=1, is_available=True, start__gt=now
+        ).order_by('start', 'pk')[:10], False),
+        # booking conflict check
+        ('slot taken', Appointment.objects.filter(
+            doctor_id=1, appointment_date=now, status__in=['pending', 'confirmed']
+        ).order_by(), False),
+        # patient vitals
+        ('vital signs of a patient', VitalSign.objects.filter(
+            patient_id=1
+        ).select_related('patient', 'recorded_by').order_by('-recorded_at'), False),
+        # vitals trend (healthManagement/vitals_trend.py)
+        ('vitals of a patient in a range', VitalSign.objects.filter(
+            patient_id=1, recorded_at__gte=now - timedelta(days=30), recorded_at__lt=now
+        ).order_by('recorded_at'), False),
+        # bulk vitals ingestion: readings already stored (healthManagement/vitals_ingest.py)
+        ('stored readings of a batch', VitalSign.objects.filter(
+            patient_id__in=[1, 2, 3], recorded_at__in=[now, now - timedelta(minutes=5)]
+        ).order_by(), False),
+        # clinical search: filtered documents, and the documents the in-process
+        # index has not seen (healthManagement/clinical_search.py)
+        ('search documents of a patient', ClinicalDocument.objects.filter(
+            patient_id=1, occurred_at__gte=now - timedelta(days=365)
+        ).values('pk'), False),
+        ('changed search documents', ClinicalDocument.objects.filter(
+            updated_at__gte=now - timedelta(seconds=30)
+        ).values_list('pk', 'updated_at'), False),
+        # patient lookup: one prefix range per word (healthManagement/patient_directory.py)
+        ('patient lookup keys by prefix', PatientLookupKey.objects.filter(
+            key__gte='ada', key__lt='ada\U0010ffff', kind__in=['name', 'email']
+        ).values_list('patient_id', 'kind', 'key'), False),
+        # patient summary sections (healthManagement/patient_summary.py)
+        ('active medications of a patient', Treatment.objects.filter(
+            medical_record__patient_id=1, treatment_type='medication', status__in=['pending', 'in_progress'],
+        ).order_by('-date_created'), True),
+        ('recent vitals of a patient', VitalSign.objects.filter(patient_id=1).order_by('-recorded_at', '-pk')[:5], False),
+        ('stale patient summaries', PatientSummary.objects.filter(patient_id__in=[1, 2, 3], stale__gt=0), False),
+        # early-warning board / re-score (healthManagement/early_warning.py)
+        ('recent vitals of admitted patients', VitalSign.objects.filter(
+            patient_id__in=Admission.objects.filter(status='active').values('patient_id'),
+            recorded_at__gte=now - timedelta(hours=24),
+        ).order_by('patient_id', 'recorded_at'), False),
+        ('active admissions', Admission.objects.filter(status='active').order_by(), False),
+        # patient medical records
+        ('medical records of a patient', MedicalRecord.objects.filter(
+            patient_id=1
+        ).order_by('-date_created', '-pk'), False),
+        # patient timeline (healthManagement/timeline.py): the kinds reached
+        # through the patient's medical records are sorted after the join
+        ('tests of a patient', TestRequest.objects.filter(
+            patient_id=1, created_at__lt=now
+        ).order_by('-created_at', '-pk')[:51], True),
+        ('treatments of a patient', Treatment.objects.filter(
+            medical_record__patient_id=1
+        ).order_by('-date_created', '-pk')[:51], True),
+        ('delivered medications of a patient', DeliveredMedicationTreatment.objects.filter(
+            medical_record__patient_id=1
+        ).order_by('-date_created', '-pk')[:51], True),
+        ('administrations of a patient', who_administered.objects.filter(
+            delivered_medication_treatment__medical_record__patient_id=1
+        ).order_by('-created_at', '-pk')[:51], True),
+        ('doctor visits of a patient', DoctorVisit.objects.filter(
+            delivered_medication_treatment__medical_record__patient_id=1
+        ).order_by('-visit_date', '-pk')[:51], True),
+        # list_test_requests, with and without ?status=
+        ('test requests', TestRequest.objects.select_related(
+            'patient', 'requested_by', 'lab_tehnician', 'test_type'
+        ).order_by('-created_at', '-pk')[:51], False),
+        ('test requests by status', TestRequest.objects.filter(
+            status='pending'
+        ).order_by('-created_at', '-pk')[:51], False),
+        # already-admitted check (.exists(), so unordered)
+        ('active admission of a patient', Admission.objects.filter(
+            patient_id=1, status='active'
+        ).order_by(), False),
+        # room availability counts
+        ('free beds in a room', Bed.objects.filter(room_id=1, is_occupied=False), False),
+    ]
+
+
+class Command(BaseCommand):
+    help = "EXPLAIN the hot query shapes and fail if any of them scans a whole table"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verbose', action='store_true', help='Print every plan')
+
+    def handle(self, *args, **options):
+        failures = []
+        for name, queryset, allow_sort in hot_queries():
+            plan, problems = plan_problems(queryset, allow_sort=allow_sort)
+            if problems:
+                failures.append(name)
+                self.stdout.write(self.style.ERROR(f"FAIL {name}: {'; '.join(problems)}"))
+            else:
+                self.stdout.write(f"ok   {name}")
+            if problems or options['verbose']:
+                self.stdout.write(f"{plan}\n")
+
+        if failures:
+            raise CommandError(f"{len(failures)} hot query(ies) without a supporting index")
@@ -0,0 +1,22 @@
+"""
+Delete old background task bookkeeping (accountant.TaskRun)
+
+Finished and failed runs older than --days go; their idempotency keys can
+then be enqueued again. Meant for a nightly cron job.
+
+    python manage.py prune_task_runs --days 7
+"""
+from django.core.management.base import BaseCommand
+
+from hmsServer.tasks import prune_task_runs
+
+
+class Command(BaseCommand):
+    help = "Prune finished background task runs"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=7, help='Keep runs updated within this many days')
+
+    def handle(self, *args, **options):
+        pruned = prune_task_runs(days=options['days'])
+        self.stdout.write(f"Pruned {pruned} task runs")
@@ -0,0 +1,23 @@
+"""
+Send the emails that are due in the outbound email queue
+
+Normally the queue drains itself through background tasks; this picks up
+anything left behind (a restarted web process, a worker that crashed mid
+batch). Safe to run from cron alongside the workers.
+
+    python manage.py send_queued_emails
+"""
+from django.core.management.base import BaseCommand
+
+from hmsServer.mail import send_queued_emails
+
+
+class Command(BaseCommand):
+    help = "Send due emails from the outbound email queue"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None, help='Emails sent per SMTP connection')
+
+    def handle(self, *args, **options):
+        result = send_queued_emails(batch_size=options['batch_size'])
+        self.stdout.write(f"Sent {result['sent']} emails, {result['failed']} failed attempts")
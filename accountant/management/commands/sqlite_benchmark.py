@@ -0,0 +1,153 @@
+"""
+Concurrent read/write throughput of SQLite under each tuning profile
+
+Runs against a throw-away database shaped like the activity log (the
+busiest writer: every tracked request inserts a row) while reader threads
+run list-endpoint style queries, so the numbers show what a profile does
+to the "database is locked" / readers-block-writers problem.
+
+    python manage.py sqlite_benchmark --seconds 10 --readers 8 --writers 2
+"""
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from hmsServer.db import SQLITE_PROFILES, apply_sqlite_pragmas
+from hmsServer.profiling import percentile
+
+SCHEMA = """
+CREATE TABLE activity (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    action_taken_by_id INTEGER,
+    action VARCHAR(10) NOT NULL,
+    model_name VARCHAR(100) NOT NULL,
+    description TEXT NOT NULL,
+    created_at DATETIME NOT NULL
+);
+CREATE INDEX activity_created_at ON activity (created_at);
+CREATE INDEX activity_user_created ON activity (action_taken_by_id, created_at);
+"""
+
+INSERT = (
+    "INSERT INTO activity (action_taken_by_id, action, model_name, description, created_at) "
+    "VALUES (?, ?, ?, ?, datetime('now'))"
+)
+
+READS = (
+    "SELECT id, action, model_name, description, created_at FROM activity "
+    "WHERE action_taken_by_id = ? ORDER BY created_at DESC LIMIT 50",
+    "SELECT model_name, COUNT(*) FROM activity WHERE action = ? GROUP BY model_name",
+)
+
+USERS = 200
+
+
+class Command(BaseCommand):
+    help = "Benchmark concurrent SQLite reads/writes under each SQLITE_PROFILES preset"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profiles', default=','.join(SQLITE_PROFILES),
+                            help='Comma separated profiles to compare')
+        parser.add_argument('--seconds', type=float, default=5, help='Duration of each run')
+        parser.add_argument('--readers', type=int, default=4, help='Reader threads')
+        parser.add_argument('--writers', type=int, default=2, help='Writer threads')
+        parser.add_argument('--rows', type=int, default=20000, help='Rows seeded before each run')
+
+    def handle(self, *args, **options):
+        profiles = [name.strip() for name in options['profiles'].split(',') if name.strip()]
+        unknown = [name for name in profiles if name not in SQLITE_PROFILES]
+        if unknown:
+            raise CommandError(f"Unknown profile(s): {', '.join(unknown)}")
+
+        self.stdout.write(
+            f"{options['readers']} readers, {options['writers']} writers, "
+            f"{options['seconds']:g}s per profile, {options['rows']} seeded rows\n"
+        )
+        header = f"{'profile':<12} {'reads/s':>10} {'writes/s':>10} {'write p50 ms':>13} {'write p95 ms':>13} {'locked':>8}"
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+
+        for profile in profiles:
+            with tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, 'benchmark.sqlite3')
+                pragmas = SQLITE_PROFILES[profile]
+                self.seed(path, pragmas, options['rows'])
+                result = self.run_profile(path, pragmas, options)
+
+            self.stdout.write(
+                f"{profile:<12} {result['reads'] / options['seconds']:>10.0f} "
+                f"{result['writes'] / options['seconds']:>10.0f} "
+                f"{percentile(result['latencies'], 50):>13.2f} "
+                f"{percentile(result['latencies'], 95):>13.2f} "
+                f"{result['locked']:>8}"
+            )
+
+    def connect(self, path, pragmas):
+        # Same defaults as Django's SQLite backend: autocommit, 5s busy handler
+        connection = sqlite3.connect(path, timeout=5, isolation_level=None, check_same_thread=False)
+        apply_sqlite_pragmas(connection.cursor(), pragmas)
+        return connection
+
+    def seed(self, path, pragmas, rows):
+        connection = self.connect(path, pragmas)
+        connection.executescript(SCHEMA)
+        connection.execute('BEGIN')
+        connection.executemany(INSERT, (
+            (random.randint(1, USERS), 'read', 'Appointment', 'seed row')
+            for _ in range(rows)
+        ))
+        connection.execute('COMMIT')
+        connection.close()
+
+    def run_profile(self, path, pragmas, options):
+        deadline = time.perf_counter() + options['seconds']
+        result = {'reads': 0, 'writes': 0, 'locked': 0, 'latencies': []}
+        lock = threading.Lock()
+
+        def reader():
+            connection = self.connect(path, pragmas)
+            reads = locked = 0
+            while time.perf_counter() < deadline:
+                try:
+                    connection.execute(READS[0], (random.randint(1, USERS),)).fetchall()
+                    connection.execute(READS[1], ('read',)).fetchall()
+                    reads += 2
+                except sqlite3.OperationalError:
+                    locked += 1
+            connection.close()
+            with lock:
+                result['reads'] += reads
+                result['locked'] += locked
+
+        def writer():
+            connection = self.connect(path, pragmas)
+            writes = locked = 0
+            latencies = []
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                try:
+                    connection.execute(INSERT, (random.randint(1, USERS), 'read', 'Appointment', 'benchmark row'))
+                    writes += 1
+                    latencies.append((time.perf_counter() - start) * 1000)
+                except sqlite3.OperationalError:
+                    locked += 1
+            connection.close()
+            with lock:
+                result['writes'] += writes
+                result['locked'] += locked
+                result['latencies'].extend(latencies)
+
+        threads = [threading.Thread(target=reader) for _ in range(options['readers'])]
+        threads += [threading.Thread(target=writer) for _ in range(options['writers'])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        result['latencies'].sort()
+        return result
@@ -0,0 +1,32 @@
+"""
+Run PRAGMA optimize and a WAL checkpoint on every SQLite database now
+
+The request_finished hook already does this every SQLITE_MAINTENANCE_INTERVAL
+seconds with a PASSIVE checkpoint; this is for cron / after bulk imports,
+where TRUNCATE also shrinks the -wal file back to zero.
+
+    python manage.py sqlite_maintenance --checkpoint TRUNCATE
+"""
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from hmsServer.db import run_sqlite_maintenance
+
+
+class Command(BaseCommand):
+    help = "Run PRAGMA optimize and a WAL checkpoint on the SQLite databases"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--checkpoint', default='TRUNCATE',
+                            choices=['PASSIVE', 'FULL', 'RESTART', 'TRUNCATE'],
+                            help='wal_checkpoint mode')
+
+    def handle(self, *args, **options):
+        for connection in connections.all():
+            if connection.vendor != 'sqlite':
+                continue
+            result = run_sqlite_maintenance(connection, checkpoint=options['checkpoint'])
+            self.stdout.write(
+                f"{connection.alias}: busy={result['busy']} wal_pages={result['wal_pages']} "
+                f"checkpointed={result['checkpointed']}"
+            )
@@ -138,3 +138,72 @@ class Activity(models.Model):
         actor = f"{self.action_taken_by}" if self.action_taken_by else "System"
         receiver = f" on {self.action_taken_on}" if self.action_taken_on else ""
         return f"{actor} - {self.get_action_display()} {self.model_name}{receiver}"
+
+
+class TaskRun(models.Model):
+    """
+    One background task run, keyed by its idempotency key (see hmsServer/tasks.py)
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('retrying', 'Retrying'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    key = models.CharField(max_length=255, unique=True)
+    name = models.CharField(max_length=200)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'updated_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.name} [{self.key}] - {self.status}"
+
+
+class OutboundEmail(models.Model):
+    """
+    An email waiting for, or done with, delivery by the email queue (see hmsServer/mail.py)
+    """
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('sending', 'Sending'),
+        ('retrying', 'Retrying'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    ]
+
+    key = models.CharField(max_length=255, unique=True, null=True, blank=True)
+    to = models.TextField(help_text="Comma separated recipients")
+    from_email = models.CharField(max_length=255, blank=True)
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    html_body = models.TextField(blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    # Time-limited content (verification codes) is not sent, or retried, after this
+    expires_at = models.DateTimeField(null=True, blank=True)
+    claim = models.CharField(max_length=32, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} -> {self.to} - {self.status}"
@@ -273,10 +273,14 @@ class WardSerializer(serializers.ModelSerializer):
     
     def get_room_count(self, obj):
         """Get the number of rooms in this ward"""
+        if hasattr(obj, 'rooms_total'):
+            return obj.rooms_total
         return obj.rooms.count()
     
     def get_total_beds(self, obj):
         """Get the total number of beds in all rooms of this ward"""
+        if hasattr(obj, 'beds_total'):
+            return obj.beds_total or 0
         return Room.objects.filter(ward=obj).aggregate(total=models.Sum('bed_count'))['total'] or 0
 
 
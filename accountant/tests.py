@@ -1,3 +1,13 @@
 from django.test import TestCase
 
-# Create your tests here.
+from accountant.management.commands.check_query_plans import hot_queries
+from hmsServer.query_plans import assert_indexed
+
+
+class HotQueryPlanTests(TestCase):
+    """The queries behind the busiest endpoints keep using an index"""
+
+    def test_hot_queries_are_indexed(self):
+        for name, queryset, allow_sort in hot_queries():
+            with self.subTest(query=name):
+                assert_indexed(queryset, allow_sort=allow_sort)
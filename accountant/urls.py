@@ -22,4 +22,8 @@ urlpatterns = [
     path('create-room', create_room),
     path('create-drug', create_drug),
     path('update-drug/<int:drug_id>', update_drug),
+    path('query-stats', query_stats),
+    path('request-timings', request_timings),
+    path('request-timings/profiles/<str:profile_id>', request_profile),
+    path('email-queue', email_queue),
 ]
\ No newline at end of file
@@ -13,6 +13,14 @@ from utils import APPLICATIONS_USER_MODEL
 from django.contrib.auth.models import Group
 from django.utils import timezone
 from healthManagement.models import *
+from pagination import InvalidQueryParameter, filter_queryset, paginate
+from hmsServer.db import read_replica
+from hmsServer.profiling import get_profile, get_profiles, get_timing_summary, reset_timing_summary
+from hmsServer.query_budget import get_query_stats, query_budget, reset_query_stats
+from hmsServer.mail import queue_stats
+import logging
+
+logger = logging.getLogger(__name__)
 
 # Activity tracking helper function
 def track_user_action(user, action, model_name, object_id=None, action_taken_on=None, description=""):
@@ -28,9 +36,11 @@ def track_user_action(user, action, model_name, object_id=None, action_taken_on=
             object_id=object_id,
             description=description
         )
-    except Exception as e:
-        print(f"Error tracking activity: {str(e)}")
+    except Exception:
+        logger.exception("Error tracking activity")
 
+@query_budget(8)
+@read_replica
 @api_view(['GET'])
 @authentication_classes([TokenAuthentication])
 @permission_classes([IsAuthenticated])
@@ -47,25 +57,41 @@ def income_list(request):
             description=f"Accountant {request.user.email} viewed income records list"
         )
         
-        # Get all income records ordered by most recent first
-        incomes = Income.objects.all().order_by('-created_at')
+        incomes = Income.objects.select_related('handled_by')
+        incomes = filter_queryset(request, incomes, {
+            'payment_method': 'payment_method',
+            'handled_by': 'handled_by_id',
+            'date_from': 'date__gte',
+            'date_to': 'date__lte',
+        })
         
-        # Serialize the data
-        serializer = IncomeSerializer(incomes, many=True)
+        # Calculate total income in the database for the filtered records
+        total_income = incomes.aggregate(total=Sum('amount'))['total'] or 0
         
-        # Calculate total income
-        total_income = sum(income.amount for income in incomes)
+        # Most recent first, one page at a time
+        data, meta = paginate(
+            request,
+            incomes,
+            IncomeSerializer,
+            ordering_fields={'created_at': 'created_at', 'date': 'date', 'amount': 'amount'},
+            default_ordering='-created_at'
+        )
         
         # Prepare response
         response_data = {
             'status': 'success',
-            'count': len(serializer.data),
+            **meta,
             'total_income': total_income,
-            'data': serializer.data
+            'data': data
         }
         
         return Response(response_data)
     
+    except InvalidQueryParameter as e:
+        return Response(
+            {'status': 'error', 'message': e.detail},
+            status=status.HTTP_400_BAD_REQUEST
+        )
     except Exception as e:
         return Response(
             {'status': 'error', 'message': str(e)},
@@ -76,6 +102,8 @@ def income_list(request):
 
 
 
+@query_budget(8)
+@read_replica
 @api_view(['GET'])
 @authentication_classes([TokenAuthentication])
 @permission_classes([IsAuthenticated])
@@ -92,20 +120,38 @@ def expense_list(request):
             description=f"Accountant {request.user.email} viewed expense records list"
         )
         
-        # Get all expenses ordered by most recent first
-        expenses = Expense.objects.all().order_by('-date', '-created_at')
-        serializer = ExpenseSerializer(expenses, many=True)
+        expenses = Expense.objects.select_related('handled_by')
+        expenses = filter_queryset(request, expenses, {
+            'payment_method': 'payment_method',
+            'paid_to': 'paid_to',
+            'date_from': 'date__gte',
+            'date_to': 'date__lte',
+        })
         
-        # Calculate total expenses
-        total_expenses = sum(expense.amount for expense in expenses)
+        # Calculate total expenses in the database for the filtered records
+        total_expenses = expenses.aggregate(total=Sum('amount'))['total'] or 0
+        
+        # Most recent first, one page at a time
+        data, meta = paginate(
+            request,
+            expenses,
+            ExpenseSerializer,
+            ordering_fields={'date': 'date', 'created_at': 'created_at', 'amount': 'amount'},
+            default_ordering='-date'
+        )
         
         return Response({
             'status': 'success',
-            'count': len(serializer.data),
+            **meta,
             'total_expenses': float(total_expenses),
-            'data': serializer.data
+            'data': data
         })
         
+    except InvalidQueryParameter as e:
+        return Response(
+            {'status': 'error', 'message': e.detail},
+            status=status.HTTP_400_BAD_REQUEST
+        )
     except Exception as e:
         return Response(
             {'status': 'error', 'message': str(e)},
@@ -123,22 +169,15 @@ def create_expense(request):
     Create a new expense record
     """
     try:
-        print("\n=== Incoming Request Data ===")
-        print(f"Request method: {request.method}")
-        print(f"Content-Type: {request.content_type}")
-        print(f"Request data: {request.data}")
-        
         serializer = CreateExpenseSerializer(
             data=request.data,
             context={'request': request}
         )
         
-        print("\n=== Validation Results ===")
         is_valid = serializer.is_valid()
-        print(f"Is valid: {is_valid}")
         
         if not is_valid:
-            print("Validation errors:", serializer.errors)
+            logger.info("Expense rejected, invalid fields: %s", sorted(serializer.errors))
             return Response({
                 'status': 'error',
                 'errors': serializer.errors,
@@ -147,7 +186,7 @@ def create_expense(request):
             }, status=status.HTTP_400_BAD_REQUEST)
             
         expense = serializer.save()
-        print(f"Expense created successfully. ID: {expense.id}")
+        logger.info("Expense %s created by user %s", expense.id, request.user.id)
         
         # Track user action
         track_user_action(
@@ -589,6 +628,8 @@ def update_user_role(request, user_id):
 
 
 
+@query_budget(8)
+@read_replica
 @api_view(['GET'])
 @authentication_classes([TokenAuthentication])
 @permission_classes([IsAuthenticated])
@@ -612,18 +653,35 @@ def list_appointments(request):
             description=f"Admin {request.user.email} viewed list of all appointments"
         )
         
-        # Get all appointments ordered by date and time
-        appointments = Appointment.objects.select_related('patient', 'doctor').order_by('-appointment_date')
+        appointments = Appointment.objects.select_related('patient', 'doctor')
+        appointments = filter_queryset(request, appointments, {
+            'status': 'status',
+            'doctor_id': 'doctor_id',
+            'patient_id': 'patient_id',
+            'date_from': 'appointment_date__date__gte',
+            'date_to': 'appointment_date__date__lte',
+        })
         
-        # Serialize the data
-        serializer = AppointmentSerializer(appointments, many=True)
+        # Latest appointment date first, one page at a time
+        data, meta = paginate(
+            request,
+            appointments,
+            AppointmentSerializer,
+            ordering_fields={'appointment_date': 'appointment_date', 'created_at': 'created_at'},
+            default_ordering='-appointment_date'
+        )
         
         return Response({
             'status': 'success',
-            'count': len(serializer.data),
-            'data': serializer.data
+            **meta,
+            'data': data
         })
         
+    except InvalidQueryParameter as e:
+        return Response(
+            {'status': 'error', 'message': e.detail},
+            status=status.HTTP_400_BAD_REQUEST
+        )
     except Exception as e:
         return Response(
             {'status': 'error', 'message': str(e)},
@@ -878,11 +936,6 @@ def bed_occupancy_details(request):
         # Get all rooms with their wards
         all_rooms = Room.objects.select_related('ward').all().order_by('name')
         
-        # Debug: Log what we found
-        print(f"DEBUG: Found {all_wards.count()} wards")
-        print(f"DEBUG: Found {all_rooms.count()} rooms")
-        print(f"DEBUG: Found {beds.count()} beds")
-        
         # Initialize wards dict with all wards and their rooms
         wards_dict = {}
         for ward in all_wards:
@@ -890,7 +943,6 @@ def bed_occupancy_details(request):
                 'name': ward.name,
                 'rooms': {}
             }
-            print(f"DEBUG: Added ward: {ward.name}")
         
         # Add all rooms to their respective wards (even if no beds)
         for room in all_rooms:
@@ -900,9 +952,8 @@ def bed_occupancy_details(request):
                     'name': room.name,
                     'beds': []
                 }
-                print(f"DEBUG: Added room '{room.name}' to ward '{ward_name}'")
             else:
-                print(f"DEBUG: Room '{room.name}' has ward '{ward_name}' but ward not found in wards_dict")
+                logger.warning("Room %s points at ward %s, which is not in the ward list", room.id, room.ward_id)
         
         # Create a mapping of existing beds by room and bed_id
         existing_beds = {}
@@ -926,7 +977,6 @@ def bed_occupancy_details(request):
                     'patient': patient_name,
                     'bed_id': bed.id
                 }
-                print(f"DEBUG: Found existing bed {bed.id} in room '{room_name}' in ward '{ward_name}' (occupied: {bed.is_occupied})")
         
         # Generate all beds based on room bed_count
         for ward_name in wards_dict:
@@ -936,7 +986,6 @@ def bed_occupancy_details(request):
                 
                 if room_obj:
                     bed_count = room_obj.bed_count
-                    print(f"DEBUG: Room '{room_name}' in ward '{ward_name}' has bed_count: {bed_count}")
                     
                     # Get existing beds for this room
                     room_existing_beds = existing_beds.get(ward_name, {}).get(room_name, {})
@@ -958,7 +1007,6 @@ def bed_occupancy_details(request):
                                 'patient': bed_info['patient'],
                                 'bed_id': bed_info['bed_id']
                             })
-                            print(f"DEBUG: Added existing bed {bed_num} to room '{room_name}' in ward '{ward_name}' (occupied: {bed_info['occupied']})")
                         else:
                             # Create empty bed entry
                             wards_dict[ward_name]['rooms'][room_name]['beds'].append({
@@ -967,7 +1015,6 @@ def bed_occupancy_details(request):
                                 'patient': None,
                                 'bed_id': bed_num
                             })
-                            print(f"DEBUG: Added empty bed {bed_num} to room '{room_name}' in ward '{ward_name}'")
         
         # Convert rooms dict to list and sort
         wards_list = []
@@ -1015,6 +1062,8 @@ def bed_occupancy_details(request):
 
 
 
+@query_budget(8)
+@read_replica
 @api_view(['GET'])
 @authentication_classes([TokenAuthentication])
 @permission_classes([IsAuthenticated])
@@ -1038,8 +1087,11 @@ def get_all_wards(request):
             description=f"Admin {request.user.email} viewed list of all wards"
         )
         
-        # Get all wards
-        wards = Ward.objects.all().order_by('name')
+        # Get all wards with room and bed totals computed in one query
+        wards = Ward.objects.annotate(
+            rooms_total=Count('rooms'),
+            beds_total=Sum('rooms__bed_count')
+        ).order_by('name')
         
         # Serialize wards with room and bed counts
         serializer = WardSerializer(wards, many=True)
@@ -1127,6 +1179,8 @@ def create_ward(request):
 
 
 
+@query_budget(8)
+@read_replica
 @api_view(['GET'])
 @authentication_classes([TokenAuthentication])
 @permission_classes([IsAuthenticated])
@@ -1150,8 +1204,11 @@ def get_all_wards(request):
             description=f"Admin {request.user.email} viewed list of all wards"
         )
         
-        # Get all wards
-        wards = Ward.objects.all().order_by('name')
+        # Get all wards with room and bed totals computed in one query
+        wards = Ward.objects.annotate(
+            rooms_total=Count('rooms'),
+            beds_total=Sum('rooms__bed_count')
+        ).order_by('name')
         
         # Serialize wards with room and bed counts
         serializer = WardSerializer(wards, many=True)
@@ -1244,8 +1301,6 @@ def update_drug(request, drug_id):
             }, status=status.HTTP_404_NOT_FOUND)
         
         serializer = DrugSerializer(drug, data=request.data, partial=True)
-        print(f"DEBUG: Update drug request data: {request.data}")
-        print(f"DEBUG: Drug before update: {drug}")
         if serializer.is_valid():
             updated_drug = serializer.save()
             
@@ -1264,7 +1319,7 @@ def update_drug(request, drug_id):
                 'message': 'Drug updated successfully.'
             }, status=status.HTTP_200_OK)
         else:
-            print(f"DEBUG: Serializer errors: {serializer.errors}")
+            logger.info("Drug %s update rejected, invalid fields: %s", drug.id, sorted(serializer.errors))
             return Response({
                 'status': 'error',
                 'message': 'Invalid data provided.',
@@ -1303,3 +1358,105 @@ def get_all_activities(request):
             {'status': 'error', 'message': str(e)},
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
+
+
+
+
+@api_view(['GET'])
+@authentication_classes([TokenAuthentication])
+@permission_classes([IsAuthenticated])
+def query_stats(request):
+    """
+    Per-endpoint SQL query counters recorded by QueryBudgetMiddleware
+    - admin only
+    - ?reset=true clears the counters after reading them
+    """
+    if not request.user.is_staff:
+        return Response(
+            {'status': 'error', 'message': 'You do not have permission to view query statistics'},
+            status=status.HTTP_403_FORBIDDEN
+        )
+    
+    stats = get_query_stats()
+    if request.query_params.get('reset') == 'true':
+        reset_query_stats()
+    
+    # Worst offenders first
+    endpoints = sorted(stats.items(), key=lambda item: item[1]['avg_queries'], reverse=True)
+    
+    return Response({
+        'status': 'success',
+        'count': len(endpoints),
+        'data': [{'endpoint': endpoint, **counters} for endpoint, counters in endpoints]
+    }, status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+@authentication_classes([TokenAuthentication])
+@permission_classes([IsAuthenticated])
+def request_timings(request):
+    """
+    Rolling latency percentiles per endpoint recorded by RequestTimingMiddleware
+    - admin only
+    - mean_ms splits the time into db, serialization, signals, channels and app
+    - profiles lists the latest requests captured with the X-Profile header
+    - ?reset=true clears the windows after reading them
+    """
+    if not request.user.is_staff:
+        return Response(
+            {'status': 'error', 'message': 'You do not have permission to view request timings'},
+            status=status.HTTP_403_FORBIDDEN
+        )
+    
+    summary = get_timing_summary()
+    if request.query_params.get('reset') == 'true':
+        reset_timing_summary()
+    
+    # Slowest endpoints first
+    endpoints = sorted(summary.items(), key=lambda item: item[1]['p95_ms'], reverse=True)
+    
+    return Response({
+        'status': 'success',
+        'count': len(endpoints),
+        'data': [{'endpoint': endpoint, **timings} for endpoint, timings in endpoints],
+        'profiles': get_profiles()
+    }, status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+@authentication_classes([TokenAuthentication])
+@permission_classes([IsAuthenticated])
+def request_profile(request, profile_id):
+    """
+    Full report of a profile captured with the X-Profile header (admin only)
+    """
+    if not request.user.is_staff:
+        return Response(
+            {'status': 'error', 'message': 'You do not have permission to view request profiles'},
+            status=status.HTTP_403_FORBIDDEN
+        )
+    
+    profile = get_profile(profile_id)
+    if profile is None:
+        return Response(
+            {'status': 'error', 'message': 'Profile not found'},
+            status=status.HTTP_404_NOT_FOUND
+        )
+    
+    return Response({'status': 'success', 'data': profile}, status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+@authentication_classes([TokenAuthentication])
+@permission_classes([IsAuthenticated])
+def email_queue(request):
+    """
+    Outbound email queue: emails per status and the latest failures (admin only)
+    """
+    if not request.user.is_staff:
+        return Response(
+            {'status': 'error', 'message': 'You do not have permission to view the email queue'},
+            status=status.HTTP_403_FORBIDDEN
+        )
+
+    return Response({'status': 'success', 'data': queue_stats()}, status=status.HTTP_200_OK)
@@ -8,7 +8,7 @@ from knox.auth import TokenAuthentication
 from django.contrib.auth import logout
 from healthManagement.models import VerificationCode
 import random
-from email_utils import send_verification_email
+from email_utils import queue_password_reset_email, queue_verification_email
 
 
 # external package import
@@ -30,6 +30,9 @@ from .serializers import (
 )
 from .models import CustomUser
 from datetime import timedelta
+import logging
+
+logger = logging.getLogger(__name__)
 
 
 """
@@ -45,14 +48,11 @@ def register_api(request):
     Register function with verification email
     """
     try:
-        # Log incoming request data for debugging
-        print("Registration request data:", request.data)
-        
         serializer = RegisterSerializer(data=request.data)
         
         # Manually validate to get detailed errors
         if not serializer.is_valid():
-            print("Validation errors:", serializer.errors)
+            logger.info("Registration rejected, invalid fields: %s", sorted(serializer.errors))
             return Response(
                 {
                     'status': 'error',
@@ -72,9 +72,8 @@ def register_api(request):
             # Store it in the database for later verification
             VerificationCode.objects.create(user=user, code=code)
 
-            # Send professional verification email
-            
-            send_verification_email(user, code)
+            # Queue professional verification email
+            queue_verification_email(user, code)
 
             return Response({
                 'status': 'success',
@@ -89,7 +88,7 @@ def register_api(request):
                 },
             }, status=status.HTTP_201_CREATED)
         except Exception as e:
-            print(f"[REGISTRATION ERROR] {str(e)}")
+            logger.exception("Registration failed")
             return Response(
                 {
                     'status': 'error',
@@ -101,7 +100,7 @@ def register_api(request):
             )
 
     except Exception as e:
-        print(f"[REGISTRATION ERROR] {str(e)}")
+        logger.exception("Registration failed")
         return Response(
             {
                 'status': 'error',
@@ -213,12 +212,11 @@ def regenerate_code_api(request):
     code = f"{random.randint(100000, 999999)}"
     VerificationCode.objects.create(user=user, code=code)
 
-    # Send email using email_utils
+    # Queue email using email_utils
     try:
-        from email_utils import send_verification_email
-        send_verification_email(user, code)
-    except Exception as e:
-        print(f"[EMAIL ERROR] Could not send new verification email: {e}")
+        queue_verification_email(user, code)
+    except Exception:
+        logger.exception("Could not send new verification email")
         return Response({
             'status': 'error',
             'message': 'Failed to send verification email. Please try again later.'
@@ -293,18 +291,11 @@ def forgot_password_api(request):
     code = f"{random.randint(100000, 999999)}"
     VerificationCode.objects.create(user=user, code=code)
 
-    # Send email (console backend in dev)
-    from django.core.mail import send_mail
+    # Queue email (console backend in dev)
     try:
-        subject = "Password Reset Code"
-        message = (
-            f"Hello {user.first_name or 'User'},\n\n"
-            f"Your password reset code is: {code}\n\n"
-            f"This code will expire in 60 seconds."
-        )
-        send_mail(subject, message, None, [user.email], fail_silently=True)
-    except Exception as e:
-        print(f"[EMAIL ERROR] Could not send reset email: {e}")
+        queue_password_reset_email(user, code)
+    except Exception:
+        logger.exception("Could not queue reset email")
 
     return Response({
         'status': 'success',
@@ -1,103 +1,86 @@
 """
 Email utilities for HMS Hospital Management System
 Professional email templates for various user interactions
+
+Each email is a pair of templates in templates/emails (<name>.txt and
+<name>.html, sharing base.txt / base.html) plus a subject in
+EMAIL_SUBJECTS. The templates are compiled once per process; a bulk send
+renders all of its messages with them through one context.
+
+Views use the queue_* versions: the email is stored and sent by the email
+queue (see hmsServer/mail.py), so a slow or unreachable SMTP server does
+not hold up the response, and failed sends are retried
 """
-from django.core.mail import send_mail
+import functools
+import logging
+from datetime import timedelta
+
 from django.conf import settings
-from django.template.loader import render_to_string
-from django.utils.html import strip_tags
+from django.core.mail import send_mail
+from django.template import Context, engines
+from django.utils import timezone
 
+from hmsServer.mail import queue_email, queue_emails
 
-def send_verification_email(user, code):
-    """
-    Send professional verification email to user
-    """
-    subject = "Verify Your MEDIPLEX HMS Account - Action Required"
-    
-    # HTML email template
-    html_message = f"""
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <meta charset="utf-8">
-        <meta name="viewport" content="width=device-width, initial-scale=1.0">
-        <title>Email Verification - MEDIPLEX HMS</title>
-        <style>
-            body {{ font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; line-height: 1.6; color: #333; }}
-            .container {{ max-width: 600px; margin: 0 auto; padding: 20px; background-color: #f8f9fa; }}
-            .header {{ background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; padding: 30px; text-align: center; border-radius: 10px 10px 0 0; }}
-            .logo {{ font-size: 28px; font-weight: bold; margin-bottom: 10px; }}
-            .content {{ background-color: white; padding: 40px; border-radius: 0 0 10px 10px; box-shadow: 0 4px 6px rgba(0,0,0,0.1); }}
-            .verification-code {{ background: #f8f9fa; border: 2px dashed #667eea; padding: 20px; text-align: center; font-size: 32px; font-weight: bold; color: #667eea; margin: 20px 0; border-radius: 8px; letter-spacing: 3px; }}
-            .footer {{ text-align: center; padding: 20px; color: #666; font-size: 14px; }}
-            .btn {{ display: inline-block; padding: 12px 30px; background: #667eea; color: white; text-decoration: none; border-radius: 5px; margin: 20px 0; }}
-            .highlight {{ color: #667eea; font-weight: bold; }}
-        </style>
-    </head>
-    <body>
-        <div class="container">
-            <div class="header">
-                <div class="logo">🏥 MEDIPLEX HMS</div>
-                <div>Hospital Management System</div>
-            </div>
-            <div class="content">
-                <h2>Account Verification Required</h2>
-                <p>Dear <span class="highlight">{user.first_name or 'User'}</span>,</p>
-                <p>Thank you for registering with <strong>MEDIPLEX HOSPITAL MANAGEMENT SYSTEM</strong>. To complete your registration and activate your account, please use the verification code below:</p>
-                
-                <div class="verification-code">
-                    {code}
-                </div>
-                
-                <p><strong>⏰ This code will expire in 60 seconds for security reasons.</strong></p>
-                
-                <h3>How to verify:</h3>
-                <ol>
-                    <li>Return to the MEDIPLEX HMS application</li>
-                    <li>Enter the verification code when prompted</li>
-                    <li>Your account will be activated immediately</li>
-                </ol>
-                
-                <p>If you didn't request this verification, please ignore this email. Your account remains secure.</p>
-                
-                <p>For any assistance, please contact our support team at <strong>support@mediplex.com</strong> or call <strong>+1-800-MEDIPLEX</strong>.</p>
-            </div>
-            <div class="footer">
-                <p>&copy; 2024 MEDIPLEX Hospital Management System. All rights reserved.</p>
-                <p>This is an automated message. Please do not reply to this email.</p>
-            </div>
-        </div>
-    </body>
-    </html>
-    """
-    
-    # Plain text version for email clients that don't support HTML
-    message = f"""
-Dear {user.first_name or 'User'},
+logger = logging.getLogger(__name__)
+
+# Verification and password reset codes are accepted for 60 seconds (accounts/views.py);
+# their emails are not sent or retried after that
+CODE_LIFETIME = timedelta(seconds=60)
+
+
+EMAIL_SUBJECTS = {
+    'verification': "Verify Your MEDIPLEX HMS Account - Action Required",
+    'password_reset': "Password Reset Code",
+    'appointment_reminder': "Appointment Reminder - {{ appointment_date|date:'F j, Y, g:i A' }}",
+}
 
-Thank you for registering with MEDIPLEX HOSPITAL MANAGEMENT SYSTEM.
 
-To complete your registration and activate your account, please use the verification code below:
+@functools.lru_cache(maxsize=None)
+def _compiled(name):
+    """(subject, text, html) templates of an email, compiled on first use"""
+    engine = engines['django'].engine
+    return (
+        engine.from_string(f"{{% autoescape off %}}{EMAIL_SUBJECTS[name]}{{% endautoescape %}}"),
+        engine.get_template(f"emails/{name}.txt"),
+        engine.get_template(f"emails/{name}.html"),
+    )
+
+
+def render_emails(name, contexts):
+    """
+    Render one email per context dict
+    Returns a list of (subject, text, html)
+    """
+    subject_template, text_template, html_template = _compiled(name)
+    context = Context()
+    rendered = []
+    for values in contexts:
+        with context.push(values):
+            rendered.append((
+                subject_template.render(context).strip(),
+                text_template.render(context).strip(),
+                html_template.render(context),
+            ))
+    return rendered
 
-VERIFICATION CODE: {code}
 
-This code will expire in 60 seconds for security reasons.
+def render_email(name, context):
+    return render_emails(name, [context])[0]
 
-How to verify:
-1. Return to the MEDIPLEX HMS application
-2. Enter the verification code when prompted
-3. Your account will be activated immediately
 
-If you didn't request this verification, please ignore this email.
+def verification_email(user, code):
+    """
+    Subject, plain text and HTML of the verification email
+    """
+    return render_email('verification', {'first_name': user.first_name, 'code': code})
 
-For any assistance, please contact our support team at support@mediplex.com or call +1-800-MEDIPLEX.
 
-Best regards,
-MEDIPLEX HMS Team
-Hospital Management System
-© 2024 MEDIPLEX. All rights reserved.
+def send_verification_email(user, code):
+    """
+    Send professional verification email to user, right away
     """
-    
+    subject, message, html_message = verification_email(user, code)
     try:
         send_mail(
             subject=subject,
@@ -108,7 +91,63 @@ Hospital Management System
             fail_silently=False,
         )
         return True
-    except Exception as e:
-        print(f"[EMAIL ERROR] Could not send verification email: {e}")
+    except Exception:
+        logger.exception("Could not send verification email")
         return False
 
+
+def queue_verification_email(user, code):
+    """
+    Queue the verification email; queuing the same code again is a no-op
+    """
+    subject, message, html_message = verification_email(user, code)
+    return queue_email(
+        user.email, subject, message, html_body=html_message,
+        key=f"verification-email:{user.id}:{code}", expires_at=timezone.now() + CODE_LIFETIME,
+    )
+
+
+def queue_password_reset_email(user, code):
+    """
+    Queue the password reset code for user
+    """
+    subject, message, html_message = render_email(
+        'password_reset', {'first_name': user.first_name, 'code': code}
+    )
+    return queue_email(
+        user.email, subject, message, html_body=html_message,
+        key=f"password-reset-email:{user.id}:{code}", expires_at=timezone.now() + CODE_LIFETIME,
+    )
+
+
+def queue_appointment_reminders(appointments, kind='', starts_in=None):
+    """
+    Queue a reminder to the patient of each appointment (with patient,
+    doctor and doctor__profile__department selected). An appointment is
+    reminded once per kind and date, however often this runs; starts_in
+    maps appointment ids to how long until they start
+    Returns the number of reminders queued
+    """
+    starts_in = starts_in or {}
+    appointments = [appointment for appointment in appointments if appointment.patient.email]
+    contexts = []
+    for appointment in appointments:
+        department = getattr(getattr(appointment.doctor, 'profile', None), 'department', None)
+        contexts.append({
+            'first_name': appointment.patient.first_name,
+            'appointment_date': appointment.appointment_date,
+            'doctor_name': f"{appointment.doctor.first_name} {appointment.doctor.last_name}",
+            'department': department.name if department else '',
+            'starts_in': starts_in.get(appointment.id, ''),
+        })
+
+    emails = []
+    for appointment, (subject, message, html_message) in zip(appointments, render_emails('appointment_reminder', contexts)):
+        emails.append({
+            'to': appointment.patient.email,
+            'subject': subject,
+            'body': message,
+            'html_body': html_message,
+            'key': f"appointment-reminder:{appointment.id}:{kind}:{appointment.appointment_date.isoformat()}",
+        })
+    return queue_emails(emails)
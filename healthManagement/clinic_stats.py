@@ -0,0 +1,315 @@
+"""
+Clinic wait-time and throughput statistics
+
+Rolled up from the AppointmentEvent log (written by transitions.py) into
+per-department, per-day rows, so reading a month of statistics touches a
+few hundred rollup rows rather than every appointment:
+- roll_up() processes the events after the last one it saw: arrivals,
+  completions and cancellations are counted, each finished waiting time
+  (WAIT_METRICS) lands in a one-minute WaitTimeBucket, and each finished
+  consultation in its doctor's DoctorDailyStats
+- close_days() counts, once a day is over, the appointments it had and the
+  no-shows (active appointments whose patient never arrived)
+- medians and p90s are read off the minute histograms, so they stay exact
+  to the minute and days can be merged
+Both run every CLINIC_STATS_INTERVAL seconds (roll_up_clinic_stats).
+"""
+import logging
+import math
+from collections import Counter, defaultdict
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+
+from .models import (
+    Appointment, AppointmentEvent, ClinicDailyStats, ClinicStatsProgress, DoctorDailyStats, WaitTimeBucket,
+)
+
+logger = logging.getLogger(__name__)
+
+# metric: (start actions, the first one logged wins; end action)
+WAIT_METRICS = {
+    'vitals_wait': (['patient_available'], 'vitals_taken'),
+    'doctor_wait': (['vitals_taken', 'patient_available'], 'doctor_with_patient'),
+    'consultation': (['doctor_with_patient'], 'doctor_done'),
+    'visit': (['patient_available'], 'doctor_done'),
+}
+
+COUNTED_ACTIONS = {
+    'patient_available': 'arrived',
+    'doctor_done': 'completed',
+    'cancel': 'cancelled',
+    'terminate': 'cancelled',
+    'patient_left': 'cancelled',
+}
+
+# Events younger than this are left for the next run, so one committed late
+# (after a newer id) is not skipped
+SETTLE_SECONDS = 60
+
+# Longer waits share the last bucket
+MAX_BUCKET_MINUTES = 24 * 60
+
+
+def _day(moment):
+    return timezone.localdate(moment)
+
+
+def _day_bounds(day):
+    start = timezone.make_aware(datetime.combine(day, time.min))
+    return start, start + timedelta(days=1)
+
+
+def _progress():
+    progress = ClinicStatsProgress.objects.order_by('pk').first()
+    return progress or ClinicStatsProgress.objects.create()
+
+
+def _stage_times(appointment_ids):
+    """{(appointment_id, action): first time it was logged}"""
+    times = {}
+    starts = {action for actions, _ in WAIT_METRICS.values() for action in actions}
+    for appointment_id, action, occurred_at in AppointmentEvent.objects.filter(
+        appointment_id__in=appointment_ids, action__in=starts
+    ).order_by('occurred_at').values_list('appointment_id', 'action', 'occurred_at'):
+        times.setdefault((appointment_id, action), occurred_at)
+    return times
+
+
+def _add(model, keys, rows, defaults=None):
+    """
+    Add rows, {key: Counter} where key holds the values of the keys fields,
+    to the existing rows of model, creating the missing ones (with
+    defaults[key] as their other fields)
+    """
+    if not rows:
+        return
+    lookup = Q()
+    for key in rows:
+        lookup |= Q(**dict(zip(keys, key)))
+    existing = {tuple(getattr(row, field) for field in keys): row for row in model.objects.filter(lookup)}
+    created, updated, changed = [], [], set()
+    for key, counts in rows.items():
+        row = existing.get(key)
+        if row is None:
+            created.append(model(**dict(zip(keys, key)), **(defaults or {}).get(key, {}), **counts))
+            continue
+        for field, value in counts.items():
+            setattr(row, field, getattr(row, field) + value)
+        updated.append(row)
+        changed.update(counts)
+    model.objects.bulk_create(created)
+    if updated:
+        model.objects.bulk_update(updated, sorted(changed))
+
+
+def _roll_up_events(events):
+    days = defaultdict(Counter)
+    buckets = defaultdict(Counter)
+    doctors = defaultdict(Counter)
+    departments = {}
+    times = _stage_times({event.appointment_id for event in events if event.action in
+                          {end for _, end in WAIT_METRICS.values()}})
+
+    for event in events:
+        if event.department_id is None:
+            continue
+        day = _day(event.occurred_at)
+        if event.action in COUNTED_ACTIONS:
+            days[(event.department_id, day)][COUNTED_ACTIONS[event.action]] += 1
+        for metric, (starts, end) in WAIT_METRICS.items():
+            if event.action != end:
+                continue
+            start = next((times[(event.appointment_id, action)] for action in starts
+                          if (event.appointment_id, action) in times), None)
+            if start is None or start > event.occurred_at:
+                continue
+            seconds = (event.occurred_at - start).total_seconds()
+            minutes = min(int(seconds // 60), MAX_BUCKET_MINUTES)
+            buckets[(event.department_id, day, metric, minutes)]['count'] += 1
+            if metric == 'consultation':
+                doctors[(event.doctor_id, day)]['completed'] += 1
+                doctors[(event.doctor_id, day)]['consultation_seconds'] += int(seconds)
+                departments.setdefault((event.doctor_id, day), {'department_id': event.department_id})
+
+    _add(ClinicDailyStats, ('department_id', 'date'), days)
+    _add(WaitTimeBucket, ('department_id', 'date', 'metric', 'minutes'), buckets)
+    # A doctor's day counts for the department they were in when it started
+    _add(DoctorDailyStats, ('doctor_id', 'date'), doctors, defaults=departments)
+
+
+def roll_up(batch_size=5000, now=None):
+    """
+    Roll up the events logged since the last run, batch_size at a time
+    Returns the number of events processed
+    """
+    settled = (now or timezone.now()) - timedelta(seconds=SETTLE_SECONDS)
+    processed = 0
+    while True:
+        progress = _progress()
+        events = list(AppointmentEvent.objects.filter(
+            pk__gt=progress.last_event_id, occurred_at__lt=settled
+        ).order_by('pk')[:batch_size])
+        if not events:
+            break
+        with transaction.atomic():
+            # Claim the batch; an overlapping run that got there first wins
+            claimed = ClinicStatsProgress.objects.filter(
+                pk=progress.pk, last_event_id=progress.last_event_id
+            ).update(last_event_id=events[-1].pk)
+            if not claimed:
+                break
+            _roll_up_events(events)
+        processed += len(events)
+    return processed
+
+
+def close_days(today=None):
+    """
+    Count the appointments and no-shows of every department for the days
+    that ended since the last run (CLINIC_STATS_BACKFILL_DAYS back at first)
+    Returns the days closed
+    """
+    today = today or timezone.localdate()
+    progress = _progress()
+    day = (progress.closed_through + timedelta(days=1) if progress.closed_through
+           else today - timedelta(days=settings.CLINIC_STATS_BACKFILL_DAYS))
+    closed = []
+    while day < today:
+        start, end = _day_bounds(day)
+        rows = {}
+        for department_id, scheduled, no_shows in Appointment.objects.filter(
+            appointment_date__gte=start, appointment_date__lt=end,
+            doctor__profile__department__isnull=False,
+        ).order_by().values('doctor__profile__department_id').annotate(
+            scheduled=Count('id'),
+            no_shows=Count('id', filter=Q(
+                status__in=['pending', 'confirmed'], is_patient_available=False, is_doctor_done_with_patient=False
+            )),
+        ).values_list('doctor__profile__department_id', 'scheduled', 'no_shows'):
+            rows[department_id] = (scheduled, no_shows)
+
+        with transaction.atomic():
+            claimed = ClinicStatsProgress.objects.filter(
+                pk=progress.pk, closed_through=progress.closed_through
+            ).update(closed_through=day)
+            if not claimed:
+                break
+            existing = {stats.department_id: stats for stats in ClinicDailyStats.objects.filter(date=day)}
+            for department_id, (scheduled, no_shows) in rows.items():
+                stats = existing.pop(department_id, None) or ClinicDailyStats(department_id=department_id, date=day)
+                stats.scheduled, stats.no_shows, stats.closed = scheduled, no_shows, True
+                stats.save()
+            ClinicDailyStats.objects.filter(pk__in=[stats.pk for stats in existing.values()]).update(closed=True)
+        progress.closed_through = day
+        closed.append(day)
+        day += timedelta(days=1)
+    return closed
+
+
+def percentile(histogram, fraction):
+    """Nearest-rank percentile of a {minutes: count} histogram, None when empty"""
+    total = sum(histogram.values())
+    if not total:
+        return None
+    rank = max(math.ceil(fraction * total), 1)
+    seen = 0
+    for minutes in sorted(histogram):
+        seen += histogram[minutes]
+        if seen >= rank:
+            return minutes
+    return None
+
+
+def _waits(histograms):
+    return {
+        metric: {
+            'count': sum(histograms.get(metric, {}).values()),
+            'median_minutes': percentile(histograms.get(metric, {}), 0.5),
+            'p90_minutes': percentile(histograms.get(metric, {}), 0.9),
+        }
+        for metric in WAIT_METRICS
+    }
+
+
+def _no_show_rate(counts):
+    """No-shows per appointment not cancelled, once the days are closed"""
+    expected = counts['scheduled'] - counts['cancelled']
+    return round(counts['no_shows'] / expected, 3) if counts['closed'] and expected > 0 else None
+
+
+def department_stats(department_id, start_date, end_date):
+    """
+    Statistics of a department for the days start_date..end_date (inclusive),
+    from the rollups: per day and for the whole period, plus each doctor's
+    throughput. Days not closed yet have no scheduled / no-show figures
+    """
+    days = {
+        stats.date: stats for stats in ClinicDailyStats.objects.filter(
+            department_id=department_id, date__gte=start_date, date__lte=end_date
+        )
+    }
+    histograms = defaultdict(lambda: defaultdict(Counter))
+    for day, metric, minutes, count in WaitTimeBucket.objects.filter(
+        department_id=department_id, date__gte=start_date, date__lte=end_date
+    ).values_list('date', 'metric', 'minutes', 'count'):
+        histograms[day][metric][minutes] += count
+
+    progress = ClinicStatsProgress.objects.order_by('pk').first()
+    closed_through = progress.closed_through if progress else None
+
+    period_counts = Counter()
+    period_histograms = defaultdict(Counter)
+    daily = []
+    day = start_date
+    while day <= end_date:
+        stats = days.get(day)
+        counts = {
+            field: getattr(stats, field) if stats else 0
+            for field in ('scheduled', 'arrived', 'completed', 'cancelled', 'no_shows')
+        }
+        # A closed day without a row had no appointments
+        counts['closed'] = stats.closed if stats else bool(closed_through and day <= closed_through)
+        period_counts.update({field: value for field, value in counts.items() if field != 'closed'})
+        period_counts['open_days'] += not counts['closed']
+        for metric, histogram in histograms[day].items():
+            period_histograms[metric].update(histogram)
+        daily.append({
+            'date': day.isoformat(),
+            **counts,
+            'no_show_rate': _no_show_rate(counts),
+            'waits': _waits(histograms[day]),
+        })
+        day += timedelta(days=1)
+
+    period = {field: period_counts[field] for field in ('scheduled', 'arrived', 'completed', 'cancelled', 'no_shows')}
+    period['closed'] = not period_counts['open_days']
+    period.update({'no_show_rate': _no_show_rate(period), 'waits': _waits(period_histograms)})
+
+    doctors = DoctorDailyStats.objects.filter(
+        department_id=department_id, date__gte=start_date, date__lte=end_date
+    ).order_by().values('doctor_id', 'doctor__first_name', 'doctor__last_name').annotate(
+        completed_total=Sum('completed'), seconds_total=Sum('consultation_seconds'),
+    ).order_by('-completed_total', 'doctor_id')
+
+    return {
+        'department_id': department_id,
+        'from': start_date.isoformat(),
+        'to': end_date.isoformat(),
+        'period': period,
+        'days': daily,
+        'doctors': [
+            {
+                'doctor_id': row['doctor_id'],
+                'doctor': f"{row['doctor__first_name']} {row['doctor__last_name']}",
+                'completed': row['completed_total'],
+                'per_day': round(row['completed_total'] / len(daily), 1),
+                'average_consultation_minutes': round(row['seconds_total'] / row['completed_total'] / 60, 1)
+                if row['completed_total'] else None,
+            }
+            for row in doctors
+        ],
+    }
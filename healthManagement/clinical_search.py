@@ -0,0 +1,440 @@
+"""
+Clinical full-text search
+
+Medical records (diagnosis, symptoms, notes), treatments (name, notes),
+test results (findings, conclusion) and doctor visits (observation, note)
+are searched through an inverted index, ranked by BM25:
+- each source row has one ClinicalDocument (its text, patient, doctor and
+  time), written by the post_save / post_delete receivers in signals.py, so
+  the index follows every change; rebuild_search_index fills it for rows
+  written before
+- on SQLite the index is an FTS5 table over ClinicalDocument, kept in step
+  by triggers (migration 0015); other databases use PythonIndex, an
+  in-process index that picks up the documents changed since it last looked
+- queries are words, all of which must match; `word*` matches a prefix.
+  Both indexes tokenize alike (case and accents folded), so they find the
+  same documents
+- results can be narrowed to kinds, a patient, a doctor and a time range;
+  what a user may see depends on their role (visible_kinds)
+"""
+import base64
+import binascii
+import logging
+import math
+import re
+import threading
+import unicodedata
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.db import connections, router
+from django.db.models import F, Value
+from django.db.models.functions import Coalesce, Concat, NullIf
+from django.utils import timezone
+from django.utils.html import escape
+
+from .models import ClinicalDocument, DoctorVisit, MedicalRecord, TestResult, Treatment
+
+logger = logging.getLogger(__name__)
+
+FTS_TABLE = 'healthManagement_clinicalsearch'
+
+MAX_TERMS = 10
+SNIPPET_WORDS = 24
+
+# BM25 parameters (FTS5's)
+K1 = 1.2
+B = 0.75
+
+# Documents changed this long before the last sync are looked at again, so
+# one committed late is not missed
+SETTLE_SECONDS = 30
+
+# kind: (model, {patient, doctor and time of its documents}, text fields, title)
+SOURCES = {
+    'record': (
+        MedicalRecord,
+        {'search_patient': F('patient_id'), 'search_doctor': F('doctor_id'), 'search_at': F('date_created')},
+        ['diagnosis', 'symptoms', 'notes'],
+        F('diagnosis'),
+    ),
+    'treatment': (
+        Treatment,
+        {
+            'search_patient': F('medical_record__patient_id'), 'search_doctor': F('prescribed_by_id'),
+            'search_at': F('date_created'),
+        },
+        ['name', 'notes'],
+        F('name'),
+    ),
+    'test_result': (
+        TestResult,
+        {
+            'search_patient': F('test_request__patient_id'), 'search_doctor': F('test_request__requested_by_id'),
+            'search_at': F('result_date'),
+        },
+        ['findings', 'conclusion'],
+        Coalesce(NullIf('test_request__test_name', Value('')), 'test_request__test_type__name', Value('')),
+    ),
+    'doctor_visit': (
+        DoctorVisit,
+        {
+            'search_patient': Coalesce('patient_id', 'delivered_medication_treatment__medical_record__patient_id'),
+            'search_doctor': F('doctor_id'), 'search_at': F('visit_date'),
+        },
+        ['observation', 'note'],
+        Concat(Value('Visit: '), 'delivered_medication_treatment__drug__name'),
+    ),
+}
+KINDS = list(SOURCES)
+
+# Roles that see only some kinds; patients see every kind of their own
+# documents, the clinical roles (and admins) everything
+ROLE_KINDS = {
+    'doctor': KINDS,
+    'nurse': KINDS,
+    'admin': KINDS,
+    'patient': KINDS,
+    'labtech': ['test_result'],
+    'pharmacy': ['treatment'],
+}
+
+
+class InvalidQuery(ValueError):
+    pass
+
+
+def visible_kinds(user):
+    """Kinds of document user may search, empty when none"""
+    if user.is_staff:
+        return KINDS
+    return ROLE_KINDS.get(getattr(getattr(user, 'role', None), 'name', None), [])
+
+
+def _fold(text):
+    """Lowercase, without accents"""
+    return ''.join(
+        char for char in unicodedata.normalize('NFKD', text.lower()) if not unicodedata.combining(char)
+    )
+
+
+def tokenize(text):
+    return re.findall(r'[^\W_]+', _fold(text))
+
+
+def parse_query(query):
+    """[(term, is_prefix)] of a query; raises InvalidQuery"""
+    terms = []
+    for word in re.findall(r'[^\W_]+\*?', _fold(query or '')):
+        prefix = word.endswith('*')
+        terms.append((word.rstrip('*'), prefix))
+    if not terms:
+        raise InvalidQuery('Enter at least one word to search for.')
+    if len(terms) > MAX_TERMS:
+        raise InvalidQuery(f'At most {MAX_TERMS} words can be searched for.')
+    return list(dict.fromkeys(terms))
+
+
+# Indexing
+
+def index_objects(kind, ids):
+    """(Re)write the documents of the kind's rows ids; rows without text (or gone) lose theirs"""
+    model, fields, text_fields, title = SOURCES[kind]
+    rows = model.objects.filter(pk__in=ids).order_by().values('pk', *text_fields, search_title=title, **fields)
+    documents = []
+    for row in rows:
+        text = '\n'.join(row[field] for field in text_fields if row[field])
+        if text.strip() and row['search_at'] is not None:
+            documents.append(ClinicalDocument(
+                kind=kind, object_id=row['pk'], patient_id=row['search_patient'], doctor_id=row['search_doctor'],
+                occurred_at=row['search_at'], title=(row['search_title'] or '')[:255], text=text,
+                updated_at=timezone.now(),
+            ))
+    indexed = {document.object_id for document in documents}
+    removed = [pk for pk in ids if pk not in indexed]
+    if removed:
+        remove_objects(kind, removed)
+    if documents:
+        ClinicalDocument.objects.bulk_create(
+            documents, update_conflicts=True, unique_fields=['kind', 'object_id'],
+            update_fields=['patient', 'doctor', 'occurred_at', 'title', 'text', 'updated_at'],
+        )
+    return len(documents)
+
+
+def remove_objects(kind, ids):
+    ClinicalDocument.objects.filter(kind=kind, object_id__in=ids).delete()
+
+
+def rebuild(batch_size=1000, kinds=None):
+    """Index every row of the kinds (all of them); returns {kind: documents written}"""
+    written = {}
+    for kind in kinds or KINDS:
+        model = SOURCES[kind][0]
+        written[kind] = 0
+        ids = list(model.objects.order_by('pk').values_list('pk', flat=True))
+        for index in range(0, len(ids), batch_size):
+            written[kind] += index_objects(kind, ids[index:index + batch_size])
+        # Documents of rows deleted while the receivers were not connected
+        ClinicalDocument.objects.filter(kind=kind).exclude(object_id__in=model.objects.values('pk')).delete()
+    connection = connections[router.db_for_write(ClinicalDocument)]
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize')")
+    logger.info("Rebuilt the clinical search index: %s", written)
+    return written
+
+
+# Searching
+
+def backend(alias=None):
+    """'fts5' or 'python' (SEARCH_BACKEND, or by the database)"""
+    if settings.SEARCH_BACKEND != 'auto':
+        return settings.SEARCH_BACKEND
+    alias = alias or router.db_for_read(ClinicalDocument)
+    return 'fts5' if connections[alias].vendor == 'sqlite' else 'python'
+
+
+def _filters(kinds, patient_id, doctor_id, start, end):
+    filters = {'kind__in': kinds}
+    if patient_id is not None:
+        filters['patient_id'] = patient_id
+    if doctor_id is not None:
+        filters['doctor_id'] = doctor_id
+    if start is not None:
+        filters['occurred_at__gte'] = start
+    if end is not None:
+        filters['occurred_at__lt'] = end
+    return filters
+
+
+# filter: SQL condition on the documents table
+FTS_CONDITIONS = {
+    'patient_id': 'd.patient_id = %s',
+    'doctor_id': 'd.doctor_id = %s',
+    'occurred_at__gte': 'd.occurred_at >= %s',
+    'occurred_at__lt': 'd.occurred_at < %s',
+}
+
+
+def _fts5_search(terms, filters, limit, offset):
+    """[(document id, score)], best first"""
+    match = ' '.join(f'"{term}"*' if prefix else f'"{term}"' for term, prefix in terms)
+    alias = router.db_for_read(ClinicalDocument)
+    connection = connections[alias]
+    conditions, params = [f"{FTS_TABLE} MATCH %s"], [match]
+    if set(filters['kind__in']) != set(KINDS):
+        conditions.append(f"d.kind IN ({', '.join(['%s'] * len(filters['kind__in']))})")
+        params.extend(filters['kind__in'])
+    for name, condition in FTS_CONDITIONS.items():
+        if name in filters:
+            conditions.append(condition)
+            value = filters[name]
+            params.append(connection.ops.adapt_datetimefield_value(value) if name.startswith('occurred_at') else value)
+    # Unfiltered searches need nothing but the index
+    join = f"JOIN {ClinicalDocument._meta.db_table} d ON d.id = {FTS_TABLE}.rowid " if len(conditions) > 1 else ''
+    with connection.cursor() as cursor:
+        # bm25() is lower for better matches
+        cursor.execute(
+            f"SELECT {FTS_TABLE}.rowid, bm25({FTS_TABLE}) FROM {FTS_TABLE} {join}"
+            f"WHERE {' AND '.join(conditions)} ORDER BY bm25({FTS_TABLE}) LIMIT %s OFFSET %s",
+            [*params, limit, offset],
+        )
+        return [(pk, -rank) for pk, rank in cursor.fetchall()]
+
+
+class PythonIndex:
+    """
+    In-process inverted index of the ClinicalDocuments, for databases
+    without FTS5; sync() adds the documents changed since the last call.
+    Deleted documents are dropped when a search finds them gone
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.postings = defaultdict(dict)   # term: {document id: occurrences}
+        self.documents = {}                 # document id: (length, terms, kind, patient_id, doctor_id, occurred_at)
+        self.updated = {}                   # document id: updated_at when indexed
+        self.total_length = 0
+        self.synced = None
+
+    def _remove(self, pk):
+        document = self.documents.pop(pk, None)
+        self.updated.pop(pk, None)
+        if document is None:
+            return
+        self.total_length -= document[0]
+        for term in document[1]:
+            postings = self.postings[term]
+            postings.pop(pk, None)
+            if not postings:
+                del self.postings[term]
+
+    def _add(self, pk, text, kind, patient_id, doctor_id, occurred_at):
+        counts = defaultdict(int)
+        tokens = tokenize(text)
+        for token in tokens:
+            counts[token] += 1
+        for term, count in counts.items():
+            self.postings[term][pk] = count
+        self.documents[pk] = (len(tokens), tuple(counts), kind, patient_id, doctor_id, occurred_at)
+        self.total_length += len(tokens)
+
+    def sync(self, batch_size=2000):
+        started = timezone.now()
+        documents = ClinicalDocument.objects.order_by()
+        if self.synced is not None:
+            documents = documents.filter(updated_at__gte=self.synced - timedelta(seconds=SETTLE_SECONDS))
+        # Only the documents not indexed as they are now are read in full
+        changed = [
+            pk for pk, updated_at in documents.values_list('pk', 'updated_at').iterator(chunk_size=batch_size)
+            if self.updated.get(pk) != updated_at
+        ]
+        with self.lock:
+            for index in range(0, len(changed), batch_size):
+                for pk, updated_at, *row in ClinicalDocument.objects.filter(
+                    pk__in=changed[index:index + batch_size]
+                ).values_list('pk', 'updated_at', 'text', 'kind', 'patient_id', 'doctor_id', 'occurred_at'):
+                    self._remove(pk)
+                    self._add(pk, *row)
+                    self.updated[pk] = updated_at
+            self.synced = started
+
+    def discard(self, pks):
+        with self.lock:
+            for pk in pks:
+                self._remove(pk)
+
+    def _matches(self, term, prefix):
+        """{document id: occurrences} of a query term"""
+        if not prefix:
+            return self.postings.get(term, {})
+        matches = defaultdict(int)
+        for token, postings in list(self.postings.items()):
+            if token.startswith(term):
+                for pk, count in postings.items():
+                    matches[pk] += count
+        return matches
+
+    def search(self, terms, filters, limit, offset):
+        """[(document id, score)], best first"""
+        with self.lock:
+            if not self.documents:
+                return []
+            total = len(self.documents)
+            average = self.total_length / total
+            matched = [self._matches(term, prefix) for term, prefix in terms]
+            candidates = set(min(matched, key=len))
+            for postings in matched:
+                candidates &= postings.keys()
+
+            kinds = set(filters['kind__in'])
+            scored = []
+            for pk in candidates:
+                length, _, kind, patient_id, doctor_id, occurred_at = self.documents[pk]
+                if (kind not in kinds
+                        or filters.get('patient_id', patient_id) != patient_id
+                        or filters.get('doctor_id', doctor_id) != doctor_id
+                        or ('occurred_at__gte' in filters and occurred_at < filters['occurred_at__gte'])
+                        or ('occurred_at__lt' in filters and occurred_at >= filters['occurred_at__lt'])):
+                    continue
+                score = 0.0
+                for postings in matched:
+                    idf = max(math.log((total - len(postings) + 0.5) / (len(postings) + 0.5)), 1e-6)
+                    count = postings[pk]
+                    score += idf * count * (K1 + 1) / (count + K1 * (1 - B + B * length / average))
+                scored.append((score, pk))
+        scored.sort(key=lambda item: (-item[0], item[1]))
+        return [(pk, score) for score, pk in scored[offset:offset + limit]]
+
+
+python_index = PythonIndex()
+
+
+def _snippet(text, terms):
+    """
+    SNIPPET_WORDS words of text around its first match, as HTML: the text
+    escaped, matches in <mark>
+    """
+    words = list(re.finditer(r'[^\W_]+', text))
+
+    def matches(word):
+        folded = _fold(word.group())
+        return any(folded.startswith(term) if prefix else folded == term for term, prefix in terms)
+
+    first = next((index for index, word in enumerate(words) if matches(word)), 0)
+    start = max(first - SNIPPET_WORDS // 3, 0)
+    shown = words[start:start + SNIPPET_WORDS]
+    if not shown:
+        return ''
+    parts = ['…' if start else '']
+    position = shown[0].start()
+    for word in shown:
+        parts.append(escape(text[position:word.start()]))
+        parts.append(f'<mark>{escape(word.group())}</mark>' if matches(word) else escape(word.group()))
+        position = word.end()
+    if shown[-1].end() < len(text.rstrip()):
+        parts.append('…')
+    return ' '.join(''.join(parts).split())
+
+
+def _name(user):
+    return f"{user.first_name} {user.last_name}" if user else None
+
+
+def encode_cursor(offset):
+    return base64.urlsafe_b64encode(str(offset).encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        offset = int(base64.urlsafe_b64decode(cursor.encode()).decode())
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise InvalidQuery('Invalid cursor')
+    if offset < 0:
+        raise InvalidQuery('Invalid cursor')
+    return offset
+
+
+def _start_of(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def search(query, kinds, patient_id=None, doctor_id=None, date_from=None, date_to=None, limit=20, offset=0):
+    """
+    One page of the documents matching query, best first: (results,
+    next_offset); date_from and date_to are inclusive. Raises InvalidQuery
+    """
+    terms = parse_query(query)
+    filters = _filters(
+        kinds, patient_id, doctor_id,
+        _start_of(date_from) if date_from else None,
+        _start_of(date_to + timedelta(days=1)) if date_to else None,
+    )
+    if backend() == 'fts5':
+        ranked = _fts5_search(terms, filters, limit + 1, offset)
+    else:
+        python_index.sync()
+        ranked = python_index.search(terms, filters, limit + 1, offset)
+
+    documents = ClinicalDocument.objects.select_related('patient', 'doctor').in_bulk([pk for pk, _ in ranked[:limit]])
+    gone = [pk for pk, _ in ranked[:limit] if pk not in documents]
+    if gone:
+        python_index.discard(gone)
+    results = [
+        {
+            'kind': documents[pk].kind,
+            'id': documents[pk].object_id,
+            'title': documents[pk].title,
+            'snippet': _snippet(documents[pk].text, terms),
+            'score': round(score, 4),
+            'at': documents[pk].occurred_at.isoformat(),
+            'patient_id': documents[pk].patient_id,
+            'patient': _name(documents[pk].patient),
+            'doctor_id': documents[pk].doctor_id,
+            'doctor': _name(documents[pk].doctor),
+        }
+        for pk, score in ranked[:limit] if pk in documents
+    ]
+    return results, offset + limit if len(ranked) > limit else None
@@ -2,7 +2,7 @@ import json
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
 from accounts.models import CustomUser
-from healthManagement.models import ActiveWebSocketConnection, Appointment, Notification
+from healthManagement.models import ActiveWebSocketConnection, Appointment
 from healthManagement.serializers import (
     PatientAppointmentSerializer as AppointmentSerializer,
     DoctorAppointmentSerializer,
@@ -13,6 +13,12 @@ from django.utils import timezone
 from django.db.models import Prefetch
 from django.core.serializers.json import DjangoJSONEncoder
 from asgiref.sync import async_to_sync
+from healthManagement.notifications import inbox, unread_count
+from healthManagement.queue_board import department_board, position as queue_position
+from hmsServer.log import correlation_scope, mask_email
+import logging
+
+logger = logging.getLogger(__name__)
 
 
 class SimpleConsumer(AsyncWebsocketConsumer):
@@ -55,6 +61,14 @@ class SimpleConsumer(AsyncWebsocketConsumer):
                     self.channel_name
                 )
                 
+                # Staff also get their department's queue board as it changes
+                self.department_id = await self.get_staff_department_id(email)
+                if self.department_id:
+                    await self.channel_layer.group_add(
+                        f"queue_board_{self.department_id}",
+                        self.channel_name
+                    )
+                
                 await self.accept()
                 
                 # Send connection success message
@@ -63,15 +77,15 @@ class SimpleConsumer(AsyncWebsocketConsumer):
                     'message': f'Connected successfully as {email}'
                 }))
                 
-                print(f"WebSocket connected: {email}")
+                logger.info("WebSocket connected: %s", mask_email(email))
             else:
                 # Reject connection if email not found
                 await self.close(code=4001)
-                print(f"WebSocket connection rejected: {email} not found in database")
+                logger.warning("WebSocket connection rejected: %s not found in database", mask_email(email))
         else:
             # Reject connection if no email provided
             await self.close(code=4000)
-            print("WebSocket connection rejected: No email provided")
+            logger.warning("WebSocket connection rejected: no email provided")
     
     async def disconnect(self, close_code):
         """
@@ -85,12 +99,17 @@ class SimpleConsumer(AsyncWebsocketConsumer):
                     self.user_group_name,
                     self.channel_name
                 )
+            if getattr(self, 'department_id', None):
+                await self.channel_layer.group_discard(
+                    f"queue_board_{self.department_id}",
+                    self.channel_name
+                )
             
             # Remove connection from database
             await self.remove_connection(self.email)
-            print(f"WebSocket disconnected: {self.email} (code: {close_code})")
+            logger.info("WebSocket disconnected: %s (code: %s)", mask_email(self.email), close_code)
         else:
-            print(f"WebSocket disconnected (code: {close_code})")
+            logger.info("WebSocket disconnected (code: %s)", close_code)
     
     async def receive(self, text_data):
         """
@@ -103,13 +122,28 @@ class SimpleConsumer(AsyncWebsocketConsumer):
         
         Available actions:
         - 'get_appointments': Get patient appointments (uses connected user's email)
-        - 'get_notifications': Get user notifications
+        - 'get_notifications': Get the newest page of user notifications ('cursor' in data for older ones)
         - 'get_doctor_appointments': Get doctor appointments (uses connected user's email)
         - 'get_appointment_detail': Get specific appointment details (requires 'appointment_id' in data)
         - 'get_department_appointments_today': Get all appointments for doctors in same department for today
+        - 'get_queue_board': Get today's queue board of the connected staff member's department
+        - 'get_queue_position': Get the queue stage, place in line and estimated wait of an appointment
+          (requires 'appointment_id' in data)
+        
+        An optional 'request_id' is used as the correlation ID in the logs
         """
         try:
             data = json.loads(text_data)
+        except json.JSONDecodeError:
+            await self.send(text_data=json.dumps({
+                'type': 'error',
+                'message': 'Invalid JSON format'
+            }))
+            return
+        
+        # Everything logged while handling this message shares one correlation ID
+        # (the client may pass its own as 'request_id')
+        with correlation_scope(data.get('request_id')):
             action = data.get('action')
             
             if action == 'get_appointments':
@@ -122,17 +156,15 @@ class SimpleConsumer(AsyncWebsocketConsumer):
                 await self.handle_get_appointment_detail(data.get('data', {}))
             elif action == 'get_department_appointments_today':
                 await self.handle_get_department_appointments_today(data.get('data', {}))
+            elif action == 'get_queue_board':
+                await self.handle_get_queue_board(data.get('data', {}))
+            elif action == 'get_queue_position':
+                await self.handle_get_queue_position(data.get('data', {}))
             else:
                 await self.send(text_data=json.dumps({
                     'type': 'error',
                     'message': f'Unknown action: {action}'
                 }))
-                
-        except json.JSONDecodeError:
-            await self.send(text_data=json.dumps({
-                'type': 'error',
-                'message': 'Invalid JSON format'
-            }))
             
     async def handle_get_appointments(self, data):
         """
@@ -169,8 +201,8 @@ class SimpleConsumer(AsyncWebsocketConsumer):
             serializer = AppointmentSerializer(appointments, many=True)
             return serializer.data
             
-        except Exception as e:
-            print(f"Error getting appointments: {str(e)}")
+        except Exception:
+            logger.exception("Error getting appointments")
             return []
     
     async def handle_get_doctor_appointments(self, data):
@@ -219,8 +251,8 @@ class SimpleConsumer(AsyncWebsocketConsumer):
             )
             return serializer.data
             
-        except Exception as e:
-            print(f"Error getting doctor appointments: {str(e)}")
+        except Exception:
+            logger.exception("Error getting doctor appointments")
             return []
     
     async def handle_get_appointment_detail(self, data):
@@ -238,7 +270,11 @@ class SimpleConsumer(AsyncWebsocketConsumer):
                 }))
                 return
             
-            appointment_detail = await self.get_appointment_detail(appointment_id)
+            appointment_detail = await self.get_appointment_detail(
+                appointment_id,
+                fields=data.get('fields'),
+                expand=data.get('expand')
+            )
             
             if appointment_detail is None:
                 await self.send(text_data=json.dumps({
@@ -258,31 +294,35 @@ class SimpleConsumer(AsyncWebsocketConsumer):
             }))
     
     @database_sync_to_async
-    def get_appointment_detail(self, appointment_id):
+    def get_appointment_detail(self, appointment_id, fields=None, expand=None):
         """
         Get details of a specific appointment by ID
         Includes complete patient and doctor information with profiles
+        - fields / expand shape the payload like the HTTP ?fields= / ?expand=
         """
         try:
-            appointment = Appointment.objects.get(id=appointment_id)
-            
             # Create a fake request context for URL building
             from django.test.client import RequestFactory
             factory = RequestFactory()
             request = factory.get('/')
+            context = {'request': request, 'fields': fields, 'expand': expand}
+            
+            appointment = AppointmentDetailSerializer.setup_eager_loading(
+                Appointment.objects.all(), context
+            ).get(id=appointment_id)
             
             # Serialize the appointment using AppointmentDetailSerializer
             serializer = AppointmentDetailSerializer(
                 appointment,
-                context={'request': request}
+                context=context
             )
             return serializer.data
             
         except Appointment.DoesNotExist:
-            print(f"Appointment with ID {appointment_id} not found")
+            logger.info("Appointment %s not found", appointment_id)
             return None
-        except Exception as e:
-            print(f"Error getting appointment detail: {str(e)}")
+        except Exception:
+            logger.exception("Error getting appointment detail")
             return None
     
     async def handle_get_department_appointments_today(self, data):
@@ -372,18 +412,106 @@ class SimpleConsumer(AsyncWebsocketConsumer):
             }
             
         except CustomUser.DoesNotExist:
-            print(f"User with email {email} not found")
+            logger.warning("User %s not found", mask_email(email))
             return {
                 'nurse_appointments': [],
                 'error': 'User not found'
             }
         except Exception as e:
-            print(f"Error getting department appointments: {str(e)}")
+            logger.exception("Error getting department appointments")
             return {
                 'nurse_appointments': [],
                 'error': str(e)
             }
     
+    async def handle_get_queue_board(self, data):
+        """
+        Handle get_queue_board action
+        The board is also pushed as 'queue_board_data' whenever it changes
+        """
+        if not getattr(self, 'department_id', None):
+            await self.send(text_data=json.dumps({
+                'type': 'error',
+                'message': 'Only hospital staff with a department can view the queue board'
+            }))
+            return
+        try:
+            board = await database_sync_to_async(department_board)(self.department_id)
+            await self.send(text_data=json.dumps({
+                'type': 'queue_board_data',
+                'data': board
+            }))
+        except Exception as e:
+            logger.exception("Error getting queue board")
+            await self.send(text_data=json.dumps({
+                'type': 'error',
+                'message': f'Failed to fetch queue board: {str(e)}'
+            }))
+    
+    async def handle_get_queue_position(self, data):
+        """
+        Handle get_queue_position action
+        Patients can only ask about their own appointments
+        """
+        appointment_id = data.get('appointment_id')
+        if not appointment_id:
+            await self.send(text_data=json.dumps({
+                'type': 'error',
+                'message': 'appointment_id is required'
+            }))
+            return
+        try:
+            queue = await self.get_queue_position(self.email, appointment_id)
+            await self.send(text_data=json.dumps({
+                'type': 'queue_position_data',
+                'data': queue
+            }))
+        except Exception as e:
+            logger.exception("Error getting queue position")
+            await self.send(text_data=json.dumps({
+                'type': 'error',
+                'message': f'Failed to fetch queue position: {str(e)}'
+            }))
+    
+    @database_sync_to_async
+    def get_queue_position(self, email, appointment_id):
+        """
+        Queue position of an appointment the user may see, None otherwise
+        """
+        appointment = Appointment.objects.filter(pk=appointment_id).select_related(
+            'patient', 'doctor__profile'
+        ).first()
+        if appointment is None:
+            return None
+        # The patient, or staff of the department the appointment's doctor works in
+        doctor_profile = getattr(appointment.doctor, 'profile', None)
+        in_department = (
+            self.department_id is not None and doctor_profile is not None
+            and doctor_profile.department_id == self.department_id
+        )
+        if not in_department and appointment.patient.email != email:
+            return None
+        return queue_position(appointment)
+    
+    async def queue_board_update(self, event):
+        """
+        Handle queue board pushes sent to the department group
+        (see healthManagement.tasks.send_queue_board)
+        """
+        await self.send(text_data=json.dumps({
+            'type': 'queue_board_data',
+            'data': event['board']
+        }))
+    
+    @database_sync_to_async
+    def get_staff_department_id(self, email):
+        """
+        Department of a staff member (anyone but a patient), None for patients
+        """
+        return CustomUser.objects.filter(
+            email=email, profile__department__isnull=False
+        ).exclude(role__name='patient').values_list('profile__department_id', flat=True).first()
+    
     @database_sync_to_async
     def check_user_exists(self, email):
         """
@@ -415,14 +543,19 @@ class SimpleConsumer(AsyncWebsocketConsumer):
     async def handle_get_notifications(self, data):
         """
         Handle get_notifications action
+        Sends the newest page; pass data.cursor (the previous next_cursor)
+        for older notifications and data.limit for the page size
         """
         try:
-            notifications, unread_count = await self.get_user_notifications(self.email)
+            notifications, unread_count, next_cursor = await self.get_user_notifications(
+                self.email, cursor=data.get('cursor'), limit=data.get('limit')
+            )
             await self.send(text_data=json.dumps({
                 'type': 'notifications_data',
                 'data': {
                     'notifications': notifications,
-                    'unread_count': unread_count
+                    'unread_count': unread_count,
+                    'next_cursor': next_cursor
                 }
             }))
         except Exception as e:
@@ -432,18 +565,17 @@ class SimpleConsumer(AsyncWebsocketConsumer):
             }))
     
     @database_sync_to_async
-    def get_user_notifications(self, email):
+    def get_user_notifications(self, email, cursor=None, limit=None):
         """
-        Get all notifications for a user by email using NotificationSerializer
-        Returns a tuple of (serialized_notifications, unread_count)
+        Get one page of a user's notifications by email using NotificationSerializer
+        Returns a tuple of (serialized_notifications, unread_count, next_cursor)
         """
-        # Get all notifications for the user
-        notifications = Notification.objects.filter(
-            receivers__email=email
-        ).select_related('sender').order_by('-created_at')
+        user_id = CustomUser.objects.filter(email=email).values_list('id', flat=True).first()
+        if not user_id:
+            return [], 0, None
         
-        # Get unread count
-        unread_count = notifications.filter(is_read=False).count()
+        # Newest page only, with this user's read state
+        notifications, next_cursor = inbox(user_id, limit=int(limit) if limit else None, cursor=cursor)
         
         # Create a fake request context for URL building
         from django.test.client import RequestFactory
@@ -457,7 +589,8 @@ class SimpleConsumer(AsyncWebsocketConsumer):
             context={'request': request}
         )
         
-        return serializer.data, unread_count
+        # Maintained counter, not a COUNT over the deliveries
+        return serializer.data, unread_count(user_id), next_cursor
         
     async def send_notification(self, event):
         """
@@ -487,7 +620,7 @@ class SimpleConsumer(AsyncWebsocketConsumer):
                     'data': message
                 }))
         except Exception as e:
-            print(f"Error in send_notification: {str(e)}")
+            logger.exception("Error in send_notification")
             await self.send(text_data=json.dumps({
                 'type': 'error',
                 'message': f'Error processing notification: {str(e)}'
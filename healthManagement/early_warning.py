@@ -0,0 +1,270 @@
+"""
+Early-warning scores over vital signs (NEWS2)
+
+- news2() scores a reading from its respiratory rate, SpO2 (scale 1),
+  systolic BP, pulse and temperature; each parameter's bands are looked up
+  with a bisect over their upper bounds. Every VitalSign is scored as it is
+  saved (see signals.py). Consciousness and supplemental oxygen are not
+  recorded, so a patient is taken to be alert and on air
+- a reading is deteriorating when its score went up and is
+  DETERIORATION_POINTS or more above the lowest of the patient's last
+  TREND_HOURS
+- check_readings() alerts the patient's ward (the doctors and nurses of the
+  admitting clinician's department, or of whoever took the reading for
+  patients not admitted) when the risk reaches low-medium or more and has
+  gone up, or the reading is deteriorating
+- rescore() re-scores stored readings in bulk (after the bands change, or
+  for readings taken before scoring existed); early_warning_board() lists
+  the admitted patients by their latest score, from the stored scores
+"""
+import logging
+from bisect import bisect_left
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Subquery
+from django.utils import timezone
+
+from accounts.models import CustomUser
+
+from .models import Admission, Profile, VitalSign
+from .notifications import notify_many
+from .patient_summary import invalidate as invalidate_summaries
+
+logger = logging.getLogger(__name__)
+
+# parameter: (upper bounds of the bands, inclusive; points of each band and above the last)
+BANDS = {
+    'respiratory_rate': ([8, 11, 20, 24], [3, 1, 0, 2, 3]),
+    'oxygen_saturation': ([91, 93, 95], [3, 2, 1, 0]),
+    'systolic_bp': ([90, 100, 110, 219], [3, 2, 1, 0, 3]),
+    'pulse_rate': ([40, 50, 90, 110, 130], [3, 1, 0, 1, 2, 3]),
+    'temperature_c': ([35.0, 36.0, 38.0, 39.0], [3, 1, 0, 1, 2]),
+}
+PARAMETERS = list(BANDS)
+
+RISKS = ['low', 'low_medium', 'medium', 'high']
+
+TREND_HOURS = 24
+DETERIORATION_POINTS = 2
+
+# Staff alerted about a patient
+WARD_ROLES = ['doctor', 'nurse']
+
+
+def news2(values):
+    """
+    (score, risk) of the PARAMETERS values, in order; a missing value
+    scores 0
+    """
+    score = 0
+    worst = 0
+    for parameter, value in zip(PARAMETERS, values):
+        if value is None:
+            continue
+        bounds, points = BANDS[parameter]
+        band = points[bisect_left(bounds, float(value))]
+        score += band
+        worst = max(worst, band)
+    if score >= 7:
+        risk = 'high'
+    elif score >= 5:
+        risk = 'medium'
+    elif worst == 3:
+        risk = 'low_medium'
+    else:
+        risk = 'low'
+    return score, risk
+
+
+def score_reading(vital_sign):
+    """Set the news2_score and news2_risk of a VitalSign"""
+    vital_sign.news2_score, vital_sign.news2_risk = news2(
+        [getattr(vital_sign, parameter) for parameter in PARAMETERS]
+    )
+
+
+def trend(scores):
+    """
+    'deteriorating', 'improving' or 'stable', for a patient's scores of the
+    last TREND_HOURS, oldest first, the latest being judged: it must have
+    moved since the previous one, and DETERIORATION_POINTS away from the
+    best (worst) of the window
+    """
+    latest = scores[-1]
+    previous = scores[-2] if len(scores) > 1 else latest
+    if latest > previous and latest - min(scores) >= DETERIORATION_POINTS:
+        return 'deteriorating'
+    if latest < previous and max(scores) - latest >= DETERIORATION_POINTS:
+        return 'improving'
+    return 'stable'
+
+
+def _ward_staff(readings):
+    """{patient_id: ids of the doctors and nurses to alert about them}, for (patient_id, recorded_by_id) pairs"""
+    departments = dict(Admission.objects.filter(
+        patient_id__in={patient_id for patient_id, _ in readings}, status='active', admitted_by__isnull=False
+    ).values_list('patient_id', 'admitted_by__profile__department_id'))
+    recorder_departments = dict(Profile.objects.filter(
+        user_id__in={recorded_by_id for _, recorded_by_id in readings if recorded_by_id is not None}
+    ).values_list('user_id', 'department_id'))
+    for patient_id, recorded_by_id in readings:
+        if departments.get(patient_id) is None:
+            departments[patient_id] = recorder_departments.get(recorded_by_id)
+
+    staff = defaultdict(list)
+    for user_id, department_id in CustomUser.objects.filter(
+        profile__department_id__in={department_id for department_id in departments.values() if department_id},
+        role__name__in=WARD_ROLES, is_active=True,
+    ).values_list('pk', 'profile__department_id'):
+        staff[department_id].append(user_id)
+
+    receivers = {}
+    for patient_id, recorded_by_id in readings:
+        receivers[patient_id] = list(dict.fromkeys(
+            staff.get(departments[patient_id], []) + ([recorded_by_id] if recorded_by_id is not None else [])
+        ))
+    return receivers
+
+
+def _message(vital_sign, direction):
+    patient = vital_sign.patient
+    risk = vital_sign.get_news2_risk_display()
+    return (
+        f"Early Warning: {risk} Risk",
+        f"{patient.first_name} {patient.last_name} scored NEWS2 {vital_sign.news2_score} ({risk.lower()} risk"
+        f"{', deteriorating' if direction == 'deteriorating' else ''}): "
+        f"RR {vital_sign.respiratory_rate}, SpO2 {vital_sign.oxygen_saturation}%, "
+        f"BP {vital_sign.systolic_bp}/{vital_sign.diastolic_bp}, pulse {vital_sign.pulse_rate}, "
+        f"temp {vital_sign.temperature_c}°C.",
+    )
+
+
+def check_readings(vital_sign_ids):
+    """
+    Alert the wards about the patients whose latest new reading calls for
+    it (earlier ones in the batch count as history); the queries do not
+    grow with the number of readings. Returns the notifications
+    """
+    vital_signs = list(VitalSign.objects.filter(
+        pk__in=vital_sign_ids, news2_score__isnull=False
+    ).select_related('patient', 'recorded_by').order_by('recorded_at', 'pk'))
+    if not vital_signs:
+        return []
+
+    # Every score of the patients in the trend windows of the readings
+    history = defaultdict(list)
+    for patient_id, pk, recorded_at, score, risk in VitalSign.objects.filter(
+        patient_id__in={vital_sign.patient_id for vital_sign in vital_signs},
+        recorded_at__gte=vital_signs[0].recorded_at - timedelta(hours=TREND_HOURS),
+        recorded_at__lte=vital_signs[-1].recorded_at,
+        news2_score__isnull=False,
+    ).order_by('patient_id', 'recorded_at', 'pk').values_list('patient_id', 'pk', 'recorded_at', 'news2_score', 'news2_risk'):
+        history[patient_id].append((recorded_at, pk, score, risk))
+
+    latest = {vital_sign.patient_id: vital_sign for vital_sign in vital_signs}
+    alerts = {}
+    for vital_sign in latest.values():
+        since = vital_sign.recorded_at - timedelta(hours=TREND_HOURS)
+        before = [
+            (score, risk) for recorded_at, pk, score, risk in history[vital_sign.patient_id]
+            if since <= recorded_at and (recorded_at, pk) < (vital_sign.recorded_at, vital_sign.pk)
+        ]
+        direction = trend([score for score, _ in before] + [vital_sign.news2_score])
+        rank = RISKS.index(vital_sign.news2_risk)
+        escalated = not before or rank > RISKS.index(before[-1][1])
+        if rank >= RISKS.index('low_medium') and (escalated or direction == 'deteriorating'):
+            alerts[vital_sign.patient_id] = (vital_sign, direction)
+    if not alerts:
+        return []
+
+    receivers = _ward_staff([(patient_id, vital_sign.recorded_by_id) for patient_id, (vital_sign, _) in alerts.items()])
+    items = [
+        (receivers[patient_id], *_message(vital_sign, direction), vital_sign.recorded_by)
+        for patient_id, (vital_sign, direction) in alerts.items() if receivers[patient_id]
+    ]
+    for patient_id, (vital_sign, direction) in alerts.items():
+        logger.info("Early warning for patient %s: NEWS2 %s (%s)", patient_id, vital_sign.news2_score, direction)
+    return notify_many(items) if items else []
+
+
+def _admitted_patient_ids():
+    return Admission.objects.filter(status='active', patient__isnull=False).values('patient_id')
+
+
+def rescore(hours=TREND_HOURS, admitted_only=True, batch_size=1000):
+    """
+    Re-score the readings of the last hours (all readings when None) of
+    the admitted patients (of every patient unless admitted_only)
+    Returns {'scanned': n, 'changed': n}
+    """
+    readings = VitalSign.objects.order_by()
+    if hours is not None:
+        readings = readings.filter(recorded_at__gte=timezone.now() - timedelta(hours=hours))
+    if admitted_only:
+        readings = readings.filter(patient_id__in=Subquery(_admitted_patient_ids()))
+
+    scanned, changed, patient_ids = 0, defaultdict(list), set()
+    for pk, patient_id, old_score, old_risk, *values in readings.values_list(
+        'pk', 'patient_id', 'news2_score', 'news2_risk', *PARAMETERS
+    ).iterator(chunk_size=batch_size):
+        scanned += 1
+        scored = news2(values)
+        if scored != (old_score, old_risk):
+            changed[scored].append(pk)
+            patient_ids.add(patient_id)
+    # Scores take few distinct values: one UPDATE per value (and batch)
+    # rather than a CASE over every row
+    with transaction.atomic():
+        for (score, risk), pks in changed.items():
+            for index in range(0, len(pks), batch_size):
+                VitalSign.objects.filter(pk__in=pks[index:index + batch_size]).update(
+                    news2_score=score, news2_risk=risk
+                )
+        # The summaries show the scores of recent vitals; a read rebuilds them
+        patient_ids = list(patient_ids)
+        for index in range(0, len(patient_ids), batch_size):
+            invalidate_summaries(patient_ids[index:index + batch_size], 'vitals')
+    return {'scanned': scanned, 'changed': sum(len(pks) for pks in changed.values())}
+
+
+def early_warning_board(hours=TREND_HOURS):
+    """
+    The admitted patients, highest latest score first: where they are,
+    their latest score and risk, and its trend over the last hours
+    """
+    admissions = {
+        row['patient_id']: row for row in Admission.objects.filter(
+            status='active', patient__isnull=False
+        ).order_by().values(
+            'patient_id', 'patient__first_name', 'patient__last_name',
+            'bed_id', 'bed__room__name', 'bed__room__ward__name',
+        )
+    }
+    readings = defaultdict(list)
+    for patient_id, recorded_at, score, risk in VitalSign.objects.filter(
+        patient_id__in=Subquery(_admitted_patient_ids()),
+        recorded_at__gte=timezone.now() - timedelta(hours=hours),
+        news2_score__isnull=False,
+    ).order_by('patient_id', 'recorded_at').values_list('patient_id', 'recorded_at', 'news2_score', 'news2_risk'):
+        readings[patient_id].append((recorded_at, score, risk))
+
+    board = []
+    for patient_id, admission in admissions.items():
+        history = readings.get(patient_id)
+        recorded_at, score, risk = history[-1] if history else (None, None, None)
+        board.append({
+            'patient_id': patient_id,
+            'patient': f"{admission['patient__first_name']} {admission['patient__last_name']}",
+            'bed_id': admission['bed_id'],
+            'room': admission['bed__room__name'],
+            'ward': admission['bed__room__ward__name'],
+            'news2_score': score,
+            'news2_risk': risk,
+            'trend': trend([reading[1] for reading in history]) if history else None,
+            'recorded_at': recorded_at.isoformat() if recorded_at else None,
+            'readings': len(history or []),
+        })
+    board.sort(key=lambda row: (row['news2_score'] is None, -(row['news2_score'] or 0), row['patient_id']))
+    return board
@@ -0,0 +1,24 @@
+"""
+Build bookable appointment slots from the doctors' weekly schedules
+
+Runs every few hours as a periodic task; run it by hand after changing
+schedules in the admin, or from cron without Celery beat.
+
+    python manage.py build_slots
+    python manage.py build_slots --doctor 12 --days 7
+"""
+from django.core.management.base import BaseCommand
+
+from healthManagement.slots import build_slots
+
+
+class Command(BaseCommand):
+    help = "Build appointment slots from doctor schedules"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--doctor', type=int, action='append', help='Only this doctor (repeatable)')
+        parser.add_argument('--days', type=int, default=None, help='Days ahead (default SLOT_HORIZON_DAYS)')
+
+    def handle(self, *args, **options):
+        result = build_slots(doctor_ids=options['doctor'], days=options['days'])
+        self.stdout.write(f"Created {result['created']} slots, removed {result['removed']}")
@@ -0,0 +1,25 @@
+"""
+Drop old notification deliveries and the notifications left without any
+
+Read deliveries go after NOTIFICATION_RETENTION_DAYS, unread ones after
+NOTIFICATION_UNREAD_RETENTION_DAYS; unread counters are adjusted. Meant for
+a nightly cron job.
+
+    python manage.py prune_notifications
+"""
+from django.core.management.base import BaseCommand
+
+from healthManagement.notifications import prune_notifications
+
+
+class Command(BaseCommand):
+    help = "Prune old notification deliveries and orphaned notifications"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000, help='Rows deleted per transaction')
+
+    def handle(self, *args, **options):
+        pruned = prune_notifications(batch_size=options['batch_size'])
+        self.stdout.write(
+            f"Pruned {pruned['deliveries']} deliveries and {pruned['notifications']} notifications"
+        )
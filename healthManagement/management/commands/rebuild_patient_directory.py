@@ -0,0 +1,23 @@
+"""
+Write the patient lookup keys of every patient
+
+Keys are written as users and profiles are saved; run this once after
+deploying the patient lookup, to cover the patients registered before, or
+after restoring a backup or bulk loading users.
+
+    python manage.py rebuild_patient_directory
+"""
+from django.core.management.base import BaseCommand
+
+from healthManagement.patient_directory import rebuild
+
+
+class Command(BaseCommand):
+    help = "Rebuild the patient lookup keys"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        added, removed = rebuild(options['batch_size'])
+        self.stdout.write(f"{added} keys added, {removed} removed")
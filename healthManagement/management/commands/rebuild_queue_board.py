@@ -0,0 +1,25 @@
+"""
+Rebuild today's department queue boards from the database
+
+Boards build themselves on first read; run this after editing
+appointments in the admin or moving doctors between departments.
+
+    python manage.py rebuild_queue_board
+    python manage.py rebuild_queue_board --department 3
+"""
+from django.core.management.base import BaseCommand
+
+from healthManagement.models import Department
+from healthManagement.queue_board import rebuild
+
+
+class Command(BaseCommand):
+    help = "Rebuild today's department queue boards"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--department', type=int, action='append', help='Only this department (repeatable)')
+
+    def handle(self, *args, **options):
+        department_ids = options['department'] or Department.objects.values_list('id', flat=True)
+        for department_id in department_ids:
+            self.stdout.write(f"Rebuilt {rebuild(department_id)}")
@@ -0,0 +1,29 @@
+"""
+Index every medical record, treatment, test result and doctor visit for
+clinical search
+
+Rows are indexed as they are saved; run this once after deploying search,
+to index the rows written before, or after restoring a backup.
+
+    python manage.py rebuild_search_index
+    python manage.py rebuild_search_index --kinds test_result,doctor_visit
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from healthManagement.clinical_search import KINDS, rebuild
+
+
+class Command(BaseCommand):
+    help = "Rebuild the clinical search index"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--kinds', default='', help=f"Comma separated subset of {', '.join(KINDS)}")
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        kinds = [kind for kind in options['kinds'].split(',') if kind]
+        unknown = sorted(set(kinds) - set(KINDS))
+        if unknown:
+            raise CommandError(f"Unknown kinds: {', '.join(unknown)}")
+        for kind, written in rebuild(options['batch_size'], kinds).items():
+            self.stdout.write(f"{kind}: {written} documents")
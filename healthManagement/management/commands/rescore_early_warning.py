@@ -0,0 +1,29 @@
+"""
+Re-score stored vital signs with the current early-warning bands
+
+New readings are scored as they are saved; run this after changing the
+bands in early_warning.py, or with --all once to score the readings taken
+before scoring existed.
+
+    python manage.py rescore_early_warning
+    python manage.py rescore_early_warning --hours 72
+    python manage.py rescore_early_warning --all
+"""
+from django.core.management.base import BaseCommand
+
+from healthManagement.early_warning import TREND_HOURS, rescore
+
+
+class Command(BaseCommand):
+    help = "Re-score the admitted patients' recent vital signs (NEWS2)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=int, default=TREND_HOURS, help='Readings of the last N hours')
+        parser.add_argument('--all', action='store_true', help="Every reading of every patient")
+
+    def handle(self, *args, **options):
+        if options['all']:
+            done = rescore(hours=None, admitted_only=False)
+        else:
+            done = rescore(hours=options['hours'])
+        self.stdout.write(f"{done['scanned']} readings scanned, {done['changed']} re-scored")
@@ -0,0 +1,32 @@
+"""
+Roll up the clinic statistics (see healthManagement/clinic_stats.py)
+
+Overlapping runs are safe: each batch of events and each day is claimed
+once. Without Celery beat, run it from cron every few minutes, or keep it
+running with --every.
+
+    python manage.py roll_up_clinic_stats
+    python manage.py roll_up_clinic_stats --every 300
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from healthManagement.tasks import roll_up_clinic_stats
+
+
+class Command(BaseCommand):
+    help = "Roll up the clinic wait-time and throughput statistics"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--every', type=int, default=0, help='Keep running, rolling up every N seconds')
+
+    def handle(self, *args, **options):
+        while True:
+            done = roll_up_clinic_stats()
+            self.stdout.write(f"{done['events']} events rolled up, {done['days_closed']} days closed")
+            if not options['every']:
+                break
+            close_old_connections()
+            time.sleep(options['every'])
@@ -0,0 +1,31 @@
+"""
+Send the appointment reminders that are due (24 hours and 1 hour before)
+
+Overlapping runs are safe: each reminder is claimed once. Without Celery
+beat, run it from cron every few minutes, or keep it running with --every.
+
+    python manage.py send_appointment_reminders
+    python manage.py send_appointment_reminders --every 300
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from healthManagement.tasks import send_appointment_reminders
+
+
+class Command(BaseCommand):
+    help = "Send due appointment reminders"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--every', type=int, default=0, help='Keep running, scanning every N seconds')
+
+    def handle(self, *args, **options):
+        while True:
+            sent = send_appointment_reminders()
+            self.stdout.write(", ".join(f"{count} {kind} reminders" for kind, count in sent.items()))
+            if not options['every']:
+                break
+            close_old_connections()
+            time.sleep(options['every'])
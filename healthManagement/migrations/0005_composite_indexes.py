@@ -0,0 +1,43 @@
+# Generated by Django 5.0.14 on 2026-10-18 23:28
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('healthManagement', '0004_delete_activity'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='admission',
+            index=models.Index(fields=['patient', 'status'], name='healthManag_patient_af7852_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['patient', 'appointment_date'], name='healthManag_patient_3f8dce_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bed',
+            index=models.Index(fields=['room', 'is_occupied'], name='healthManag_room_id_7703c6_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='medicalrecord',
+            index=models.Index(fields=['patient', 'date_created'], name='healthManag_patient_392263_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='testrequest',
+            index=models.Index(fields=['status', 'created_at'], name='healthManag_status_488275_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='testrequest',
+            index=models.Index(fields=['created_at'], name='healthManag_created_46976e_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='vitalsign',
+            index=models.Index(fields=['patient', 'recorded_at'], name='healthManag_patient_0408a0_idx'),
+        ),
+    ]
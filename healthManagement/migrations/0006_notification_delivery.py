@@ -0,0 +1,94 @@
+# Generated by Django 5.0.14 on 2026-10-18 23:30
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+def copy_receivers(apps, schema_editor):
+    """
+    One delivery per existing (notification, receiver) pair. The old shared
+    is_read flag becomes read_at on every copy of that notification
+    """
+    Notification = apps.get_model('healthManagement', 'Notification')
+    NotificationDelivery = apps.get_model('healthManagement', 'NotificationDelivery')
+    NotificationCounter = apps.get_model('healthManagement', 'NotificationCounter')
+    Through = Notification.receivers.through
+
+    rows = Through.objects.values_list(
+        'notification_id', 'customuser_id', 'notification__is_read', 'notification__created_at'
+    ).iterator(chunk_size=2000)
+    batch = []
+    unread = {}
+    for notification_id, user_id, is_read, created_at in rows:
+        batch.append(NotificationDelivery(
+            notification_id=notification_id,
+            receiver_id=user_id,
+            read_at=created_at if is_read else None,
+            created_at=created_at,
+        ))
+        if not is_read:
+            unread[user_id] = unread.get(user_id, 0) + 1
+        if len(batch) >= 2000:
+            NotificationDelivery.objects.bulk_create(batch)
+            batch = []
+    NotificationDelivery.objects.bulk_create(batch)
+
+    NotificationCounter.objects.bulk_create(
+        [NotificationCounter(user_id=user_id, unread=count) for user_id, count in unread.items()],
+        batch_size=2000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0001_initial'),
+        ('healthManagement', '0005_composite_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationCounter',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='notification_counter', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('unread', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='NotificationDelivery',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('read_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('notification', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='deliveries', to='healthManagement.notification')),
+                ('receiver', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='notification_deliveries', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('notification', 'receiver')},
+                'indexes': [models.Index(fields=['receiver', 'read_at', 'created_at'], name='healthManag_receive_da8803_idx')],
+            },
+        ),
+        migrations.RunPython(copy_receivers, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='notification',
+            name='healthManag_is_read_559552_idx',
+        ),
+        migrations.RemoveField(
+            model_name='notification',
+            name='is_read',
+        ),
+        # A through model cannot be added to an existing M2M in place: drop
+        # the auto-created table (its rows were copied above) and re-add
+        migrations.RemoveField(
+            model_name='notification',
+            name='receivers',
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='receivers',
+            field=models.ManyToManyField(help_text='Users who will receive the notification', related_name='received_notifications', through='healthManagement.NotificationDelivery', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.0.14 on 2026-10-18 23:34
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('healthManagement', '0006_notification_delivery'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='notificationdelivery',
+            index=models.Index(fields=['receiver', 'created_at'], name='healthManag_receive_f8e208_idx'),
+        ),
+    ]
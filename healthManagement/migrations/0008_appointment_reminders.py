@@ -0,0 +1,44 @@
+# Generated by Django 5.0.14 on 2026-10-18 23:48
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('healthManagement', '0007_notification_inbox_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AppointmentReminder',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('24h', '24 hours before'), ('1h', '1 hour before')], max_length=5)),
+                ('appointment_date', models.DateTimeField()),
+                ('run', models.CharField(max_length=32)),
+                ('sent_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['appointment_date'], name='healthManag_appoint_640fd9_idx'),
+        ),
+        migrations.AddField(
+            model_name='appointmentreminder',
+            name='appointment',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reminders', to='healthManagement.appointment'),
+        ),
+        migrations.AddIndex(
+            model_name='appointmentreminder',
+            index=models.Index(fields=['run'], name='healthManag_run_16791b_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='appointmentreminder',
+            unique_together={('appointment', 'kind', 'appointment_date')},
+        ),
+    ]
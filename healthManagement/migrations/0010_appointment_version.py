@@ -0,0 +1,18 @@
+# Generated by Django 5.0.14 on 2026-10-19 00:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('healthManagement', '0009_slot_calendar'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='appointment',
+            name='version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
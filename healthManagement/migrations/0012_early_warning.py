@@ -0,0 +1,29 @@
+# Generated by Django 5.0.14 on 2026-10-19 00:19
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('healthManagement', '0011_clinic_stats'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='vitalsign',
+            name='news2_risk',
+            field=models.CharField(blank=True, choices=[('low', 'Low'), ('low_medium', 'Low-medium'), ('medium', 'Medium'), ('high', 'High')], editable=False, max_length=10),
+        ),
+        migrations.AddField(
+            model_name='vitalsign',
+            name='news2_score',
+            field=models.PositiveSmallIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='admission',
+            index=models.Index(fields=['status', 'patient'], name='healthManag_status_f873c9_idx'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.0.14 on 2026-10-19 00:22
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('healthManagement', '0012_early_warning'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='vitalsign',
+            name='recorded_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
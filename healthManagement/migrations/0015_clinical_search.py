@@ -0,0 +1,74 @@
+# Generated by Django 5.0.14 on 2026-10-19 00:35
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+# Full-text index over ClinicalDocument.text (see healthManagement/clinical_search.py),
+# an external-content FTS5 table kept in step by triggers (with prefix indexes
+# for word* queries); SQLite only
+FTS_TABLE = 'healthManagement_clinicalsearch'
+DOCUMENTS = 'healthManagement_clinicaldocument'
+
+
+def create_search_table(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5("
+        f"text, content='{DOCUMENTS}', content_rowid='id', tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+    )
+    schema_editor.execute(
+        f"CREATE TRIGGER {FTS_TABLE}_insert AFTER INSERT ON {DOCUMENTS} BEGIN "
+        f"INSERT INTO {FTS_TABLE}(rowid, text) VALUES (new.id, new.text); END"
+    )
+    schema_editor.execute(
+        f"CREATE TRIGGER {FTS_TABLE}_delete AFTER DELETE ON {DOCUMENTS} BEGIN "
+        f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, text) VALUES ('delete', old.id, old.text); END"
+    )
+    schema_editor.execute(
+        f"CREATE TRIGGER {FTS_TABLE}_update AFTER UPDATE OF text ON {DOCUMENTS} BEGIN "
+        f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, text) VALUES ('delete', old.id, old.text); "
+        f"INSERT INTO {FTS_TABLE}(rowid, text) VALUES (new.id, new.text); END"
+    )
+
+
+def drop_search_table(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for trigger in ('insert', 'delete', 'update'):
+        schema_editor.execute(f"DROP TRIGGER IF EXISTS {FTS_TABLE}_{trigger}")
+    schema_editor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('healthManagement', '0014_patient_summary'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClinicalDocument',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('record', 'Medical record'), ('treatment', 'Treatment'), ('test_result', 'Test result'), ('doctor_visit', 'Doctor visit')], max_length=20)),
+                ('object_id', models.PositiveBigIntegerField()),
+                ('occurred_at', models.DateTimeField()),
+                ('title', models.CharField(blank=True, max_length=255)),
+                ('text', models.TextField()),
+                ('updated_at', models.DateTimeField(auto_now=True, db_index=True)),
+                ('doctor', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('patient', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['patient', 'occurred_at'], name='healthManag_patient_5f7520_idx'), models.Index(fields=['doctor', 'occurred_at'], name='healthManag_doctor__2bc661_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='clinicaldocument',
+            constraint=models.UniqueConstraint(fields=('kind', 'object_id'), name='unique_clinical_document'),
+        ),
+        migrations.RunPython(create_search_table, drop_search_table),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.0.14 on 2026-10-19 00:47
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('healthManagement', '0015_clinical_search'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PatientLookupKey',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('name', 'Name'), ('phone', 'Phone'), ('national_id', 'National ID'), ('email', 'Email')], max_length=12)),
+                ('key', models.CharField(max_length=255)),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lookup_keys', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['key', 'kind', 'patient'], name='healthManag_key_262727_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='patientlookupkey',
+            constraint=models.UniqueConstraint(fields=('patient', 'kind', 'key'), name='unique_patient_lookup_key'),
+        ),
+    ]
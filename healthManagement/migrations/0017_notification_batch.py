@@ -0,0 +1,24 @@
+# Generated by Django 5.0.14 on 2026-10-19 01:14
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('healthManagement', '0016_patient_directory'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='batch',
+            field=models.CharField(blank=True, max_length=48, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['batch'], name='healthManag_batch_ad9806_idx'),
+        ),
+    ]
@@ -146,18 +146,261 @@ class Appointment(models.Model):
         default='pending'
     )
     appointment_date = models.DateTimeField()
+    # Bumped by every save; clients send it back so a stale change is refused (see transitions.py)
+    version = models.PositiveIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['-appointment_date']
-        unique_together = ['doctor', 'appointment_date']
+        constraints = [
+            # A doctor's time can be booked again once the appointment there is cancelled
+            models.UniqueConstraint(
+                fields=['doctor', 'appointment_date'],
+                condition=models.Q(status__in=['pending', 'confirmed']),
+                name='unique_active_doctor_appointment',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['doctor', 'appointment_date']),
+            models.Index(fields=['patient', 'appointment_date']),
+            # reminder scheduler time windows
+            models.Index(fields=['appointment_date']),
+        ]
 
     def __str__(self):
         return f"Appointment #{self.id} - {self.patient} with Dr. {self.doctor}"
 
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if self._state.adding or (update_fields is not None and 'version' in update_fields):
+            super().save(*args, **kwargs)
+            return
+        # Bumped in the database: a save from a stale instance still moves
+        # past every version another writer has used
+        self.version = models.F('version') + 1
+        if update_fields is not None:
+            kwargs['update_fields'] = [*update_fields, 'version']
+        super().save(*args, **kwargs)
+        self.refresh_from_db(fields=['version'])
+
+
+class DoctorSchedule(models.Model):
+    """
+    A block of a doctor's weekly working hours, cut into bookable slots
+    (see healthManagement/slots.py); a day may have several blocks
+    """
+    WEEKDAY_CHOICES = [
+        (0, 'Monday'),
+        (1, 'Tuesday'),
+        (2, 'Wednesday'),
+        (3, 'Thursday'),
+        (4, 'Friday'),
+        (5, 'Saturday'),
+        (6, 'Sunday'),
+    ]
+
+    doctor = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='schedules',
+        limit_choices_to={'role__name': 'doctor'}
+    )
+    weekday = models.PositiveSmallIntegerField(choices=WEEKDAY_CHOICES)
+    start_time = models.TimeField()
+    end_time = models.TimeField()
+    slot_minutes = models.PositiveSmallIntegerField(default=30)
+
+    class Meta:
+        ordering = ['weekday', 'start_time']
+        indexes = [
+            models.Index(fields=['doctor', 'weekday']),
+        ]
+
+    def clean(self):
+        if self.start_time >= self.end_time:
+            raise ValidationError("start_time must be before end_time.")
+
+    def __str__(self):
+        return f"Dr. {self.doctor} - {self.get_weekday_display()} {self.start_time}-{self.end_time}"
+
+
+class AppointmentSlot(models.Model):
+    """
+    One bookable slot of a doctor, precomputed from DoctorSchedule for the
+    next SLOT_HORIZON_DAYS days; booking claims it by setting appointment
+    """
+    doctor = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='appointment_slots'
+    )
+    # The doctor's department, copied so "free slots in department X" needs no join
+    department = models.ForeignKey(
+        Department,
+        on_delete=models.SET_NULL,
+        null=True, blank=True,
+        related_name='appointment_slots',
+        # covered by the free_slots_by_department index
+        db_index=False
+    )
+    start = models.DateTimeField()
+    end = models.DateTimeField()
+    is_available = models.BooleanField(default=True)
+    appointment = models.OneToOneField(
+        Appointment,
+        on_delete=models.SET_NULL,
+        null=True, blank=True,
+        related_name='slot'
+    )
+
+    class Meta:
+        ordering = ['start']
+        # (doctor, start) also serves a doctor's free slots
+        unique_together = ['doctor', 'start']
+        indexes = [
+            # Only free slots are indexed, so taken ones cost the department query nothing
+            models.Index(
+                fields=['department', 'start'],
+                condition=models.Q(is_available=True),
+                name='free_slots_by_department',
+            ),
+        ]
+
+    def __str__(self):
+        return f"Dr. {self.doctor} {self.start:%Y-%m-%d %H:%M} ({'free' if self.is_available else 'taken'})"
 
 
+class AppointmentReminder(models.Model):
+    """
+    A reminder sent for an appointment (see healthManagement/reminders.py)
+    One per kind and appointment date, so a rescheduled appointment is reminded again
+    """
+    KIND_CHOICES = [
+        ('24h', '24 hours before'),
+        ('1h', '1 hour before'),
+    ]
+
+    appointment = models.ForeignKey(Appointment, on_delete=models.CASCADE, related_name='reminders')
+    kind = models.CharField(max_length=5, choices=KIND_CHOICES)
+    appointment_date = models.DateTimeField()
+    # Token of the scheduler run that claimed it
+    run = models.CharField(max_length=32)
+    sent_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        unique_together = ['appointment', 'kind', 'appointment_date']
+        indexes = [
+            models.Index(fields=['run']),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} reminder for appointment #{self.appointment_id}"
+
+
+class AppointmentEvent(models.Model):
+    """
+    Append-only log of appointment transitions (see transitions.py), with
+    the doctor and department of the moment copied in; the clinic
+    statistics are rolled up from it (see clinic_stats.py)
+    """
+    appointment = models.ForeignKey(
+        Appointment,
+        on_delete=models.CASCADE,
+        related_name='events',
+        # covered by the (appointment, action) index
+        db_index=False
+    )
+    action = models.CharField(max_length=30)
+    actor = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True, blank=True,
+        related_name='+'
+    )
+    doctor = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='+',
+        db_index=False
+    )
+    department = models.ForeignKey(
+        Department,
+        on_delete=models.SET_NULL,
+        null=True, blank=True,
+        related_name='+',
+        db_index=False
+    )
+    occurred_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            # stage timestamps of a batch of appointments
+            models.Index(fields=['appointment', 'action']),
+        ]
+
+    def __str__(self):
+        return f"{self.action} on appointment #{self.appointment_id} at {self.occurred_at}"
+
+
+class ClinicDailyStats(models.Model):
+    """
+    A department's day: arrivals, completions and cancellations rolled up
+    from AppointmentEvent as they happen; scheduled and no-shows once the
+    day is closed
+    """
+    department = models.ForeignKey(Department, on_delete=models.CASCADE, related_name='daily_stats')
+    date = models.DateField()
+    arrived = models.PositiveIntegerField(default=0)
+    completed = models.PositiveIntegerField(default=0)
+    cancelled = models.PositiveIntegerField(default=0)
+    scheduled = models.PositiveIntegerField(default=0)
+    no_shows = models.PositiveIntegerField(default=0)
+    closed = models.BooleanField(default=False)
+
+    class Meta:
+        unique_together = ['department', 'date']
+
+    def __str__(self):
+        return f"{self.department} on {self.date}"
+
+
+class WaitTimeBucket(models.Model):
+    """
+    Histogram of one waiting time of a department's day, by whole minutes;
+    medians and percentiles are read from it
+    """
+    department = models.ForeignKey(Department, on_delete=models.CASCADE, related_name='+')
+    date = models.DateField()
+    metric = models.CharField(max_length=20)
+    minutes = models.PositiveIntegerField()
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ['department', 'date', 'metric', 'minutes']
+
+
+class DoctorDailyStats(models.Model):
+    """Consultations a doctor finished in a day, and their total length"""
+    doctor = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='daily_stats')
+    department = models.ForeignKey(Department, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    date = models.DateField()
+    completed = models.PositiveIntegerField(default=0)
+    consultation_seconds = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ['doctor', 'date']
+        indexes = [
+            models.Index(fields=['department', 'date']),
+        ]
+
+
+class ClinicStatsProgress(models.Model):
+    """How far the clinic statistics have been rolled up (a single row)"""
+    last_event_id = models.BigIntegerField(default=0)
+    # Days up to and including this one have their scheduled / no-show counts
+    closed_through = models.DateField(null=True, blank=True)
+
 
 class Notification(models.Model):
     """
@@ -173,19 +416,22 @@ class Notification(models.Model):
     )
     receivers = models.ManyToManyField(
         settings.AUTH_USER_MODEL,
+        through='NotificationDelivery',
         related_name='received_notifications',
         help_text="Users who will receive the notification"
     )
     title = models.CharField(max_length=200)
     message = models.TextField()
-    is_read = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Token of the notify_many() call that wrote it, on databases that
+    # return no primary keys from bulk inserts (see notifications.py)
+    batch = models.CharField(max_length=48, null=True, blank=True)
     
     class Meta:
         ordering = ['-created_at']
         indexes = [
-            models.Index(fields=['is_read']),
             models.Index(fields=['created_at']),
+            models.Index(fields=['batch']),
         ]
     
     def __str__(self):
@@ -194,6 +440,104 @@ class Notification(models.Model):
         return f"{self.title} - From: {sender} To: {receiver_count} recipient(s)"
 
 
+class NotificationDelivery(models.Model):
+    """
+    One receiver's copy of a notification
+    Read state lives here, so reading a notification only marks it read
+    for that receiver
+    """
+    notification = models.ForeignKey(
+        Notification,
+        on_delete=models.CASCADE,
+        related_name='deliveries'
+    )
+    receiver = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='notification_deliveries'
+    )
+    read_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        unique_together = ['notification', 'receiver']
+        indexes = [
+            # unread badge / unread-only inbox
+            models.Index(fields=['receiver', 'read_at', 'created_at']),
+            # inbox pages, newest first
+            models.Index(fields=['receiver', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"Notification #{self.notification_id} -> user #{self.receiver_id}"
+
+
+class NotificationCounter(models.Model):
+    """Unread notifications per user, kept in step with NotificationDelivery"""
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='notification_counter'
+    )
+    unread = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.user_id}: {self.unread} unread"
+
+
+class PatientLookupKey(models.Model):
+    """A normalized key a patient is found by in the patient directory (see patient_directory.py)"""
+    KIND_CHOICES = [
+        ('name', 'Name'),
+        ('phone', 'Phone'),
+        ('national_id', 'National ID'),
+        ('email', 'Email'),
+    ]
+
+    patient = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='lookup_keys'
+    )
+    kind = models.CharField(max_length=12, choices=KIND_CHOICES)
+    key = models.CharField(max_length=255)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['patient', 'kind', 'key'], name='unique_patient_lookup_key'),
+        ]
+        indexes = [
+            # prefix lookups are range scans over key; kind and patient come from the index
+            models.Index(fields=['key', 'kind', 'patient']),
+        ]
+
+    def __str__(self):
+        return f"{self.kind}: {self.key}"
+
+
+class PatientSummary(models.Model):
+    """
+    A patient's summary (profile, current admission, active medications,
+    recent vitals) as one precomputed document, see patient_summary.py
+    """
+    patient = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='summary'
+    )
+    data = models.JSONField(default=dict)
+    # Bumped on every rebuild
+    version = models.PositiveIntegerField(default=0)
+    # Sections changed since they were built, one bit each (patient_summary.SECTIONS)
+    stale = models.PositiveSmallIntegerField(default=0)
+    built_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Summary of {self.patient_id} (v{self.version})"
+
+
 
 
 class VitalSign(models.Model):
@@ -205,7 +549,8 @@ class VitalSign(models.Model):
         limit_choices_to={'role__name': 'patient'}
     )
     recorded_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True)
-    recorded_at = models.DateTimeField(auto_now_add=True)
+    # When the reading was taken; devices sending in bulk give their own time
+    recorded_at = models.DateTimeField(default=timezone.now)
 
     temperature_c = models.DecimalField(max_digits=4, decimal_places=1, help_text="Body temperature in Celsius")
     pulse_rate = models.PositiveIntegerField(help_text="Heart rate in beats per minute (bpm)")
@@ -217,8 +562,21 @@ class VitalSign(models.Model):
     height_cm = models.DecimalField(max_digits=5, decimal_places=2, null=True, blank=True)
     notes = models.TextField(blank=True, null=True)
 
+    # Early-warning score of the reading, set on save (see early_warning.py)
+    NEWS2_RISK_CHOICES = [
+        ('low', 'Low'),
+        ('low_medium', 'Low-medium'),
+        ('medium', 'Medium'),
+        ('high', 'High'),
+    ]
+    news2_score = models.PositiveSmallIntegerField(null=True, blank=True, editable=False)
+    news2_risk = models.CharField(max_length=10, choices=NEWS2_RISK_CHOICES, blank=True, editable=False)
+
     class Meta:
         ordering = ['-recorded_at']
+        indexes = [
+            models.Index(fields=['patient', 'recorded_at']),
+        ]
 
     def __str__(self):
         return f"Vitals for {self.patient} at {self.recorded_at.strftime('%Y-%m-%d %H:%M')}"
@@ -295,6 +653,9 @@ class MedicalRecord(models.Model):
 
     class Meta:
         ordering = ['-date_created']
+        indexes = [
+            models.Index(fields=['patient', 'date_created']),
+        ]
 
     def __str__(self):
         return f"{self.patient.email}: {self.diagnosis} ({self.get_status_display()})"
@@ -517,6 +878,10 @@ class Bed(models.Model):
     created_at = models.DateTimeField(auto_now_add=True, null=True, blank=True)
     is_occupied = models.BooleanField(default=False)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['room', 'is_occupied']),
+        ]
     
     def __str__(self):
         if self.patient and self.is_occupied:
@@ -575,6 +940,11 @@ class Admission(models.Model):
     
     class Meta:
         ordering = ['-admission_date']
+        indexes = [
+            models.Index(fields=['patient', 'status']),
+            # admitted patients (early-warning board)
+            models.Index(fields=['status', 'patient']),
+        ]
     
     def __str__(self):
         return f"{self.patient.email} - {self.bed} ({self.status})"
@@ -750,6 +1120,11 @@ class TestRequest(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+            # unfiltered list, newest first
+            models.Index(fields=['created_at']),
+        ]
     
     def __str__(self):
         if self.patient:
@@ -857,6 +1232,50 @@ class TestResult(models.Model):
 
 
 # i need drug model here
+class ClinicalDocument(models.Model):
+    """
+    The searchable text of one medical record, treatment, test result or
+    doctor visit, with what search results are filtered on (see clinical_search.py)
+    """
+    KIND_CHOICES = [
+        ('record', 'Medical record'),
+        ('treatment', 'Treatment'),
+        ('test_result', 'Test result'),
+        ('doctor_visit', 'Doctor visit'),
+    ]
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    object_id = models.PositiveBigIntegerField()
+    patient = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        null=True,
+        related_name='+'
+    )
+    doctor = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        related_name='+'
+    )
+    occurred_at = models.DateTimeField()
+    title = models.CharField(max_length=255, blank=True)
+    text = models.TextField()
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'object_id'], name='unique_clinical_document'),
+        ]
+        indexes = [
+            models.Index(fields=['patient', 'occurred_at']),
+            models.Index(fields=['doctor', 'occurred_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.object_id}"
+
+
 class Drug(models.Model):
     """
     Model to represent a medication or drug
@@ -0,0 +1,250 @@
+"""
+Notification inbox: fan-out, paging, read state and unread counters
+
+- notify() writes a notification and all of its deliveries with one bulk
+  insert, however many receivers there are; notify_many() does the same
+  for a batch of notifications
+- every receiver has a NotificationDelivery row; read_at is theirs alone
+- on databases that return no primary keys from a bulk insert (MySQL),
+  notify_many() tags its notifications with a batch token and selects
+  them back by it, as reminders.py claims its rows
+- inbox() returns the newest page of a user's notifications plus a cursor
+  for older ones, so pushes stay small for long-tenured staff
+- NotificationCounter holds each user's unread total, so a badge is one
+  primary key lookup instead of a COUNT over the receivers join
+- counters follow the deliveries: receivers.add()/remove()/clear() and
+  deleting a notification are handled in signals.py; notify(),
+  mark_read() and prune_notifications() adjust them themselves
+"""
+import base64
+import binascii
+import uuid
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, F, Q
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from pagination import MAX_PAGE_SIZE
+
+from .models import Notification, NotificationCounter, NotificationDelivery
+
+
+def adjust_unread(deltas):
+    """
+    Apply {user_id: change} to the unread counters
+    - creates missing counter rows; never goes below zero
+    - users sharing the same change are updated with one statement
+    """
+    deltas = {user_id: delta for user_id, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    NotificationCounter.objects.bulk_create(
+        [NotificationCounter(user_id=user_id) for user_id in deltas],
+        ignore_conflicts=True,
+    )
+    by_delta = defaultdict(list)
+    for user_id, delta in deltas.items():
+        by_delta[delta].append(user_id)
+    for delta, user_ids in by_delta.items():
+        NotificationCounter.objects.filter(user_id__in=user_ids).update(
+            unread=Greatest(F('unread') + delta, 0)
+        )
+
+
+def unread_deltas(deliveries):
+    """{receiver_id: -unread} for the deliveries about to be removed"""
+    rows = (
+        deliveries.filter(read_at__isnull=True)
+        .values('receiver_id')
+        .annotate(unread=Count('id'))
+        .order_by()
+    )
+    return {row['receiver_id']: -row['unread'] for row in rows}
+
+
+def rebuild_unread_counters(user_ids):
+    """Recount the unread deliveries of the given users; returns {user_id: unread}"""
+    counts = dict.fromkeys(user_ids, 0)
+    rows = (
+        NotificationDelivery.objects.filter(receiver_id__in=user_ids, read_at__isnull=True)
+        .values('receiver_id')
+        .annotate(unread=Count('id'))
+        .order_by()
+    )
+    for row in rows:
+        counts[row['receiver_id']] = row['unread']
+    with transaction.atomic():
+        for user_id, unread in counts.items():
+            NotificationCounter.objects.update_or_create(user_id=user_id, defaults={'unread': unread})
+    return counts
+
+
+def unread_count(user_id):
+    unread = NotificationCounter.objects.filter(user_id=user_id).values_list('unread', flat=True).first()
+    if unread is None:
+        # No counter yet (user never received anything since counters were added)
+        return rebuild_unread_counters([user_id])[user_id]
+    return unread
+
+
+def mark_read(user_id, notification_ids=None):
+    """
+    Mark the user's unread deliveries read - all of them, or only those of
+    notification_ids - and move the counter by the same amount
+    Returns (number marked, unread left)
+    """
+    with transaction.atomic():
+        deliveries = NotificationDelivery.objects.filter(receiver_id=user_id, read_at__isnull=True)
+        if notification_ids is not None:
+            deliveries = deliveries.filter(notification_id__in=notification_ids)
+        marked = deliveries.update(read_at=timezone.now())
+        adjust_unread({user_id: -marked})
+    return marked, unread_count(user_id)
+
+
+def notify(receivers, title, message, sender=None):
+    """
+    Create a notification for receivers (users or user ids; duplicates and
+    None are dropped): one INSERT for the notification, one bulk INSERT for
+    the deliveries and one counter update
+    """
+    user_ids = list(dict.fromkeys(
+        getattr(receiver, 'pk', receiver) for receiver in receivers if receiver is not None
+    ))
+    with transaction.atomic():
+        notification = Notification.objects.create(sender=sender, title=title, message=message)
+        # bulk_create sends no m2m_changed, so the counters are moved here
+        NotificationDelivery.objects.bulk_create([
+            NotificationDelivery(notification=notification, receiver_id=user_id, created_at=notification.created_at)
+            for user_id in user_ids
+        ])
+        adjust_unread(dict.fromkeys(user_ids, 1))
+    return notification
+
+
+def notify_many(items, batch_size=1000):
+    """
+    Bulk notify(): items are (receivers, title, message, sender) tuples.
+    Notifications, deliveries and counters are each written with bulk
+    statements. Returns the notifications
+    """
+    items = list(items)
+    # Without primary keys back, each notification gets token-index so it can be selected again
+    token = None if connection.features.can_return_rows_from_bulk_insert else uuid.uuid4().hex
+    with transaction.atomic():
+        notifications = Notification.objects.bulk_create(
+            [
+                Notification(
+                    sender=sender, title=title, message=message, batch=token and f'{token}-{index}'
+                )
+                for index, (_, title, message, sender) in enumerate(items)
+            ],
+            batch_size=batch_size,
+        )
+        if token:
+            created = {
+                notification.batch: notification
+                for notification in Notification.objects.filter(batch__startswith=f'{token}-')
+            }
+            notifications = [created[f'{token}-{index}'] for index in range(len(items))]
+        deliveries = []
+        unread = Counter()
+        for notification, (receivers, *_) in zip(notifications, items):
+            user_ids = dict.fromkeys(
+                getattr(receiver, 'pk', receiver) for receiver in receivers if receiver is not None
+            )
+            for user_id in user_ids:
+                deliveries.append(NotificationDelivery(
+                    notification=notification, receiver_id=user_id, created_at=notification.created_at
+                ))
+                unread[user_id] += 1
+        NotificationDelivery.objects.bulk_create(deliveries, batch_size=batch_size)
+        adjust_unread(unread)
+    return notifications
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def _encode_cursor(delivery):
+    return base64.urlsafe_b64encode(f"{delivery.created_at.isoformat()}|{delivery.pk}".encode()).decode()
+
+
+def _decode_cursor(cursor):
+    try:
+        created_at, pk = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return datetime.fromisoformat(created_at), int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise InvalidCursor('Invalid cursor')
+
+
+def inbox(user_id, limit=None, cursor=None, unread_only=False):
+    """
+    One page of a user's notifications, newest first
+    - keyset pagination on the delivery's (created_at, id), so older pages
+      cost the same as the first
+    - each notification carries this user's read_at
+    Returns (notifications, next_cursor); raises InvalidCursor
+    """
+    limit = max(1, min(limit or settings.NOTIFICATION_PAGE_SIZE, MAX_PAGE_SIZE))
+
+    deliveries = NotificationDelivery.objects.filter(receiver_id=user_id)
+    if unread_only:
+        deliveries = deliveries.filter(read_at__isnull=True)
+    if cursor:
+        created_at, pk = _decode_cursor(cursor)
+        deliveries = deliveries.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, pk__lt=pk))
+
+    rows = list(
+        deliveries.select_related('notification__sender__profile')
+        .order_by('-created_at', '-pk')[:limit + 1]
+    )
+    next_cursor = _encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+
+    notifications = []
+    for delivery in rows[:limit]:
+        notification = delivery.notification
+        notification.read_at = delivery.read_at
+        notifications.append(notification)
+    return notifications, next_cursor
+
+
+def prune_notifications(batch_size=2000):
+    """
+    Drop read deliveries older than NOTIFICATION_RETENTION_DAYS and unread
+    ones older than NOTIFICATION_UNREAD_RETENTION_DAYS, then notifications
+    nobody holds a delivery for any more
+    Returns {'deliveries': n, 'notifications': n}
+    """
+    now = timezone.now()
+    read_cutoff = now - timedelta(days=settings.NOTIFICATION_RETENTION_DAYS)
+    unread_cutoff = now - timedelta(days=settings.NOTIFICATION_UNREAD_RETENTION_DAYS)
+    stale = NotificationDelivery.objects.filter(
+        Q(read_at__isnull=False, created_at__lt=read_cutoff)
+        | Q(read_at__isnull=True, created_at__lt=unread_cutoff)
+    )
+
+    pruned = {'deliveries': 0, 'notifications': 0}
+    while True:
+        ids = list(stale.values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            break
+        with transaction.atomic():
+            batch = NotificationDelivery.objects.filter(pk__in=ids)
+            adjust_unread(unread_deltas(batch))
+            pruned['deliveries'] += batch.delete()[0]
+
+    orphans = Notification.objects.filter(deliveries__isnull=True, created_at__lt=read_cutoff)
+    while True:
+        ids = list(orphans.values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            break
+        pruned['notifications'] += Notification.objects.filter(pk__in=ids).delete()[1].get(
+            Notification._meta.label, 0
+        )
+    return pruned
@@ -0,0 +1,198 @@
+"""
+Patient directory lookup
+
+Front desks find a patient by typing part of a name, phone number,
+national ID or email, without downloading the patient list:
+- every patient has PatientLookupKeys, normalized as queries are: name
+  tokens and emails lowercased without accents, phone numbers as digits
+  (also without the leading 0s of a local number), national IDs as letters
+  and digits. Saving a patient's user or profile rewrites them
+  (signals.py); rebuild_patient_directory writes them for every patient
+- a query is split into tokens, each of which must match a key of the
+  patient; a token matches a key it starts. Each token is a range scan of
+  the (key, kind, patient) index; one query groups the keys found by
+  patient, keeps the patients every token matched and ranks them
+- a token matching a whole key scores higher than a prefix; the best
+  scores come first, then by name
+"""
+import re
+import unicodedata
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Case, F, Max, Q, Value, When
+from django.db.models.functions import Lower
+
+from accounts.models import CustomUser
+
+from .models import PatientLookupKey
+
+MIN_PREFIX = 2
+MIN_DIGITS = 3
+MAX_TOKENS = 5
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 50
+
+# Whole queries that are one phone number or numeric ID, spaces and all
+PHONE_QUERY = re.compile(r'^[\d\s()+\-.]+$')
+
+
+def _fold(text):
+    """Lowercase, without accents"""
+    return ''.join(
+        char for char in unicodedata.normalize('NFKD', (text or '').lower()) if not unicodedata.combining(char)
+    )
+
+
+def _alphanumeric(text):
+    return re.sub(r'[^\w]|_', '', _fold(text))
+
+
+def _phone_keys(phone):
+    digits = re.sub(r'\D', '', phone or '')
+    return {key for key in (digits, digits.lstrip('0')) if len(key) >= MIN_DIGITS}
+
+
+def keys_of(first_name, last_name, email, phone_number, national_id):
+    """{(kind, key)} a patient is found by"""
+    keys = {('name', token) for token in re.findall(r'[^\W_]+', _fold(f"{first_name or ''} {last_name or ''}"))}
+    keys |= {('phone', key) for key in _phone_keys(phone_number)}
+    if _alphanumeric(national_id):
+        keys.add(('national_id', _alphanumeric(national_id)))
+    if email:
+        keys.add(('email', _fold(email)))
+    return {(kind, key[:255]) for kind, key in keys}
+
+
+def _patient_keys(patient_ids):
+    """{patient_id: {(kind, key)}} of the patients among patient_ids"""
+    return {
+        row['pk']: keys_of(
+            row['first_name'], row['last_name'], row['email'], row['profile__phone_number'], row['profile__national_id']
+        )
+        for row in CustomUser.objects.filter(pk__in=patient_ids, role__name='patient').values(
+            'pk', 'first_name', 'last_name', 'email', 'profile__phone_number', 'profile__national_id'
+        )
+    }
+
+
+def update_keys(user_ids, batch_size=1000):
+    """
+    Rewrite the lookup keys of the users that changed (none for users who
+    are not patients); only keys that differ are written
+    """
+    user_ids = list(user_ids)
+    wanted = _patient_keys(user_ids)
+    existing = defaultdict(dict)
+    for pk, patient_id, kind, key in PatientLookupKey.objects.filter(
+        patient_id__in=user_ids
+    ).values_list('pk', 'patient_id', 'kind', 'key'):
+        existing[patient_id][(kind, key)] = pk
+
+    removed, added = [], []
+    for user_id in user_ids:
+        keys = wanted.get(user_id, set())
+        removed += [pk for kind_key, pk in existing[user_id].items() if kind_key not in keys]
+        added += [
+            PatientLookupKey(patient_id=user_id, kind=kind, key=key)
+            for kind, key in keys if (kind, key) not in existing[user_id]
+        ]
+    with transaction.atomic():
+        if removed:
+            PatientLookupKey.objects.filter(pk__in=removed).delete()
+        PatientLookupKey.objects.bulk_create(added, batch_size=batch_size)
+    return len(added), len(removed)
+
+
+def rebuild(batch_size=1000):
+    """Write the lookup keys of every patient; returns (keys added, keys removed)"""
+    added = removed = 0
+    patient_ids = list(CustomUser.objects.filter(role__name='patient').order_by('pk').values_list('pk', flat=True))
+    for index in range(0, len(patient_ids), batch_size):
+        done = update_keys(patient_ids[index:index + batch_size], batch_size)
+        added, removed = added + done[0], removed + done[1]
+    # Users who are no longer patients
+    stale = PatientLookupKey.objects.exclude(patient__role__name='patient')
+    removed += stale.count()
+    stale.delete()
+    return added, removed
+
+
+def parse_query(query):
+    """
+    [(kinds, prefixes)] per token of a query: the key kinds it is looked
+    up in, and what their keys may start with
+    """
+    query = (query or '').strip()
+    if PHONE_QUERY.match(query):
+        digits = re.sub(r'\D', '', query)
+        if len(digits) >= MIN_DIGITS:
+            return [(('phone', 'national_id'), sorted({digits} | _phone_keys(digits)))]
+        return []
+
+    tokens = []
+    for word in query.split()[:MAX_TOKENS]:
+        if '@' in word:
+            tokens.append((('email',), [_fold(word)]))
+            continue
+        for part in re.findall(r'[^\W_]+', _fold(word)):
+            if len(part) >= MIN_PREFIX:
+                tokens.append((('name', 'national_id', 'email', 'phone'), [part]))
+    return tokens
+
+
+def lookup(query, limit=DEFAULT_LIMIT):
+    """
+    The patients best matching query, best first, with what the front desk
+    needs to tell them apart
+    """
+    tokens = parse_query(query)
+    if not tokens:
+        return []
+
+    condition = Q()
+    points = {}
+    for index, (kinds, prefixes) in enumerate(tokens):
+        started = Q()
+        for prefix in prefixes:
+            # A range rather than LIKE, so it is an index range scan on every database
+            started |= Q(key__gte=prefix, key__lt=prefix + '\U0010ffff')
+        started &= Q(kind__in=kinds)
+        condition |= started
+        points[f'token_{index}'] = Max(Case(
+            When(Q(kind__in=kinds, key__in=prefixes), then=Value(2)),
+            When(started, then=Value(1)),
+            default=Value(0),
+        ))
+    # Every token is matched before ranking, so a common word cannot crowd out a rare one
+    ranked = list(PatientLookupKey.objects.filter(condition).values('patient_id').annotate(**points).filter(
+        **{f'{name}__gt': 0 for name in points}
+    ).annotate(
+        score=sum((F(name) for name in points), Value(0))
+    ).order_by(
+        '-score', Lower('patient__last_name'), Lower('patient__first_name'), 'patient_id'
+    ).values_list('patient_id', 'score')[:limit])
+    if not ranked:
+        return []
+
+    patients = {
+        row['pk']: row
+        for row in CustomUser.objects.filter(pk__in=[patient_id for patient_id, _ in ranked], role__name='patient').values(
+            'pk', 'first_name', 'last_name', 'email', 'profile__phone_number', 'profile__national_id',
+            'profile__date_of_birth', 'profile__gender',
+        )
+    }
+    return [
+        {
+            'id': patient_id,
+            'name': f"{row['first_name'] or ''} {row['last_name'] or ''}".strip(),
+            'email': row['email'],
+            'phone_number': row['profile__phone_number'],
+            'national_id': row['profile__national_id'],
+            'date_of_birth': row['profile__date_of_birth'],
+            'gender': row['profile__gender'],
+            'score': score,
+        }
+        for patient_id, score in ranked
+        for row in [patients.get(patient_id)] if row
+    ]
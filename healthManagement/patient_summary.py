@@ -0,0 +1,272 @@
+"""
+Patient summary snapshots
+
+What the chart header shows about a patient (profile, current admission,
+active medications, recent vitals) is kept as one precomputed, versioned
+document (PatientSummary), so opening a patient reads one JSON blob rather
+than joining the profile, admission, treatment and vital-sign tables:
+- the document has one section per SECTIONS entry, each built by its own
+  query or two; a change to a patient's rows (see signals.py) marks only
+  the sections it affects stale, and refresh_patient_summaries rebuilds
+  those once committed, bumping the version
+- a read rebuilds any section still stale first, so it never serves a
+  change that has been committed
+- documents are cached for PATIENT_SUMMARY_CACHE_SECONDS (CACHES), keyed by
+  patient; a change drops the cached copy. A copy is checked against the
+  database after it is cached, so one built just before a change cannot
+  outlive the change's drop. The cache is only a shortcut: if it is down,
+  the document is read from the database
+"""
+import json
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import F, Prefetch
+
+from accounts.models import CustomUser
+
+from .models import Admission, DeliveredMedicationTreatment, PatientSummary, Treatment, VitalSign
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_TREATMENT_STATUSES = ['pending', 'in_progress']
+RECENT_VITALS = 5
+
+
+def _number(value):
+    return None if value is None else float(value)
+
+
+def _name(user):
+    return f"{user.first_name} {user.last_name}" if user else None
+
+
+def _profile(patient_id):
+    patient = CustomUser.objects.filter(
+        pk=patient_id, role__name='patient'
+    ).select_related('profile').first()
+    if patient is None:
+        return None
+    profile = getattr(patient, 'profile', None)
+    return {
+        'id': patient.id,
+        'email': patient.email,
+        'first_name': patient.first_name,
+        'last_name': patient.last_name,
+        'profile': {
+            'phone_number': profile.phone_number if profile else None,
+            'date_of_birth': profile.date_of_birth if profile else None,
+            'gender': profile.gender if profile else None,
+            'blood_group': profile.blood_group if profile else None,
+            'genotype': profile.genotype if profile else None,
+            'address': profile.address if profile else None,
+            'emergency_contact': profile.emergency_contact if profile else None,
+            # Relative; made absolute per request
+            'profile_picture': profile.profile_picture.url if profile and profile.profile_picture else None,
+        },
+    }
+
+
+def _admission(patient_id):
+    admission = Admission.objects.filter(
+        patient_id=patient_id, status='active'
+    ).select_related('bed__room__ward').first()
+    if admission is None:
+        return None
+    bed = admission.bed
+    room = bed.room if bed else None
+    return {
+        'id': admission.id,
+        'admission_date': admission.admission_date,
+        'ward': {
+            'id': room.ward.id,
+            'name': room.ward.name,
+            'description': room.ward.description,
+        } if room and room.ward else None,
+        'room': {
+            'id': room.id,
+            'name': room.name,
+            'description': room.description,
+        } if room else None,
+        'bed': {
+            'id': bed.id,
+            'name': f"{room.name} - Bed {bed.id}",
+            'is_occupied': bed.is_occupied,
+        } if bed else None,
+    }
+
+
+def _medications(patient_id):
+    treatments = Treatment.objects.filter(
+        medical_record__patient_id=patient_id, treatment_type='medication', status__in=ACTIVE_TREATMENT_STATUSES,
+    ).select_related('prescribed_by').prefetch_related(
+        Prefetch('delivered_treatment', queryset=DeliveredMedicationTreatment.objects.select_related('drug'))
+    ).order_by('-date_created')
+    return [
+        {
+            'id': treatment.id,
+            'name': treatment.name,
+            'status': treatment.status,
+            'start_date': treatment.start_date,
+            'end_date': treatment.end_date,
+            'prescribed_by': _name(treatment.prescribed_by),
+            'drugs': [
+                {
+                    'drug': delivery.drug.name,
+                    'dosage': delivery.dosage,
+                    'frequency': delivery.frequency,
+                    'duration': delivery.duration,
+                }
+                for delivery in treatment.delivered_treatment.all()
+            ],
+        }
+        for treatment in treatments
+    ]
+
+
+def _vitals(patient_id):
+    return [
+        {
+            'id': vital_sign.id,
+            'recorded_at': vital_sign.recorded_at,
+            'temperature_c': _number(vital_sign.temperature_c),
+            'pulse_rate': vital_sign.pulse_rate,
+            'respiratory_rate': vital_sign.respiratory_rate,
+            'systolic_bp': vital_sign.systolic_bp,
+            'diastolic_bp': vital_sign.diastolic_bp,
+            'oxygen_saturation': _number(vital_sign.oxygen_saturation),
+            'weight_kg': _number(vital_sign.weight_kg),
+            'height_cm': _number(vital_sign.height_cm),
+            'bmi': vital_sign.bmi(),
+            'news2_score': vital_sign.news2_score,
+            'news2_risk': vital_sign.news2_risk,
+        }
+        for vital_sign in VitalSign.objects.filter(patient_id=patient_id).order_by('-recorded_at', '-pk')[:RECENT_VITALS]
+    ]
+
+
+# section: builder; the order gives each its bit in PatientSummary.stale
+SECTIONS = {
+    'profile': _profile,
+    'admission': _admission,
+    'medications': _medications,
+    'vitals': _vitals,
+}
+ALL_SECTIONS = (1 << len(SECTIONS)) - 1
+
+
+def _mask(sections):
+    names = list(SECTIONS)
+    mask = 0
+    for section in sections:
+        mask |= 1 << names.index(section)
+    return mask
+
+
+def _key(patient_id):
+    return f"patient-summary:{patient_id}"
+
+
+def _entry(summary):
+    return {'version': summary.version, 'built_at': summary.built_at.isoformat(), 'data': summary.data}
+
+
+def _cache_get(patient_id):
+    try:
+        return cache.get(_key(patient_id))
+    except Exception:
+        logger.exception("Could not read the summary of patient %s from the cache", patient_id)
+        return None
+
+
+def _cache_set(patient_id, entry):
+    try:
+        cache.set(_key(patient_id), entry, settings.PATIENT_SUMMARY_CACHE_SECONDS)
+    except Exception:
+        logger.exception("Could not cache the summary of patient %s", patient_id)
+        return
+    # A change committed since the entry was read may have dropped the cached copy before it was set
+    if not PatientSummary.objects.filter(patient_id=patient_id, version=entry['version'], stale=0).exists():
+        _cache_delete([patient_id])
+
+
+def _cache_delete(patient_ids):
+    try:
+        cache.delete_many([_key(patient_id) for patient_id in patient_ids])
+    except Exception:
+        logger.exception("Could not drop %s patient summaries from the cache", len(patient_ids))
+
+
+def invalidate(patient_ids, *sections):
+    """
+    Mark sections of the patients' summaries stale, and drop the cached
+    copies once committed; returns the number of summaries marked (the
+    ones not built yet need nothing)
+    """
+    patient_ids = list(set(patient_ids))
+    marked = PatientSummary.objects.filter(patient_id__in=patient_ids).update(
+        stale=F('stale').bitor(_mask(sections))
+    )
+    if marked:
+        transaction.on_commit(lambda: _cache_delete(patient_ids))
+    return marked
+
+
+def refresh(patient_id):
+    """
+    Rebuild the stale sections of a patient's summary (all of them the
+    first time) and cache it; returns it, None when not a patient
+    """
+    with transaction.atomic():
+        summary = PatientSummary.objects.select_for_update().filter(patient_id=patient_id).first()
+        mask = summary.stale if summary else ALL_SECTIONS
+        if summary and not mask:
+            entry = _entry(summary)
+        else:
+            data = dict(summary.data) if summary else {}
+            for bit, (section, build) in enumerate(SECTIONS.items()):
+                if mask & 1 << bit:
+                    data[section] = build(patient_id)
+            if data['profile'] is None:
+                if summary:
+                    summary.delete()
+                return None
+            summary = summary or PatientSummary(patient_id=patient_id)
+            # Dates and times as the API renders them, whether read from the cache or the database
+            summary.data = json.loads(json.dumps(data, cls=DjangoJSONEncoder))
+            summary.version += 1
+            summary.stale = 0
+            summary.save()
+            entry = _entry(summary)
+    _cache_set(patient_id, entry)
+    return entry
+
+
+def patient_summary(patient_id):
+    """
+    A patient's summary, {'version', 'built_at', 'data': {section: ...}},
+    from the cache, else the database (rebuilding stale sections); None when
+    not a patient
+    """
+    entry = _cache_get(patient_id)
+    if entry is not None:
+        return entry
+    summary = PatientSummary.objects.filter(patient_id=patient_id).first()
+    if summary is not None and not summary.stale:
+        entry = _entry(summary)
+        _cache_set(patient_id, entry)
+        return entry
+    return refresh(patient_id)
+
+
+def refresh_stale(patient_ids):
+    """Rebuild the stale sections of the patients' summaries; returns how many were rebuilt"""
+    stale = list(PatientSummary.objects.filter(
+        patient_id__in=patient_ids, stale__gt=0
+    ).values_list('patient_id', flat=True))
+    for patient_id in stale:
+        refresh(patient_id)
+    return len(stale)
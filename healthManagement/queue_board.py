@@ -0,0 +1,485 @@
+"""
+Department queue board
+
+Today's patient flow of each department (scheduled -> available -> vitals
+taken -> with doctor -> done) is kept in Redis, so the board, a patient's
+place in line and the per-stage counts are read without querying or
+re-serializing the day's appointments:
+- the Appointment post_save receiver moves the appointment to its new stage
+  after the transaction commits (every mark_* endpoint saves through it)
+- per board (department, day): a sorted set per stage and a line per
+  doctor of the patients waiting for them, ordered by appointment time;
+  counts are ZCARD, a place in line is ZRANK
+- wait estimates use the department's average consultation today (time
+  from "with doctor" to "done"), QUEUE_CONSULTATION_MINUTES until the first
+  one finishes
+- a board is built from the database on first read (new day, Redis
+  flushed), and can be rebuilt with the rebuild_queue_board command
+QUEUE_BOARD_BACKEND=memory keeps the boards in the process instead (a single
+process only: development and tests).
+"""
+import bisect
+import logging
+import math
+import threading
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import Appointment, Profile
+
+logger = logging.getLogger(__name__)
+
+STAGES = ['scheduled', 'available', 'vitals_taken', 'with_doctor', 'done']
+# Stages in which a patient is in their doctor's line
+WAITING = ['available', 'vitals_taken']
+
+# Boards outlive their day by a day, then expire
+BOARD_TTL = 2 * 24 * 60 * 60
+
+
+def stage_of(appointment):
+    """Queue stage of an appointment, None once it is cancelled"""
+    if appointment.status in ('cancelled', 'canceled'):
+        return None
+    if appointment.status == 'completed' or appointment.is_doctor_done_with_patient:
+        return 'done'
+    if appointment.is_doctor_with_patient:
+        return 'with_doctor'
+    if appointment.is_vitals_taken:
+        return 'vitals_taken'
+    if appointment.is_patient_available:
+        return 'available'
+    return 'scheduled'
+
+
+class MemoryStore:
+    """
+    In-process stand-in for the handful of Redis commands the board uses
+    (strings, hashes, sorted sets); expiry is ignored
+    """
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.RLock()
+
+    def pipeline(self, transaction=True):
+        return _MemoryPipeline(self)
+
+    def get(self, key):
+        return self._data.get(key)
+
+    def set(self, key, value, ex=None):
+        self._data[key] = str(value)
+
+    def delete(self, *keys):
+        with self._lock:
+            return sum(self._data.pop(key, None) is not None for key in keys)
+
+    def expire(self, key, seconds):
+        return key in self._data
+
+    def hget(self, key, field):
+        return self._data.get(key, {}).get(str(field))
+
+    def hmget(self, key, fields):
+        values = self._data.get(key, {})
+        return [values.get(str(field)) for field in fields]
+
+    def hgetall(self, key):
+        return dict(self._data.get(key, {}))
+
+    def hset(self, key, field=None, value=None, mapping=None):
+        with self._lock:
+            values = self._data.setdefault(key, {})
+            items = dict(mapping or {})
+            if field is not None:
+                items[field] = value
+            for name, item in items.items():
+                values[str(name)] = str(item)
+            return len(items)
+
+    def hdel(self, key, *fields):
+        with self._lock:
+            values = self._data.get(key, {})
+            removed = sum(values.pop(str(field), None) is not None for field in fields)
+            if not values:
+                self._data.pop(key, None)
+            return removed
+
+    def hincrbyfloat(self, key, field, amount):
+        with self._lock:
+            values = self._data.setdefault(key, {})
+            total = float(values.get(str(field), 0)) + amount
+            values[str(field)] = repr(total)
+            return total
+
+    def zadd(self, key, mapping):
+        with self._lock:
+            entries = self._data.setdefault(key, [])
+            for member, score in mapping.items():
+                member = str(member)
+                entries[:] = [entry for entry in entries if entry[1] != member]
+                bisect.insort(entries, (float(score), member))
+            return len(mapping)
+
+    def zrem(self, key, *members):
+        with self._lock:
+            entries = self._data.get(key, [])
+            members = {str(member) for member in members}
+            kept = [entry for entry in entries if entry[1] not in members]
+            if entries:
+                if kept:
+                    self._data[key] = kept
+                else:
+                    self._data.pop(key)
+            return len(entries) - len(kept)
+
+    def zcard(self, key):
+        return len(self._data.get(key, []))
+
+    def zrank(self, key, member):
+        for rank, (score, name) in enumerate(self._data.get(key, [])):
+            if name == str(member):
+                return rank
+        return None
+
+    def zrange(self, key, start, end, withscores=False):
+        entries = self._data.get(key, [])
+        entries = entries[start:] if end == -1 else entries[start:end + 1]
+        if withscores:
+            return [(member, score) for score, member in entries]
+        return [member for score, member in entries]
+
+
+class _MemoryPipeline:
+    """Queues calls and runs them together under the store's lock, like MULTI/EXEC"""
+
+    def __init__(self, store):
+        self._store = store
+        self._calls = []
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self._calls.append((name, args, kwargs))
+            return self
+        return queue
+
+    def execute(self):
+        with self._store._lock:
+            results = [getattr(self._store, name)(*args, **kwargs) for name, args, kwargs in self._calls]
+        self._calls = []
+        return results
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """The Redis client (or MemoryStore) holding the boards, created on first use"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                if settings.QUEUE_BOARD_BACKEND == 'memory':
+                    _store = MemoryStore()
+                else:
+                    import redis
+                    _store = redis.Redis.from_url(settings.QUEUE_BOARD_REDIS_URL, decode_responses=True)
+    return _store
+
+
+def board_key(department_id, day):
+    return f"{department_id}:{day.isoformat()}"
+
+
+def _key(board, *parts):
+    return ':'.join(('queue', board) + tuple(str(part) for part in parts))
+
+
+def _appointment_key(appointment_id):
+    return f"queue:appointment:{appointment_id}"
+
+
+def _score(appointment_date):
+    return appointment_date.timestamp()
+
+
+def _day_bounds(day):
+    start = timezone.make_aware(datetime.combine(day, time.min))
+    return start, start + timedelta(days=1)
+
+
+def _leave(store, board, appointment_id):
+    """Take an appointment off a board"""
+    where = store.hget(_key(board, 'where'), appointment_id)
+    if where is None:
+        return
+    stage, doctor_id = where.split(':')
+    pipe = store.pipeline()
+    pipe.zrem(_key(board, 'stage', stage), appointment_id)
+    pipe.zrem(_key(board, 'line', doctor_id), appointment_id)
+    pipe.hdel(_key(board, 'where'), appointment_id)
+    pipe.hdel(_key(board, 'since'), appointment_id)
+    if stage == 'with_doctor' and store.hget(_key(board, 'busy'), doctor_id) == str(appointment_id):
+        pipe.hdel(_key(board, 'busy'), doctor_id)
+    pipe.execute()
+
+
+def _enter(store, board, appointment_id, doctor_id, appointment_date, stage, now):
+    """Put an appointment in its stage on a board (moving it from its previous one)"""
+    where_key, since_key, busy_key = _key(board, 'where'), _key(board, 'since'), _key(board, 'busy')
+    previous, since = store.hmget(where_key, [appointment_id]) + store.hmget(since_key, [appointment_id])
+    previous_stage, previous_doctor = previous.split(':') if previous else (None, None)
+
+    pipe = store.pipeline()
+    if previous_stage:
+        pipe.zrem(_key(board, 'stage', previous_stage), appointment_id)
+        pipe.zrem(_key(board, 'line', previous_doctor), appointment_id)
+        if previous_stage == 'with_doctor' and store.hget(busy_key, previous_doctor) == str(appointment_id):
+            pipe.hdel(busy_key, previous_doctor)
+    if previous_stage == 'with_doctor' and stage == 'done' and since:
+        # One more finished consultation for the department's average
+        pipe.hincrbyfloat(_key(board, 'stats'), 'served', 1)
+        pipe.hincrbyfloat(_key(board, 'stats'), 'consultation_seconds', max(now.timestamp() - float(since), 0))
+        pipe.expire(_key(board, 'stats'), BOARD_TTL)
+
+    score = _score(appointment_date)
+    pipe.zadd(_key(board, 'stage', stage), {appointment_id: score})
+    pipe.expire(_key(board, 'stage', stage), BOARD_TTL)
+    if stage in WAITING:
+        pipe.zadd(_key(board, 'line', doctor_id), {appointment_id: score})
+        pipe.expire(_key(board, 'line', doctor_id), BOARD_TTL)
+    if stage == 'with_doctor':
+        pipe.hset(busy_key, doctor_id, appointment_id)
+        pipe.expire(busy_key, BOARD_TTL)
+    pipe.hset(where_key, appointment_id, f"{stage}:{doctor_id}")
+    if stage != previous_stage:
+        pipe.hset(since_key, appointment_id, now.timestamp())
+    pipe.expire(where_key, BOARD_TTL)
+    pipe.expire(since_key, BOARD_TTL)
+    pipe.set(_appointment_key(appointment_id), board, ex=BOARD_TTL)
+    pipe.execute()
+
+
+def appointment_changed(appointment_id, doctor_id, appointment_date, stage, now=None):
+    """
+    Move an appointment to its stage on today's board of its doctor's
+    department (off the board when cancelled, moved to another day or
+    deleted, with stage None). Returns the department ids whose board changed
+    """
+    now = now or timezone.now()
+    store = get_store()
+    board = None
+    department_id = None
+    if stage is not None and timezone.localdate(appointment_date) == timezone.localdate(now):
+        department_id = Profile.objects.filter(user_id=doctor_id).values_list('department_id', flat=True).first()
+        if department_id:
+            board = board_key(department_id, timezone.localdate(now))
+
+    changed = []
+    previous = store.get(_appointment_key(appointment_id))
+    if previous and previous != board:
+        _leave(store, previous, appointment_id)
+        store.delete(_appointment_key(appointment_id))
+        changed.append(int(previous.split(':')[0]))
+    # A board that is not built yet picks the appointment up when it is
+    if board and store.get(_key(board, 'built')):
+        _enter(store, board, appointment_id, doctor_id, appointment_date, stage, now)
+        changed.append(department_id)
+    return changed
+
+
+def rebuild(department_id, day=None):
+    """Build a department's board for day (today) from the database"""
+    day = day or timezone.localdate()
+    board = board_key(department_id, day)
+    start, end = _day_bounds(day)
+    appointments = Appointment.objects.filter(
+        doctor__profile__department_id=department_id,
+        appointment_date__gte=start,
+        appointment_date__lt=end,
+    ).order_by().only(
+        'id', 'doctor_id', 'appointment_date', 'status', 'is_patient_available', 'is_vitals_taken',
+        'is_doctor_with_patient', 'is_doctor_done_with_patient',
+    )
+
+    store = get_store()
+    old_doctors = {where.split(':')[1] for where in store.hgetall(_key(board, 'where')).values()}
+    stamp = timezone.now().timestamp()
+
+    stages = {stage: {} for stage in STAGES}
+    lines = {}
+    where, busy = {}, {}
+    for appointment in appointments:
+        stage = stage_of(appointment)
+        if stage is None:
+            continue
+        score = _score(appointment.appointment_date)
+        stages[stage][appointment.id] = score
+        if stage in WAITING:
+            lines.setdefault(appointment.doctor_id, {})[appointment.id] = score
+        if stage == 'with_doctor':
+            busy[appointment.doctor_id] = appointment.id
+        where[appointment.id] = f"{stage}:{appointment.doctor_id}"
+
+    pipe = store.pipeline()
+    pipe.delete(
+        *[_key(board, 'stage', stage) for stage in STAGES],
+        *[_key(board, 'line', doctor_id) for doctor_id in old_doctors | {str(doctor_id) for doctor_id in lines}],
+        _key(board, 'where'), _key(board, 'since'), _key(board, 'busy'),
+    )
+    for stage, members in stages.items():
+        if members:
+            pipe.zadd(_key(board, 'stage', stage), members)
+            pipe.expire(_key(board, 'stage', stage), BOARD_TTL)
+    for doctor_id, members in lines.items():
+        pipe.zadd(_key(board, 'line', doctor_id), members)
+        pipe.expire(_key(board, 'line', doctor_id), BOARD_TTL)
+    if where:
+        # Time in the current stage is unknown, so it starts now
+        pipe.hset(_key(board, 'where'), mapping=where)
+        pipe.hset(_key(board, 'since'), mapping=dict.fromkeys(where, stamp))
+        for appointment_id in where:
+            pipe.set(_appointment_key(appointment_id), board, ex=BOARD_TTL)
+    if busy:
+        pipe.hset(_key(board, 'busy'), mapping=busy)
+    for name in ('where', 'since', 'busy'):
+        pipe.expire(_key(board, name), BOARD_TTL)
+    pipe.set(_key(board, 'built'), stamp, ex=BOARD_TTL)
+    pipe.execute()
+    logger.info("Queue board %s rebuilt with %s appointments", board, len(where))
+    return board
+
+
+def _ensure_built(store, department_id, day):
+    board = board_key(department_id, day)
+    if not store.get(_key(board, 'built')):
+        rebuild(department_id, day)
+    return board
+
+
+def _average_consultation(stats):
+    served = float(stats.get('served') or 0)
+    if served:
+        return float(stats['consultation_seconds']) / served
+    return settings.QUEUE_CONSULTATION_MINUTES * 60
+
+
+def _estimate(ahead, average, busy_since, now):
+    """Seconds until a patient with ahead patients before them is seen"""
+    remaining = max(average - (now - busy_since), 0) if busy_since is not None else 0
+    return ahead * average + remaining
+
+
+def _minutes(seconds):
+    return math.ceil(seconds / 60)
+
+
+def department_board(department_id, now=None):
+    """
+    Today's board of a department: per-stage counts, each doctor's line with
+    positions and wait estimates, and the average consultation time
+    """
+    now = now or timezone.now()
+    day = timezone.localdate(now)
+    store = get_store()
+    key = _ensure_built(store, department_id, day)
+
+    pipe = store.pipeline(transaction=False)
+    for stage in STAGES:
+        pipe.zcard(_key(key, 'stage', stage))
+    for stage in WAITING:
+        pipe.zrange(_key(key, 'stage', stage), 0, -1, withscores=True)
+    pipe.hgetall(_key(key, 'busy'))
+    pipe.hgetall(_key(key, 'stats'))
+    results = pipe.execute()
+    counts = dict(zip(STAGES, results[:len(STAGES)]))
+    waiting = sorted(
+        (score, int(member), stage)
+        for stage, members in zip(WAITING, results[len(STAGES):len(STAGES) + len(WAITING)])
+        for member, score in members
+    )
+    busy, stats = results[-2:]
+
+    where = dict(zip(
+        [appointment_id for _, appointment_id, _ in waiting],
+        store.hmget(_key(key, 'where'), [appointment_id for _, appointment_id, _ in waiting]) if waiting else [],
+    ))
+    busy_since = dict(zip(
+        busy, store.hmget(_key(key, 'since'), list(busy.values())) if busy else []
+    ))
+    average = _average_consultation(stats)
+    timestamp = now.timestamp()
+
+    doctors = {}
+    for doctor_id, appointment_id in busy.items():
+        doctors[int(doctor_id)] = {'doctor_id': int(doctor_id), 'with_patient': int(appointment_id), 'line': []}
+    for score, appointment_id, stage in waiting:
+        doctor_id = int(where[appointment_id].split(':')[1])
+        doctor = doctors.setdefault(doctor_id, {'doctor_id': doctor_id, 'with_patient': None, 'line': []})
+        since = busy_since.get(str(doctor_id))
+        ahead = len(doctor['line'])
+        doctor['line'].append({
+            'appointment_id': appointment_id,
+            'stage': stage,
+            'position': ahead + 1,
+            'appointment_date': timezone.localtime(datetime.fromtimestamp(score, dt_timezone.utc)).isoformat(),
+            'estimated_wait_minutes': _minutes(_estimate(
+                ahead, average, float(since) if since else None, timestamp
+            )),
+        })
+
+    return {
+        'department_id': department_id,
+        'date': day.isoformat(),
+        'counts': counts,
+        'waiting': sum(counts[stage] for stage in WAITING),
+        'served': int(float(stats.get('served') or 0)),
+        'average_consultation_minutes': round(average / 60, 1),
+        'doctors': sorted(doctors.values(), key=lambda doctor: doctor['doctor_id']),
+    }
+
+
+def position(appointment, now=None):
+    """
+    Stage of an appointment on today's board and, while the patient waits,
+    their place in the doctor's line and estimated wait
+    None when the appointment is not on a board today
+    """
+    now = now or timezone.now()
+    stage = stage_of(appointment)
+    if stage is None or timezone.localdate(appointment.appointment_date) != timezone.localdate(now):
+        return None
+    department_id = Profile.objects.filter(
+        user_id=appointment.doctor_id
+    ).values_list('department_id', flat=True).first()
+    if not department_id:
+        return None
+
+    store = get_store()
+    key = _ensure_built(store, department_id, timezone.localdate(now))
+    where = store.hget(_key(key, 'where'), appointment.id)
+    if where is None:
+        return None
+    stage, doctor_id = where.split(':')
+    result = {'appointment_id': appointment.id, 'department_id': department_id, 'stage': stage}
+    if stage not in WAITING:
+        return result
+
+    pipe = store.pipeline(transaction=False)
+    pipe.zrank(_key(key, 'line', doctor_id), appointment.id)
+    pipe.hget(_key(key, 'busy'), doctor_id)
+    pipe.hgetall(_key(key, 'stats'))
+    ahead, busy, stats = pipe.execute()
+    since = store.hget(_key(key, 'since'), busy) if busy else None
+    ahead = ahead or 0
+    result.update({
+        'position': ahead + 1,
+        'estimated_wait_minutes': _minutes(_estimate(
+            ahead, _average_consultation(stats), float(since) if since else None, now.timestamp()
+        )),
+    })
+    return result
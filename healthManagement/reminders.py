@@ -0,0 +1,127 @@
+"""
+Appointment reminders
+
+send_due_reminders() runs every APPOINTMENT_REMINDER_INTERVAL seconds (a
+periodic task, or the send_appointment_reminders command from cron) and
+reminds patients 24 hours and 1 hour before their appointment:
+- each kind scans one time window on the appointment_date index, e.g. the
+  24h reminder covers appointments starting between 1 and 24 hours from now,
+  so a run that was missed is caught up by the next one
+- a reminder is claimed by inserting its AppointmentReminder row with the
+  run's token; the unique (appointment, kind, appointment_date) constraint
+  makes overlapping runs skip each other's appointments
+- each batch is one transaction: reminder rows, notifications, deliveries
+  and queued emails are all bulk inserts
+"""
+import logging
+import uuid
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from email_utils import queue_appointment_reminders
+
+from .models import Appointment, AppointmentReminder
+from .notifications import notify_many
+
+logger = logging.getLogger(__name__)
+
+# (kind, lead time), longest first; a kind's window ends where the next one starts
+REMINDERS = [
+    ('24h', timedelta(hours=24)),
+    ('1h', timedelta(hours=1)),
+]
+
+def starts_in(appointment_date, now):
+    """
+    How long until the appointment, as the reminder states it: a run that
+    catches up after an outage reminds appointments nearer than the lead
+    time of their kind
+    """
+    minutes = max(round((appointment_date - now).total_seconds() / 60), 1)
+    if minutes < 60:
+        return f"{minutes} minute{'s' if minutes != 1 else ''}"
+    hours = round(minutes / 60)
+    return f"{hours} hour{'s' if hours != 1 else ''}"
+
+
+def reminder_windows(now):
+    """{kind: (after, until)}: appointments in after < appointment_date <= until are due"""
+    windows = {}
+    for index, (kind, lead) in enumerate(REMINDERS):
+        next_lead = REMINDERS[index + 1][1] if index + 1 < len(REMINDERS) else timedelta(0)
+        windows[kind] = (now + next_lead, now + lead)
+    return windows
+
+
+def due_appointments(kind, after, until):
+    """Appointments in the window that have not had this reminder yet"""
+    already_reminded = AppointmentReminder.objects.filter(
+        appointment=OuterRef('pk'), kind=kind, appointment_date=OuterRef('appointment_date')
+    )
+    return Appointment.objects.filter(
+        appointment_date__gt=after, appointment_date__lte=until
+    ).exclude(
+        status__in=['cancelled', 'completed']
+    ).filter(~Exists(already_reminded))
+
+
+def _remind(kind, appointments, now):
+    """Claim the reminders of appointments; returns the ones this run got"""
+    token = uuid.uuid4().hex
+    AppointmentReminder.objects.bulk_create(
+        [
+            AppointmentReminder(
+                appointment=appointment, kind=kind, appointment_date=appointment.appointment_date, run=token
+            )
+            for appointment in appointments
+        ],
+        ignore_conflicts=True,
+    )
+    claimed = set(AppointmentReminder.objects.filter(run=token).values_list('appointment_id', flat=True))
+    appointments = [appointment for appointment in appointments if appointment.id in claimed]
+    lead_times = {appointment.id: starts_in(appointment.appointment_date, now) for appointment in appointments}
+
+    notify_many(
+        (
+            [appointment.patient],
+            "Appointment Reminder",
+            f"Reminder: your appointment with Dr. {appointment.doctor.first_name} {appointment.doctor.last_name} "
+            f"starts in {lead_times[appointment.id]}, "
+            f"on {timezone.localtime(appointment.appointment_date).strftime('%Y-%m-%d %H:%M')}.",
+            None,
+        )
+        for appointment in appointments
+    )
+    queue_appointment_reminders(appointments, kind=kind, starts_in=lead_times)
+    return appointments
+
+
+def send_due_reminders(now=None, batch_size=1000):
+    """
+    Send every reminder that is due
+    Returns ({kind: reminders sent}, ids of the patients reminded)
+    """
+    now = now or timezone.now()
+    sent = {}
+    patient_ids = set()
+    for kind, (after, until) in reminder_windows(now).items():
+        sent[kind] = 0
+        while True:
+            batch = list(
+                due_appointments(kind, after, until)
+                .select_related('patient', 'doctor', 'doctor__profile__department')
+                .order_by('appointment_date')[:batch_size]
+            )
+            if not batch:
+                break
+            with transaction.atomic():
+                reminded = _remind(kind, batch, now)
+            sent[kind] += len(reminded)
+            patient_ids.update(appointment.patient_id for appointment in reminded)
+
+    if any(sent.values()):
+        logger.info("Appointment reminders sent: %s", sent)
+    return sent, patient_ids
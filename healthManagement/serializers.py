@@ -11,12 +11,67 @@ from django.shortcuts import get_object_or_404
 from django.db import transaction
 from utils import APPLICATIONS_USER_MODEL
 from .models import Treatment
+from .slots import book_appointment
+from .transitions import TRANSITIONS
+import logging
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
 
+logger = logging.getLogger(__name__)
+
 APPLICATIONS_USER_MODEL = get_user_model()
 
 
+def get_shaping_param(context, name):
+    """
+    Read a comma separated ?fields= / ?expand= value
+    - a value passed in the serializer context wins over the query string
+    - returns None when the parameter was not given at all
+    """
+    value = context.get(name)
+    if value is None:
+        request = context.get('request')
+        params = getattr(request, 'query_params', getattr(request, 'GET', None))
+        if params is None or name not in params:
+            return None
+        value = params.get(name)
+    if isinstance(value, str):
+        value = value.split(',')
+    return {item.strip() for item in value if item and item.strip()}
+
+
+class SparseFieldsetMixin:
+    """
+    Response shaping through ?fields= and ?expand=
+    - fields: top-level fields to return; the rest are dropped before
+      serialization so their method fields never run
+    - expand: related blocks to build; once the parameter is given, any
+      expandable block that is not listed is skipped
+    Without either parameter the output is unchanged.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        requested = get_shaping_param(self.context, 'fields')
+        if requested:
+            for name in set(self.fields) - requested:
+                self.fields.pop(name)
+        self._expand = get_shaping_param(self.context, 'expand')
+
+    def is_expanded(self, name):
+        return self._expand is None or name in self._expand
+
+    @staticmethod
+    def field_requested(context, name):
+        fields = get_shaping_param(context, 'fields')
+        return not fields or name in fields
+
+    @staticmethod
+    def expand_requested(context, name):
+        expand = get_shaping_param(context, 'expand')
+        return expand is None or name in expand
+
+
 class ChatRequestSerializer(serializers.Serializer):
     message = serializers.CharField(max_length=1000, required=True)
     conversation_history = serializers.ListField(
@@ -313,6 +368,7 @@ class NotificationSerializer(serializers.ModelSerializer):
     """
     sender_info = serializers.SerializerMethodField()
     created_at_formatted = serializers.SerializerMethodField()
+    is_read = serializers.SerializerMethodField()
     
     class Meta:
         model = Notification
@@ -326,7 +382,11 @@ class NotificationSerializer(serializers.ModelSerializer):
             'sender',
             'sender_info'
         ]
-        read_only_fields = ['created_at', 'is_read']
+        read_only_fields = ['created_at']
+    
+    def get_is_read(self, obj):
+        """Read state of the receiver the notifications were fetched for (annotated as read_at)"""
+        return getattr(obj, 'read_at', None) is not None
     
     def get_sender_info(self, obj):
         """Include sender's information"""
@@ -540,14 +600,28 @@ class DepartmentSerializer(serializers.ModelSerializer):
         fields = ['id', 'name', 'description', 'total_staff', 'total_patients']
     
     def get_total_staff(self, obj):
+        # Use the count annotated by the view when present (avoids a query per department)
+        if hasattr(obj, 'staff_count'):
+            return obj.staff_count
         return obj.profiles.filter(user__role__name__in=['doctor', 'nurse']).count()
     
     def get_total_patients(self, obj):
+        if hasattr(obj, 'patient_count'):
+            return obj.patient_count
         return obj.profiles.filter(user__role__name='patient').count()
 
 
 
-class DoctorListSerializer(serializers.ModelSerializer):
+class DoctorListSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    """
+    Doctor directory entry
+    - expandable: department (otherwise only the department id is returned)
+    """
+    PROFILE_FIELDS = [
+        'department', 'profile_picture', 'specialization', 'phone_number', 'bio',
+        'education', 'experience', 'consultation_fee'
+    ]
+
     full_name = serializers.SerializerMethodField()
     department = serializers.SerializerMethodField()
     profile_picture = serializers.SerializerMethodField()
@@ -563,10 +637,26 @@ class DoctorListSerializer(serializers.ModelSerializer):
         model = get_user_model()
         fields = '__all__'
 
+    @classmethod
+    def setup_eager_loading(cls, queryset, context):
+        """Join only the relations the requested fields need"""
+        if cls.field_requested(context, 'department') and cls.expand_requested(context, 'department'):
+            queryset = queryset.select_related('profile__department')
+        elif any(cls.field_requested(context, name) for name in cls.PROFILE_FIELDS):
+            queryset = queryset.select_related('profile')
+        for name in ('groups', 'user_permissions'):
+            if cls.field_requested(context, name):
+                queryset = queryset.prefetch_related(name)
+        if cls.field_requested(context, 'available_hours'):
+            queryset = queryset.prefetch_related('schedules')
+        return queryset
+
     def get_full_name(self, obj):
         return f"{obj.first_name} {obj.last_name}"
 
     def get_department(self, obj):
+        if not self.is_expanded('department'):
+            return obj.profile.department_id if hasattr(obj, 'profile') and obj.profile else None
         if hasattr(obj, 'profile') and obj.profile and obj.profile.department:
             return {
                 'id': obj.profile.department.id,
@@ -602,9 +692,16 @@ class DoctorListSerializer(serializers.ModelSerializer):
         return getattr(obj.profile, 'consultation_fee', None) if hasattr(obj, 'profile') else None
 
     def get_available_hours(self, obj):
-        if hasattr(obj, 'profile') and hasattr(obj.profile, 'available_hours'):
-            return obj.profile.available_hours
-        return None
+        # Weekly working hours (DoctorSchedule), prefetched by setup_eager_loading
+        return [
+            {
+                'weekday': schedule.weekday,
+                'start_time': schedule.start_time.strftime('%H:%M'),
+                'end_time': schedule.end_time.strftime('%H:%M'),
+                'slot_minutes': schedule.slot_minutes,
+            }
+            for schedule in obj.schedules.all()
+        ]
 
 
 
@@ -637,28 +734,46 @@ class BookAppointmentSerializer(serializers.ModelSerializer):
                 {"appointment_date": "Appointment date must be in the future."}
             )
 
-        # Check for existing appointment at same time
-        if Appointment.objects.filter(
-            doctor=doctor,
-            appointment_date=data['appointment_date'],
-            status__in=['pending', 'confirmed']
-        ).exists():
-            raise serializers.ValidationError(
-                {"appointment_date": "This time slot is already booked."}
-            )
-
         return data
 
     def create(self, validated_data):
-        return Appointment.objects.create(
+        # Claims the slot atomically; raises SlotUnavailable when it is taken
+        return book_appointment(
             patient=self.context['request'].user,
             doctor=validated_data['doctor'],
             appointment_date=validated_data['appointment_date'],
-            patient_reason_for_appointment=validated_data.get('patient_reason_for_appointment', ''),
-            status='pending'
+            reason=validated_data.get('patient_reason_for_appointment', ''),
         )
 
 
+class DoctorScheduleSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = DoctorSchedule
+        fields = ['id', 'weekday', 'start_time', 'end_time', 'slot_minutes']
+
+    def validate(self, data):
+        if data['start_time'] >= data['end_time']:
+            raise serializers.ValidationError({"end_time": "end_time must be after start_time."})
+        if not 5 <= data.get('slot_minutes', 30) <= 240:
+            raise serializers.ValidationError({"slot_minutes": "slot_minutes must be between 5 and 240."})
+        return data
+
+
+class AppointmentSlotSerializer(serializers.ModelSerializer):
+    doctor_name = serializers.SerializerMethodField()
+    department_name = serializers.SerializerMethodField()
+
+    class Meta:
+        model = AppointmentSlot
+        fields = ['id', 'doctor', 'doctor_name', 'department', 'department_name', 'start', 'end']
+
+    def get_doctor_name(self, obj):
+        return f"{obj.doctor.first_name} {obj.doctor.last_name}"
+
+    def get_department_name(self, obj):
+        return obj.department.name if obj.department else None
+
+
 
 # In healthManagement/serializers.py, add this after the BookAppointmentSerializer
 class PatientAppointmentSerializer(serializers.ModelSerializer):
@@ -833,10 +948,11 @@ class DoctorAppointmentSerializer(serializers.ModelSerializer):
         return obj.appointment_date <= timezone.now()
 
 
-class AppointmentDetailSerializer(serializers.ModelSerializer):
+class AppointmentDetailSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """
     Detailed serializer for a single appointment
     Includes complete patient and doctor information with profiles
+    - expandable: patient_profile, doctor_profile, nurse_profile
     """
     # Patient information
     patient_info = serializers.SerializerMethodField()
@@ -877,10 +993,25 @@ class AppointmentDetailSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = fields
 
+    @classmethod
+    def setup_eager_loading(cls, queryset, context):
+        """Join only the people and profiles the requested fields need"""
+        related = []
+        for role in ('patient', 'doctor', 'nurse'):
+            if not cls.field_requested(context, f'{role}_info'):
+                continue
+            if cls.expand_requested(context, f'{role}_profile'):
+                related.append(f'{role}__profile')
+            else:
+                related.append(role)
+        if 'doctor__profile' in related:
+            related.append('doctor__profile__department')
+        return queryset.select_related(*related) if related else queryset
+
     def get_patient_info(self, obj):
         """Get complete patient information including profile"""
         patient = obj.patient
-        profile = getattr(patient, 'profile', None)
+        profile = getattr(patient, 'profile', None) if self.is_expanded('patient_profile') else None
         
         patient_data = {
             'id': patient.id,
@@ -920,7 +1051,7 @@ class AppointmentDetailSerializer(serializers.ModelSerializer):
     def get_doctor_info(self, obj):
         """Get complete doctor information including profile"""
         doctor = obj.doctor
-        profile = getattr(doctor, 'profile', None)
+        profile = getattr(doctor, 'profile', None) if self.is_expanded('doctor_profile') else None
         
         doctor_data = {
             'id': doctor.id,
@@ -958,7 +1089,7 @@ class AppointmentDetailSerializer(serializers.ModelSerializer):
             return None
             
         nurse = obj.nurse
-        profile = getattr(nurse, 'profile', None)
+        profile = getattr(nurse, 'profile', None) if self.is_expanded('nurse_profile') else None
         
         nurse_data = {
             'id': nurse.id,
@@ -1327,9 +1458,11 @@ class VitalSignSerializer(serializers.ModelSerializer):
             'weight_kg',
             'height_cm',
             'bmi',
-            'notes'
+            'notes',
+            'news2_score',
+            'news2_risk'
         ]
-        read_only_fields = ['recorded_at', 'recorded_by']
+        read_only_fields = ['recorded_at', 'recorded_by', 'news2_score', 'news2_risk']
     
     def get_patient_info(self, obj):
         """Include patient's basic information"""
@@ -1632,8 +1765,8 @@ class PatientUserSerializer(serializers.ModelSerializer):
             
             return admission_data
             
-        except Exception as e:
-            print(f"Error getting admission: {str(e)}")
+        except Exception:
+            logger.exception("Error getting admission")
             return None
 
 
@@ -1870,8 +2003,10 @@ class MedicationTreatmentSerializer(serializers.ModelSerializer):
                 existing_referral.total_amount = str(total_amount)
                 existing_referral.save()
                 
-                print(f"[INFO] Added delivered treatment {delivered_treatment.id} to existing pharmacy referral {existing_referral.id}")
-                print(f"[INFO] Updated total amount to {total_amount}")
+                logger.info(
+                    "Added delivered treatment %s to pharmacy referral %s, total now %s",
+                    delivered_treatment.id, existing_referral.id, total_amount
+                )
             else:
                 # Create new pharmacy referral
                 new_referral = PharmacyReferral.objects.create(
@@ -1892,13 +2027,13 @@ class MedicationTreatmentSerializer(serializers.ModelSerializer):
                 new_referral.total_amount = str(total_amount)
                 new_referral.save()
                 
-                print(f"[INFO] Created new pharmacy referral {new_referral.id} and added delivered treatment {delivered_treatment.id}")
-                print(f"[INFO] Initial total amount: {total_amount}")
+                logger.info(
+                    "Created pharmacy referral %s for delivered treatment %s, total %s",
+                    new_referral.id, delivered_treatment.id, total_amount
+                )
             
-        except Exception as e:
-            print(f"[ERROR] Failed to create/update pharmacy referral: {str(e)}")
-            import traceback
-            traceback.print_exc()
+        except Exception:
+            logger.exception("Failed to create/update pharmacy referral")
             # Continue without failing the whole operation if referral creation fails
         
         # Update the medical record's sent_to_pharmacy field
@@ -1920,7 +2055,7 @@ class MedicationTreatmentSerializer(serializers.ModelSerializer):
             # Update existing item by adding to number_of_cards
             existing_item.number_of_cards += quantity
             existing_item.save()
-            print(f"[INFO] Updated existing ReferralDispensedDrugItem for {drug.name}. New number_of_cards: {existing_item.number_of_cards}")
+            logger.debug("Referral %s drug %s now has %s cards", referral.id, drug.id, existing_item.number_of_cards)
         else:
             # Create new item
             ReferralDispensedDrugItem.objects.create(
@@ -1928,7 +2063,7 @@ class MedicationTreatmentSerializer(serializers.ModelSerializer):
                 drug=drug,
                 number_of_cards=quantity
             )
-            print(f"[INFO] Created new ReferralDispensedDrugItem for {drug.name} with number_of_cards: {quantity}")
+            logger.debug("Referral %s drug %s added with %s cards", referral.id, drug.id, quantity)
     
     def _calculate_total_amount(self, referral):
         """Calculate total amount for all drugs in the referral"""
@@ -1977,35 +2112,90 @@ class DeliveredMedicationTreatmentSerializer(serializers.ModelSerializer):
         return WhoAdministeredSerializer(admins, many=True).data
 
 
-class PatientTreatmentHistorySerializer(serializers.ModelSerializer):
+class TreatmentWithDeliveriesSerializer(serializers.ModelSerializer):
+    """Treatment with the medications delivered against it"""
+    delivered_medications = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = Treatment
+        fields = '__all__'
+        depth = 1
+    
+    def get_delivered_medications(self, treatment_obj):
+        # Get all delivered treatments for this treatment
+        delivered = treatment_obj.delivered_treatment.all()
+        return DeliveredMedicationTreatmentSerializer(delivered, many=True).data
+
+
+class PatientTreatmentHistorySerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    """
+    Medical records with their treatments and deliveries
+    - expandable: patient, doctor, appointment, vital_signs (ids otherwise)
+      and deliveries (delivered medications under each treatment)
+    """
+    RELATED_FIELDS = ['patient', 'doctor', 'appointment', 'vital_signs']
+
     treatments = serializers.SerializerMethodField()
     
     class Meta:
         model = MedicalRecord
         fields = '__all__'
         depth = 1
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Relations that were not expanded are rendered as plain ids
+        for name in self.RELATED_FIELDS:
+            if name in self.fields and not self.is_expanded(name):
+                self.fields[name] = serializers.PrimaryKeyRelatedField(read_only=True)
+
+    @classmethod
+    def setup_eager_loading(cls, queryset, context):
+        """Join and prefetch only what the requested fields and expansions need"""
+        related = [
+            name for name in cls.RELATED_FIELDS
+            if cls.field_requested(context, name) and cls.expand_requested(context, name)
+        ]
+        if related:
+            queryset = queryset.select_related(*related)
+        # depth=1 renders users with their groups/permissions, load those in bulk too
+        for name in ('patient', 'doctor'):
+            if name in related:
+                queryset = queryset.prefetch_related(f'{name}__groups', f'{name}__user_permissions')
+        if cls.field_requested(context, 'treatments'):
+            queryset = queryset.prefetch_related(
+                Prefetch(
+                    'treatments',
+                    queryset=Treatment.objects.select_related('medical_record', 'prescribed_by')
+                ),
+                'treatments__prescribed_by__groups',
+                'treatments__prescribed_by__user_permissions'
+            )
+            if cls.expand_requested(context, 'deliveries'):
+                queryset = queryset.prefetch_related(
+                    Prefetch(
+                        'treatments__delivered_treatment',
+                        queryset=DeliveredMedicationTreatment.objects.select_related(
+                            'treatment', 'medical_record', 'drug', 'prescribed_by'
+                        )
+                    ),
+                    'treatments__delivered_treatment__prescribed_by__groups',
+                    'treatments__delivered_treatment__prescribed_by__user_permissions',
+                    Prefetch(
+                        'treatments__delivered_treatment__nurse',
+                        queryset=who_administered.objects.select_related('user', 'delivered_medication_treatment')
+                    )
+                )
+        return queryset
     
     def get_treatments(self, obj):
-        from .serializers import TreatmentSerializer  # Import here to avoid circular import
-        
         # Get all treatments for this medical record
         treatments = obj.treatments.all()
         
-        # Create a custom serializer method to include delivered treatments
-        class TreatmentWithDeliveriesSerializer(serializers.ModelSerializer):
-            delivered_medications = serializers.SerializerMethodField()
-            
-            class Meta:
-                model = Treatment
-                fields = '__all__'
-                depth = 1
-            
-            def get_delivered_medications(self, treatment_obj):
-                # Get all delivered treatments for this treatment
-                delivered = treatment_obj.delivered_treatment.all()
-                return DeliveredMedicationTreatmentSerializer(delivered, many=True).data
-        
-        return TreatmentWithDeliveriesSerializer(treatments, many=True, context=self.context).data
+        serializer = TreatmentWithDeliveriesSerializer(treatments, many=True, context=self.context)
+        if not self.is_expanded('deliveries'):
+            serializer.child.fields.pop('delivered_medications')
+        return serializer.data
 
 
 
@@ -2164,7 +2354,7 @@ class PharmacyReferralPaymentUpdateSerializer(serializers.ModelSerializer):
         if is_new_payment:
             # Deduct drug quantities when payment is completed
             self._deduct_drug_quantities(instance)
-            print(f"[INFO] Payment completed for referral {instance.id}. Drug quantities deducted.")
+            logger.info("Payment completed for referral %s, drug quantities deducted", instance.id)
         
         # Set payment received by the current user and mark payment as done
         validated_data['payment_received_by'] = self.context['request'].user
@@ -2186,7 +2376,7 @@ class PharmacyReferralPaymentUpdateSerializer(serializers.ModelSerializer):
             # Deduct from drug quantity
             drug.quantity -= item_quantity
             drug.save()
-            print(f"[INFO] Deducted {item_quantity} from {drug.name} quantity. New quantity: {drug.quantity}")
+            logger.debug("Deducted %s from drug %s, %s left", item_quantity, drug.id, drug.quantity)
 
 
 
@@ -2226,15 +2416,11 @@ class DrugSaleSerializer(serializers.ModelSerializer):
         read_only_fields = ('balance', 'created_at', 'updated_at', 'sold_by')
     
     def validate(self, data):
-        print("\n=== Validating Data ===")
-        print(f"Input data: {data}")
-        
         # Ensure required fields are present
         required_fields = ['bulk_sale_id', 'items', 'customer_name', 'total_amount']
         missing_fields = [field for field in required_fields if field not in data]
         if missing_fields:
             error_msg = f"Missing required fields: {', '.join(missing_fields)}"
-            print(f"Validation error: {error_msg}")
             raise serializers.ValidationError({'detail': error_msg})
         
         # Ensure amount_paid is not greater than total_amount
@@ -2242,29 +2428,22 @@ class DrugSaleSerializer(serializers.ModelSerializer):
         total_amount = data.get('total_amount', 0)
         items = data.get('items', [])
         
-        print(f"Validating payment: amount_paid={amount_paid}, total_amount={total_amount}")
-        
         if amount_paid > total_amount:
             error_msg = 'Amount paid cannot be greater than total amount'
-            print(f"Validation error: {error_msg}")
             raise serializers.ValidationError({'amount_paid': error_msg})
             
         # Validate items
         if not items:
             error_msg = 'At least one item is required'
-            print(f"Validation error: {error_msg}")
             raise serializers.ValidationError({'items': error_msg})
             
         for idx, item in enumerate(items):
-            print(f"Validating item {idx}: {item}")
             if not isinstance(item, dict):
                 error_msg = f'Item {idx} must be an object with drug and number_of_cards'
-                print(f"Validation error: {error_msg}")
                 raise serializers.ValidationError({'items': {str(idx): error_msg}})
                 
             if 'drug' not in item or 'number_of_cards' not in item:
                 error_msg = 'Each item must contain both drug ID and number_of_cards'
-                print(f"Validation error: {error_msg}")
                 raise serializers.ValidationError({'items': {str(idx): error_msg}})
                 
             try:
@@ -2274,7 +2453,6 @@ class DrugSaleSerializer(serializers.ModelSerializer):
                     raise ValueError("number_of_cards must be positive")
             except (ValueError, TypeError) as e:
                 error_msg = f'Invalid value in item {idx}: {str(e)}'
-                print(f"Validation error: {error_msg}")
                 raise serializers.ValidationError({'items': {str(idx): str(e)}})
                 
         # Set default payment_status if not provided
@@ -2286,20 +2464,14 @@ class DrugSaleSerializer(serializers.ModelSerializer):
             else:
                 data['payment_status'] = 'paid'
                 
-        print(f"Validation successful. Final data: {data}")
-        print("========================\n")
         return data
     
     def validate(self, data):
-        print("\n=== Validating Data ===")
-        print(f"Input data: {data}")
-        
         # Ensure required fields are present
         required_fields = ['sales_id', 'customer_name', 'total_amount']
         missing_fields = [field for field in required_fields if field not in data]
         if missing_fields:
             error_msg = f"Missing required fields: {', '.join(missing_fields)}"
-            print(f"Validation error: {error_msg}")
             raise serializers.ValidationError({'detail': error_msg})
         
         # Ensure amount_paid is not greater than total_amount
@@ -2308,7 +2480,6 @@ class DrugSaleSerializer(serializers.ModelSerializer):
         
         if amount_paid > total_amount:
             error_msg = 'Amount paid cannot be greater than total amount'
-            print(f"Validation error: {error_msg}")
             raise serializers.ValidationError({'amount_paid': error_msg})
                 
         # Set default payment_status if not provided
@@ -2320,12 +2491,9 @@ class DrugSaleSerializer(serializers.ModelSerializer):
             else:
                 data['payment_status'] = 'paid'
                 
-        print(f"Validation successful. Final data: {data}")
         return data
     
     def create(self, validated_data):
-        print("\n=== Creating Drug Sale ===")
-        print(f"Validated data: {validated_data}")
         
         # Extract sales_id from validated_data
         sales_id_str = validated_data.pop('sales_id')
@@ -2340,23 +2508,19 @@ class DrugSaleSerializer(serializers.ModelSerializer):
             bulk_sale = BulkSaleId.objects.get(bulk_id=sales_id_str)
             validated_data['sales_id'] = bulk_sale
             
-            print(f"Creating DrugSale with data: {validated_data}")
             
             # Create the DrugSale instance
             drug_sale = super().create(validated_data)
-            print(f"Created DrugSale: {drug_sale.id}")
+            logger.info("Created DrugSale %s", drug_sale.id)
             
             return drug_sale
             
         except BulkSaleId.DoesNotExist as e:
             error_msg = f'Bulk sale with ID {bulk_sale_id} not found'
-            print(f"Error: {error_msg}")
             raise serializers.ValidationError({'bulk_sale_id': error_msg})
             
         except Exception as e:
-            import traceback
-            print("Error creating DrugSale:")
-            print(traceback.format_exc())
+            logger.exception("Error creating DrugSale")
             raise serializers.ValidationError({
                 'detail': f'Error creating drug sale: {str(e)}'
             })
@@ -2672,6 +2836,18 @@ class AppointmentUpdateSerializer(serializers.ModelSerializer):
         return data
 
 
+class AppointmentTransitionSerializer(serializers.Serializer):
+    """
+    One appointment state transition (see healthManagement/transitions.py)
+    version is optional: when given, the transition is refused if the
+    appointment has changed since
+    """
+    appointment_id = serializers.IntegerField()
+    action = serializers.ChoiceField(choices=list(TRANSITIONS))
+    version = serializers.IntegerField(min_value=0, required=False)
+    reason = serializers.CharField(max_length=500, required=False, allow_blank=True)
+
+
 class AppointmentTerminationSerializer(serializers.ModelSerializer):
     """
     Serializer for terminating appointments
@@ -1,4 +1,4 @@
-from django.db.models.signals import post_save, pre_save
+from django.db.models.signals import m2m_changed, post_delete, post_init, post_save, pre_delete, pre_save
 from django.db import transaction
 from django.dispatch import receiver
 from accounts.models import CustomUser
@@ -6,7 +6,38 @@ from .models import *
 from channels.layers import get_channel_layer
 from asgiref.sync import async_to_sync
 import json
+import logging
 from django.db.models import Count
+from .notifications import adjust_unread, unread_deltas
+from . import queue_board
+from . import clinical_search
+from . import patient_directory
+from .early_warning import score_reading
+from .patient_summary import invalidate as invalidate_summaries
+from .slots import sync_appointment_slot
+from .tasks import (
+    check_vital_signs, notify_appointment_event, push_appointment_updates, push_queue_board, refresh_patient_summaries,
+)
+
+logger = logging.getLogger(__name__)
+
+# User columns the profile receivers read; saves limited to other columns
+# (last_login at every login) leave the profile alone
+PROFILE_USER_FIELDS = {'first_name', 'last_name', 'email', 'role', 'role_id'}
+# Profile columns the patient summary and the lookup keys are built from
+SUMMARY_PROFILE_FIELDS = {
+    'phone_number', 'date_of_birth', 'gender', 'blood_group', 'genotype', 'address', 'emergency_contact',
+    'profile_picture',
+}
+LOOKUP_PROFILE_FIELDS = {'phone_number', 'national_id'}
+
+
+def _saves_any(update_fields, fields):
+    return update_fields is None or not fields.isdisjoint(update_fields)
+
+
+def _is_patient(profile):
+    return getattr(getattr(profile.user, 'role', None), 'name', None) == 'patient'
 
 @receiver(post_save, sender=CustomUser)
 def create_user_profile(sender, instance, created, **kwargs):
@@ -14,50 +45,20 @@ def create_user_profile(sender, instance, created, **kwargs):
         Profile.objects.create(user=instance)
 
 @receiver(post_save, sender=CustomUser)
-def save_user_profile(sender, instance, **kwargs):
-    if hasattr(instance, 'profile'):
+def save_user_profile(sender, instance, update_fields=None, **kwargs):
+    if _saves_any(update_fields, PROFILE_USER_FIELDS) and hasattr(instance, 'profile'):
         instance.profile.save()
 
 @receiver(post_save, sender=Appointment)
 def create_appointment_notification(sender, instance, created, **kwargs):
     """
     Create a notification when a new appointment is created
+    Notifies the doctor
     """
     if created:
-        # Create notification for the doctor
-        notification = Notification.objects.create(
-            sender=instance.patient,
-            title="New Appointment",
-            message=f"You have a new appointment with {instance.patient.first_name} {instance.patient.last_name} on {instance.appointment_date.strftime('%Y-%m-%d %H:%M')}."
+        notify_appointment_event.delay(
+            instance.id, 'created', idempotency_key=f"appointment:{instance.id}:created"
         )
-        # Add doctor as receiver
-        notification.receivers.add(instance.doctor)
-        
-        # Send WebSocket notification to the doctor if they are connected
-        try:
-            # Get the channel layer
-            channel_layer = get_channel_layer()
-            
-            # Check if doctor has an active WebSocket connection
-            doctor_connections = ActiveWebSocketConnection.objects.filter(email=instance.doctor.email)
-            
-            if doctor_connections.exists():
-                # Convert email to a valid group name by replacing @ and . with _
-                safe_email = instance.doctor.email.replace('@', '_').replace('.', '_')
-                
-                # Send notification to the doctor's WebSocket
-                async_to_sync(channel_layer.group_send)(
-                    f"user_{safe_email}",
-                    {
-                        "type": "send_notification",
-                        "message": {
-                            "action": "get_notifications",
-                            "data": {}
-                        }
-                    }
-                )
-        except Exception as e:
-            print(f"Error sending WebSocket notification: {str(e)}")
 
 
 @receiver(post_save, sender=Appointment)
@@ -72,46 +73,9 @@ def send_patient_available_notification(sender, instance, **kwargs):
         # Use update_fields to check if is_patient_available was actually updated
         update_fields = kwargs.get('update_fields')
         if update_fields is None or 'is_patient_available' in update_fields:
-            try:
-                # Create notification for patient availability
-                notification = Notification.objects.create(
-                    sender=instance.patient,
-                    title="Patient Available",
-                    message=f"{instance.patient.first_name} {instance.patient.last_name} is now available for their appointment scheduled on {instance.appointment_date.strftime('%Y-%m-%d %H:%M')}. Ready for vitals check."
-                )
-                
-                # Add doctor as receiver
-                notification.receivers.add(instance.doctor)
-                
-                # Collect all affected users
-                affected_users = [instance.doctor]
-                
-                # Find all nurses in the doctor's department
-                if hasattr(instance.doctor, 'profile') and instance.doctor.profile and instance.doctor.profile.department:
-                    doctor_department = instance.doctor.profile.department
-                    
-                    # Get all nurses in the same department
-                    nurses_in_department = CustomUser.objects.filter(
-                        role__name='nurse',
-                        profile__department=doctor_department,
-                        is_active=True
-                    )
-                    
-                    # Add all nurses as receivers
-                    for nurse in nurses_in_department:
-                        notification.receivers.add(nurse)
-                        affected_users.append(nurse)
-                
-                # Send WebSocket notifications to all receivers
-                send_websocket_notification_to_users(notification)
-                
-                # Trigger get_appointment_detail action for all affected users
-                send_refresh_appointment_action(affected_users, instance.id)
-                
-            except Exception as e:
-                print(f"Error in patient available notification: {str(e)}")
-
-
+            notify_appointment_event.delay(
+                instance.id, 'patient_available', idempotency_key=f"appointment:{instance.id}:patient_available"
+            )
 
 
 @receiver(post_save, sender=Appointment)
@@ -126,39 +90,9 @@ def send_doctor_with_patient_notification(sender, instance, **kwargs):
         # Use update_fields to check if is_doctor_with_patient was actually updated
         update_fields = kwargs.get('update_fields')
         if update_fields is None or 'is_doctor_with_patient' in update_fields:
-            try:
-                # Get doctor name
-                doctor_name = f"Dr. {instance.doctor.first_name} {instance.doctor.last_name}"
-                patient_name = f"{instance.patient.first_name} {instance.patient.last_name}"
-                
-                # Create notification for doctor with patient
-                notification = Notification.objects.create(
-                    sender=instance.doctor,
-                    title="Doctor With Patient",
-                    message=f"{doctor_name} is now with patient {patient_name} for the appointment scheduled on {instance.appointment_date.strftime('%Y-%m-%d %H:%M')}."
-                )
-                
-                # Add patient as receiver
-                notification.receivers.add(instance.patient)
-                
-                # Collect affected users for appointment details
-                affected_users = [instance.patient]
-                
-                # Add nurse as receiver if assigned
-                if instance.nurse:
-                    notification.receivers.add(instance.nurse)
-                    affected_users.append(instance.nurse)
-                
-                # Send WebSocket notifications to all receivers
-                send_websocket_notification_to_users(notification)
-                
-                # Trigger get_appointment_detail action for all affected users
-                send_refresh_appointment_action(affected_users, instance.id)
-                    
-            except Exception as e:
-                print(f"Error in doctor with patient notification: {str(e)}")
-
-
+            notify_appointment_event.delay(
+                instance.id, 'doctor_with_patient', idempotency_key=f"appointment:{instance.id}:doctor_with_patient"
+            )
 
 
 @receiver(post_save, sender=Appointment)
@@ -173,32 +107,9 @@ def send_vitals_taken_notification(sender, instance, **kwargs):
         # Use update_fields to check if is_vitals_taken was actually updated
         update_fields = kwargs.get('update_fields')
         if update_fields is None or 'is_vitals_taken' in update_fields:
-            try:
-                # Get nurse name
-                nurse_name = f"{instance.nurse.first_name} {instance.nurse.last_name}" if instance.nurse else "Nurse"
-                
-                # Create notification for vitals taken
-                notification = Notification.objects.create(
-                    sender=instance.nurse,
-                    title="Vitals Taken",
-                    message=f"Vitals have been taken by {nurse_name} for the appointment between {instance.patient.first_name} {instance.patient.last_name} and Dr. {instance.doctor.first_name} {instance.doctor.last_name} scheduled on {instance.appointment_date.strftime('%Y-%m-%d %H:%M')}."
-                )
-                
-                # Add doctor as receiver
-                notification.receivers.add(instance.doctor)
-                
-                # Add patient as receiver
-                notification.receivers.add(instance.patient)
-                
-                # Send WebSocket notifications to all receivers
-                send_websocket_notification_to_users(notification)
-                
-                # Trigger get_appointment_detail action for all affected users
-                send_refresh_appointment_action([instance.doctor, instance.patient], instance.id)
-                
-            except Exception as e:
-                print(f"Error in vitals taken notification: {str(e)}")
-
+            notify_appointment_event.delay(
+                instance.id, 'vitals_taken', idempotency_key=f"appointment:{instance.id}:vitals_taken"
+            )
 
 
 @receiver(post_save, sender=Appointment)
@@ -213,47 +124,9 @@ def send_doctor_done_with_patient_notification(sender, instance, **kwargs):
         # Use update_fields to check if is_doctor_done_with_patient was actually updated
         update_fields = kwargs.get('update_fields')
         if update_fields is None or 'is_doctor_done_with_patient' in update_fields:
-            try:
-                # Get doctor and patient names
-                doctor_name = f"Dr. {instance.doctor.first_name} {instance.doctor.last_name}"
-                patient_name = f"{instance.patient.first_name} {instance.patient.last_name}"
-                
-                # Create notification for consultation completion
-                notification = Notification.objects.create(
-                    sender=instance.doctor,
-                    title="Consultation Completed",
-                    message=f"{doctor_name} has completed the consultation with {patient_name} for the appointment scheduled on {instance.appointment_date.strftime('%Y-%m-%d %H:%M')}."
-                )
-                
-                # Add patient as receiver
-                notification.receivers.add(instance.patient)
-                
-                # Collect affected users for appointment details
-                affected_users = [instance.patient]
-                
-                # Add nurse as receiver if assigned
-                if instance.nurse:
-                    notification.receivers.add(instance.nurse)
-                    affected_users.append(instance.nurse)
-                
-                # Add all pharmacists as receivers (they may need to dispense prescriptions)
-                pharmacists = CustomUser.objects.filter(
-                    role__name='pharmacist',
-                    is_active=True
-                )
-                for pharmacist in pharmacists:
-                    notification.receivers.add(pharmacist)
-                    affected_users.append(pharmacist)
-                
-                # Send WebSocket notifications to all receivers
-                send_websocket_notification_to_users(notification)
-                
-                # Trigger get_appointment_detail action for all affected users
-                send_refresh_appointment_action(affected_users, instance.id)
-                    
-            except Exception as e:
-                print(f"Error in doctor done with patient notification: {str(e)}")
-
+            notify_appointment_event.delay(
+                instance.id, 'doctor_done', idempotency_key=f"appointment:{instance.id}:doctor_done"
+            )
 
 
 @receiver(post_save, sender=Appointment)
@@ -264,203 +137,188 @@ def send_appointment_update_to_all_parties(sender, instance, **kwargs):
     """
     # Only trigger on updates (not creation, as creation is handled by create_appointment_notification)
     if not kwargs.get('created', False):
-        try:
-            # Collect all users who should receive the update
-            affected_users = [instance.doctor, instance.patient]
-            
-            # Add nurse if assigned
-            if instance.nurse:
-                affected_users.append(instance.nurse)
-            
-            # Send all WebSocket get actions to refresh client data
-            send_all_websocket_updates(affected_users)
-            
-        except Exception as e:
-            print(f"Error in general appointment update signal: {str(e)}")
+        # Collect all users who should receive the update
+        affected_user_ids = [instance.doctor_id, instance.patient_id]
 
+        # Add nurse if assigned
+        if instance.nurse_id:
+            affected_user_ids.append(instance.nurse_id)
 
+        # Every update is pushed, so each enqueue gets a fresh key
+        push_appointment_updates.delay(affected_user_ids)
 
-    
 
-def send_all_websocket_updates(users):
+@receiver(post_save, sender=Appointment)
+def update_appointment_slot(sender, instance, created, **kwargs):
     """
-    Helper function to send all WebSocket get actions to a list of users
-    This triggers the client to refresh appointments, notifications, and other data
+    Free the slot of a cancelled or moved appointment and claim the new one
+    Booking through slots.book_appointment has already claimed it
     """
-    try:
-        # Get the channel layer
-        channel_layer = get_channel_layer()
-        
-        # WebSocket actions to trigger on the client
-        actions = [
-            "get_appointments",
-            "get_notifications",
-            "get_department_appointments_today",
-            # Add more actions here as needed (e.g., "get_prescriptions", "get_vitals", etc.)
-        ]
-        
-        # Send to all affected users
-        for user in users:
-            # Check if user has an active WebSocket connection
-            user_connections = ActiveWebSocketConnection.objects.filter(email=user.email)
-            
-            if user_connections.exists():
-                # Convert email to a valid group name by replacing @ and . with _
-                safe_email = user.email.replace('@', '_').replace('.', '_')
-                
-                # Send each action to the user's WebSocket
-                for action in actions:
-                    async_to_sync(channel_layer.group_send)(
-                        f"user_{safe_email}",
-                        {
-                            "type": "send_notification",
-                            "message": {
-                                "action": action,
-                                "data": {}
-                            }
-                        }
-                    )
-    except Exception as e:
-        print(f"Error sending WebSocket updates: {str(e)}")
+    update_fields = kwargs.get('update_fields')
+    if created or update_fields is None or {'status', 'appointment_date', 'doctor'} & set(update_fields):
+        sync_appointment_slot(instance)
 
 
-def send_websocket_notification_to_users(notification):
-    """
-    Helper function to send WebSocket notifications to all notification receivers
-    """
-    try:
-        # Get the channel layer
-        channel_layer = get_channel_layer()
-        
-        # Send to all receivers
-        for receiver in notification.receivers.all():
-            # Check if receiver has an active WebSocket connection
-            receiver_connections = ActiveWebSocketConnection.objects.filter(email=receiver.email)
-            
-            if receiver_connections.exists():
-                # Convert email to a valid group name by replacing @ and . with _
-                safe_email = receiver.email.replace('@', '_').replace('.', '_')
-                
-                # Send notification to the receiver's WebSocket
-                async_to_sync(channel_layer.group_send)(
-                    f"user_{safe_email}",
-                    {
-                        "type": "send_notification",
-                        "message": {
-                            "action": "get_notifications",
-                            "data": {}
-                        }
-                    }
-                )
-    except Exception as e:
-        print(f"Error sending WebSocket notifications: {str(e)}")
+# Appointment fields that decide where it is on the queue board
+QUEUE_FIELDS = {
+    'status', 'appointment_date', 'doctor', 'is_patient_available', 'is_vitals_taken',
+    'is_doctor_with_patient', 'is_doctor_done_with_patient',
+}
 
 
-def send_websocket_appointments_update(notification):
-    """
-    Helper function to send WebSocket appointments update to all notification receivers
-    This refreshes the appointment lists in real-time for doctors and nurses
-    """
+def _move_on_queue_board(appointment_id, doctor_id, appointment_date, stage):
     try:
-        # Get the channel layer
-        channel_layer = get_channel_layer()
-        
-        # Send to all receivers
-        for receiver in notification.receivers.all():
-            # Check if receiver has an active WebSocket connection
-            receiver_connections = ActiveWebSocketConnection.objects.filter(email=receiver.email)
-            
-            if receiver_connections.exists():
-                # Convert email to a valid group name by replacing @ and . with _
-                safe_email = receiver.email.replace('@', '_').replace('.', '_')
-                
-                # Send appointments update to the receiver's WebSocket
-                async_to_sync(channel_layer.group_send)(
-                    f"user_{safe_email}",
-                    {
-                        "type": "send_notification",
-                        "message": {
-                            "action": "get_appointments",
-                            "data": {}
-                        }
-                    }
-                )
-    except Exception as e:
-        print(f"Error sending WebSocket appointments update: {str(e)}")
+        department_ids = queue_board.appointment_changed(appointment_id, doctor_id, appointment_date, stage)
+    except Exception:
+        # The board is rebuilt from the database; a store outage must not fail the request
+        logger.exception("Could not update the queue board for appointment %s", appointment_id)
+        return
+    for department_id in department_ids:
+        push_queue_board.delay(department_id)
 
 
-def send_appointment_details_to_users(users, appointment_data, event_type):
-    """
-    Helper function to send appointment details directly to users via WebSocket
-    
-    Args:
-        users: List of users to send the appointment data to
-        appointment_data: Serialized appointment data (dictionary)
-        event_type: Type of event (e.g., 'patient_available', 'vitals_taken', etc.)
-    """
-    try:
-        # Get the channel layer
-        channel_layer = get_channel_layer()
-        
-        # Send to all specified users
-        for user in users:
-            # Check if user has an active WebSocket connection
-            user_connections = ActiveWebSocketConnection.objects.filter(email=user.email)
-            
-            if user_connections.exists():
-                # Convert email to a valid group name by replacing @ and . with _
-                safe_email = user.email.replace('@', '_').replace('.', '_')
-                
-                # Send appointment details to the user's WebSocket
-                async_to_sync(channel_layer.group_send)(
-                    f"user_{safe_email}",
-                    {
-                        "type": "send_notification",
-                        "message": {
-                            "action": "appointment_updated",
-                            "event_type": event_type,
-                            "data": {
-                                "appointment": appointment_data
-                            }
-                        }
-                    }
-                )
-    except Exception as e:
-        print(f"Error sending appointment details via WebSocket: {str(e)}")
+@receiver(post_save, sender=Appointment)
+def update_queue_board(sender, instance, created, **kwargs):
+    """Move the appointment to its stage on the department queue board, once committed"""
+    update_fields = kwargs.get('update_fields')
+    if created or update_fields is None or QUEUE_FIELDS & set(update_fields):
+        args = (instance.id, instance.doctor_id, instance.appointment_date, queue_board.stage_of(instance))
+        transaction.on_commit(lambda: _move_on_queue_board(*args))
+
+
+@receiver(post_delete, sender=Appointment)
+def remove_from_queue_board(sender, instance, **kwargs):
+    appointment_id = instance.id
+    transaction.on_commit(lambda: _move_on_queue_board(appointment_id, None, None, None))
 
 
-def send_refresh_appointment_action(users, appointment_id):
+@receiver(pre_save, sender=VitalSign)
+def score_vital_sign(sender, instance, **kwargs):
+    """Early-warning score of the reading (see early_warning.py)"""
+    score_reading(instance)
+
+
+@receiver(post_save, sender=VitalSign)
+def check_early_warning(sender, instance, created, **kwargs):
+    """Alert the ward about a worrying new reading, once committed"""
+    if created:
+        check_vital_signs.delay([instance.pk])
+
+
+def _summary_changed(patient_ids, *sections):
+    """Mark sections of the patients' summaries stale and have them rebuilt (see patient_summary.py)"""
+    patient_ids = [patient_id for patient_id in patient_ids if patient_id is not None]
+    if patient_ids and invalidate_summaries(patient_ids, *sections):
+        refresh_patient_summaries.delay(patient_ids)
+
+
+@receiver(post_save, sender=Profile)
+def update_summary_profile(sender, instance, created, update_fields=None, **kwargs):
+    # Saving the user saves its profile too (save_user_profile)
+    if created or not _saves_any(update_fields, SUMMARY_PROFILE_FIELDS):
+        return
+    # Only patients have summaries, unless this user was one until now
+    if _is_patient(instance) or PatientSummary.objects.filter(patient_id=instance.user_id).exists():
+        _summary_changed([instance.user_id], 'profile')
+
+
+@receiver(post_save, sender=Admission)
+@receiver(post_delete, sender=Admission)
+def update_summary_admission(sender, instance, **kwargs):
+    _summary_changed([instance.patient_id], 'admission')
+
+
+@receiver(post_save, sender=Treatment)
+@receiver(post_delete, sender=Treatment)
+@receiver(post_save, sender=DeliveredMedicationTreatment)
+@receiver(post_delete, sender=DeliveredMedicationTreatment)
+def update_summary_medications(sender, instance, **kwargs):
+    patient_id = MedicalRecord.objects.filter(pk=instance.medical_record_id).values_list('patient_id', flat=True).first()
+    _summary_changed([patient_id], 'medications')
+
+
+@receiver(post_save, sender=VitalSign)
+@receiver(post_delete, sender=VitalSign)
+def update_summary_vitals(sender, instance, **kwargs):
+    _summary_changed([instance.patient_id], 'vitals')
+
+
+# Models whose text is searched (see clinical_search.py)
+SEARCHED_KINDS = {model: kind for kind, (model, *_) in clinical_search.SOURCES.items()}
+
+
+@receiver(post_save, sender=MedicalRecord)
+@receiver(post_save, sender=Treatment)
+@receiver(post_save, sender=TestResult)
+@receiver(post_save, sender=DoctorVisit)
+def update_search_index(sender, instance, **kwargs):
+    clinical_search.index_objects(SEARCHED_KINDS[sender], [instance.pk])
+
+
+@receiver(post_delete, sender=MedicalRecord)
+@receiver(post_delete, sender=Treatment)
+@receiver(post_delete, sender=TestResult)
+@receiver(post_delete, sender=DoctorVisit)
+def remove_from_search_index(sender, instance, **kwargs):
+    clinical_search.remove_objects(SEARCHED_KINDS[sender], [instance.pk])
+
+
+
+@receiver(post_save, sender=Profile)
+def update_patient_lookup_keys(sender, instance, update_fields=None, **kwargs):
+    # Creating or saving the user saves its profile too, so name, email and role changes land here
+    if not _saves_any(update_fields, LOOKUP_PROFILE_FIELDS):
+        return
+    # Only patients have keys, unless this user was one until now
+    if _is_patient(instance) or PatientLookupKey.objects.filter(patient_id=instance.user_id).exists():
+        patient_directory.update_keys([instance.user_id])
+
+
+@receiver(post_init, sender=Profile)
+def remember_profile_department(sender, instance, **kwargs):
+    instance._loaded_department_id = instance.department_id
+
+
+@receiver(post_save, sender=Profile)
+def update_slot_department(sender, instance, created, **kwargs):
+    """Future slots follow the doctor's department"""
+    if created or instance.department_id == instance._loaded_department_id:
+        return
+    instance._loaded_department_id = instance.department_id
+    AppointmentSlot.objects.filter(
+        doctor_id=instance.user_id, start__gte=timezone.now()
+    ).exclude(department_id=instance.department_id).update(department_id=instance.department_id)
+
+
+@receiver(m2m_changed, sender=Notification.receivers.through)
+def update_unread_counters(sender, instance, action, reverse, pk_set, **kwargs):
     """
-    Helper function to trigger get_appointment_detail action for users via WebSocket
-    This prompts the client to fetch the updated appointment data
-    
-    Args:
-        users: List of users to send the action to
-        appointment_id: ID of the appointment to refresh
+    Keep NotificationCounter in step with receivers.add()/remove()/clear()
+    (from either side of the relation). New deliveries start unread
     """
-    try:
-        # Get the channel layer
-        channel_layer = get_channel_layer()
-        
-        for user in users:
-            if not isinstance(user, CustomUser):
-                continue
-                
-            # Send refresh action to user's WebSocket group
-            safe_email = user.email.replace('@', '_').replace('.', '_')
-            async_to_sync(channel_layer.group_send)(
-                f"user_{safe_email}",
-                {
-                    "type": "send_message",
-                    "message": {
-                        "type": "action",
-                        "action": "get_appointment_detail",
-                        "appointment_id": str(appointment_id)
-                    }
-                }
-            )
-    except Exception as e:
-        print(f"Error sending refresh appointment action: {str(e)}")
+    if reverse:
+        deliveries = NotificationDelivery.objects.filter(receiver=instance)
+        if pk_set is not None:
+            deliveries = deliveries.filter(notification_id__in=pk_set)
+    else:
+        deliveries = NotificationDelivery.objects.filter(notification=instance)
+        if pk_set is not None:
+            deliveries = deliveries.filter(receiver_id__in=pk_set)
+
+    if action == 'post_add' and pk_set:
+        if reverse:
+            adjust_unread({instance.pk: len(pk_set)})
+        else:
+            adjust_unread(dict.fromkeys(pk_set, 1))
+    elif action in ('pre_remove', 'pre_clear'):
+        adjust_unread(unread_deltas(deliveries))
+
+
+@receiver(pre_delete, sender=Notification)
+def release_unread_counters(sender, instance, **kwargs):
+    """Deleting a notification takes its unread deliveries off the counters"""
+    adjust_unread(unread_deltas(NotificationDelivery.objects.filter(notification=instance)))
+
 
 
 @receiver(post_save, sender=Room)
@@ -543,8 +401,8 @@ def create_room_beds(sender, instance, created, **kwargs):
                         }
                     }
                 )
-    except Exception as e:
-        print(f"Error sending refresh appointment action via WebSocket: {str(e)}")
+    except Exception:
+        logger.exception("Error sending refresh appointment action via WebSocket")
 
 
 @receiver(post_save, sender=DrugSale)
@@ -552,18 +410,16 @@ def update_drug_quantities_on_payment(sender, instance, created, **kwargs):
     """
     Subtract drug quantities when DrugSale payment status changes to 'paid'
     """
-    print(f"DrugSale signal triggered - created: {created}, payment_status: {instance.payment_status}, amount_paid: {instance.amount_paid}, total_amount: {instance.total_amount}")
+    logger.debug(
+        "DrugSale %s saved (created=%s, payment_status=%s)",
+        instance.id, created, instance.payment_status
+    )
     
     # Check if this is an update (not creation) and payment status is now 'paid'
     if not created and instance.payment_status == 'paid':
-        print("Payment status is 'paid' and this is an update, checking update_fields...")
-        
         # Use update_fields to check if payment_status was actually updated
         update_fields = kwargs.get('update_fields')
-        print(f"Update fields: {update_fields}")
-        
         if update_fields is None or 'payment_status' in update_fields or 'amount_paid' in update_fields:
-            print("Proceeding with drug quantity update...")
             try:
                 with transaction.atomic():
                     # Find related ReferralDispensedDrugItem through BulkSaleId
@@ -572,28 +428,25 @@ def update_drug_quantities_on_payment(sender, instance, created, **kwargs):
                             bulk_sale_id=instance.sales_id
                         )
                         
-                        print(f"Processing payment for DrugSale {instance.id}, found {referral_items.count()} items")
-                        
                         for item in referral_items:
                             # Subtract the number_of_cards from the drug quantity
                             drug = item.drug
                             if drug.quantity >= item.number_of_cards:
                                 drug.quantity -= item.number_of_cards
                                 drug.save(update_fields=['quantity'])
-                                print(f"Reduced {drug.name} quantity by {item.number_of_cards}, new quantity: {drug.quantity}")
+                                logger.debug(
+                                    "Reduced drug %s quantity by %s to %s",
+                                    drug.id, item.number_of_cards, drug.quantity
+                                )
                             else:
                                 # Handle insufficient quantity - could raise an error or log warning
-                                print(f"Warning: Insufficient quantity for drug {drug.name}. "
-                                      f"Available: {drug.quantity}, Required: {item.number_of_cards}")
+                                logger.warning(
+                                    "Insufficient quantity for drug %s (available %s, required %s)",
+                                    drug.id, drug.quantity, item.number_of_cards,
+                                    extra={'drug_sale_id': instance.id}
+                                )
                     else:
-                        print("No sales_id found for this DrugSale")
+                        logger.warning("DrugSale %s was paid without a sales_id", instance.id)
                                 
-            except Exception as e:
-                print(f"Error updating drug quantities on payment: {str(e)}")
-        else:
-            print("Update fields check failed - not processing")
-    else:
-        if created:
-            print("This is a new DrugSale creation - not processing")
-        else:
-            print(f"Payment status is not 'paid': {instance.payment_status}")
\ No newline at end of file
+            except Exception:
+                logger.exception("Error updating drug quantities on payment")
\ No newline at end of file
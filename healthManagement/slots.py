@@ -0,0 +1,173 @@
+"""
+Doctor slot calendar
+
+Doctors' weekly working hours (DoctorSchedule) are cut into AppointmentSlot
+rows for the next SLOT_HORIZON_DAYS days, which serve as the availability
+index:
+- free slots of a department or doctor are one range scan, on a partial
+  index of free slots by (department, start) or on (doctor, start)
+- booking claims a slot with a conditional UPDATE (is_available true ->
+  false), so of two concurrent requests for one slot exactly one wins;
+  the partial unique constraint on active appointments is the backstop
+- cancelling or moving an appointment frees its slot (see signals.py)
+- build_slots() runs when a schedule is saved through the API and every
+  few hours to extend the horizon; it never touches a booked slot
+Doctors without a schedule are booked as before, at any future time.
+"""
+import logging
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import Appointment, AppointmentSlot, DoctorSchedule, Profile
+
+logger = logging.getLogger(__name__)
+
+# Appointments that hold their slot
+ACTIVE_STATUSES = ['pending', 'confirmed']
+
+
+class SlotUnavailable(Exception):
+    pass
+
+
+def _aware(day, at):
+    return timezone.make_aware(datetime.combine(day, at))
+
+
+def build_slots(doctor_ids=None, start_date=None, days=None):
+    """
+    Create the slots of the given doctors (all scheduled doctors when None)
+    for days days from start_date (today). Free slots that are no longer
+    in a schedule are dropped; slots at already booked times are linked to
+    their appointment. Returns {'created': n, 'removed': n}
+    """
+    now = timezone.now()
+    start_date = start_date or timezone.localdate()
+    days = days or settings.SLOT_HORIZON_DAYS
+    window_start = max(now, _aware(start_date, time.min))
+    window_end = _aware(start_date + timedelta(days=days), time.min)
+
+    schedules = DoctorSchedule.objects.all()
+    if doctor_ids is not None:
+        schedules = schedules.filter(doctor_id__in=doctor_ids)
+    blocks = defaultdict(lambda: defaultdict(list))
+    for schedule in schedules:
+        blocks[schedule.doctor_id][schedule.weekday].append(schedule)
+    departments = dict(
+        Profile.objects.filter(user_id__in=list(blocks)).values_list('user_id', 'department_id')
+    )
+
+    wanted = {}
+    for offset in range(days):
+        day = start_date + timedelta(days=offset)
+        for doctor_id, by_weekday in blocks.items():
+            for block in by_weekday.get(day.weekday(), []):
+                step = timedelta(minutes=block.slot_minutes)
+                start, block_end = _aware(day, block.start_time), _aware(day, block.end_time)
+                while start + step <= block_end:
+                    if start >= window_start:
+                        wanted[(doctor_id, start)] = AppointmentSlot(
+                            doctor_id=doctor_id, department_id=departments.get(doctor_id),
+                            start=start, end=start + step,
+                        )
+                    start += step
+
+    existing = AppointmentSlot.objects.filter(start__gte=window_start, start__lt=window_end)
+    appointments = Appointment.objects.filter(
+        status__in=ACTIVE_STATUSES, appointment_date__gte=window_start, appointment_date__lt=window_end,
+        slot__isnull=True,
+    )
+    if doctor_ids is not None:
+        existing = existing.filter(doctor_id__in=doctor_ids)
+        appointments = appointments.filter(doctor_id__in=doctor_ids)
+
+    with transaction.atomic():
+        stale = []
+        for pk, doctor_id, start, is_available in existing.values_list('pk', 'doctor_id', 'start', 'is_available'):
+            if wanted.pop((doctor_id, start), None) is None and is_available:
+                stale.append(pk)
+        for index in range(0, len(stale), 500):
+            AppointmentSlot.objects.filter(pk__in=stale[index:index + 500]).delete()
+        AppointmentSlot.objects.bulk_create(wanted.values(), batch_size=1000, ignore_conflicts=True)
+
+        # Appointments booked before their slot existed
+        for appointment in appointments.only('pk', 'doctor_id', 'appointment_date'):
+            claim_slot(appointment)
+
+    return {'created': len(wanted), 'removed': len(stale)}
+
+
+def free_slots(department_id=None, doctor_id=None, after=None, limit=10):
+    """The next limit free slots of a department or doctor, earliest first"""
+    after = max(after or timezone.now(), timezone.now())
+    slots = AppointmentSlot.objects.filter(is_available=True, start__gt=after)
+    if department_id is not None:
+        slots = slots.filter(department_id=department_id)
+    if doctor_id is not None:
+        slots = slots.filter(doctor_id=doctor_id)
+    return slots.select_related('doctor', 'department').order_by('start', 'pk')[:limit]
+
+
+def claim_slot(appointment):
+    """Take the free slot an appointment falls in, if any; returns whether it got one"""
+    return bool(AppointmentSlot.objects.filter(
+        doctor_id=appointment.doctor_id,
+        start__lte=appointment.appointment_date,
+        end__gt=appointment.appointment_date,
+        is_available=True,
+    ).update(is_available=False, appointment=appointment))
+
+
+def sync_appointment_slot(appointment):
+    """
+    After an appointment was cancelled, completed early or moved: free the
+    slot it no longer occupies and claim the one it does
+    """
+    active = appointment.status in ACTIVE_STATUSES
+    held = AppointmentSlot.objects.filter(appointment=appointment)
+    if active:
+        held = held.exclude(
+            doctor_id=appointment.doctor_id,
+            start__lte=appointment.appointment_date,
+            end__gt=appointment.appointment_date,
+        )
+    held.filter(start__gt=timezone.now()).update(is_available=True, appointment=None)
+    if active and not AppointmentSlot.objects.filter(appointment=appointment).exists():
+        claim_slot(appointment)
+
+
+def book_appointment(patient, doctor, appointment_date, reason=''):
+    """
+    Book appointment_date with doctor for patient, claiming its slot
+    Raises SlotUnavailable when the slot is taken or outside the doctor's hours
+    """
+    with transaction.atomic():
+        claimed = AppointmentSlot.objects.filter(
+            doctor=doctor, start=appointment_date, is_available=True
+        ).update(is_available=False)
+        if not claimed:
+            if AppointmentSlot.objects.filter(doctor=doctor, start=appointment_date).exists():
+                raise SlotUnavailable("This time slot is already booked.")
+            if DoctorSchedule.objects.filter(doctor=doctor).exists():
+                raise SlotUnavailable("The doctor has no slot at this time.")
+
+        try:
+            with transaction.atomic():
+                appointment = Appointment.objects.create(
+                    patient=patient,
+                    doctor=doctor,
+                    appointment_date=appointment_date,
+                    patient_reason_for_appointment=reason,
+                    status='pending'
+                )
+        except IntegrityError:
+            # Unscheduled doctor, booked concurrently
+            raise SlotUnavailable("This time slot is already booked.")
+
+        if claimed:
+            AppointmentSlot.objects.filter(doctor=doctor, start=appointment_date).update(appointment=appointment)
+    return appointment
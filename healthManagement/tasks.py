@@ -0,0 +1,377 @@
+"""
+Background tasks for appointment notifications and WebSocket pushes
+
+The post_save receivers in signals.py only decide *that* something
+happened and enqueue one of these (see hmsServer/tasks.py), so saving an
+Appointment no longer waits for receiver lookups, deliveries or channel
+sends. Each step is its own task: a failed push is retried without
+creating the notification a second time. The send helpers let channel
+layer errors propagate, so the task runner logs and retries them (a
+retried push may reach some clients twice, which only refreshes them again).
+"""
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+
+from accounts.models import CustomUser
+from hmsServer.tasks import task
+
+from .clinic_stats import close_days, roll_up
+from .early_warning import check_readings
+from .models import ActiveWebSocketConnection, Appointment, Notification
+from .notifications import notify
+from .patient_summary import refresh_stale
+from .queue_board import department_board
+from .reminders import send_due_reminders
+from .slots import build_slots
+
+
+def _safe_group(email):
+    # Convert email to a valid group name by replacing @ and . with _
+    return f"user_{email.replace('@', '_').replace('.', '_')}"
+
+
+def _connected_emails(users):
+    """Emails of the given users that have an active WebSocket connection, in one query"""
+    emails = [user.email for user in users if user is not None]
+    return list(
+        ActiveWebSocketConnection.objects.filter(email__in=emails).values_list('email', flat=True).distinct()
+    )
+
+
+def send_websocket_notification_to_users(notification):
+    """
+    Helper function to send WebSocket notifications to all notification receivers
+    """
+    # Get the channel layer
+    channel_layer = get_channel_layer()
+
+    # Receivers with an active WebSocket connection, in one query
+    connected_emails = ActiveWebSocketConnection.objects.filter(
+        email__in=notification.receivers.values('email')
+    ).values_list('email', flat=True).distinct()
+
+    for email in connected_emails:
+        # Send notification to the receiver's WebSocket
+        async_to_sync(channel_layer.group_send)(
+            _safe_group(email),
+            {
+                "type": "send_notification",
+                "message": {
+                    "action": "get_notifications",
+                    "data": {}
+                }
+            }
+        )
+
+
+def send_notifications_refresh(users):
+    """
+    Helper function to tell users with an active WebSocket connection to refresh their notifications
+    """
+    # Get the channel layer
+    channel_layer = get_channel_layer()
+
+    for email in _connected_emails(users):
+        async_to_sync(channel_layer.group_send)(
+            _safe_group(email),
+            {
+                "type": "send_notification",
+                "message": {
+                    "action": "get_notifications",
+                    "data": {}
+                }
+            }
+        )
+
+
+def send_all_websocket_updates(users):
+    """
+    Helper function to send all WebSocket get actions to a list of users
+    This triggers the client to refresh appointments, notifications, and other data
+    """
+    # Get the channel layer
+    channel_layer = get_channel_layer()
+
+    # WebSocket actions to trigger on the client
+    actions = [
+        "get_appointments",
+        "get_notifications",
+        "get_department_appointments_today",
+        # Add more actions here as needed (e.g., "get_prescriptions", "get_vitals", etc.)
+    ]
+
+    # Send to all affected users with an active WebSocket connection
+    for email in _connected_emails(users):
+        # Send each action to the user's WebSocket
+        for action in actions:
+            async_to_sync(channel_layer.group_send)(
+                _safe_group(email),
+                {
+                    "type": "send_notification",
+                    "message": {
+                        "action": action,
+                        "data": {}
+                    }
+                }
+            )
+
+
+def send_websocket_appointments_update(notification):
+    """
+    Helper function to send WebSocket appointments update to all notification receivers
+    This refreshes the appointment lists in real-time for doctors and nurses
+    """
+    # Get the channel layer
+    channel_layer = get_channel_layer()
+
+    # Send appointments update to the receivers' WebSockets
+    for email in _connected_emails(notification.receivers.all()):
+        async_to_sync(channel_layer.group_send)(
+            _safe_group(email),
+            {
+                "type": "send_notification",
+                "message": {
+                    "action": "get_appointments",
+                    "data": {}
+                }
+            }
+        )
+
+
+def send_appointment_details_to_users(users, appointment_data, event_type):
+    """
+    Helper function to send appointment details directly to users via WebSocket
+
+    Args:
+        users: List of users to send the appointment data to
+        appointment_data: Serialized appointment data (dictionary)
+        event_type: Type of event (e.g., 'patient_available', 'vitals_taken', etc.)
+    """
+    # Get the channel layer
+    channel_layer = get_channel_layer()
+
+    # Send appointment details to the users' WebSockets
+    for email in _connected_emails(users):
+        async_to_sync(channel_layer.group_send)(
+            _safe_group(email),
+            {
+                "type": "send_notification",
+                "message": {
+                    "action": "appointment_updated",
+                    "event_type": event_type,
+                    "data": {
+                        "appointment": appointment_data
+                    }
+                }
+            }
+        )
+
+
+def send_queue_board(department_id):
+    """
+    Send a department's queue board to every connected member of the
+    department (see SimpleConsumer.queue_board_update); the board is read
+    once for all of them
+    """
+    channel_layer = get_channel_layer()
+    async_to_sync(channel_layer.group_send)(
+        f"queue_board_{department_id}",
+        {
+            "type": "queue_board_update",
+            "board": department_board(department_id),
+        }
+    )
+
+
+def send_refresh_appointment_action(users, appointment_id):
+    """
+    Helper function to trigger get_appointment_detail action for users via WebSocket
+    This prompts the client to fetch the updated appointment data
+
+    Args:
+        users: List of users to send the action to
+        appointment_id: ID of the appointment to refresh
+    """
+    # Get the channel layer
+    channel_layer = get_channel_layer()
+
+    for user in users:
+        if not isinstance(user, CustomUser):
+            continue
+
+        # Send refresh action to user's WebSocket group
+        async_to_sync(channel_layer.group_send)(
+            _safe_group(user.email),
+            {
+                "type": "send_message",
+                "message": {
+                    "type": "action",
+                    "action": "get_appointment_detail",
+                    "appointment_id": str(appointment_id)
+                }
+            }
+        )
+
+
+# What each appointment event notifies: (receivers, title, message, sender)
+
+def _when(appointment):
+    return appointment.appointment_date.strftime('%Y-%m-%d %H:%M')
+
+
+def _full_name(user):
+    return f"{user.first_name} {user.last_name}"
+
+
+def _created(appointment):
+    return (
+        [appointment.doctor],
+        "New Appointment",
+        f"You have a new appointment with {_full_name(appointment.patient)} on {_when(appointment)}.",
+        appointment.patient,
+    )
+
+
+def _patient_available(appointment):
+    # The doctor and all nurses in the doctor's department
+    receivers = [appointment.doctor]
+    profile = getattr(appointment.doctor, 'profile', None)
+    if profile and profile.department_id:
+        receivers.extend(CustomUser.objects.filter(
+            role__name='nurse',
+            profile__department_id=profile.department_id,
+            is_active=True
+        ))
+    return (
+        receivers,
+        "Patient Available",
+        f"{_full_name(appointment.patient)} is now available for their appointment scheduled on {_when(appointment)}. Ready for vitals check.",
+        appointment.patient,
+    )
+
+
+def _doctor_with_patient(appointment):
+    # The patient, and the nurse if assigned
+    receivers = [appointment.patient]
+    if appointment.nurse:
+        receivers.append(appointment.nurse)
+    return (
+        receivers,
+        "Doctor With Patient",
+        f"Dr. {_full_name(appointment.doctor)} is now with patient {_full_name(appointment.patient)} for the appointment scheduled on {_when(appointment)}.",
+        appointment.doctor,
+    )
+
+
+def _vitals_taken(appointment):
+    nurse_name = _full_name(appointment.nurse) if appointment.nurse else "Nurse"
+    return (
+        [appointment.doctor, appointment.patient],
+        "Vitals Taken",
+        f"Vitals have been taken by {nurse_name} for the appointment between {_full_name(appointment.patient)} and Dr. {_full_name(appointment.doctor)} scheduled on {_when(appointment)}.",
+        appointment.nurse,
+    )
+
+
+def _doctor_done(appointment):
+    # The patient, the nurse if assigned, and all pharmacists
+    # (they may need to dispense prescriptions)
+    receivers = [appointment.patient]
+    if appointment.nurse:
+        receivers.append(appointment.nurse)
+    receivers.extend(CustomUser.objects.filter(role__name='pharmacist', is_active=True))
+    return (
+        receivers,
+        "Consultation Completed",
+        f"Dr. {_full_name(appointment.doctor)} has completed the consultation with {_full_name(appointment.patient)} for the appointment scheduled on {_when(appointment)}.",
+        appointment.doctor,
+    )
+
+
+APPOINTMENT_EVENTS = {
+    'created': _created,
+    'patient_available': _patient_available,
+    'doctor_with_patient': _doctor_with_patient,
+    'vitals_taken': _vitals_taken,
+    'doctor_done': _doctor_done,
+}
+
+
+@task()
+def notify_appointment_event(appointment_id, event):
+    """
+    Create the notification for an appointment event, then hand the
+    WebSocket pushes to their own tasks
+    """
+    appointment = Appointment.objects.select_related(
+        'patient', 'doctor', 'doctor__profile', 'nurse'
+    ).get(pk=appointment_id)
+    receivers, title, message, sender = APPOINTMENT_EVENTS[event](appointment)
+    notification = notify(receivers, title=title, message=message, sender=sender)
+
+    push_notification.delay(notification.id)
+    if event != 'created':
+        # Clients showing this appointment fetch it again
+        refresh_appointment.delay([user.pk for user in receivers], appointment.id)
+
+
+@task()
+def push_notification(notification_id):
+    """Tell connected receivers of a notification to refresh their notifications"""
+    send_websocket_notification_to_users(Notification.objects.get(pk=notification_id))
+
+
+@task()
+def refresh_appointment(user_ids, appointment_id):
+    send_refresh_appointment_action(CustomUser.objects.filter(pk__in=user_ids), appointment_id)
+
+
+@task()
+def push_appointment_updates(user_ids):
+    """Refresh appointments, notifications and department lists of connected users"""
+    send_all_websocket_updates(CustomUser.objects.filter(pk__in=user_ids))
+
+
+@task()
+def push_notifications_refresh(user_ids):
+    send_notifications_refresh(CustomUser.objects.filter(pk__in=user_ids))
+
+
+@task(max_retries=0)
+def send_appointment_reminders():
+    """Periodic: send the 24h / 1h appointment reminders that are due"""
+    sent, patient_ids = send_due_reminders()
+    if patient_ids:
+        push_notifications_refresh.delay(sorted(patient_ids))
+    return sent
+
+
+@task()
+def extend_slot_calendar():
+    """Periodic: build the slots of the day that entered the SLOT_HORIZON_DAYS window"""
+    return build_slots()
+
+
+@task()
+def push_queue_board(department_id):
+    send_queue_board(department_id)
+
+
+@task(max_retries=0)
+def roll_up_clinic_stats():
+    """Periodic: roll up the new appointment events and close the days that ended"""
+    return {'events': roll_up(), 'days_closed': len(close_days())}
+
+
+@task()
+def check_vital_signs(vital_sign_ids):
+    """Alert the wards about new readings that call for it (see early_warning.check_readings)"""
+    for notification in check_readings(vital_sign_ids):
+        # Pushed by its own task, so a failed push is retried without alerting twice
+        push_notification.delay(notification.id)
+
+
+@task()
+def refresh_patient_summaries(patient_ids):
+    """Rebuild the stale sections of the patients' summaries (see patient_summary.py)"""
+    return refresh_stale(patient_ids)
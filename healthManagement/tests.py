@@ -0,0 +1,266 @@
+from datetime import time, timedelta
+
+from django.contrib.auth.models import Group
+from django.test import TestCase
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework.test import APIClient
+
+from accounts.models import CustomUser
+
+from . import patient_directory, reminders, transitions, vitals_ingest
+from .models import (
+    Appointment, AppointmentReminder, AppointmentSlot, DoctorSchedule, Notification, NotificationCounter, VitalSign,
+)
+from .slots import build_slots
+from .transitions import TransitionConflict, apply_transition, apply_transitions
+from .notifications import adjust_unread, mark_read, notify, notify_many, unread_count
+
+
+class PatientLookupTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        patient = Group.objects.create(name='patient')
+        # More keys for the common word than a lookup could read unranked
+        CustomUser.objects.bulk_create([
+            CustomUser(email=f'john.doe{i}@example.com', first_name='John', last_name=f'Doe{i}', role=patient)
+            for i in range(2500)
+        ])
+        cls.smith = CustomUser.objects.create(
+            email='jsmith@example.com', first_name='John', last_name='Smith', role=patient
+        )
+        patient_directory.rebuild()
+
+    def test_rare_word_is_not_crowded_out_by_a_common_one(self):
+        for query in ['john smith', 'smith john', 'jo smi']:
+            with self.subTest(query=query):
+                self.assertEqual([row['id'] for row in patient_directory.lookup(query)], [self.smith.pk])
+
+    def test_whole_words_rank_before_prefixes(self):
+        results = patient_directory.lookup('smith', limit=50)
+        self.assertEqual([row['id'] for row in results], [self.smith.pk])
+        self.assertEqual(results[0]['score'], 2)
+        self.assertEqual(len(patient_directory.lookup('doe1', limit=50)), 50)
+        self.assertEqual(patient_directory.lookup('doe1')[0]['name'], 'John Doe1')
+
+
+class UnreadCounterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = CustomUser.objects.create(email='alice@example.com')
+        cls.bob = CustomUser.objects.create(email='bob@example.com')
+
+    def counts(self):
+        return unread_count(self.alice.pk), unread_count(self.bob.pk)
+
+    def test_counters_follow_deliveries(self):
+        first = notify([self.alice, self.bob, self.alice.pk, None], 'First', 'To both')
+        notify_many([([self.alice], 'Second', 'To Alice', None), ([self.bob], 'Third', 'To Bob', None)])
+        self.assertEqual(self.counts(), (2, 2))
+
+        self.assertEqual(mark_read(self.alice.pk, [first.pk]), (1, 1))
+        # Already read: nothing marked, nothing taken off
+        self.assertEqual(mark_read(self.alice.pk, [first.pk]), (0, 1))
+
+        first.receivers.remove(self.bob)
+        self.assertEqual(self.counts(), (1, 1))
+        first.receivers.add(self.bob)
+        self.assertEqual(self.counts(), (1, 2))
+        # Alice had read it, so deleting it only moves Bob's counter
+        first.delete()
+        self.assertEqual(self.counts(), (1, 1))
+
+        self.assertEqual(mark_read(self.bob.pk), (1, 0))
+
+    def test_counters_never_go_below_zero(self):
+        adjust_unread({self.alice.pk: -3, self.bob.pk: 2})
+        self.assertEqual(
+            dict(NotificationCounter.objects.values_list('user_id', 'unread')),
+            {self.alice.pk: 0, self.bob.pk: 2},
+        )
+
+
+class ReminderTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.now = timezone.now()
+        patient = CustomUser.objects.create(
+            email='patient@example.com', role=Group.objects.create(name='patient')
+        )
+        doctor = CustomUser.objects.create(
+            email='doctor@example.com', last_name='House', role=Group.objects.create(name='doctor')
+        )
+        cls.appointment = Appointment.objects.create(
+            patient=patient, doctor=doctor, appointment_date=cls.now + timedelta(hours=3)
+        )
+
+    def test_each_reminder_is_sent_once(self):
+        self.assertEqual(reminders.send_due_reminders(self.now)[0], {'24h': 1, '1h': 0})
+        self.assertEqual(reminders.send_due_reminders(self.now)[0], {'24h': 0, '1h': 0})
+        # Two hours later it is the 1h reminder's turn
+        later = self.now + timedelta(hours=2, minutes=30)
+        self.assertEqual(reminders.send_due_reminders(later)[0], {'24h': 0, '1h': 1})
+        self.assertEqual(Notification.objects.filter(title='Appointment Reminder').count(), 2)
+
+    def test_overlapping_runs_skip_claimed_appointments(self):
+        # This run read its batch, then another run claimed the same reminder first
+        after, until = reminders.reminder_windows(self.now)['24h']
+        batch = list(reminders.due_appointments('24h', after, until).select_related('patient', 'doctor'))
+        self.assertEqual(batch, [self.appointment])
+        AppointmentReminder.objects.create(
+            appointment=self.appointment, kind='24h', appointment_date=self.appointment.appointment_date, run='other'
+        )
+
+        self.assertEqual(reminders._remind('24h', batch, self.now), [])
+        self.assertFalse(Notification.objects.exists())
+
+    def test_rescheduled_appointment_is_reminded_again(self):
+        reminders.send_due_reminders(self.now)
+        self.appointment.appointment_date += timedelta(hours=1)
+        self.appointment.save()
+        self.assertEqual(reminders.send_due_reminders(self.now)[0]['24h'], 1)
+
+
+class BookingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        patient = Group.objects.create(name='patient')
+        doctor = Group.objects.create(name='doctor')
+        cls.patients = [
+            CustomUser.objects.create(email=f'patient{i}@example.com', role=patient) for i in range(2)
+        ]
+        cls.scheduled = CustomUser.objects.create(email='scheduled@example.com', role=doctor)
+        cls.unscheduled = CustomUser.objects.create(email='unscheduled@example.com', role=doctor)
+        tomorrow = timezone.localdate() + timedelta(days=1)
+        DoctorSchedule.objects.create(
+            doctor=cls.scheduled, weekday=tomorrow.weekday(), start_time=time(9), end_time=time(10)
+        )
+        build_slots([cls.scheduled.pk], start_date=tomorrow, days=1)
+
+    def book(self, patient, doctor, appointment_date):
+        client = APIClient()
+        client.force_authenticate(patient)
+        return client.post('/api/hms/book_appointment', {
+            'doctor_id': doctor.pk,
+            'appointment_date': appointment_date.isoformat(),
+            'patient_reason_for_appointment': 'Checkup',
+        }, format='json')
+
+    def test_second_booking_of_a_slot_conflicts(self):
+        slot = AppointmentSlot.objects.filter(doctor=self.scheduled).order_by('start').first()
+        first = self.book(self.patients[0], self.scheduled, slot.start)
+        self.assertEqual(first.status_code, 201)
+        second = self.book(self.patients[1], self.scheduled, slot.start)
+        self.assertEqual(second.status_code, 409)
+        self.assertIn('appointment_date', second.json()['errors'])
+
+        slot.refresh_from_db()
+        self.assertFalse(slot.is_available)
+        self.assertEqual(slot.appointment_id, first.json()['appointment_id'])
+        self.assertEqual(Appointment.objects.filter(doctor=self.scheduled).count(), 1)
+
+    def test_time_outside_the_schedule_conflicts(self):
+        first_slot = AppointmentSlot.objects.filter(doctor=self.scheduled).order_by('start').first()
+        outside = first_slot.start - timedelta(hours=2)
+        self.assertEqual(self.book(self.patients[0], self.scheduled, outside).status_code, 409)
+
+    def test_unscheduled_doctor_is_held_by_the_unique_constraint(self):
+        when = timezone.now() + timedelta(days=2)
+        self.assertEqual(self.book(self.patients[0], self.unscheduled, when).status_code, 201)
+        self.assertEqual(self.book(self.patients[1], self.unscheduled, when).status_code, 409)
+
+
+class TransitionConflictTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        patient = CustomUser.objects.create(
+            email='patient@example.com', role=Group.objects.create(name='patient')
+        )
+        cls.doctor = CustomUser.objects.create(
+            email='doctor@example.com', role=Group.objects.create(name='doctor')
+        )
+        when = timezone.now() + timedelta(days=1)
+        cls.first, cls.second = [
+            Appointment.objects.create(
+                patient=patient, doctor=cls.doctor, appointment_date=when + timedelta(hours=hour)
+            )
+            for hour in range(2)
+        ]
+
+    def test_stale_version_conflicts(self):
+        version = Appointment.objects.get(pk=self.first.pk).version
+        appointment = apply_transition(self.doctor, self.first.pk, 'confirm', version=version)
+        self.assertEqual((appointment.status, appointment.version), ('confirmed', version + 1))
+
+        with self.assertRaises(TransitionConflict) as raised:
+            apply_transition(self.doctor, self.first.pk, 'cancel', version=version)
+        self.assertEqual(raised.exception.status, 409)
+        self.assertEqual(Appointment.objects.get(pk=self.first.pk).status, 'confirmed')
+
+    def test_conflict_rolls_back_the_whole_batch(self):
+        first, second = (Appointment.objects.get(pk=pk) for pk in (self.first.pk, self.second.pk))
+        with self.assertRaises(TransitionConflict):
+            apply_transitions(self.doctor, [
+                {'appointment_id': first.pk, 'action': 'confirm', 'version': first.version},
+                {'appointment_id': second.pk, 'action': 'confirm', 'version': second.version - 1},
+            ])
+        first.refresh_from_db()
+        self.assertEqual((first.status, first.version), ('pending', self.first.version))
+
+    def test_change_between_load_and_claim_conflicts(self):
+        loaded = transitions._load([self.first.pk])[self.first.pk]
+        # Someone else saves the appointment after it was loaded
+        Appointment.objects.get(pk=self.first.pk).save()
+        with self.assertRaises(TransitionConflict):
+            transitions._apply(transitions._Actor(self.doctor), loaded, 'confirm')
+        self.assertEqual(Appointment.objects.get(pk=self.first.pk).status, 'pending')
+
+
+class VitalsIngestTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        patient = Group.objects.create(name='patient')
+        cls.nurse = CustomUser.objects.create(email='nurse@example.com', role=Group.objects.create(name='nurse'))
+        cls.patients = [
+            CustomUser.objects.create(email=f'patient{i}@example.com', role=patient) for i in range(2)
+        ]
+
+    def reading(self, patient, recorded_at, **values):
+        return {
+            'patient_id': patient.pk, 'recorded_at': recorded_at, 'temperature_c': 37.0, 'pulse_rate': 80,
+            'respiratory_rate': 16, 'systolic_bp': 120, 'diastolic_bp': 80, 'oxygen_saturation': 98, **values,
+        }
+
+    def statuses(self, readings):
+        return [result['status'] for result in vitals_ingest.ingest(self.nurse, readings)]
+
+    def test_duplicates_are_reported_not_stored(self):
+        first, second = self.patients
+        batch = [
+            self.reading(first, '2026-01-01T02:00:00Z'),
+            # The same reading twice in one batch
+            self.reading(first, '2026-01-01T02:00:00Z', pulse_rate=90),
+            # Same time, another patient
+            self.reading(second, '2026-01-01T02:00:00Z'),
+        ]
+        self.assertEqual(self.statuses(batch), ['created', 'duplicate', 'created'])
+        # A device resending the batch, plus one new reading
+        self.assertEqual(
+            self.statuses(batch + [self.reading(first, '2026-01-01T03:00:00Z')]),
+            ['duplicate', 'duplicate', 'duplicate', 'created'],
+        )
+        self.assertEqual(VitalSign.objects.filter(patient=first).count(), 2)
+        # The first of the two readings at 02:00 is the one kept
+        kept = VitalSign.objects.get(patient=first, recorded_at=parse_datetime('2026-01-01T02:00:00Z'))
+        self.assertEqual(kept.pulse_rate, 80)
+
+    def test_invalid_readings_do_not_stop_the_others(self):
+        first, _ = self.patients
+        results = vitals_ingest.ingest(self.nurse, [
+            self.reading(first, '2026-01-01T02:00:00Z', pulse_rate='fast'),
+            self.reading(self.nurse, '2026-01-01T02:00:00Z'),
+            self.reading(first, '2026-01-01T02:00:00Z'),
+        ])
+        self.assertEqual([result['status'] for result in results], ['error', 'error', 'created'])
+        self.assertEqual(results[0]['errors'], {'pulse_rate': 'Must be a number.'})
+        self.assertEqual(results[1]['errors'], {'patient_id': 'Patient not found.'})
@@ -0,0 +1,216 @@
+"""
+Patient timeline: a patient's whole chart as one list, newest first
+
+Medical records, treatments, delivered medications, administrations,
+doctor visits, vital signs and tests are merged into one chronological,
+cursor-paginated list, in a fixed number of queries whatever the page
+size or the size of the chart:
+- one query per kind (SOURCES), each fetching the next limit + 1 entries
+  after the cursor with everything its entries show joined in
+- the per-kind pages are merged, and the first limit entries kept
+- entries are ordered by (time, kind, id), all descending, which the
+  cursor holds, so pages neither skip nor repeat entries with equal times
+"""
+import base64
+import binascii
+import heapq
+from datetime import datetime
+
+from django.db.models import Q
+
+from .models import (
+    DeliveredMedicationTreatment, DoctorVisit, MedicalRecord, TestRequest, Treatment, VitalSign, who_administered,
+)
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def _name(user):
+    return f"{user.first_name} {user.last_name}" if user else None
+
+
+def _number(value):
+    return None if value is None else float(value)
+
+
+def _record(record):
+    return {
+        'diagnosis': record.diagnosis,
+        'symptoms': record.symptoms,
+        'status': record.status,
+        'notes': record.notes,
+        'doctor': _name(record.doctor),
+        'appointment_id': record.appointment_id,
+    }
+
+
+def _treatment(treatment):
+    return {
+        'name': treatment.name,
+        'treatment_type': treatment.treatment_type,
+        'status': treatment.status,
+        'start_date': treatment.start_date.isoformat() if treatment.start_date else None,
+        'end_date': treatment.end_date.isoformat() if treatment.end_date else None,
+        'notes': treatment.notes,
+        'prescribed_by': _name(treatment.prescribed_by),
+        'medical_record_id': treatment.medical_record_id,
+    }
+
+
+def _delivery(delivery):
+    return {
+        'drug': delivery.drug.name,
+        'dosage': delivery.dosage,
+        'frequency': delivery.frequency,
+        'duration': delivery.duration,
+        'item_quantity': delivery.item_quantity,
+        'description': delivery.description,
+        'prescribed_by': _name(delivery.prescribed_by),
+        'treatment_id': delivery.treatment_id,
+        'medical_record_id': delivery.medical_record_id,
+    }
+
+
+def _administration(administration):
+    return {
+        'drug': administration.delivered_medication_treatment.drug.name,
+        'administered_by': _name(administration.user),
+        'nurse_administered': administration.nurse_administered,
+        'patient_received': administration.patient_received,
+        'preobservation': administration.preobservation,
+        'postobservation': administration.postobservation,
+        'delivered_medication_id': administration.delivered_medication_treatment_id,
+    }
+
+
+def _visit(visit):
+    return {
+        'drug': visit.delivered_medication_treatment.drug.name,
+        'doctor': _name(visit.doctor),
+        'observation': visit.observation,
+        'note': visit.note,
+        'delivered_medication_id': visit.delivered_medication_treatment_id,
+    }
+
+
+def _vital(vital_sign):
+    return {
+        'temperature_c': _number(vital_sign.temperature_c),
+        'pulse_rate': vital_sign.pulse_rate,
+        'respiratory_rate': vital_sign.respiratory_rate,
+        'systolic_bp': vital_sign.systolic_bp,
+        'diastolic_bp': vital_sign.diastolic_bp,
+        'oxygen_saturation': _number(vital_sign.oxygen_saturation),
+        'weight_kg': _number(vital_sign.weight_kg),
+        'height_cm': _number(vital_sign.height_cm),
+        'news2_score': vital_sign.news2_score,
+        'news2_risk': vital_sign.news2_risk,
+        'notes': vital_sign.notes,
+        'recorded_by': _name(vital_sign.recorded_by),
+    }
+
+
+def _test(test):
+    result = getattr(test, 'result', None)
+    return {
+        'test': test.test_name or (test.test_type.name if test.test_type else None),
+        'status': test.status,
+        'requested_by': _name(test.requested_by),
+        'medical_record_id': test.medical_record_id,
+        'result': {
+            'test_value': _number(result.test_value),
+            'unit': result.unit,
+            'reference_range': result.reference_range,
+            'result_status': result.result_status,
+            'findings': result.findings,
+            'conclusion': result.conclusion,
+        } if result else None,
+    }
+
+
+# kind: (queryset, patient lookup, time field, entry data); the kinds are
+# in their tie-break order
+SOURCES = {
+    'administration': (
+        lambda: who_administered.objects.select_related('user', 'delivered_medication_treatment__drug'),
+        'delivered_medication_treatment__medical_record__patient_id', 'created_at', _administration,
+    ),
+    'delivery': (
+        lambda: DeliveredMedicationTreatment.objects.select_related('drug', 'prescribed_by'),
+        'medical_record__patient_id', 'date_created', _delivery,
+    ),
+    'doctor_visit': (
+        lambda: DoctorVisit.objects.select_related('doctor', 'delivered_medication_treatment__drug'),
+        'delivered_medication_treatment__medical_record__patient_id', 'visit_date', _visit,
+    ),
+    'record': (
+        lambda: MedicalRecord.objects.select_related('doctor'),
+        'patient_id', 'date_created', _record,
+    ),
+    'test': (
+        lambda: TestRequest.objects.select_related('test_type', 'requested_by', 'result'),
+        'patient_id', 'created_at', _test,
+    ),
+    'treatment': (
+        lambda: Treatment.objects.select_related('prescribed_by'),
+        'medical_record__patient_id', 'date_created', _treatment,
+    ),
+    'vital': (
+        lambda: VitalSign.objects.select_related('recorded_by'),
+        'patient_id', 'recorded_at', _vital,
+    ),
+}
+KINDS = list(SOURCES)
+
+
+def _encode_cursor(entry):
+    at, kind, pk = entry
+    return base64.urlsafe_b64encode(f"{at.isoformat()}|{kind}|{pk}".encode()).decode()
+
+
+def _decode_cursor(cursor):
+    try:
+        at, kind, pk = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        if kind not in SOURCES:
+            raise ValueError(kind)
+        return datetime.fromisoformat(at), kind, int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise InvalidCursor('Invalid cursor')
+
+
+def _after(kind, time_field, cursor):
+    """Entries of kind that come after the cursor in (time, kind, id) descending order"""
+    at, cursor_kind, pk = cursor
+    before = Q(**{f'{time_field}__lt': at})
+    if kind < cursor_kind:
+        return before | Q(**{time_field: at})
+    if kind == cursor_kind:
+        return before | Q(**{time_field: at, 'pk__lt': pk})
+    return before
+
+
+def patient_timeline(patient_id, limit, cursor=None, kinds=None):
+    """
+    One page of a patient's timeline, newest first: (entries, next_cursor)
+    kinds limits it to some of KINDS. Raises InvalidCursor
+    """
+    after = _decode_cursor(cursor) if cursor else None
+    pages = []
+    for kind in kinds or KINDS:
+        queryset, patient_lookup, time_field, _ = SOURCES[kind]
+        rows = queryset().filter(**{patient_lookup: patient_id})
+        if after:
+            rows = rows.filter(_after(kind, time_field, after))
+        rows = rows.order_by(f'-{time_field}', '-pk')[:limit + 1]
+        pages.append([(getattr(row, time_field), kind, row.pk, row) for row in rows])
+
+    # Each page is already sorted; reverse=True merges them newest first
+    merged = list(heapq.merge(*pages, key=lambda entry: entry[:3], reverse=True))
+    page = merged[:limit]
+    next_cursor = _encode_cursor(page[-1][:3]) if len(merged) > limit else None
+    return [
+        {'kind': kind, 'id': pk, 'at': at.isoformat(), **SOURCES[kind][3](row)}
+        for at, kind, pk, row in page
+    ], next_cursor
@@ -0,0 +1,339 @@
+"""
+Appointment state transitions
+
+Every change of an appointment's status or patient-flow flags goes through
+one engine, driven by the TRANSITIONS table:
+- each transition names the roles that may apply it, whose appointment it
+  must be (the patient's own, the doctor's own, or the doctor's department),
+  the statuses it may start from and the fields it sets
+- the appointment is saved with update_fields, so only the post_save
+  receivers of the changed fields do any work
+- optimistic locking: the appointment's version (bumped by every save) is
+  claimed with a conditional UPDATE; a client that sends the version it has
+  seen gets a conflict instead of overwriting a newer change
+- each applied transition is logged as an AppointmentEvent, the stage
+  timestamps the clinic statistics are built from (see clinic_stats.py)
+- apply_transitions() applies a batch (e.g. vitals for several patients) in
+  one transaction, all or nothing, loading the appointments and the user's
+  department once
+A transition whose fields are already set is a no-op.
+"""
+import logging
+
+from django.db import transaction
+
+from accountant.models import Activity
+
+from .models import Appointment, AppointmentEvent, Profile
+from .notifications import notify_many
+from .tasks import push_notification, refresh_appointment
+
+logger = logging.getLogger(__name__)
+
+# Statuses in which the patient flow can move
+ACTIVE_STATUSES = ['pending', 'confirmed']
+
+
+class TransitionError(Exception):
+    """A transition that cannot be applied; status is the HTTP status to answer with"""
+    status = 400
+
+    def __init__(self, message, appointment_id=None):
+        super().__init__(message)
+        self.appointment_id = appointment_id
+
+
+class AppointmentNotFound(TransitionError):
+    status = 404
+
+
+class TransitionForbidden(TransitionError):
+    status = 403
+
+
+class TransitionConflict(TransitionError):
+    status = 409
+
+
+def _when(appointment):
+    return appointment.appointment_date.strftime('%B %d, %Y at %I:%M %p')
+
+
+def _name(user):
+    return f"{user.first_name} {user.last_name}"
+
+
+class Transition:
+    """
+    One edge of the appointment state graph
+    - roles: role names allowed to apply it
+    - scope: 'patient' (their own appointment), 'doctor' (their own),
+      'department' (the doctor's or anyone in the doctor's department) or 'any'
+    - allowed_from: statuses it may start from
+    - changes: {field: value}, a value may be a callable of the acting user
+    - describe(appointment, user, reason): the Activity description
+    - notify(appointment, user, reason): [(receivers, title, message)] to notify;
+      the patient-flow flags notify through their post_save receivers
+    """
+
+    def __init__(self, roles, scope, allowed_from, changes, describe, notify=None, message=''):
+        self.roles = set(roles)
+        self.scope = scope
+        self.allowed_from = set(allowed_from)
+        self.changes = changes
+        self.describe = describe
+        self.notify = notify
+        self.message = message
+
+
+def _notify_patient_left(appointment, user, reason):
+    message = f"Patient {_name(user)} has left the hospital and their appointment has been canceled."
+    return [
+        ([receiver], "Patient Left - Appointment Canceled", message)
+        for receiver in (appointment.doctor, appointment.nurse) if receiver is not None
+    ]
+
+
+def _notify_confirmed(appointment, user, reason):
+    return [([appointment.patient], "Appointment Confirmed",
+             f"Dr. {_name(user)} has confirmed your appointment scheduled for {_when(appointment)}.")]
+
+
+def _notify_cancelled(appointment, user, reason):
+    return [([appointment.patient], "Appointment Cancelled",
+             f"Dr. {_name(user)} has cancelled your appointment scheduled for {_when(appointment)}. Reason: {reason}")]
+
+
+def _notify_terminated(appointment, user, reason):
+    role = user.role.name
+    notifications = [([appointment.patient], "Appointment Terminated",
+                      f"Your appointment scheduled for {_when(appointment)} has been terminated by "
+                      f"{_name(user)} ({role}). Reason: {reason}")]
+    if user != appointment.doctor:
+        notifications.append(([appointment.doctor], "Appointment Terminated",
+                              f"Appointment with {_name(appointment.patient)} scheduled for {_when(appointment)} "
+                              f"has been terminated by {_name(user)} ({role}). Reason: {reason}"))
+    return notifications
+
+
+TRANSITIONS = {
+    'patient_available': Transition(
+        roles=['patient'], scope='patient', allowed_from=ACTIVE_STATUSES,
+        changes={'is_patient_available': True},
+        describe=lambda a, user, reason: (
+            f"Patient {user.email} marked themselves as available for appointment with Dr. {a.doctor.first_name}"
+        ),
+        message='You have been marked as available for this appointment.',
+    ),
+    'patient_left': Transition(
+        roles=['patient'], scope='patient', allowed_from=ACTIVE_STATUSES,
+        changes={'is_patient_available': False, 'status': 'cancelled'},
+        describe=lambda a, user, reason: (
+            f"Patient {user.email} marked themselves as left and canceled appointment with Dr. {a.doctor.first_name}"
+        ),
+        notify=_notify_patient_left,
+        message='You have been marked as having left the hospital. Your appointment has been canceled.',
+    ),
+    'vitals_taken': Transition(
+        roles=['nurse'], scope='department', allowed_from=ACTIVE_STATUSES,
+        changes={'is_vitals_taken': True, 'nurse_id': lambda user: user.pk},
+        describe=lambda a, user, reason: (
+            f"Nurse {user.email} marked vitals as taken for patient {a.patient.email} "
+            f"in appointment with Dr. {a.doctor.first_name}"
+        ),
+        message='Vitals have been marked as taken for this appointment.',
+    ),
+    'doctor_with_patient': Transition(
+        roles=['doctor'], scope='department', allowed_from=ACTIVE_STATUSES,
+        changes={'is_doctor_with_patient': True},
+        describe=lambda a, user, reason: f"Doctor {user.email} marked themselves as with patient {a.patient.email}",
+        message='Doctor has been marked as with the patient for this appointment.',
+    ),
+    'doctor_done': Transition(
+        roles=['doctor'], scope='department', allowed_from=ACTIVE_STATUSES,
+        changes={'is_doctor_done_with_patient': True},
+        describe=lambda a, user, reason: f"Doctor {user.email} marked themselves as done with patient {a.patient.email}",
+        message='Doctor has been marked as done with the patient for this appointment.',
+    ),
+    'confirm': Transition(
+        roles=['doctor'], scope='doctor', allowed_from=['pending'],
+        changes={'status': 'confirmed'},
+        describe=lambda a, user, reason: (
+            f"Doctor {user.email} confirmed appointment for patient {a.patient.email} on {a.appointment_date}"
+        ),
+        notify=_notify_confirmed,
+        message='Appointment confirmed successfully. Patient has been notified.',
+    ),
+    'cancel': Transition(
+        roles=['doctor'], scope='doctor', allowed_from=ACTIVE_STATUSES,
+        changes={'status': 'cancelled'},
+        describe=lambda a, user, reason: (
+            f"Doctor {user.email} cancelled appointment for patient {a.patient.email}, reason: {reason}"
+        ),
+        notify=_notify_cancelled,
+        message='Appointment cancelled successfully. Patient has been notified.',
+    ),
+    'terminate': Transition(
+        roles=['doctor', 'patient', 'nurse', 'admin'], scope='any', allowed_from=ACTIVE_STATUSES,
+        changes={'status': 'cancelled', 'who_terminated_id': lambda user: user.pk},
+        describe=lambda a, user, reason: (
+            f"{_name(user)} ({user.role.name}) terminated appointment for patient {a.patient.email}, "
+            f"reason: {reason}"
+        ),
+        notify=_notify_terminated,
+        message='Appointment terminated successfully. Relevant parties have been notified.',
+    ),
+}
+
+
+class _Actor:
+    """The acting user, with their role and department looked up once per batch"""
+
+    def __init__(self, user):
+        self.user = user
+        self.role = getattr(getattr(user, 'role', None), 'name', None)
+        self._department_id = False
+
+    @property
+    def department_id(self):
+        if self._department_id is False:
+            self._department_id = Profile.objects.filter(
+                user_id=self.user.pk
+            ).values_list('department_id', flat=True).first()
+        return self._department_id
+
+
+def appointment_event(appointment, action, actor):
+    """An unsaved AppointmentEvent of action, with the doctor's current department"""
+    profile = getattr(appointment.doctor, 'profile', None)
+    return AppointmentEvent(
+        appointment=appointment,
+        action=action,
+        actor=actor,
+        doctor_id=appointment.doctor_id,
+        department_id=profile.department_id if profile else None,
+    )
+
+
+def _check(actor, action, appointment):
+    transition = TRANSITIONS.get(action)
+    if transition is None:
+        raise TransitionError(
+            f"Unknown action '{action}'. Choose from: {', '.join(TRANSITIONS)}.", appointment.id
+        )
+    if actor.role not in transition.roles:
+        raise TransitionForbidden(
+            f"Only {', '.join(sorted(transition.roles))} users can apply '{action}'.", appointment.id
+        )
+    user_id = actor.user.pk
+    if transition.scope == 'patient' and appointment.patient_id != user_id:
+        raise AppointmentNotFound("Appointment not found or you don't have permission to modify it.", appointment.id)
+    if transition.scope == 'doctor' and appointment.doctor_id != user_id:
+        raise TransitionForbidden("You can only change your own appointments.", appointment.id)
+    if transition.scope == 'department' and appointment.doctor_id != user_id:
+        doctor_profile = getattr(appointment.doctor, 'profile', None)
+        doctor_department_id = doctor_profile.department_id if doctor_profile else None
+        if actor.department_id != doctor_department_id:
+            raise TransitionForbidden("You can only change appointments in your department.", appointment.id)
+    if appointment.status not in transition.allowed_from:
+        raise TransitionError(f"Cannot apply '{action}' to a {appointment.status} appointment.", appointment.id)
+    return transition
+
+
+def _apply(actor, appointment, action, version=None, reason=''):
+    """
+    Apply one transition to a loaded appointment, inside the caller's
+    transaction. Returns (activity, event, notifications), or None when
+    the appointment was already in that state
+    """
+    transition = _check(actor, action, appointment)
+    if version is not None and int(version) != appointment.version:
+        raise TransitionConflict(
+            "The appointment has been changed since you loaded it; reload it and try again.", appointment.id
+        )
+
+    changes = {
+        field: value(actor.user) if callable(value) else value
+        for field, value in transition.changes.items()
+    }
+    changed = {field: value for field, value in changes.items() if getattr(appointment, field) != value}
+    if not changed:
+        return None
+
+    # Claim the version: of two concurrent transitions only one matches it
+    claimed = Appointment.objects.filter(
+        pk=appointment.pk, version=appointment.version
+    ).update(version=appointment.version + 1)
+    if not claimed:
+        raise TransitionConflict(
+            "The appointment was changed by someone else; reload it and try again.", appointment.id
+        )
+    appointment.version += 1
+    for field, value in changed.items():
+        setattr(appointment, field, value)
+    appointment.save(update_fields=[
+        *(Appointment._meta.get_field(field).name for field in changed), 'version', 'updated_at'
+    ])
+
+    activity = Activity(
+        action_taken_by=actor.user,
+        action_taken_on=appointment.doctor if transition.scope == 'patient' else appointment.patient,
+        action='update',
+        model_name='Appointment',
+        object_id=appointment.id,
+        description=transition.describe(appointment, actor.user, reason),
+    )
+    notifications = transition.notify(appointment, actor.user, reason) if transition.notify else []
+    return activity, appointment_event(appointment, action, actor.user), notifications
+
+
+def _load(appointment_ids):
+    return Appointment.objects.select_related(
+        'patient', 'doctor', 'doctor__profile', 'nurse'
+    ).in_bulk(appointment_ids)
+
+
+def apply_transitions(user, items):
+    """
+    Apply [{'appointment_id', 'action', 'version' (optional), 'reason'
+    (optional)}] for user in one transaction; any error rolls all of them
+    back. Returns the appointments, in the order of items
+    Raises TransitionError (its status tells 400/403/404/409)
+    """
+    actor = _Actor(user)
+    appointments = _load([item['appointment_id'] for item in items])
+    activities, events, notifications, done = [], [], [], []
+    with transaction.atomic():
+        for item in items:
+            appointment = appointments.get(item['appointment_id'])
+            if appointment is None:
+                raise AppointmentNotFound("Appointment not found.", item['appointment_id'])
+            result = _apply(
+                actor, appointment, item['action'],
+                version=item.get('version'), reason=item.get('reason') or 'No reason provided',
+            )
+            done.append(appointment)
+            if result is None:
+                continue
+            activity, event, notify = result
+            activities.append(activity)
+            events.append(event)
+            notifications.extend(
+                (appointment, (receivers, title, message, user)) for receivers, title, message in notify
+            )
+
+        Activity.objects.bulk_create(activities)
+        AppointmentEvent.objects.bulk_create(events)
+        created = notify_many(item for _, item in notifications)
+
+    for notification, (appointment, (receivers, *_)) in zip(created, notifications):
+        push_notification.delay(notification.id)
+        refresh_appointment.delay([receiver.pk for receiver in receivers], appointment.id)
+    return done
+
+
+def apply_transition(user, appointment_id, action, version=None, reason=''):
+    """Apply one transition; returns the appointment. Raises TransitionError"""
+    return apply_transitions(user, [
+        {'appointment_id': appointment_id, 'action': action, 'version': version, 'reason': reason}
+    ])[0]
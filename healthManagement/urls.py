@@ -7,6 +7,8 @@ urlpatterns = [
     path('update-profile', update_profile),
     path('departments', get_departments),
     path('doctors', get_doctors),
+    path('doctors/<int:doctor_id>/schedule', doctor_schedule),
+    path('slots', get_free_slots),
 
     path('book_appointment', patient_book_appointment),
     path('patient_appointments', get_patient_appointments),
@@ -16,10 +18,20 @@ urlpatterns = [
     
     path('mark_doctor_with_patient/<int:appointment_id>', mark_doctor_with_patient),
     path('mark_doctor_done_with_patient/<int:appointment_id>', mark_doctor_done_with_patient),
+    path('appointments/<int:appointment_id>/transition', transition_appointment),
+    path('appointments/transitions', transition_appointments),
+    path('queue-board', get_queue_board),
+    path('appointments/<int:appointment_id>/queue-position', get_queue_position),
+    path('departments/<int:department_id>/stats', get_department_stats),
     
     # Vital signs endpoints
     path('create_patient_vital', create_patient_vital),
+    path('vitals/bulk', create_patient_vitals_bulk),
     path('patient_vitals/<int:patient_id>', get_patient_vitals),
+    path('patients/<int:patient_id>/vitals/trend', get_patient_vitals_trend),
+    path('patients/<int:patient_id>/timeline', get_patient_timeline),
+    path('search/clinical', search_clinical_notes),
+    path('early-warning', get_early_warning_board),
     
     # Appointment status management endpoints
     path('confirm_appointment/<int:appointment_id>', confirm_appointment),
@@ -61,6 +73,7 @@ urlpatterns = [
     
     # Patient users
     path('patients', get_patient_users),
+    path('patients/lookup', lookup_patients),
     path('patient-detail/<int:user_id>', get_patient_user_detail),
 
     path('get-all-drugs', get_drugs),
@@ -100,4 +113,9 @@ urlpatterns = [
     path('admission-charges/<int:charge_id>', update_admission_charge),
     path('test-types', get_test_types),
     path('payment-methods', get_payment_methods),
+
+    # Notifications
+    path('notifications', get_notifications),
+    path('notifications/unread-count', get_unread_notification_count),
+    path('notifications/mark-read', mark_notifications_read),
 ]
\ No newline at end of file
@@ -9,7 +9,7 @@ from django.utils import timezone
 from .serializers import *
 from rest_framework import status
 from .models import *
-from django.db.models import Q
+from django.db.models import Count, Q
 from django.core.mail import send_mail
 from django.shortcuts import get_object_or_404
 from django.db.models import Prefetch
@@ -21,16 +21,43 @@ from rest_framework import status
 from knox.auth import TokenAuthentication
 from django.http import Http404
 from rest_framework.exceptions import ValidationError
-from datetime import datetime, date
+from datetime import datetime, date, timedelta
 from django.utils import timezone
 from utils import APPLICATIONS_USER_MODEL
 from .serializers import * 
 from .models import *
 from django.db.models import Prefetch
 from django.conf import settings
+from django.db import transaction
+from django.utils.dateparse import parse_datetime
 from openai import OpenAI
 import uuid
+from collections import Counter
 from .serializers import ChatRequestSerializer, ChatResponseSerializer, TestTypesSerializer
+from pagination import InvalidQueryParameter, filter_queryset, get_page_size, paginate
+from hmsServer.db import read_replica
+from hmsServer.query_budget import query_budget
+from .notifications import InvalidCursor, inbox, mark_read, unread_count
+from .clinic_stats import department_stats
+from .clinical_search import (
+    InvalidQuery, decode_cursor as decode_search_cursor, encode_cursor as encode_search_cursor, search as clinical_search,
+    visible_kinds,
+)
+from .early_warning import early_warning_board
+from .patient_directory import (
+    DEFAULT_LIMIT as LOOKUP_LIMIT, MAX_LIMIT as MAX_LOOKUP_LIMIT, lookup as lookup_patient_directory,
+)
+from .patient_summary import patient_summary
+from .queue_board import department_board, position as queue_position
+from .slots import SlotUnavailable, build_slots, free_slots
+from .timeline import KINDS as TIMELINE_KINDS, InvalidCursor as InvalidTimelineCursor, patient_timeline
+from .vitals_ingest import InvalidBatch, ingest, parse_ndjson
+from .vitals_trend import DEFAULT_POINTS, MAX_POINTS, vitals_trend
+from .transitions import TRANSITIONS, TransitionError, appointment_event, apply_transition, apply_transitions
+from .tasks import push_notification
+import logging
+
+logger = logging.getLogger(__name__)
 
 
 def track_user_action(user, action, model_name, object_id=None, action_taken_on=None, description=""):
@@ -46,8 +73,8 @@ def track_user_action(user, action, model_name, object_id=None, action_taken_on=
             object_id=object_id,
             description=description
         )
-    except Exception as e:
-        print(f"Error tracking activity: {str(e)}")
+    except Exception:
+        logger.exception("Error tracking activity")
 
 
 @api_view(['GET'])
@@ -71,11 +98,20 @@ def get_my_profile(request):
     )
     
     serializer = UserProfileSerializer(user, context={'request': request})
-    
-    return Response({
+    response = {
         'status': 'success',
         'user': serializer.data
-    }, status=status.HTTP_200_OK)
+    }
+    # Patients also get their chart header (admission, medications, vitals)
+    if getattr(user.role, 'name', None) == 'patient':
+        summary = patient_summary(user.id)
+        if summary:
+            response['summary'] = {
+                'version': summary['version'],
+                **{section: summary['data'][section] for section in ('admission', 'medications', 'vitals')},
+            }
+    
+    return Response(response, status=status.HTTP_200_OK)
 
 
 @api_view(['PUT', 'PATCH'])
@@ -96,10 +132,6 @@ def update_profile(request):
     # Use partial=True for PATCH requests to allow partial updates
     partial = request.method == 'PATCH'
     
-    # Log request data for debugging
-    print(f"Update Profile - User: {user.email}, Method: {request.method}")
-    print(f"Request Data: {request.data}")
-    
     # Update profile with request data
     serializer = ProfileSerializer(profile, data=request.data, partial=partial, context={'request': request})
     
@@ -124,8 +156,7 @@ def update_profile(request):
             'user': user_serializer.data
         }, status=status.HTTP_200_OK)
     
-    # Log validation errors for debugging
-    print(f"Validation Errors: {serializer.errors}")
+    logger.info("Profile update rejected for user %s, invalid fields: %s", user.id, sorted(serializer.errors))
     
     return Response({
         'status': 'error',
@@ -135,6 +166,8 @@ def update_profile(request):
 
 
 # Get All Departments
+@query_budget(8)
+@read_replica
 @api_view(['GET'])
 @authentication_classes([TokenAuthentication])
 @permission_classes([IsAuthenticated])
@@ -151,11 +184,23 @@ def get_departments(request):
         description=f"User {request.user.email} viewed departments list"
     )
     
-    departments = Department.objects.all().order_by('name')
+    # Count staff and patients in the same query instead of two per department
+    departments = Department.objects.annotate(
+        staff_count=Count(
+            'profiles',
+            filter=Q(profiles__user__role__name__in=['doctor', 'nurse']),
+            distinct=True
+        ),
+        patient_count=Count(
+            'profiles',
+            filter=Q(profiles__user__role__name='patient'),
+            distinct=True
+        )
+    ).order_by('name')
     serializer = DepartmentSerializer(departments, many=True)
     return Response({
         'status': 'success',
-        'count': departments.count(),
+        'count': len(serializer.data),
         'departments': serializer.data
     }, status=status.HTTP_200_OK)
 
@@ -180,7 +225,13 @@ def patient_book_appointment(request):
     )
 
     if serializer.is_valid():
-        appointment = serializer.save()
+        try:
+            appointment = serializer.save()
+        except SlotUnavailable as e:
+            return Response({
+                'status': 'error',
+                'errors': {'appointment_date': [str(e)]}
+            }, status=status.HTTP_409_CONFLICT)
         
         # Track user action
         track_user_action(
@@ -207,6 +258,8 @@ def patient_book_appointment(request):
     })
 
 
+@query_budget(10)
+@read_replica
 @api_view(['GET'])
 @authentication_classes([TokenAuthentication])
 @permission_classes([IsAuthenticated])
@@ -243,11 +296,13 @@ def get_doctors(request):
         if department:
             doctors = doctors.filter(profile__department__name__iexact=department)
         
-        # Serialize the data
+        # Serialize the data, loading only what ?fields= / ?expand= ask for
+        context = {'request': request}
+        doctors = DoctorListSerializer.setup_eager_loading(doctors, context)
         serializer = DoctorListSerializer(
             doctors, 
             many=True,
-            context={'request': request}
+            context=context
         )
         
         return Response({
@@ -265,6 +320,232 @@ def get_doctors(request):
 
 
 
+@query_budget(3)
+@read_replica
+@api_view(['GET'])
+@authentication_classes([TokenAuthentication])
+@permission_classes([IsAuthenticated])
+def get_free_slots(request):
+    """
+    Next free appointment slots, earliest first
+    Optional query parameters:
+    - department: department id
+    - doctor: doctor id
+    - after: ISO datetime to start from (default now)
+    - limit: number of slots (default 10, max 100)
+    """
+    try:
+        department_id = request.query_params.get('department')
+        doctor_id = request.query_params.get('doctor')
+        after = request.query_params.get('after')
+        limit = int(request.query_params.get('limit', 10))
+        if department_id is not None:
+            department_id = int(department_id)
+        if doctor_id is not None:
+            doctor_id = int(doctor_id)
+        if after is not None:
+            after = parse_datetime(after)
+            if after is None:
+                raise ValueError
+            if timezone.is_naive(after):
+                after = timezone.make_aware(after)
+    except (TypeError, ValueError):
+        return Response({
+            'status': 'error',
+            'message': 'department, doctor and limit must be integers and after an ISO datetime.'
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    slots = free_slots(
+        department_id=department_id, doctor_id=doctor_id, after=after, limit=max(1, min(limit, 100))
+    )
+    serializer = AppointmentSlotSerializer(slots, many=True)
+    return Response({
+        'status': 'success',
+        'count': len(serializer.data),
+        'slots': serializer.data
+    }, status=status.HTTP_200_OK)
+
+
+@api_view(['GET', 'PUT'])
+@authentication_classes([TokenAuthentication])
+@permission_classes([IsAuthenticated])
+def doctor_schedule(request, doctor_id):
+    """
+    Weekly working hours of a doctor, from which bookable slots are built
+    - GET: anyone signed in
+    - PUT: the doctor or an admin; a list of {weekday, start_time, end_time,
+      slot_minutes} replaces the schedule and rebuilds the doctor's free slots
+    """
+    doctor = get_object_or_404(get_user_model(), pk=doctor_id, role__name='doctor')
+
+    if request.method == 'PUT':
+        if request.user != doctor and not request.user.is_staff:
+            return Response({
+                'status': 'error',
+                'message': 'Only the doctor or an admin can change this schedule.'
+            }, status=status.HTTP_403_FORBIDDEN)
+
+        serializer = DoctorScheduleSerializer(data=request.data, many=True)
+        if not serializer.is_valid():
+            return Response({
+                'status': 'error',
+                'errors': serializer.errors
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        with transaction.atomic():
+            DoctorSchedule.objects.filter(doctor=doctor).delete()
+            DoctorSchedule.objects.bulk_create([
+                DoctorSchedule(doctor=doctor, **block) for block in serializer.validated_data
+            ])
+            rebuilt = build_slots(doctor_ids=[doctor.id])
+
+        track_user_action(
+            user=request.user,
+            action='update',
+            model_name='DoctorSchedule',
+            object_id=doctor.id,
+            action_taken_on=doctor,
+            description=f"{request.user.email} updated the schedule of Dr. {doctor.email}"
+        )
+        logger.info("Schedule of doctor %s rebuilt: %s", doctor.id, rebuilt)
+
+    schedules = DoctorSchedule.objects.filter(doctor=doctor)
+    return Response({
+        'status': 'success',
+        'doctor_id': doctor.id,
+        'schedule': DoctorScheduleSerializer(schedules, many=True).data
+    }, status=status.HTTP_200_OK)
+
+
+@query_budget(3)
+@api_view(['GET'])
+@authentication_classes([TokenAuthentication])
+@permission_classes([IsAuthenticated])
+def get_queue_board(request):
+    """
+    Today's queue board of the user's department: patients per stage, each
+    doctor's line with positions and estimated waits
+    - admins may pass ?department=<id> for another department
+    - patients get 403
+    """
+    if getattr(getattr(request.user, 'role', None), 'name', None) == 'patient':
+        return Response({
+            'status': 'error',
+            'message': 'Only hospital staff can view the queue board.'
+        }, status=status.HTTP_403_FORBIDDEN)
+
+    department_id = request.query_params.get('department')
+    if department_id is not None and request.user.is_staff:
+        try:
+            department_id = int(department_id)
+        except ValueError:
+            return Response({
+                'status': 'error',
+                'message': 'department must be an integer.'
+            }, status=status.HTTP_400_BAD_REQUEST)
+    else:
+        department_id = Profile.objects.filter(
+            user=request.user
+        ).values_list('department_id', flat=True).first()
+        if not department_id:
+            return Response({
+                'status': 'error',
+                'message': 'User does not have a department assigned.'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+    return Response({
+        'status': 'success',
+        'board': department_board(department_id)
+    }, status=status.HTTP_200_OK)
+
+
+@query_budget(6)
+@read_replica
+@api_view(['GET'])
+@authentication_classes([TokenAuthentication])
+@permission_classes([IsAuthenticated])
+def get_department_stats(request, department_id):
+    """
+    Wait-time and throughput statistics of a department, from the daily
+    rollups (see clinic_stats.py): per day and for the whole range, median
+    and p90 waits per stage, no-show rates and each doctor's throughput
+    Optional query parameters:
+    - from, to: YYYY-MM-DD, inclusive (the last 7 days by default)
+    Members of the department and admins only
+    """
+    if not request.user.is_staff and not Profile.objects.filter(
+        user=request.user, department_id=department_id
+    ).exclude(user__role__name='patient').exists():
+        return Response({
+            'status': 'error',
+            'message': 'Only members of the department can view its statistics.'
+        }, status=status.HTTP_403_FORBIDDEN)
+
+    try:
+        end_date = date.fromisoformat(request.query_params['to']) if request.query_params.get('to') \
+            else timezone.localdate()
+        start_date = date.fromisoformat(request.query_params['from']) if request.query_params.get('from') \
+            else end_date - timedelta(days=6)
+    except ValueError:
+        return Response({
+            'status': 'error',
+            'message': 'from and to must be dates (YYYY-MM-DD).'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    if start_date > end_date or (end_date - start_date).days >= settings.CLINIC_STATS_MAX_DAYS:
+        return Response({
+            'status': 'error',
+            'message': f'from must be on or before to, at most {settings.CLINIC_STATS_MAX_DAYS} days apart.'
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    return Response({
+        'status': 'success',
+        'stats': department_stats(department_id, start_date, end_date)
+    }, status=status.HTTP_200_OK)
+
+
+@query_budget(4)
+@api_view(['GET'])
+@authentication_classes([TokenAuthentication])
+@permission_classes([IsAuthenticated])
+def get_queue_position(request, appointment_id):
+    """
+    Where an appointment of today is in the patient flow and, while the
+    patient waits, their place in the doctor's line and estimated wait
+    Patients can only see their own appointments, staff those of their
+    department's doctors
+    """
+    appointment = get_object_or_404(
+        Appointment.objects.select_related('doctor__profile'), pk=appointment_id
+    )
+    visible = appointment.patient_id == request.user.id
+    if not visible:
+        # Staff: the appointment's doctor works in their department
+        doctor_profile = getattr(appointment.doctor, 'profile', None)
+        staff_department_id = Profile.objects.filter(
+            user_id=request.user.id, department__isnull=False
+        ).exclude(user__role__name='patient').values_list('department_id', flat=True).first()
+        visible = (
+            staff_department_id is not None and doctor_profile is not None
+            and doctor_profile.department_id == staff_department_id
+        )
+    if not visible:
+        return Response({
+            'status': 'error',
+            'message': 'Appointment not found.'
+        }, status=status.HTTP_404_NOT_FOUND)
+
+    queue = queue_position(appointment)
+    if queue is None:
+        return Response({
+            'status': 'error',
+            'message': 'This appointment is not in a queue today.'
+        }, status=status.HTTP_404_NOT_FOUND)
+    return Response({
+        'status': 'success',
+        'queue': queue
+    }, status=status.HTTP_200_OK)
+
+
 @api_view(['GET'])
 @authentication_classes([TokenAuthentication])
 @permission_classes([IsAuthenticated])
@@ -302,9 +583,6 @@ def get_user_admissions(request):
             context={'request': request}
         )
         
-        # Debug: Print serialized data
-        print(f"Serialized data: {serializer.data}")
-
         return Response({
             'status': 'success',
             'count': admissions.count(),
@@ -312,7 +590,7 @@ def get_user_admissions(request):
         }, status=status.HTTP_200_OK)
 
     except Exception as e:
-        print(f"Error in get_user_admissions: {str(e)}")
+        logger.exception("Error in get_user_admissions")
         return Response({
             'status': 'error',
             'message': str(e)
@@ -327,10 +605,6 @@ def get_patient_appointments(request):
     Get all appointments for the authenticated patient
     """
     try:
-        # Debug: Print request user info
-        print(f"Request User: {request.user}")
-        print(f"User Role: {getattr(request.user, 'role', None)}")
-        
         # Verify the user is a patient
         if not hasattr(request.user, 'role') or request.user.role.name != 'patient':
             return Response(
@@ -369,172 +643,165 @@ def get_patient_appointments(request):
         }, status=status.HTTP_200_OK)
 
     except Exception as e:
-        # Print the full error traceback
-        import traceback
-        error_traceback = traceback.format_exc()
-        print(f"Error in get_patient_appointments: {str(e)}")
-        print(f"Traceback: {error_traceback}")
+        logger.exception("Error in get_patient_appointments")
         
         return Response({
             'status': 'error',
-            'message': str(e),
-            'traceback': error_traceback
+            'message': str(e)
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
 
 
+def _transition_error(error):
+    return Response({
+        'status': 'error',
+        'message': str(error),
+        'appointment_id': error.appointment_id
+    }, status=error.status)
+
+
+def _appointment_state(appointment):
+    return {
+        'appointment_id': appointment.id,
+        'appointment_status': appointment.status,
+        'version': appointment.version,
+        'is_patient_available': appointment.is_patient_available,
+        'is_vitals_taken': appointment.is_vitals_taken,
+        'is_doctor_with_patient': appointment.is_doctor_with_patient,
+        'is_doctor_done_with_patient': appointment.is_doctor_done_with_patient,
+    }
+
+
+def _apply_transition(request, appointment_id, action):
+    """
+    Validate the optional version / reason of the request and apply one transition
+    Raises TransitionError
+    """
+    data = {key: request.data[key] for key in ('version', 'reason') if key in request.data}
+    serializer = AppointmentTransitionSerializer(data={**data, 'appointment_id': appointment_id, 'action': action})
+    if not serializer.is_valid():
+        raise TransitionError(
+            '; '.join(f"{field}: {' '.join(map(str, errors))}" for field, errors in serializer.errors.items()),
+            appointment_id
+        )
+    return apply_transition(request.user, **serializer.validated_data)
+
+
 @api_view(['PATCH'])
 @authentication_classes([TokenAuthentication])
 @permission_classes([IsAuthenticated])
-def mark_patient_available(request, appointment_id):
+def transition_appointment(request, appointment_id):
     """
-    Allow a patient to mark themselves as available for their appointment
-    Updates the is_patient_available field to True
+    Move an appointment along its state graph (see healthManagement/transitions.py)
+    Body: {action, version (optional), reason (optional)}
+    - action: patient_available, patient_left, vitals_taken, doctor_with_patient,
+      doctor_done, confirm, cancel or terminate
+    - version: the version the client last saw; 409 if the appointment has changed since
     """
+    if not isinstance(request.data, dict):
+        return Response({
+            'status': 'error',
+            'message': 'Send an object: {"action": ..., "version": ..., "reason": ...}.'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    action = request.data.get('action')
     try:
-        # Verify the user is a patient
-        if not hasattr(request.user, 'role') or request.user.role.name != 'patient':
-            return Response(
-                {"error": "Only patients can mark themselves as available."},
-                status=status.HTTP_403_FORBIDDEN
-            )
+        appointment = _apply_transition(request, appointment_id, action)
+    except TransitionError as e:
+        return _transition_error(e)
 
-        # Get the appointment and verify it belongs to the current patient
-        try:
-            appointment = Appointment.objects.get(
-                id=appointment_id,
-                patient=request.user
-            )
-        except Appointment.DoesNotExist:
-            return Response(
-                {"error": "Appointment not found or you don't have permission to modify it."},
-                status=status.HTTP_404_NOT_FOUND
-            )
+    return Response({
+        'status': 'success',
+        'message': TRANSITIONS[action].message,
+        'appointment': _appointment_state(appointment)
+    }, status=status.HTTP_200_OK)
 
-        # Update the is_patient_available field to True
-        appointment.is_patient_available = True
-        # Use update_fields to ensure the signal properly detects the change
-        appointment.save(update_fields=['is_patient_available'])
-        
-        # Track user action
-        track_user_action(
-            user=request.user,
-            action='update',
-            model_name='Appointment',
-            object_id=appointment.id,
-            action_taken_on=appointment.doctor,
-            description=f"Patient {request.user.email} marked themselves as available for appointment with Dr. {appointment.doctor.first_name}"
-        )
 
+@api_view(['POST'])
+@authentication_classes([TokenAuthentication])
+@permission_classes([IsAuthenticated])
+def transition_appointments(request):
+    """
+    Apply several transitions in one transaction, e.g. a nurse marking vitals
+    for several patients: {transitions: [{appointment_id, action, version, reason}, ...]}
+    (at most 100). All are applied or, on the first error, none
+    """
+    if not isinstance(request.data, dict):
         return Response({
-            'status': 'success',
-            'message': 'You have been marked as available for this appointment.',
-            'appointment_id': appointment.id,
-            'is_patient_available': appointment.is_patient_available,
-            'appointment_date': appointment.appointment_date,
-            'doctor': f"{appointment.doctor.first_name} {appointment.doctor.last_name}"
-        }, status=status.HTTP_200_OK)
-
-    except Exception as e:
+            'status': 'error',
+            'message': 'Send an object: {"transitions": [...]}.'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    serializer = AppointmentTransitionSerializer(data=request.data.get('transitions'), many=True)
+    if not serializer.is_valid():
         return Response({
             'status': 'error',
-            'message': str(e)
-        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            'errors': serializer.errors
+        }, status=status.HTTP_400_BAD_REQUEST)
+    if not 1 <= len(serializer.validated_data) <= 100:
+        return Response({
+            'status': 'error',
+            'message': 'Send between 1 and 100 transitions.'
+        }, status=status.HTTP_400_BAD_REQUEST)
 
+    try:
+        appointments = apply_transitions(request.user, serializer.validated_data)
+    except TransitionError as e:
+        return _transition_error(e)
 
+    return Response({
+        'status': 'success',
+        'count': len(appointments),
+        'appointments': [_appointment_state(appointment) for appointment in appointments]
+    }, status=status.HTTP_200_OK)
 
 
 @api_view(['PATCH'])
 @authentication_classes([TokenAuthentication])
 @permission_classes([IsAuthenticated])
-def mark_patient_left(request, appointment_id):
+def mark_patient_available(request, appointment_id):
     """
-    Allow a patient to mark themselves as having left the hospital
-    Updates the is_patient_available field to False and marks appointment as canceled
-    Sends notifications to both doctor and nurse
+    Allow a patient to mark themselves as available for their appointment
+    Updates the is_patient_available field to True ('patient_available' transition)
     """
     try:
-        # Verify the user is a patient
-        if not hasattr(request.user, 'role') or request.user.role.name != 'patient':
-            return Response(
-                {"error": "Only patients can mark themselves as having left."},
-                status=status.HTTP_403_FORBIDDEN
-            )
-
-        # Get the appointment and verify it belongs to the current patient
-        try:
-            appointment = Appointment.objects.get(
-                id=appointment_id,
-                patient=request.user
-            )
-        except Appointment.DoesNotExist:
-            return Response(
-                {"error": "Appointment not found or you don't have permission to modify it."},
-                status=status.HTTP_404_NOT_FOUND
-            )
-
-        # Check if appointment is already completed or canceled
-        if appointment.status in ['completed', 'canceled']:
-            return Response(
-                {"error": f"Cannot update status of a {appointment.status} appointment."},
-                
-            )
-
-        # Update the appointment status and patient availability
-        appointment.is_patient_available = False
-        appointment.status = 'canceled'
-        appointment.save(update_fields=['is_patient_available', 'status'])
-        
-        # Track user action
-        track_user_action(
-            user=request.user,
-            action='update',
-            model_name='Appointment',
-            object_id=appointment.id,
-            action_taken_on=appointment.doctor,
-            description=f"Patient {request.user.email} marked themselves as left and canceled appointment with Dr. {appointment.doctor.first_name}"
-        )
-
-        # Create notification for doctor
-        if appointment.doctor:
-            Notification.objects.create(
-                title="Patient Left - Appointment Canceled",
-                message=f"Patient {request.user.get_full_name()} has left the hospital and their appointment has been canceled.",
-                sender=request.user,
-                receivers=[appointment.doctor]
-            )
-
-        # Create notification for nurse if assigned
-        if appointment.nurse:
-            Notification.objects.create(
-                title="Patient Left - Appointment Canceled",
-                message=f"Patient {request.user.get_full_name()} has left the hospital and their appointment has been canceled.",
-                sender=request.user,
-                receivers=[appointment.nurse]
-            )
+        appointment = _apply_transition(request, appointment_id, 'patient_available')
+    except TransitionError as e:
+        return _transition_error(e)
 
-        return Response({
-            'status': 'success',
-            'message': 'You have been marked as having left the hospital. Your appointment has been canceled.',
-            'appointment_id': appointment.id,
-            'status': appointment.get_status_display(),
-            'is_patient_available': appointment.is_patient_available,
-            'canceled_at': timezone.now().isoformat()
-        }, status=status.HTTP_200_OK)
+    return Response({
+        'status': 'success',
+        'message': TRANSITIONS['patient_available'].message,
+        'appointment_id': appointment.id,
+        'is_patient_available': appointment.is_patient_available,
+        'appointment_date': appointment.appointment_date,
+        'doctor': f"{appointment.doctor.first_name} {appointment.doctor.last_name}",
+        'version': appointment.version
+    }, status=status.HTTP_200_OK)
 
-    except Exception as e:
-        error_traceback = traceback.format_exc()
-        print(f"Error in mark_patient_left: {str(e)}")
-        print(f"Traceback: {error_traceback}")
-        
-        return Response({
-            'status': 'error',
-            'message': 'Failed to update patient status',
-            'error': str(e)
-        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+@api_view(['PATCH'])
+@authentication_classes([TokenAuthentication])
+@permission_classes([IsAuthenticated])
+def mark_patient_left(request, appointment_id):
+    """
+    Allow a patient to mark themselves as having left the hospital
+    Updates the is_patient_available field to False and cancels the appointment
+    Sends notifications to both doctor and nurse ('patient_left' transition)
+    """
+    try:
+        appointment = _apply_transition(request, appointment_id, 'patient_left')
+    except TransitionError as e:
+        return _transition_error(e)
 
+    return Response({
+        'status': 'success',
+        'message': TRANSITIONS['patient_left'].message,
+        'appointment_id': appointment.id,
+        'appointment_status': appointment.get_status_display(),
+        'is_patient_available': appointment.is_patient_available,
+        'canceled_at': timezone.now().isoformat(),
+        'version': appointment.version
+    }, status=status.HTTP_200_OK)
 
 
 @api_view(['PATCH'])
@@ -542,68 +809,26 @@ def mark_patient_left(request, appointment_id):
 @permission_classes([IsAuthenticated])
 def mark_vitals_taken(request, appointment_id):
     """
-    Allow a nurse to mark vitals as taken for an appointment
+    Allow a nurse to mark vitals as taken for an appointment in their department
     Updates the is_vitals_taken field to True and tracks which nurse took vitals
+    ('vitals_taken' transition; several at once through transition_appointments)
     """
     try:
-        # Verify the user is a nurse
-        if not hasattr(request.user, 'role') or request.user.role.name != 'nurse':
-            return Response(
-                {"error": "Only nurses can mark vitals as taken."},
-                status=status.HTTP_403_FORBIDDEN
-            )
-
-        # Get the appointment
-        try:
-            appointment = Appointment.objects.get(id=appointment_id)
-        except Appointment.DoesNotExist:
-            return Response(
-                {"error": "Appointment not found."},
-                status=status.HTTP_404_NOT_FOUND
-            )
-
-        # Check if the nurse is in the same department as the doctor (optional security check)
-        if (hasattr(request.user, 'profile') and request.user.profile and 
-            hasattr(appointment.doctor, 'profile') and appointment.doctor.profile and
-            request.user.profile.department != appointment.doctor.profile.department):
-            return Response(
-                {"error": "You can only take vitals for appointments in your department."},
-                status=status.HTTP_403_FORBIDDEN
-            )
-
-        # Update the is_vitals_taken field to True and track the nurse
-        appointment.is_vitals_taken = True
-        appointment.nurse = request.user
-        # Use update_fields to ensure the signal properly detects the change
-        appointment.save(update_fields=['is_vitals_taken', 'nurse'])
-        
-        # Track user action
-        track_user_action(
-            user=request.user,
-            action='update',
-            model_name='Appointment',
-            object_id=appointment.id,
-            action_taken_on=appointment.patient,
-            description=f"Nurse {request.user.email} marked vitals as taken for patient {appointment.patient.email} in appointment with Dr. {appointment.doctor.first_name}"
-        )
-
-        return Response({
-            'status': 'success',
-            'message': 'Vitals have been marked as taken for this appointment.',
-            'appointment_id': appointment.id,
-            'is_vitals_taken': appointment.is_vitals_taken,
-            'nurse_name': f"{request.user.first_name} {request.user.last_name}",
-            'appointment_date': appointment.appointment_date,
-            'patient': f"{appointment.patient.first_name} {appointment.patient.last_name}",
-            'doctor': f"{appointment.doctor.first_name} {appointment.doctor.last_name}"
-        }, status=status.HTTP_200_OK)
-
-    except Exception as e:
-        return Response({
-            'status': 'error',
-            'message': str(e)
-        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        appointment = _apply_transition(request, appointment_id, 'vitals_taken')
+    except TransitionError as e:
+        return _transition_error(e)
 
+    return Response({
+        'status': 'success',
+        'message': TRANSITIONS['vitals_taken'].message,
+        'appointment_id': appointment.id,
+        'is_vitals_taken': appointment.is_vitals_taken,
+        'nurse_name': f"{request.user.first_name} {request.user.last_name}",
+        'appointment_date': appointment.appointment_date,
+        'patient': f"{appointment.patient.first_name} {appointment.patient.last_name}",
+        'doctor': f"{appointment.doctor.first_name} {appointment.doctor.last_name}",
+        'version': appointment.version
+    }, status=status.HTTP_200_OK)
 
 
 @api_view(['PATCH'])
@@ -611,70 +836,25 @@ def mark_vitals_taken(request, appointment_id):
 @permission_classes([IsAuthenticated])
 def mark_doctor_with_patient(request, appointment_id):
     """
-    Allow a doctor to mark is_doctor_with_patient as True for an appointment the doctor is already associated to the appointment
-    Updates the is_doctor_with_patient field to True and tracks which doctor is with the patient
+    Allow the appointment's doctor, or a doctor of the same department, to mark
+    is_doctor_with_patient as True ('doctor_with_patient' transition)
     """
     try:
-        # Verify the user is a doctor
-        if not hasattr(request.user, 'role') or request.user.role.name != 'doctor':
-            return Response(
-                {"error": "Only doctors can mark is_doctor_with_patient as True."},
-                status=status.HTTP_403_FORBIDDEN
-            )
-
-        # Get the appointment
-        try:
-            appointment = Appointment.objects.get(id=appointment_id)
-        except Appointment.DoesNotExist:
-            return Response(
-                {"error": "Appointment not found."},
-                status=status.HTTP_404_NOT_FOUND
-            )
-
-        # Check if the doctor is authorized for this appointment
-        # The doctor must be the appointment's doctor OR in the same department as the appointment's doctor
-        if request.user != appointment.doctor:
-            # If not the appointment's doctor, check department match
-            if (hasattr(request.user, 'profile') and request.user.profile and 
-                hasattr(appointment.doctor, 'profile') and appointment.doctor.profile and
-                request.user.profile.department != appointment.doctor.profile.department):
-                return Response(
-                    {"error": "You can only mark appointments for your own patients or patients in your department."},
-                    status=status.HTTP_403_FORBIDDEN
-                )
-
-        # Update the is_doctor_with_patient field to True
-        appointment.is_doctor_with_patient = True
-        # Use update_fields to ensure the signal properly detects the change
-        appointment.save(update_fields=['is_doctor_with_patient'])
-        
-        # Track user action
-        track_user_action(
-            user=request.user,
-            action='update',
-            model_name='Appointment',
-            object_id=appointment.id,
-            action_taken_on=appointment.patient,
-            description=f"Doctor {request.user.email} marked themselves as with patient {appointment.patient.email}"
-        )
-
-        return Response({
-            'status': 'success',
-            'message': 'Doctor has been marked as with the patient for this appointment.',
-            'appointment_id': appointment.id,
-            'is_doctor_with_patient': appointment.is_doctor_with_patient,
-            'doctor_name': f"{request.user.first_name} {request.user.last_name}",
-            'appointment_date': appointment.appointment_date,
-            'patient': f"{appointment.patient.first_name} {appointment.patient.last_name}",
-            'doctor': f"{appointment.doctor.first_name} {appointment.doctor.last_name}"
-        }, status=status.HTTP_200_OK)
-
-    except Exception as e:
-        return Response({
-            'status': 'error',
-            'message': str(e)
-        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        appointment = _apply_transition(request, appointment_id, 'doctor_with_patient')
+    except TransitionError as e:
+        return _transition_error(e)
 
+    return Response({
+        'status': 'success',
+        'message': TRANSITIONS['doctor_with_patient'].message,
+        'appointment_id': appointment.id,
+        'is_doctor_with_patient': appointment.is_doctor_with_patient,
+        'doctor_name': f"{request.user.first_name} {request.user.last_name}",
+        'appointment_date': appointment.appointment_date,
+        'patient': f"{appointment.patient.first_name} {appointment.patient.last_name}",
+        'doctor': f"{appointment.doctor.first_name} {appointment.doctor.last_name}",
+        'version': appointment.version
+    }, status=status.HTTP_200_OK)
 
 
 @api_view(['PATCH'])
@@ -682,69 +862,25 @@ def mark_doctor_with_patient(request, appointment_id):
 @permission_classes([IsAuthenticated])
 def mark_doctor_done_with_patient(request, appointment_id):
     """
-    Allow a doctor to mark is_doctor_done_with_patient as True for an appointment
-    Updates the is_doctor_done_with_patient field to True
+    Allow the appointment's doctor, or a doctor of the same department, to mark
+    is_doctor_done_with_patient as True ('doctor_done' transition)
     """
     try:
-        # Verify the user is a doctor
-        if not hasattr(request.user, 'role') or request.user.role.name != 'doctor':
-            return Response(
-                {"error": "Only doctors can mark is_doctor_done_with_patient as True."},
-                status=status.HTTP_403_FORBIDDEN
-            )
-
-        # Get the appointment
-        try:
-            appointment = Appointment.objects.get(id=appointment_id)
-        except Appointment.DoesNotExist:
-            return Response(
-                {"error": "Appointment not found."},
-                status=status.HTTP_404_NOT_FOUND
-            )
-
-        # Check if the doctor is authorized for this appointment
-        # The doctor must be the appointment's doctor OR in the same department as the appointment's doctor
-        if request.user != appointment.doctor:
-            # If not the appointment's doctor, check department match
-            if (hasattr(request.user, 'profile') and request.user.profile and 
-                hasattr(appointment.doctor, 'profile') and appointment.doctor.profile and
-                request.user.profile.department != appointment.doctor.profile.department):
-                return Response(
-                    {"error": "You can only mark appointments for your own patients or patients in your department."},
-                    status=status.HTTP_403_FORBIDDEN
-                )
-
-        # Update the is_doctor_done_with_patient field to True
-        appointment.is_doctor_done_with_patient = True
-        # Use update_fields to ensure the signal properly detects the change
-        appointment.save(update_fields=['is_doctor_done_with_patient'])
-        
-        # Track user action
-        track_user_action(
-            user=request.user,
-            action='update',
-            model_name='Appointment',
-            object_id=appointment.id,
-            action_taken_on=appointment.patient,
-            description=f"Doctor {request.user.email} marked themselves as done with patient {appointment.patient.email}"
-        )
-
-        return Response({
-            'status': 'success',
-            'message': 'Doctor has been marked as done with the patient for this appointment.',
-            'appointment_id': appointment.id,
-            'is_doctor_done_with_patient': appointment.is_doctor_done_with_patient,
-            'doctor_name': f"{request.user.first_name} {request.user.last_name}",
-            'appointment_date': appointment.appointment_date,
-            'patient': f"{appointment.patient.first_name} {appointment.patient.last_name}",
-            'doctor': f"{appointment.doctor.first_name} {appointment.doctor.last_name}"
-        }, status=status.HTTP_200_OK)
+        appointment = _apply_transition(request, appointment_id, 'doctor_done')
+    except TransitionError as e:
+        return _transition_error(e)
 
-    except Exception as e:
-        return Response({
-            'status': 'error',
-            'message': str(e)
-        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    return Response({
+        'status': 'success',
+        'message': TRANSITIONS['doctor_done'].message,
+        'appointment_id': appointment.id,
+        'is_doctor_done_with_patient': appointment.is_doctor_done_with_patient,
+        'doctor_name': f"{request.user.first_name} {request.user.last_name}",
+        'appointment_date': appointment.appointment_date,
+        'patient': f"{appointment.patient.first_name} {appointment.patient.last_name}",
+        'doctor': f"{appointment.doctor.first_name} {appointment.doctor.last_name}",
+        'version': appointment.version
+    }, status=status.HTTP_200_OK)
 
 
 @api_view(['POST'])
@@ -758,13 +894,8 @@ def create_patient_vital(request):
     - Updates appointment's is_vitals_taken field and triggers notifications
     """
     try:
-        print(f"\n=== Received request to create patient vital ===")
-        print(f"User: {request.user.email} (ID: {request.user.id})")
-        print(f"Request data: {request.data}")
-        
         # Verify the user is a nurse or doctor
         if not hasattr(request.user, 'role') or request.user.role.name not in ['nurse', 'doctor']:
-            print("Access denied: User is not a nurse or doctor")
             return Response(
                 {"error": "Only nurses and doctors can record patient vitals."},
                 status=status.HTTP_403_FORBIDDEN
@@ -774,12 +905,8 @@ def create_patient_vital(request):
         patient_id = request.data.get('patient_id')
         appointment_id = request.data.get('appointment_id')
         
-        print(f"Patient ID: {patient_id}")
-        print(f"Appointment ID: {appointment_id}")
-        
         if not patient_id:
             error_msg = "patient_id is required"
-            print(f"Validation error: {error_msg}")
             return Response(
                 {"error": error_msg},
                 
@@ -825,12 +952,9 @@ def create_patient_vital(request):
             'notes': request.data.get('notes', '')
         }
 
-        print(f"Vital data to be saved: {vital_data}")
-        
         serializer = VitalSignSerializer(data=vital_data, context={'request': request})
         
         if serializer.is_valid():
-            print("Vital sign data is valid")
             # Save with the current user as recorded_by
             vital_sign = serializer.save(recorded_by=request.user)
             
@@ -846,6 +970,8 @@ def create_patient_vital(request):
             
 # Update appointment's is_vitals_taken field if appointment exists
             if appointment:
+                if not appointment.is_vitals_taken:
+                    appointment_event(appointment, 'vitals_taken', request.user).save()
                 appointment.is_vitals_taken = True
                 if request.user.role.name == 'nurse' and not appointment.nurse:
                     appointment.nurse = request.user
@@ -868,7 +994,7 @@ def create_patient_vital(request):
                 'appointment_updated': appointment_updated
             }, status=status.HTTP_201_CREATED)
         else:
-            print(f"Validation errors: {serializer.errors}")
+            logger.info("Vital sign rejected, invalid fields: %s", sorted(serializer.errors))
             return Response({
                 'status': 'error',
                 'message': 'Invalid data provided.',
@@ -876,185 +1002,115 @@ def create_patient_vital(request):
             })
 
     except Exception as e:
-        import traceback
-        error_trace = traceback.format_exc()
-        print(f"Error in create_patient_vital: {str(e)}\n{error_trace}")
-        from django.conf import settings
+        logger.exception("Error in create_patient_vital")
         return Response({
             'status': 'error',
             'message': 'An error occurred while recording vital signs.',
-            'detail': str(e),
-            'trace': error_trace if settings.DEBUG else None
+            'detail': str(e)
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
-@api_view(['PATCH'])
+@api_view(['POST'])
 @authentication_classes([TokenAuthentication])
 @permission_classes([IsAuthenticated])
-def confirm_appointment(request, appointment_id):
+def create_patient_vitals_bulk(request):
     """
-    Allow a doctor to confirm an appointment
-    Changes appointment status to 'confirmed'
-    Sends notification to the patient who booked the appointment
+    Record many vital sign readings at once, for any patients (rounds,
+    bedside monitors); see vitals_ingest.py
+    - Only nurses and doctors can record vitals
+    - Body: a JSON array of readings, {"readings": [...]}, or NDJSON
+      (Content-Type: application/x-ndjson), one reading per line
+    - A reading: patient_id, the measurements of create_patient_vital,
+      optional recorded_at (ISO datetime, now by default) and notes
+    - Valid readings are stored even when others are not; results gives
+      each reading's status ('created', 'duplicate', 'error') by index
     """
-    try:
-        # Verify the user is a doctor
-        if not hasattr(request.user, 'role') or request.user.role.name != 'doctor':
-            return Response(
-                {"error": "Only doctors can confirm appointments."},
-                status=status.HTTP_403_FORBIDDEN
-            )
-
-        # Get the appointment
-        try:
-            appointment = Appointment.objects.get(id=appointment_id)
-        except Appointment.DoesNotExist:
-            return Response(
-                {"error": "Appointment not found."},
-            )
-
-        # Verify the doctor is authorized for this appointment
-        if request.user != appointment.doctor:
-            return Response(
-                {"error": "You can only confirm your own appointments."},
-                status=status.HTTP_403_FORBIDDEN
-            )
-
-        # Check if appointment is in pending status
-        if appointment.status != 'pending':
-            return Response(
-                {"error": f"Appointment is already {appointment.status}. Only pending appointments can be confirmed."},
-                
-            )
-
-        # Update appointment status to confirmed
-        appointment.status = 'confirmed'
-        appointment.save(update_fields=['status'])
-        
-        # Track user action
-        track_user_action(
-            user=request.user,
-            action='update',
-            model_name='Appointment',
-            object_id=appointment.id,
-            action_taken_on=appointment.patient,
-            description=f"Doctor {request.user.email} confirmed appointment for patient {appointment.patient.email} on {appointment.appointment_date}"
-        )
-
-        # Create notification for the patient
-        notification = Notification.objects.create(
-            sender=request.user,
-            title="Appointment Confirmed",
-            message=f"Dr. {request.user.first_name} {request.user.last_name} has confirmed your appointment scheduled for {appointment.appointment_date.strftime('%B %d, %Y at %I:%M %p')}."
-        )
-        notification.receivers.add(appointment.patient)
-
-        # Send WebSocket notification to the patient
-        from .signals import send_websocket_notification_to_users, send_refresh_appointment_action
-        send_websocket_notification_to_users(notification)
-        send_refresh_appointment_action([appointment.patient], appointment.id)
-
+    if getattr(getattr(request.user, 'role', None), 'name', None) not in ['nurse', 'doctor']:
         return Response({
-            'status': 'success',
-            'message': 'Appointment confirmed successfully. Patient has been notified.',
-            'appointment_id': appointment.id,
-            'appointment_status': appointment.status,
-            'appointment_date': appointment.appointment_date,
-            'patient': f"{appointment.patient.first_name} {appointment.patient.last_name}"
-        }, status=status.HTTP_200_OK)
+            'status': 'error',
+            'message': 'Only nurses and doctors can record patient vitals.'
+        }, status=status.HTTP_403_FORBIDDEN)
 
-    except Exception as e:
+    try:
+        if request.content_type.startswith('application/x-ndjson'):
+            readings = parse_ndjson(request.body)
+        else:
+            readings = request.data.get('readings') if isinstance(request.data, dict) else request.data
+            if not isinstance(readings, list):
+                raise InvalidBatch('Send a JSON array of readings, {"readings": [...]} or NDJSON.')
+    except InvalidBatch as e:
         return Response({
             'status': 'error',
             'message': str(e)
-        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        }, status=status.HTTP_400_BAD_REQUEST)
+    if not 1 <= len(readings) <= settings.VITALS_BULK_MAX_READINGS:
+        return Response({
+            'status': 'error',
+            'message': f'Send between 1 and {settings.VITALS_BULK_MAX_READINGS} readings.'
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    results = ingest(request.user, readings)
+    counts = Counter(result['status'] for result in results)
+    return Response({
+        'status': 'success' if counts['error'] < len(results) else 'error',
+        'created': counts['created'],
+        'duplicates': counts['duplicate'],
+        'failed': counts['error'],
+        'results': results
+    }, status=status.HTTP_201_CREATED if counts['created'] else (
+        status.HTTP_400_BAD_REQUEST if counts['error'] == len(results) else status.HTTP_200_OK
+    ))
 
 
 @api_view(['PATCH'])
 @authentication_classes([TokenAuthentication])
 @permission_classes([IsAuthenticated])
-def cancel_appointment(request, appointment_id):
+def confirm_appointment(request, appointment_id):
     """
-    Allow a doctor to cancel an appointment
-    Changes appointment status to 'cancelled'
+    Allow a doctor to confirm an appointment
+    Changes appointment status to 'confirmed' ('confirm' transition)
     Sends notification to the patient who booked the appointment
     """
     try:
-        # Verify the user is a doctor
-        if not hasattr(request.user, 'role') or request.user.role.name != 'doctor':
-            return Response(
-                {"error": "Only doctors can cancel appointments."},
-                status=status.HTTP_403_FORBIDDEN
-            )
-
-        # Get the appointment
-        try:
-            appointment = Appointment.objects.get(id=appointment_id)
-        except Appointment.DoesNotExist:
-            return Response(
-                {"error": "Appointment not found."},
-                status=status.HTTP_404_NOT_FOUND
-            )
-
-        # Verify the doctor is authorized for this appointment
-        if request.user != appointment.doctor:
-            return Response(
-                {"error": "You can only cancel your own appointments."},
-                status=status.HTTP_403_FORBIDDEN
-            )
-
-        # Check if appointment can be cancelled
-        if appointment.status in ['cancelled', 'completed']:
-            return Response(
-                {"error": f"Appointment is already {appointment.status} and cannot be cancelled."},
-                
-            )
-
-        # Optional: Get cancellation reason from request
-        cancellation_reason = request.data.get('reason', 'No reason provided')
+        appointment = _apply_transition(request, appointment_id, 'confirm')
+    except TransitionError as e:
+        return _transition_error(e)
 
-        # Update appointment status to cancelled
-        appointment.status = 'cancelled'
-        appointment.save(update_fields=['status'])
-        
-        # Track user action
-        track_user_action(
-            user=request.user,
-            action='update',
-            model_name='Appointment',
-            object_id=appointment.id,
-            action_taken_on=appointment.patient,
-            description=f"Doctor {request.user.email} cancelled appointment for patient {appointment.patient.email}, reason: {cancellation_reason}"
-        )
-
-        # Create notification for the patient
-        notification = Notification.objects.create(
-            sender=request.user,
-            title="Appointment Cancelled",
-            message=f"Dr. {request.user.first_name} {request.user.last_name} has cancelled your appointment scheduled for {appointment.appointment_date.strftime('%B %d, %Y at %I:%M %p')}. Reason: {cancellation_reason}"
-        )
-        notification.receivers.add(appointment.patient)
+    return Response({
+        'status': 'success',
+        'message': TRANSITIONS['confirm'].message,
+        'appointment_id': appointment.id,
+        'appointment_status': appointment.status,
+        'appointment_date': appointment.appointment_date,
+        'patient': f"{appointment.patient.first_name} {appointment.patient.last_name}",
+        'version': appointment.version
+    }, status=status.HTTP_200_OK)
 
-        # Send WebSocket notification to the patient
-        from .signals import send_websocket_notification_to_users, send_refresh_appointment_action
-        send_websocket_notification_to_users(notification)
-        send_refresh_appointment_action([appointment.patient], appointment.id)
 
-        return Response({
-            'status': 'success',
-            'message': 'Appointment cancelled successfully. Patient has been notified.',
-            'appointment_id': appointment.id,
-            'appointment_status': appointment.status,
-            'appointment_date': appointment.appointment_date,
-            'patient': f"{appointment.patient.first_name} {appointment.patient.last_name}",
-            'cancellation_reason': cancellation_reason
-        }, status=status.HTTP_200_OK)
+@api_view(['PATCH'])
+@authentication_classes([TokenAuthentication])
+@permission_classes([IsAuthenticated])
+def cancel_appointment(request, appointment_id):
+    """
+    Allow a doctor to cancel an appointment
+    Changes appointment status to 'cancelled' ('cancel' transition)
+    Sends notification to the patient who booked the appointment
+    """
+    try:
+        appointment = _apply_transition(request, appointment_id, 'cancel')
+    except TransitionError as e:
+        return _transition_error(e)
 
-    except Exception as e:
-        return Response({
-            'status': 'error',
-            'message': str(e)
-        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    return Response({
+        'status': 'success',
+        'message': TRANSITIONS['cancel'].message,
+        'appointment_id': appointment.id,
+        'appointment_status': appointment.status,
+        'appointment_date': appointment.appointment_date,
+        'patient': f"{appointment.patient.first_name} {appointment.patient.last_name}",
+        'cancellation_reason': request.data.get('reason', 'No reason provided'),
+        'version': appointment.version
+    }, status=status.HTTP_200_OK)
 
 
 @api_view(['PATCH'])
@@ -1064,105 +1120,23 @@ def terminate_appointment(request, appointment_id):
     """
     Terminate an appointment
     Changes appointment status to 'cancelled' and records who terminated it
-    Allows authorized staff (doctors, nurses, admins) to terminate appointments
+    ('terminate' transition). Allows doctors, patients, nurses and admins
     """
     try:
-        # Verify the user has permission to terminate appointments
-        user_role = getattr(request.user, 'role', None)
-        if not user_role or user_role.name not in ['doctor', 'patient', 'nurse', 'admin']:
-            return Response(
-                {"error": "Only doctors, nurses, and admins can terminate appointments."},
-                status=status.HTTP_403_FORBIDDEN
-            )
-
-        # Get the appointment
-        try:
-            appointment = Appointment.objects.get(id=appointment_id)
-        except Appointment.DoesNotExist:
-            return Response(
-                {"error": "Appointment not found."},
-                status=status.HTTP_404_NOT_FOUND
-            )
-
-        # Check if appointment can be terminated
-        if appointment.status in ['cancelled', 'completed']:
-            return Response(
-                {"error": f"Appointment is already {appointment.status} and cannot be terminated."},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-
-        # Get termination reason from request
-        termination_reason = request.data.get('reason', 'No reason provided')
-
-        # Use the serializer to update the appointment
-        serializer = AppointmentTerminationSerializer(
-            instance=appointment,
-            data=request.data,
-            partial=True,
-            context={'request': request}
-        )
-        
-        if serializer.is_valid():
-            updated_appointment = serializer.save()
-            
-            # Track user action
-            track_user_action(
-                user=request.user,
-                action='update',
-                model_name='Appointment',
-                object_id=appointment.id,
-                action_taken_on=appointment.patient,
-                description=f"{request.user.get_full_name()} ({user_role.name}) terminated appointment for patient {appointment.patient.email}, reason: {termination_reason}"
-            )
-            
-            # Create notification for the patient
-            notification = Notification.objects.create(
-                sender=request.user,
-                title="Appointment Terminated",
-                message=f"Your appointment scheduled for {appointment.appointment_date.strftime('%B %d, %Y at %I:%M %p')} has been terminated by {request.user.first_name} {request.user.last_name} ({user_role.name}). Reason: {termination_reason}"
-            )
-            notification.receivers.add(appointment.patient)
-            
-            # Also notify the doctor if the terminator is not the doctor
-            if user_role.name != 'doctor' or request.user != appointment.doctor:
-                doctor_notification = Notification.objects.create(
-                    sender=request.user,
-                    title="Appointment Terminated",
-                    message=f"Appointment with {appointment.patient.first_name} {appointment.patient.last_name} scheduled for {appointment.appointment_date.strftime('%B %d, %Y at %I:%M %p')} has been terminated by {request.user.first_name} {request.user.last_name} ({user_role.name}). Reason: {termination_reason}"
-                )
-                doctor_notification.receivers.add(appointment.doctor)
-            
-            # Send WebSocket notifications
-            from .signals import send_websocket_notification_to_users, send_refresh_appointment_action
-            send_websocket_notification_to_users(notification)
-            send_refresh_appointment_action([appointment.patient], appointment.id)
-            
-            # Also notify the doctor if needed
-            if user_role.name != 'doctor' or request.user != appointment.doctor:
-                send_websocket_notification_to_users(doctor_notification)
-                send_refresh_appointment_action([appointment.doctor], appointment.id)
-
-            return Response({
-                'status': 'success',
-                'message': 'Appointment terminated successfully. Relevant parties have been notified.',
-                'appointment_id': updated_appointment.id,
-                'appointment_status': updated_appointment.status,
-                'appointment_date': updated_appointment.appointment_date,
-                'terminated_by': f"{request.user.first_name} {request.user.last_name} ({user_role.name})",
-                'termination_reason': termination_reason
-            }, status=status.HTTP_200_OK)
-        else:
-            return Response({
-                'status': 'error',
-                'message': 'Validation failed',
-                'errors': serializer.errors
-            }, status=status.HTTP_400_BAD_REQUEST)
+        appointment = _apply_transition(request, appointment_id, 'terminate')
+    except TransitionError as e:
+        return _transition_error(e)
 
-    except Exception as e:
-        return Response({
-            'status': 'error',
-            'message': str(e)
-        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    return Response({
+        'status': 'success',
+        'message': TRANSITIONS['terminate'].message,
+        'appointment_id': appointment.id,
+        'appointment_status': appointment.status,
+        'appointment_date': appointment.appointment_date,
+        'terminated_by': f"{request.user.first_name} {request.user.last_name} ({request.user.role.name})",
+        'termination_reason': request.data.get('reason', 'No reason provided'),
+        'version': appointment.version
+    }, status=status.HTTP_200_OK)
 
 
 @api_view(['PATCH'])
@@ -1233,8 +1207,7 @@ def update_appointment(request, appointment_id):
                 notification.receivers.add(updated_appointment.patient)
                 
                 # Send WebSocket notification
-                from .signals import send_websocket_notification_to_users
-                send_websocket_notification_to_users(notification)
+                push_notification.delay(notification.id)
             
             # Create notification if date/time was changed
             if 'appointment_date' in serializer.validated_data:
@@ -1246,8 +1219,7 @@ def update_appointment(request, appointment_id):
                 notification.receivers.add(updated_appointment.patient)
                 
                 # Send WebSocket notification
-                from .signals import send_websocket_notification_to_users
-                send_websocket_notification_to_users(notification)
+                push_notification.delay(notification.id)
 
             return Response({
                 'status': 'success',
@@ -1281,14 +1253,7 @@ def get_patient_vitals(request, patient_id):
     - Ordered by most recent first
     - Uses VitalSignSerializer for consistent data formatting
     """
-    import traceback
-    import logging
-    
-    logger = logging.getLogger(__name__)
-    
     try:
-        logger.info(f"Fetching vitals for patient ID: {patient_id}")
-        
         # Track user action
         track_user_action(
             user=request.user,
@@ -1303,9 +1268,8 @@ def get_patient_vitals(request, patient_id):
                 id=patient_id,
                 role__name='patient'
             )
-            logger.info(f"Found patient: {patient.first_name} {patient.last_name}")
-        except APPLICATIONS_USER_MODEL.DoesNotExist as e:
-            logger.error(f"Patient not found: {str(e)}")
+        except APPLICATIONS_USER_MODEL.DoesNotExist:
+            logger.info("Vitals requested for unknown patient %s", patient_id)
             return Response(
                 {"error": "Patient not found or invalid patient ID"},
                 status=status.HTTP_404_NOT_FOUND
@@ -1318,52 +1282,152 @@ def get_patient_vitals(request, patient_id):
             'patient',
             'recorded_by'
         ).order_by('-recorded_at')
-        
-        logger.info(f"Found {vitals.count()} vitals for patient {patient_id}")
 
-        try:
-            # Serialize the data using the existing VitalSignSerializer
-            serializer = VitalSignSerializer(vitals, many=True, context={'request': request})
-            
-            # Get patient's full name
-            patient_name = f"{patient.first_name} {patient.last_name}"
-            
-            # Prepare last_updated safely
-            last_updated = None
-            if vitals.exists():
-                first_vital = vitals.first()
-                if hasattr(first_vital, 'recorded_at') and first_vital.recorded_at is not None:
-                    last_updated = first_vital.recorded_at.isoformat()
-            
-            response_data = {
-                'status': 'success',
-                'patient': {
-                    'id': patient.id,
-                    'name': patient_name,
-                    'email': patient.email
-                },
-                'vital_signs': serializer.data,
-                'count': len(serializer.data),
-                'last_updated': last_updated
-            }
-            
-            logger.info(f"Successfully prepared response for patient {patient_id}")
-            return Response(response_data, status=status.HTTP_200_OK)
-            
-        except Exception as e:
-            logger.error(f"Error serializing vitals: {str(e)}\n{traceback.format_exc()}")
-            raise
+        # Serialize the data using the existing VitalSignSerializer
+        serializer = VitalSignSerializer(vitals, many=True, context={'request': request})
+        
+        # Get patient's full name
+        patient_name = f"{patient.first_name} {patient.last_name}"
+        
+        # Prepare last_updated safely
+        last_updated = None
+        if vitals.exists():
+            first_vital = vitals.first()
+            if hasattr(first_vital, 'recorded_at') and first_vital.recorded_at is not None:
+                last_updated = first_vital.recorded_at.isoformat()
+        
+        response_data = {
+            'status': 'success',
+            'patient': {
+                'id': patient.id,
+                'name': patient_name,
+                'email': patient.email
+            },
+            'vital_signs': serializer.data,
+            'count': len(serializer.data),
+            'last_updated': last_updated
+        }
+        
+        return Response(response_data, status=status.HTTP_200_OK)
 
     except Exception as e:
-        logger.error(f"Error in get_patient_vitals: {str(e)}\n{traceback.format_exc()}")
+        logger.exception("Error in get_patient_vitals")
         return Response({
             'status': 'error',
             'message': 'Failed to retrieve patient vitals',
-            'detail': str(e),
-            'traceback': traceback.format_exc()
+            'detail': str(e)
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+@query_budget(4)
+@read_replica
+@api_view(['GET'])
+@authentication_classes([TokenAuthentication])
+@permission_classes([IsAuthenticated])
+def get_early_warning_board(request):
+    """
+    Admitted patients by their latest early-warning (NEWS2) score, highest
+    first, with its risk and trend (see early_warning.py)
+    - hospital staff only
+    - hours: how far back the trend looks (default 24)
+    """
+    if getattr(getattr(request.user, 'role', None), 'name', None) == 'patient':
+        return Response({
+            'status': 'error',
+            'message': 'Only hospital staff can view early warning scores.'
+        }, status=status.HTTP_403_FORBIDDEN)
+    try:
+        hours = int(request.query_params.get('hours', 24))
+        if not 1 <= hours <= 24 * 7:
+            raise ValueError
+    except ValueError:
+        return Response({
+            'status': 'error',
+            'message': 'hours must be between 1 and 168.'
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    board = early_warning_board(hours)
+    return Response({
+        'status': 'success',
+        'patients': board,
+        'count': len(board)
+    }, status=status.HTTP_200_OK)
+
+
+def _aware_datetime(value):
+    """An optional ISO datetime query parameter; naive ones are in the server's timezone"""
+    if not value:
+        return None
+    parsed = parse_datetime(value)
+    if parsed is None:
+        raise ValueError(value)
+    return timezone.make_aware(parsed) if timezone.is_naive(parsed) else parsed
+
+
+@query_budget(5)
+@read_replica
+@api_view(['GET'])
+@authentication_classes([TokenAuthentication])
+@permission_classes([IsAuthenticated])
+def get_patient_vitals_trend(request, patient_id):
+    """
+    A patient's vitals as chart-ready columns (see vitals_trend.py)
+    - Patients can only view their own; hospital staff any patient's
+    Optional query parameters:
+    - from, to: ISO datetimes bounding the range (to is exclusive)
+    - points: downsample to about this many buckets when there are more
+      readings (default 300, at most 2000)
+    - resolution: bucket width in minutes, always downsampling
+    """
+    if request.user.id != patient_id and getattr(getattr(request.user, 'role', None), 'name', None) == 'patient':
+        return Response({
+            'status': 'error',
+            'message': "You can only view your own vitals."
+        }, status=status.HTTP_403_FORBIDDEN)
+
+    params = request.query_params
+    try:
+        start, end = (_aware_datetime(params.get(name)) for name in ('from', 'to'))
+        points = int(params.get('points', DEFAULT_POINTS))
+        resolution = int(params['resolution']) if params.get('resolution') else None
+        if not 1 <= points <= MAX_POINTS or (resolution is not None and resolution < 1):
+            raise ValueError
+    except (TypeError, ValueError):
+        return Response({
+            'status': 'error',
+            'message': f'from and to must be ISO datetimes, points between 1 and {MAX_POINTS} '
+                       'and resolution a positive number of minutes.'
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    patient = APPLICATIONS_USER_MODEL.objects.filter(
+        id=patient_id, role__name='patient'
+    ).values('id', 'first_name', 'last_name').first()
+    if patient is None:
+        return Response({
+            'status': 'error',
+            'message': 'Patient not found or invalid patient ID'
+        }, status=status.HTTP_404_NOT_FOUND)
+
+    track_user_action(
+        user=request.user,
+        action='read',
+        model_name='VitalSign',
+        description=f"User {request.user.email} viewed the vitals trend of patient ID: {patient_id}"
+    )
+    return Response({
+        'status': 'success',
+        'patient': {
+            'id': patient['id'],
+            'name': f"{patient['first_name']} {patient['last_name']}",
+        },
+        'trend': vitals_trend(
+            patient_id, start=start, end=end, points=points,
+            bucket_seconds=resolution * 60 if resolution else None,
+        ),
+    }, status=status.HTTP_200_OK)
+
+
+@read_replica
 @api_view(['GET', 'POST'])
 @authentication_classes([TokenAuthentication])
 @permission_classes([IsAuthenticated])
@@ -1390,34 +1454,32 @@ def medical_records_list_create(request):
                 description=f"Doctor/Admin {request.user.email} viewed medical records list"
             )
             
-            # Get query parameters
-            patient_id = request.query_params.get('patient_id')
-            
-            # Start with all records
-            records = MedicalRecord.objects.all()
-            
-            # Filter by patient if specified
-            if patient_id:
-                records = records.filter(patient_id=patient_id)
+            records = MedicalRecord.objects.select_related('doctor__profile__department')
+            records = filter_queryset(request, records, {
+                'patient_id': 'patient_id',
+                'appointment_id': 'appointment_id',
+                'status': 'status',
+                'date_from': 'date_created__date__gte',
+                'date_to': 'date_created__date__lte',
+            })
             
             # If not admin, only show records created by the doctor
             if request.user.role.name == 'doctor':
                 records = records.filter(doctor=request.user)
             
-            # Order by most recent first
-            records = records.order_by('-date_created')
-            
-            # Serialize and return
-            serializer = MedicalRecordSerializer(
-                records, 
-                many=True,
-                context={'request': request}
+            # Most recent first, one page at a time
+            data, meta = paginate(
+                request,
+                records,
+                MedicalRecordSerializer,
+                ordering_fields={'date_created': 'date_created', 'last_updated': 'last_updated'},
+                default_ordering='-date_created'
             )
             
             return Response({
                 'status': 'success',
-                'count': len(serializer.data),
-                'medical_records': serializer.data
+                **meta,
+                'medical_records': data
             })
             
         elif request.method == 'POST':
@@ -1467,6 +1529,11 @@ def medical_records_list_create(request):
                 'errors': serializer.errors
             })
     
+    except InvalidQueryParameter as e:
+        return Response({
+            'status': 'error',
+            'message': e.detail
+        }, status=status.HTTP_400_BAD_REQUEST)
     except Exception as e:
         return Response({
             'status': 'error',
@@ -1541,16 +1608,10 @@ def create_treatment(request, medical_record_id):
     - POST: Create a new treatment for a medical record
     """
     try:
-        print(f"Received request to create treatment for medical record {medical_record_id}")
-        print(f"Request data: {request.data}")
-        print(f"Request user: {request.user.id} ({request.user.email})")
-        
         # Check if medical record exists
         try:
             medical_record = MedicalRecord.objects.get(id=medical_record_id)
-            print(f"Found medical record: {medical_record.id}")
         except MedicalRecord.DoesNotExist:
-            print("Medical record not found")
             return Response(
                 {"status": "error", "message": "Medical record not found."},
                 status=status.HTTP_404_NOT_FOUND
@@ -1560,7 +1621,6 @@ def create_treatment(request, medical_record_id):
         
         # Only doctors can create treatments
         if not (user.role.name == 'doctor' or user.is_staff):
-            print("User is not authorized to create treatments")
             return Response(
                 {"status": "error", "message": "Only doctors can create treatments."},
                 status=status.HTTP_403_FORBIDDEN
@@ -1572,15 +1632,12 @@ def create_treatment(request, medical_record_id):
         # If prescribed_by is not provided, use the requesting doctor
         if 'prescribed_by_id' not in data:
             data['prescribed_by_id'] = user.id
-            print(f"Setting prescribed_by to requesting user: {user.id}")
             
-        print(f"Creating treatment with data: {data}")
         serializer = TreatmentSerializer(data=data, context={'request': request})
         
         if serializer.is_valid():
-            print("Serializer is valid, saving treatment...")
             treatment = serializer.save()
-            print(f"Treatment created: {treatment.id}")
+            logger.info("Treatment %s created on medical record %s", treatment.id, medical_record.id)
             
             # Track user action
             track_user_action(
@@ -1599,9 +1656,8 @@ def create_treatment(request, medical_record_id):
                     title="New Treatment Prescribed",
                     message=f"Dr. {user.get_full_name()} has prescribed a new treatment: {treatment.name}",
                 ).receivers.add(medical_record.patient)
-                print("Notification created for patient")
-            except Exception as e:
-                print(f"Error creating notification: {str(e)}")
+            except Exception:
+                logger.exception("Error creating notification")
                 # Don't fail the request if notification fails
             
             return Response({
@@ -1610,7 +1666,7 @@ def create_treatment(request, medical_record_id):
                 'treatment': TreatmentSerializer(treatment, context={'request': request}).data
             }, status=status.HTTP_201_CREATED)
             
-        print(f"Serializer errors: {serializer.errors}")
+        logger.info("Treatment rejected, invalid fields: %s", sorted(serializer.errors))
         return Response({
             'status': 'error',
             'message': 'Invalid data provided',
@@ -1618,10 +1674,7 @@ def create_treatment(request, medical_record_id):
         })
         
     except Exception as e:
-        import traceback
-        error_trace = traceback.format_exc()
-        print(f"Error in create_treatment: {str(e)}")
-        print(f"Traceback: {error_trace}")
+        logger.exception("Error in create_treatment")
         return Response({
             'status': 'error',
             'message': 'An error occurred while creating the treatment',
@@ -1773,9 +1826,9 @@ def create_surgery_placement(request):
                     title="Surgery Scheduled",
                     message=f"A surgery has been scheduled for you on {surgery_placement.scheduled_date.strftime('%B %d, %Y')}.",
                 ).receivers.add(medical_record.patient)
-            except Exception as e:
+            except Exception:
                 # Log the error but don't fail the request
-                print(f"Failed to create notification: {str(e)}")
+                logger.exception("Failed to create notification")
             
             return Response({
                 "status": "success",
@@ -1942,6 +1995,8 @@ def get_ward_space_info(request):
 
 
 
+@query_budget(8)
+@read_replica
 @api_view(['GET'])
 @authentication_classes([TokenAuthentication])
 @permission_classes([IsAuthenticated])
@@ -1958,20 +2013,38 @@ def list_test_requests(request):
             description=f"{request.user.role.name.title()} {request.user.email} viewed test requests list"
         )
         
-        # Get all test requests ordered by most recent
         test_requests = TestRequest.objects.all().select_related(
             'patient', 'requested_by', 'lab_tehnician', 'test_type'
-        ).order_by('-created_at')
+        )
+        test_requests = filter_queryset(request, test_requests, {
+            'status': 'status',
+            'patient_id': 'patient_id',
+            'test_type': 'test_type_id',
+            'is_payment_done': 'is_payment_done',
+            'date_from': 'created_at__date__gte',
+            'date_to': 'created_at__date__lte',
+        })
         
-        # Serialize the data
-        serializer = TestRequestListSerializer(test_requests, many=True)
+        # Most recent first, one page at a time
+        data, meta = paginate(
+            request,
+            test_requests,
+            TestRequestListSerializer,
+            ordering_fields={'created_at': 'created_at', 'updated_at': 'updated_at'},
+            default_ordering='-created_at'
+        )
         
         return Response({
             'status': 'success',
-            'count': len(serializer.data),
-            'results': serializer.data
+            **meta,
+            'results': data
         })
         
+    except InvalidQueryParameter as e:
+        return Response({
+            'status': 'error',
+            'message': e.detail
+        }, status=status.HTTP_400_BAD_REQUEST)
     except Exception as e:
         return Response({
             'status': 'error',
@@ -2004,8 +2077,7 @@ def create_test_request(request):
                 description=f"{request.user.role.name.title()} {request.user.email} requested {test_request.test_type.name} test for patient {patient_email}"
             )
             
-            # Debug: Log the created test request ID
-            print(f"Created TestRequest with ID: {test_request.id}")
+            logger.info("TestRequest %s created", test_request.id)
             
             # If there's a medical record associated with this test request,
             # update its requested_for_test field to True
@@ -2021,13 +2093,13 @@ def create_test_request(request):
             }, status=status.HTTP_201_CREATED)
             
         except Exception as e:
-            print(f"Error saving test request: {str(e)}")
+            logger.exception("Error saving test request")
             return Response({
                 'status': 'error',
                 'message': f'Error saving test request: {str(e)}'
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
     
-    print(f"Serializer errors: {serializer.errors}")
+    logger.info("Test request rejected, invalid fields: %s", sorted(serializer.errors))
     return Response({
         'status': 'error',
         'message': 'Validation failed',
@@ -2037,6 +2109,51 @@ def create_test_request(request):
 
 
 
+@query_budget(5)
+@read_replica
+@api_view(['GET'])
+@authentication_classes([TokenAuthentication])
+@permission_classes([IsAuthenticated])
+def lookup_patients(request):
+    """
+    Find patients by name, phone number, national ID or email, best match
+    first, without loading the patient list (see patient_directory.py)
+    - q: what the front desk typed; every word must start a name, ID or
+      email of the patient, or q is a phone number or numeric ID
+    - limit: how many patients, 10 by default
+    - Staff only
+    """
+    if getattr(getattr(request.user, 'role', None), 'name', None) == 'patient' and not request.user.is_staff:
+        return Response({
+            'status': 'error',
+            'message': 'Only staff can look up patients.'
+        }, status=status.HTTP_403_FORBIDDEN)
+
+    query = request.query_params.get('q', '').strip()
+    try:
+        limit = int(request.query_params.get('limit', LOOKUP_LIMIT))
+        if not query or not 1 <= limit <= MAX_LOOKUP_LIMIT:
+            raise ValueError
+    except ValueError:
+        return Response({
+            'status': 'error',
+            'message': f'q is required and limit must be between 1 and {MAX_LOOKUP_LIMIT}.'
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    patients = lookup_patient_directory(query, limit)
+    track_user_action(
+        user=request.user,
+        action='read',
+        model_name='User',
+        description=f"User {request.user.email} looked up patients"
+    )
+    return Response({
+        'status': 'success',
+        'data': patients,
+        'count': len(patients)
+    }, status=status.HTTP_200_OK)
+
+
 @api_view(['GET'])
 @authentication_classes([TokenAuthentication])
 @permission_classes([IsAuthenticated])
@@ -2048,8 +2165,6 @@ def get_patient_users(request):
     - Ordered by most recently joined first
     """
     try:
-        print("Fetching patient users...")
-        
         # Track user action
         track_user_action(
             user=request.user,
@@ -2059,7 +2174,6 @@ def get_patient_users(request):
         )
         
         # Get the patient role group
-        from django.contrib.auth.models import Group
         try:
             patient_group = Group.objects.get(name='patient')
         except Group.DoesNotExist:
@@ -2073,8 +2187,6 @@ def get_patient_users(request):
             role=patient_group
         ).select_related('profile').order_by('-date_joined')
         
-        print(f"Found {patients.count()} patients")
-        
         # Serialize the data
         serializer = PatientUserSerializer(patients, many=True)
         
@@ -2085,129 +2197,82 @@ def get_patient_users(request):
         }, status=status.HTTP_200_OK)
         
     except Exception as e:
-        import traceback
-        error_trace = traceback.format_exc()
-        print(f"Error in get_patient_users: {str(e)}\n{error_trace}")
+        logger.exception("Error in get_patient_users")
         
         return Response({
             'status': 'error',
-            'message': str(e),
-            'trace': error_trace if settings.DEBUG else None
+            'message': str(e)
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
 
 
 
+@query_budget(16)
 @api_view(['GET'])
 @authentication_classes([TokenAuthentication])
 @permission_classes([IsAuthenticated])
 def get_patient_user_detail(request, user_id):
     """
     Get detailed profile and admission information for a specific patient user
-    - Returns basic user info, profile details, and current admission status
+    - Returns basic user info, profile details, current admission, active
+      medications and recent vitals, from the patient's summary snapshot
+      (see patient_summary.py)
+    - Versioned: the ETag is the summary version; If-None-Match with the
+      current one returns 304 Not Modified
     - Only returns users with 'patient' role
+    - Patients can only view their own; hospital staff any patient's
     - Returns 404 if patient not found or not a patient
     """
+    if request.user.id != user_id and getattr(getattr(request.user, 'role', None), 'name', None) == 'patient':
+        return Response({
+            'status': 'error',
+            'message': "You can only view your own records."
+        }, status=status.HTTP_403_FORBIDDEN)
+
     try:
-        # Get the patient role group
-        try:
-            patient_group = Group.objects.get(name='patient')
-        except Group.DoesNotExist:
-            return Response({
-                'status': 'error',
-                'message': 'Patient role group does not exist. Please create a "patient" group in the admin.'
-            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-        
-        # Get the specific user and verify they are a patient with related data
-        try:
-            from django.utils import timezone
-            today = timezone.now().date()
-            
-            # Get patient with profile and current admission data
-            patient = APPLICATIONS_USER_MODEL.objects.filter(
-                id=user_id,
-                role=patient_group
-            ).select_related('profile').first()
-            
-            if not patient:
-                return Response({
-                    'status': 'error',
-                    'message': 'Patient not found or is not a valid patient user.'
-                }, status=status.HTTP_404_NOT_FOUND)
-                
-            # Get current admission if any
-            current_admission = patient.admissions.filter(
-                status='active'
-            ).select_related('bed', 'bed__room', 'bed__room__ward').first()
-            
-            # Prepare admission data
-            admission_data = None
-            if current_admission:
-                admission_data = {
-                    'admission_date': current_admission.admission_date,
-                    'ward': {
-                        'id': current_admission.bed.room.ward.id,
-                        'name': current_admission.bed.room.ward.name,
-                        'description': current_admission.bed.room.ward.description
-                    },
-                    'room': {
-                        'id': current_admission.bed.room.id,
-                        'name': current_admission.bed.room.name,
-                        'description': current_admission.bed.room.description
-                    },
-                    'bed': {
-                        'id': current_admission.bed.id,
-                        'name': f"{current_admission.bed.room.name} - Bed {current_admission.bed.id}",
-                        'is_occupied': current_admission.bed.is_occupied
-                    }
-                }
-            
-            # Prepare patient data
-            patient_data = {
-                'id': patient.id,
-                'email': patient.email,
-                'first_name': patient.first_name,
-                'last_name': patient.last_name,
-                'profile': {
-                    'phone_number': patient.profile.phone_number if hasattr(patient, 'profile') else None,
-                    'date_of_birth': patient.profile.date_of_birth if hasattr(patient, 'profile') else None,
-                    'gender': patient.profile.gender if hasattr(patient, 'profile') else None,
-                    'blood_group': patient.profile.blood_group if hasattr(patient, 'profile') else None,
-                    'genotype': patient.profile.genotype if hasattr(patient, 'profile') else None,
-                    'address': patient.profile.address if hasattr(patient, 'profile') else None,
-                    'emergency_contact': patient.profile.emergency_contact if hasattr(patient, 'profile') else None,
-                    'profile_picture': request.build_absolute_uri(patient.profile.profile_picture.url) if hasattr(patient, 'profile') and patient.profile.profile_picture else None
-                },
-                'admission': admission_data
-            }
-            
-            # Track user action
-            track_user_action(
-                user=request.user,
-                action='read',
-                model_name='User',
-                object_id=patient.id,
-                description=f"{request.user.role.name.title()} {request.user.email} viewed detailed profile for patient {patient.email}"
-            )
-            
-            # Return the response in the expected format
-            return Response({
-                'status': 'success',
-                'data': patient_data
-            }, status=status.HTTP_200_OK)
-            
-        except APPLICATIONS_USER_MODEL.DoesNotExist:
+        summary = patient_summary(user_id)
+        if summary is None:
             return Response({
                 'status': 'error',
                 'message': 'Patient not found or is not a valid patient user.'
             }, status=status.HTTP_404_NOT_FOUND)
-            
+
+        etag = f'"patient-summary-{user_id}-{summary["version"]}"'
+        if etag in [tag.strip() for tag in request.headers.get('If-None-Match', '').split(',')]:
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+
+        data = summary['data']
+        picture = data['profile']['profile']['profile_picture']
+        patient_data = {
+            **data['profile'],
+            'profile': {
+                **data['profile']['profile'],
+                'profile_picture': request.build_absolute_uri(picture) if picture else None,
+            },
+            'admission': data['admission'],
+            'medications': data['medications'],
+            'recent_vitals': data['vitals'],
+        }
+
+        # Track user action
+        track_user_action(
+            user=request.user,
+            action='read',
+            model_name='User',
+            object_id=user_id,
+            description=f"{request.user.role.name.title()} {request.user.email} viewed detailed profile for patient {patient_data['email']}"
+        )
+
+        return Response({
+            'status': 'success',
+            'version': summary['version'],
+            'data': patient_data
+        }, status=status.HTTP_200_OK, headers={'ETag': etag})
+
     except Exception as e:
-        import traceback
-        error_trace = traceback.format_exc()
-        print(f"Error in get_patient_user_detail: {str(e)}\n{error_trace}")
-        
+        logger.exception("Error in get_patient_user_detail")
+
         return Response({
             'status': 'error',
             'message': 'An error occurred while fetching patient details.',
@@ -2233,25 +2298,15 @@ def create_pharmacy_referral(request):
     Optional fields:
     - pharmacist_id: ID of the pharmacist (can be assigned later)
     """
-    print(f"User: {request.user} (ID: {request.user.id})")
-    print(f"Request data: {request.data}")
-
     if request.method == 'POST':
         try:
             data = request.data.copy()
-            print(f"\nRaw request data: {data}")
-            
-            # Log data types
-            print("\nData types:")
-            for key, value in data.items():
-                print(f"  {key}: {value} (type: {type(value).__name__})")
             
             # Validate required fields
             required_fields = ['patient_id', 'medical_record_id', 'referred_by_id', 'drug_ids', 'reason']
             missing_fields = [field for field in required_fields if field not in data]
             if missing_fields:
                 error_msg = f"Missing required fields: {', '.join(missing_fields)}"
-                print(f"\nValidation error: {error_msg}")
                 return Response({
                     'status': 'error',
                     'message': error_msg
@@ -2263,10 +2318,7 @@ def create_pharmacy_referral(request):
                 if field in data and data[field] is not None and isinstance(data[field], str):
                     try:
                         data[field] = int(data[field])
-                        print(f"Converted {field} to int: {data[field]}")
-                    except (ValueError, TypeError) as e:
-                        error_msg = f"Invalid {field}: {e}"
-                        print(f"\n{error_msg}")
+                    except (ValueError, TypeError):
                         return Response({
                             'status': 'error',
                             'message': f'{field} must be a valid number'
@@ -2283,16 +2335,12 @@ def create_pharmacy_referral(request):
                         'message': 'drug_ids must be a valid JSON array'
                     })
             
-            print("\nCreating serializer with data:", data)
             serializer = PharmacyReferralSerializer(data=data, context={'request': request})
             
             if serializer.is_valid():
-                print("\nSerializer is valid")
-                print("Validated data:", serializer.validated_data)
-                
                 try:
                     referral = serializer.save()
-                    print(f"\nPharmacyReferral created successfully with ID: {referral.id}")
+                    logger.info("PharmacyReferral %s created", referral.id)
                     
                     # Track user action
                     track_user_action(
@@ -2313,21 +2361,16 @@ def create_pharmacy_referral(request):
                         'referral': response_serializer.data
                     }
                     
-                    print("\nSending success response")
                     return Response(response_data, status=status.HTTP_201_CREATED)
                     
                 except Exception as e:
-                    error_msg = f"Error in serializer.save(): {str(e)}"
-                    print(f"\n!!! {error_msg} !!!")
-                    print("Traceback:", traceback.format_exc())
+                    logger.exception("Error saving pharmacy referral")
                     return Response({
                         'status': 'error',
                         'message': f'Failed to create pharmacy referral: {str(e)}'
                     })
             else:
-                error_msg = f"Serializer validation failed: {serializer.errors}"
-                print(f"\n!!! {error_msg} !!!")
-                print("Data that caused error:", data)
+                logger.info("Pharmacy referral rejected, invalid fields: %s", sorted(serializer.errors))
                 return Response({
                     'status': 'error',
                     'message': 'Validation failed',
@@ -2335,9 +2378,7 @@ def create_pharmacy_referral(request):
                 })
                 
         except Exception as e:
-            error_msg = f"Unhandled exception: {str(e)}"
-            print(f"\n!!! {error_msg} !!!")
-            print("Traceback:", traceback.format_exc())
+            logger.exception("Error in create_pharmacy_referral")
             return Response({
                 'status': 'error',
                 'message': 'An unexpected error occurred',
@@ -2405,9 +2446,7 @@ def create_delivered_medication_treatment(request):
         }, status=status.HTTP_201_CREATED)
         
     except Exception as e:
-        print(f"[ERROR] Unhandled exception: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Unhandled exception")
         
         return Response({
             'status': 'error',
@@ -2456,9 +2495,7 @@ def get_delivered_medications_for_treatment(request, treatment_id):
         }, status=status.HTTP_200_OK)
         
     except Exception as e:
-        print(f"[ERROR] Unhandled exception: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Unhandled exception")
         
         return Response({
             'status': 'error',
@@ -2469,6 +2506,8 @@ def get_delivered_medications_for_treatment(request, treatment_id):
 
 
 
+@query_budget(8)
+@read_replica
 @api_view(['GET'])
 @authentication_classes([TokenAuthentication])
 @permission_classes([IsAuthenticated])
@@ -2500,31 +2539,42 @@ def get_delivered_medication_treatments(request):
             'message': 'You do not have permission to view these records'
         }, status=status.HTTP_403_FORBIDDEN)
     
-    # Apply any filters from query parameters
-    medical_record_id = request.query_params.get('medical_record_id')
-    if medical_record_id:
-        queryset = queryset.filter(medical_record_id=medical_record_id)
-    
-    treatment_id = request.query_params.get('treatment_id')
-    if treatment_id:
-        queryset = queryset.filter(treatment_id=treatment_id)
-    
-    # Optimize queries
-    queryset = queryset.select_related(
-        'treatment',
-        'medical_record',
-        'medical_record__patient',
-        'drug',
-        'prescribed_by'
-    ).order_by('-date_created')
-    
-    # Serialize and return the data
-    serializer = MedicationTreatmentSerializer(queryset, many=True, context={'request': request})
+    try:
+        # Apply any filters from query parameters
+        queryset = filter_queryset(request, queryset, {
+            'medical_record_id': 'medical_record_id',
+            'treatment_id': 'treatment_id',
+            'drug_id': 'drug_id',
+            'date_from': 'date_created__date__gte',
+            'date_to': 'date_created__date__lte',
+        })
+        
+        # Optimize queries
+        queryset = queryset.select_related(
+            'treatment',
+            'medical_record',
+            'medical_record__patient',
+            'drug',
+            'prescribed_by'
+        )
+        
+        data, meta = paginate(
+            request,
+            queryset,
+            MedicationTreatmentSerializer,
+            ordering_fields={'date_created': 'date_created'},
+            default_ordering='-date_created'
+        )
+    except InvalidQueryParameter as e:
+        return Response({
+            'status': 'error',
+            'message': e.detail
+        }, status=status.HTTP_400_BAD_REQUEST)
     
     return Response({
         'status': 'success',
-        'count': len(serializer.data),
-        'data': serializer.data
+        **meta,
+        'data': data
     })
 
 
@@ -2607,6 +2657,7 @@ def get_drugs(request):
 
 
 
+@query_budget(20)
 @api_view(['GET'])
 @authentication_classes([TokenAuthentication])
 @permission_classes([IsAuthenticated])
@@ -2630,15 +2681,12 @@ def get_patient_treatment_history(request, patient_id):
         # Get all medical records for the patient using patient_id
         medical_records = MedicalRecord.objects.filter(
             patient_id=patient_id
-        ).select_related(
-            'patient',
-            'doctor'
-        ).prefetch_related(
-            'treatments'
         ).order_by('-date_created')  # Changed from 'created_at' to 'date_created'
         
-        # Serialize the data
-        serializer = PatientTreatmentHistorySerializer(medical_records, many=True, context={'request': request})
+        # Serialize the data, loading only what ?fields= / ?expand= ask for
+        context = {'request': request}
+        medical_records = PatientTreatmentHistorySerializer.setup_eager_loading(medical_records, context)
+        serializer = PatientTreatmentHistorySerializer(medical_records, many=True, context=context)
         
         return Response({
             'status': 'success',
@@ -2646,8 +2694,7 @@ def get_patient_treatment_history(request, patient_id):
         })
         
     except Exception as e:
-        import traceback
-        print(traceback.format_exc())
+        logger.exception("Unhandled exception")
         return Response({
             'status': 'error',
             'message': str(e)
@@ -2656,6 +2703,144 @@ def get_patient_treatment_history(request, patient_id):
 
 
 
+@query_budget(12)
+@read_replica
+@api_view(['GET'])
+@authentication_classes([TokenAuthentication])
+@permission_classes([IsAuthenticated])
+def get_patient_timeline(request, patient_id):
+    """
+    A patient's whole chart as one list, newest first (see timeline.py):
+    medical records, treatments, delivered medications, administrations,
+    doctor visits, vital signs and tests
+    - Patients can only view their own; hospital staff any patient's
+    Optional query parameters:
+    - kinds: comma separated subset, e.g. kinds=vital,test
+    - limit, cursor: page size and the next_cursor of the previous page
+    """
+    if request.user.id != patient_id and getattr(getattr(request.user, 'role', None), 'name', None) == 'patient':
+        return Response({
+            'status': 'error',
+            'message': "You can only view your own records."
+        }, status=status.HTTP_403_FORBIDDEN)
+
+    kinds = [kind for kind in request.query_params.get('kinds', '').split(',') if kind]
+    unknown = sorted(set(kinds) - set(TIMELINE_KINDS))
+    if unknown:
+        return Response({
+            'status': 'error',
+            'message': f"Unknown kinds: {', '.join(unknown)}. Kinds are: {', '.join(TIMELINE_KINDS)}."
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    patient = APPLICATIONS_USER_MODEL.objects.filter(
+        id=patient_id, role__name='patient'
+    ).values('id', 'first_name', 'last_name').first()
+    if patient is None:
+        return Response({
+            'status': 'error',
+            'message': 'Patient not found or invalid patient ID'
+        }, status=status.HTTP_404_NOT_FOUND)
+
+    try:
+        entries, next_cursor = patient_timeline(
+            patient_id, get_page_size(request), request.query_params.get('cursor'), kinds
+        )
+    except InvalidTimelineCursor as e:
+        return Response({
+            'status': 'error',
+            'message': str(e)
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    track_user_action(
+        user=request.user,
+        action='read',
+        model_name='MedicalRecord',
+        description=f"User {request.user.email} viewed the timeline of patient ID: {patient_id}"
+    )
+    return Response({
+        'status': 'success',
+        'patient': {
+            'id': patient['id'],
+            'name': f"{patient['first_name']} {patient['last_name']}",
+        },
+        'data': entries,
+        'count': len(entries),
+        'next_cursor': next_cursor
+    }, status=status.HTTP_200_OK)
+
+
+@query_budget(6)
+@read_replica
+@api_view(['GET'])
+@authentication_classes([TokenAuthentication])
+@permission_classes([IsAuthenticated])
+def search_clinical_notes(request):
+    """
+    Full-text search over medical records, treatments, test results and
+    doctor visits, best match first (see clinical_search.py)
+    - q: the words to find (all must match; word* matches a prefix)
+    - Patients search their own records; lab technicians only see test
+      results and pharmacists only treatments
+    Optional query parameters:
+    - kinds: comma separated subset of record, treatment, test_result, doctor_visit
+    - patient_id, doctor_id: only that patient's / doctor's documents
+    - from, to: YYYY-MM-DD, inclusive
+    - limit, cursor: page size and the next_cursor of the previous page
+    """
+    allowed = visible_kinds(request.user)
+    if not allowed:
+        return Response({
+            'status': 'error',
+            'message': 'You are not allowed to search clinical records.'
+        }, status=status.HTTP_403_FORBIDDEN)
+
+    kinds = [kind for kind in request.query_params.get('kinds', '').split(',') if kind] or allowed
+    unknown = sorted(set(kinds) - set(allowed))
+    if unknown:
+        return Response({
+            'status': 'error',
+            'message': f"Unknown kinds: {', '.join(unknown)}. Kinds are: {', '.join(allowed)}."
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        patient_id = int(request.query_params['patient_id']) if request.query_params.get('patient_id') else None
+        doctor_id = int(request.query_params['doctor_id']) if request.query_params.get('doctor_id') else None
+        start = date.fromisoformat(request.query_params['from']) if request.query_params.get('from') else None
+        end = date.fromisoformat(request.query_params['to']) if request.query_params.get('to') else None
+    except ValueError:
+        return Response({
+            'status': 'error',
+            'message': 'patient_id and doctor_id must be ids, from and to dates (YYYY-MM-DD).'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    if getattr(getattr(request.user, 'role', None), 'name', None) == 'patient' and not request.user.is_staff:
+        patient_id = request.user.id
+
+    try:
+        offset = decode_search_cursor(request.query_params['cursor']) if request.query_params.get('cursor') else 0
+        results, next_offset = clinical_search(
+            request.query_params.get('q'), kinds, patient_id=patient_id, doctor_id=doctor_id,
+            date_from=start, date_to=end, limit=get_page_size(request), offset=offset,
+        )
+    except InvalidQuery as e:
+        return Response({
+            'status': 'error',
+            'message': str(e)
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    track_user_action(
+        user=request.user,
+        action='read',
+        model_name='ClinicalDocument',
+        description=f"User {request.user.email} searched clinical records"
+    )
+    return Response({
+        'status': 'success',
+        'data': results,
+        'count': len(results),
+        'next_cursor': encode_search_cursor(next_offset) if next_offset is not None else None
+    }, status=status.HTTP_200_OK)
+
+
 @api_view(['POST'])
 @authentication_classes([TokenAuthentication])
 @permission_classes([IsAuthenticated])
@@ -2830,9 +3015,7 @@ def get_who_administered_for_treatment(request, delivered_medication_treatment_i
         }, status=status.HTTP_200_OK)
         
     except Exception as e:
-        print(f"[ERROR] Unhandled exception: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Unhandled exception")
         
         return Response({
             'status': 'error',
@@ -2846,6 +3029,8 @@ def get_who_administered_for_treatment(request, delivered_medication_treatment_i
 
 
 
+@query_budget(10)
+@read_replica
 @api_view(['GET'])
 @authentication_classes([TokenAuthentication])
 @permission_classes([IsAuthenticated])
@@ -2861,14 +3046,37 @@ def get_pharmacy_referrals(request):
         description=f"{request.user.role.name.title()} {request.user.email} viewed pharmacy referrals list"
     )
     
-    referrals = PharmacyReferral.objects.all().prefetch_related(
-        'referral_dispensed_items__drug'
+    referrals = PharmacyReferral.objects.select_related(
+        'patient', 'referred_by', 'phamacist'
+    ).prefetch_related(
+        Prefetch('drugs', queryset=DeliveredMedicationTreatment.objects.select_related('drug', 'prescribed_by'))
     )
-    serializer = PharmacyReferralListSerializer(referrals, many=True)
+    try:
+        referrals = filter_queryset(request, referrals, {
+            'patient_id': 'patient_id',
+            'medical_record_id': 'medical_record_id',
+            'is_payment_done': 'is_payment_done',
+            'have_pharmacist_despensed': 'have_pharmacist_despensed',
+            'have_patient_received': 'have_patient_received',
+            'date_from': 'created_at__date__gte',
+            'date_to': 'created_at__date__lte',
+        })
+        data, meta = paginate(
+            request,
+            referrals,
+            PharmacyReferralListSerializer,
+            ordering_fields={'created_at': 'created_at'},
+            default_ordering='-created_at'
+        )
+    except InvalidQueryParameter as e:
+        return Response({
+            'status': 'error',
+            'message': e.detail
+        }, status=status.HTTP_400_BAD_REQUEST)
     return Response({
         'status': 'success',
-        'count': len(serializer.data),  # Use len() on the serialized data
-        'data': serializer.data
+        **meta,
+        'data': data
     }, status=status.HTTP_200_OK)
 
 
@@ -2947,14 +3155,9 @@ def generate_bulk_sale_id(request):
     """
     Generate a new 6-character alphanumeric bulk sale ID
     """
-    print(f"Request method: {request.method}")  # Debug: Print request method
-    print(f"Request path: {request.path}")      # Debug: Print request path
-    print(f"Request headers: {request.headers}") # Debug: Print headers
-    
     try:
         # Create a new BulkSaleId - the save() method will generate the code
         bulk_sale = BulkSaleId.objects.create(staff=request.user)
-        print(f"Created BulkSaleId: {bulk_sale.id}")  # Debug: Print created ID
         
         # Track user action
         track_user_action(
@@ -2975,7 +3178,7 @@ def generate_bulk_sale_id(request):
         }, status=status.HTTP_201_CREATED)
         
     except Exception as e:
-        print(f"Error in generate_bulk_sale_id: {str(e)}")  # Debug: Print error
+        logger.exception("Error in generate_bulk_sale_id")  # Debug: Print error
         return Response({
             'status': 'error',
             'message': str(e)
@@ -3029,15 +3232,11 @@ def create_bulk_dispensed_items(request):
     """
     Create multiple ReferralDispensedDrugItem instances with the same bulk_sale_id
     """
-    print("Request data:", request.data)  # Debug: Print the entire request data
     try:
         data = request.data
         bulk_sale_id = data.get('bulk_sale_id')
         items_data = data.get('items', [])
         
-        print("bulk_sale_id:", bulk_sale_id)  # Debug: Print bulk_sale_id
-        print("items_data:", items_data)      # Debug: Print items data
-        
         if not bulk_sale_id:
             return Response({
                 'status': 'error',
@@ -3057,8 +3256,6 @@ def create_bulk_dispensed_items(request):
         
         for index, item_data in enumerate(items_data):
             try:
-                print(f"Processing item {index}:", item_data)  # Debug: Print each item being processed
-                
                 if 'drug' not in item_data:
                     raise ValueError("'drug' field is required for each item")
                 
@@ -3095,7 +3292,7 @@ def create_bulk_dispensed_items(request):
                 
             except Exception as e:
                 error_msg = str(e)
-                print(f"Error creating item {index}: {error_msg}")  # Debug: Print specific error
+                logger.info("Bulk sale %s item %s rejected: %s", bulk_sale.id, index, error_msg)
                 errors.append({
                     'index': index,
                     'error': error_msg,
@@ -3118,7 +3315,7 @@ def create_bulk_dispensed_items(request):
         }, status=status.HTTP_201_CREATED)
         
     except Exception as e:
-        print("Unexpected error in create_bulk_dispensed_items:", str(e))  # Debug: Print unexpected errors
+        logger.exception("Unexpected error in create_bulk_dispensed_items")
         return Response({
             'status': 'error',
             'message': str(e)
@@ -3149,13 +3346,6 @@ def create_drug_sale(request):
     }
     """
     try:
-        print("\n=== Incoming Request Data ===")
-        print(f"Method: {request.method}")
-        print(f"Content-Type: {request.content_type}")
-        print(f"Raw data: {request.body}")
-        print(f"Parsed data: {request.data}")
-        print("==========================\n")
-        
         # Create serializer instance with request data and context
         serializer = DrugSaleSerializer(
             data=request.data,
@@ -3164,16 +3354,13 @@ def create_drug_sale(request):
         
         # Validate the data
         is_valid = serializer.is_valid()
-        print("\n=== Validation Results ===")
-        print(f"Is valid: {is_valid}")
         if not is_valid:
-            print(f"Validation errors: {serializer.errors}")
-        print("========================\n")
+            logger.info("Drug sale rejected, invalid fields: %s", sorted(serializer.errors))
         
         # If valid, save and return success response
         if is_valid:
             drug_sale = serializer.save()
-            print(f"Created DrugSale: {drug_sale.id}")
+            logger.info("DrugSale %s created", drug_sale.id)
             
             # Track user action
             track_user_action(
@@ -3198,12 +3385,7 @@ def create_drug_sale(request):
         })
         
     except Exception as e:
-        import traceback
-        print("\n=== Error Details ===")
-        print(f"Error: {str(e)}")
-        print("Traceback:")
-        traceback.print_exc()
-        print("==================\n")
+        logger.exception("Error in create_drug_sale")
         
         return Response({
             'status': 'error',
@@ -3216,6 +3398,8 @@ def create_drug_sale(request):
 
 
 
+@query_budget(8)
+@read_replica
 @api_view(['GET'])
 @authentication_classes([TokenAuthentication])
 @permission_classes([IsAuthenticated])
@@ -3232,13 +3416,31 @@ def list_drug_sales(request):
             description=f"Pharmacy staff {request.user.email} viewed drug sales list"
         )
         
-        drug_sales = DrugSale.objects.all()
-        serializer = DrugSaleListSerializer(drug_sales, many=True)
+        drug_sales = DrugSale.objects.select_related('sales_id', 'sold_by')
+        drug_sales = filter_queryset(request, drug_sales, {
+            'payment_status': 'payment_status',
+            'payment_method': 'payment_method_id',
+            'customer_phone': 'customer_phone',
+            'date_from': 'created_at__date__gte',
+            'date_to': 'created_at__date__lte',
+        })
+        data, meta = paginate(
+            request,
+            drug_sales,
+            DrugSaleListSerializer,
+            ordering_fields={'created_at': 'created_at', 'total_amount': 'total_amount'},
+            default_ordering='-created_at'
+        )
         return Response({
             'status': 'success',
-            'count': len(serializer.data),
-            'drug_sales': serializer.data
+            **meta,
+            'drug_sales': data
         }, status=status.HTTP_200_OK)
+    except InvalidQueryParameter as e:
+        return Response({
+            'status': 'error',
+            'message': e.detail
+        }, status=status.HTTP_400_BAD_REQUEST)
     except Exception as e:
         return Response({
             'status': 'error',
@@ -3266,8 +3468,7 @@ def drug_sale_detail(request, pk):
         }, status=status.HTTP_200_OK)
         
     except Exception as e:
-        import traceback
-        traceback.print_exc()
+        logger.exception("Unhandled exception")
         return Response({
             'status': 'error',
             'message': str(e)
@@ -3325,9 +3526,9 @@ def update_drug_sale_payment(request, pk):
                     amount=float(serializer.validated_data['amount_paid']),
                     description=f'Payment for drug sale ID: {drug_sale.id}'
                 )
-            except Exception as e:
+            except Exception:
                 # Log the error but don't fail the request
-                print(f"Error creating income record: {str(e)}")
+                logger.exception("Error creating income record")
             
             # Track user action
             track_user_action(
@@ -3582,24 +3783,13 @@ def create_admission_charge(request):
     Create a new admission charge
     Any authenticated user can create an admission charge
     """
-    print("\n===== DEBUG: Entering create_admission_charge view =====")
-    print(f"Request method: {request.method}")
-    print(f"Request data: {request.data}")
-    print(f"Request path: {request.path}")
-    print(f"Request full path: {request.get_full_path()}")
-    print(f"Request META: {request.META.get('PATH_INFO')}")
-    print("=" * 50, "\n")
-    
     try:
         # Ensure the admission exists
         admission_id = request.data.get('admission')
-        print(f"DEBUG: Admission ID from request: {admission_id}")
         
         try:
             admission = Admission.objects.get(id=admission_id)
-            print(f"DEBUG: Found admission: {admission}")
         except Admission.DoesNotExist:
-            print(f"DEBUG: Admission with ID {admission_id} not found")
             return Response(
                 {'status': 'error', 'message': 'Admission not found'},
                 status=status.HTTP_404_NOT_FOUND
@@ -3608,15 +3798,13 @@ def create_admission_charge(request):
         # Set the paid_to field to the current user if not provided
         if 'paid_to' not in request.data:
             request.data['paid_to'] = request.user.id
-            print(f"DEBUG: Set paid_to to current user: {request.user.id}")
 
         serializer = AdmissionChargeCreateSerializer(data=request.data)
-        print(f"DEBUG: Serializer data: {request.data}")
 
         if serializer.is_valid():
             # Save the charge
             charge = serializer.save()
-            print(f"DEBUG: Successfully created charge: {charge.id}")
+            logger.info("Admission charge %s created for admission %s", charge.id, admission.id)
             
             # Track user action
             track_user_action(
@@ -3634,16 +3822,14 @@ def create_admission_charge(request):
                 'data': AdmissionChargesSerializer(charge).data
             }, status=status.HTTP_201_CREATED)
 
-        print(f"DEBUG: Serializer errors: {serializer.errors}")
+        logger.info("Admission charge rejected, invalid fields: %s", sorted(serializer.errors))
         return Response({
             'status': 'error',
             'errors': serializer.errors
         })
 
     except Exception as e:
-        print(f"DEBUG: Unexpected error: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Error in create_admission_charge")
         return Response(
             {'status': 'error', 'message': str(e)},
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
@@ -3863,10 +4049,6 @@ def get_test_types(request):
             'test_types': serializer.data
         }
         
-        # Debug: Print the response being sent
-        print(f"Test Types API Response: {response_data}")
-        print(f"Number of test types returned: {len(response_data['test_types'])}")
-        
         return Response(response_data, status=status.HTTP_200_OK)
         
     except Exception as e:
@@ -3894,10 +4076,6 @@ def get_payment_methods(request):
             'payment_methods': serializer.data
         }
         
-        # Debug: Print the response being sent
-        print(f"Payment Methods API Response: {response_data}")
-        print(f"Number of payment methods returned: {len(response_data['payment_methods'])}")
-        
         return Response(response_data, status=status.HTTP_200_OK)
         
     except Exception as e:
@@ -3905,3 +4083,91 @@ def get_payment_methods(request):
             'status': 'error',
             'message': str(e)
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@query_budget(4)
+@api_view(['GET'])
+@authentication_classes([TokenAuthentication])
+@permission_classes([IsAuthenticated])
+def get_notifications(request):
+    """
+    The current user's notifications, newest first, one page at a time
+    - ?limit= page size (NOTIFICATION_PAGE_SIZE by default)
+    - ?cursor= the next_cursor of the previous page
+    - ?unread=true only unread ones
+    """
+    try:
+        limit = get_page_size(request) if request.query_params.get('limit') else None
+        notifications, next_cursor = inbox(
+            request.user.pk,
+            limit=limit,
+            cursor=request.query_params.get('cursor'),
+            unread_only=request.query_params.get('unread', '').lower() in ('true', '1', 'yes')
+        )
+    except InvalidCursor:
+        return Response({
+            'status': 'error',
+            'message': 'Invalid cursor'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    except InvalidQueryParameter as e:
+        return Response({
+            'status': 'error',
+            'message': e.detail
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    serializer = NotificationSerializer(notifications, many=True, context={'request': request})
+    return Response({
+        'status': 'success',
+        'count': len(notifications),
+        'next_cursor': next_cursor,
+        'unread_count': unread_count(request.user.pk),
+        'results': serializer.data
+    }, status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+@authentication_classes([TokenAuthentication])
+@permission_classes([IsAuthenticated])
+def get_unread_notification_count(request):
+    """
+    Unread notification count of the current user (for badges)
+    Read from the maintained counter, so it is a single lookup
+    """
+    return Response({
+        'status': 'success',
+        'unread_count': unread_count(request.user.pk)
+    }, status=status.HTTP_200_OK)
+
+
+@api_view(['POST'])
+@authentication_classes([TokenAuthentication])
+@permission_classes([IsAuthenticated])
+def mark_notifications_read(request):
+    """
+    Mark notifications read for the current user only
+    Body: {"notification_ids": [1, 2, 3]} or {"all": true}
+    """
+    notification_ids = request.data.get('notification_ids')
+    mark_all = request.data.get('all') is True
+
+    if not mark_all:
+        if not isinstance(notification_ids, list) or not notification_ids:
+            return Response({
+                'status': 'error',
+                'message': 'Provide a non-empty notification_ids list or "all": true'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            notification_ids = [int(notification_id) for notification_id in notification_ids]
+        except (TypeError, ValueError):
+            return Response({
+                'status': 'error',
+                'message': 'notification_ids must be integers'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+    marked, unread = mark_read(request.user.pk, None if mark_all else notification_ids)
+
+    return Response({
+        'status': 'success',
+        'marked': marked,
+        'unread_count': unread
+    }, status=status.HTTP_200_OK)
@@ -0,0 +1,198 @@
+"""
+Bulk vital-sign ingestion (night rounds, bedside monitors)
+
+A batch of readings, for any number of patients, is checked and stored in
+a fixed number of queries rather than a few per reading:
+- each reading is checked against FIELDS (types, plausible ranges) without
+  a serializer; the patients are looked up once for the whole batch
+- readings already stored (same patient and recorded_at, e.g. a device
+  resending a batch) are reported as duplicates, not stored again
+- the valid readings are scored (see early_warning.py) and written with
+  one bulk INSERT, in one transaction with one audit Activity per patient
+- the early-warning check, and the patients' summary refresh, run once
+  for the batch
+Invalid readings are reported by their index and do not stop the others.
+"""
+import json
+import logging
+from collections import Counter
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from accountant.models import Activity
+from accounts.models import CustomUser
+
+from .early_warning import score_reading
+from .models import VitalSign
+from .patient_summary import invalidate as invalidate_summaries
+from .tasks import check_vital_signs, refresh_patient_summaries
+
+logger = logging.getLogger(__name__)
+
+# field: (type, minimum, maximum, required)
+FIELDS = {
+    'temperature_c': (Decimal('0.1'), 25, 45, True),
+    'pulse_rate': (int, 20, 300, True),
+    'respiratory_rate': (int, 0, 80, True),
+    'systolic_bp': (int, 40, 300, True),
+    'diastolic_bp': (int, 20, 200, True),
+    'oxygen_saturation': (Decimal('0.1'), 50, 100, True),
+    'weight_kg': (Decimal('0.01'), 0.5, 500, False),
+    'height_cm': (Decimal('0.01'), 20, 280, False),
+}
+
+# Clock skew allowed for device timestamps
+MAX_FUTURE_SECONDS = 300
+
+
+class InvalidBatch(Exception):
+    pass
+
+
+def parse_ndjson(body):
+    """Readings of an NDJSON body, one JSON object per non-empty line"""
+    readings = []
+    for number, line in enumerate(body.decode('utf-8').splitlines(), 1):
+        if not line.strip():
+            continue
+        try:
+            readings.append(json.loads(line))
+        except ValueError:
+            raise InvalidBatch(f"Line {number} is not valid JSON.")
+    return readings
+
+
+def _number(value, kind):
+    if isinstance(value, bool):
+        raise ValueError
+    if kind is int:
+        if isinstance(value, float) and not value.is_integer():
+            raise ValueError
+        return int(value)
+    try:
+        value = Decimal(str(value))
+    except InvalidOperation:
+        raise ValueError
+    if not value.is_finite():
+        raise ValueError
+    return value.quantize(kind)
+
+
+def _check(reading, now):
+    """(field values, errors) of one reading"""
+    if not isinstance(reading, dict):
+        return None, {'reading': 'Must be an object.'}
+    values, errors = {}, {}
+    for field, (kind, minimum, maximum, required) in FIELDS.items():
+        value = reading.get(field)
+        if value in (None, ''):
+            if required:
+                errors[field] = 'This field is required.'
+            continue
+        try:
+            value = _number(value, kind)
+        except (TypeError, ValueError, OverflowError):
+            errors[field] = 'Must be a number.'
+            continue
+        if not minimum <= value <= maximum:
+            errors[field] = f'Must be between {minimum} and {maximum}.'
+            continue
+        values[field] = value
+
+    try:
+        values['patient_id'] = int(reading.get('patient_id'))
+    except (TypeError, ValueError):
+        errors['patient_id'] = 'A patient id is required.'
+
+    recorded_at = reading.get('recorded_at')
+    if recorded_at:
+        try:
+            parsed = parse_datetime(recorded_at) if isinstance(recorded_at, str) else None
+        except ValueError:
+            parsed = None
+        if parsed is None:
+            errors['recorded_at'] = 'Must be an ISO datetime.'
+        else:
+            parsed = timezone.make_aware(parsed) if timezone.is_naive(parsed) else parsed
+            if (parsed - now).total_seconds() > MAX_FUTURE_SECONDS:
+                errors['recorded_at'] = 'Cannot be in the future.'
+            values['recorded_at'] = parsed
+    else:
+        values['recorded_at'] = now
+
+    notes = reading.get('notes')
+    if notes is not None and not isinstance(notes, str):
+        errors['notes'] = 'Must be text.'
+    values['notes'] = notes or ''
+
+    if 'systolic_bp' in values and 'diastolic_bp' in values and values['diastolic_bp'] >= values['systolic_bp']:
+        errors['diastolic_bp'] = 'Must be below the systolic pressure.'
+    return values, errors
+
+
+def ingest(user, readings):
+    """
+    Check and store a batch of readings recorded by user
+    Returns one result per reading, in order: {'index', 'status'
+    ('created', 'duplicate' or 'error'), 'id' / 'errors'}
+    """
+    now = timezone.now()
+    results = [None] * len(readings)
+    checked = []
+    for index, reading in enumerate(readings):
+        values, errors = _check(reading, now)
+        if errors:
+            results[index] = {'index': index, 'status': 'error', 'errors': errors}
+        else:
+            checked.append((index, values))
+
+    patient_ids = set(CustomUser.objects.filter(
+        pk__in={values['patient_id'] for _, values in checked}, role__name='patient'
+    ).values_list('pk', flat=True))
+    stored = set(VitalSign.objects.filter(
+        patient_id__in=patient_ids, recorded_at__in={values['recorded_at'] for _, values in checked}
+    ).values_list('patient_id', 'recorded_at'))
+
+    new = []
+    for index, values in checked:
+        key = (values['patient_id'], values['recorded_at'])
+        if values['patient_id'] not in patient_ids:
+            results[index] = {'index': index, 'status': 'error', 'errors': {'patient_id': 'Patient not found.'}}
+        elif key in stored:
+            results[index] = {'index': index, 'status': 'duplicate'}
+        else:
+            stored.add(key)
+            vital_sign = VitalSign(recorded_by=user, **values)
+            score_reading(vital_sign)
+            new.append((index, vital_sign))
+
+    if new:
+        with transaction.atomic():
+            created = VitalSign.objects.bulk_create([vital_sign for _, vital_sign in new])
+            per_patient = Counter(vital_sign.patient_id for vital_sign in created)
+            Activity.objects.bulk_create([
+                Activity(
+                    action_taken_by=user,
+                    action_taken_on_id=patient_id,
+                    action='create',
+                    model_name='VitalSign',
+                    description=f"{user.email} recorded {count} vital sign readings in bulk",
+                )
+                for patient_id, count in per_patient.items()
+            ])
+            check_vital_signs.delay([vital_sign.pk for vital_sign in created])
+            if invalidate_summaries(per_patient, 'vitals'):
+                refresh_patient_summaries.delay(list(per_patient))
+        for (index, _), vital_sign in zip(new, created):
+            results[index] = {
+                'index': index,
+                'status': 'created',
+                'id': vital_sign.pk,
+                'news2_score': vital_sign.news2_score,
+                'news2_risk': vital_sign.news2_risk,
+            }
+    logger.info("Ingested %s of %s vital sign readings", len(new), len(readings))
+    return results
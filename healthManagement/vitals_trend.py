@@ -0,0 +1,121 @@
+"""
+Vital-sign trends for charting
+
+A patient's vitals over a time range, as columns (one timestamp array and
+one array per measure) rather than one serialized object per reading:
+- the readings are read as plain tuples, oldest first, straight off the
+  (patient, recorded_at) index; nothing else is joined or serialized
+- long ranges are downsampled into fixed-width buckets, each with the
+  min / max / mean of every measure, in one pass over the rows; buckets
+  are aligned to multiples of their width, so the same range always
+  yields the same buckets
+- ranges with at most `points` readings come back unbucketed
+"""
+import math
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from .models import VitalSign
+
+MEASURES = [
+    'temperature_c', 'pulse_rate', 'respiratory_rate', 'systolic_bp', 'diastolic_bp',
+    'oxygen_saturation', 'weight_kg', 'news2_score',
+]
+
+DEFAULT_POINTS = 300
+MAX_POINTS = 2000
+
+# Bucket widths (minutes) a derived width is rounded up to, so buckets
+# start on the minute, hour or day
+BUCKET_MINUTES = [1, 2, 5, 10, 15, 30, 60, 120, 180, 360, 720, 1440]
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def _number(value):
+    return None if value is None else float(value)
+
+
+def _bucket_seconds(rows, points):
+    """The narrowest BUCKET_MINUTES width (or whole days) giving at most about points buckets"""
+    minutes = (rows[-1][0] - rows[0][0]).total_seconds() / 60 / points
+    for width in BUCKET_MINUTES:
+        if width >= minutes:
+            return width * 60
+    return math.ceil(minutes / 1440) * 1440 * 60
+
+
+def _raw(rows):
+    columns = list(zip(*rows))
+    return {
+        'timestamps': [recorded_at.isoformat() for recorded_at in columns[0]],
+        'samples': [1] * len(rows),
+        'measures': {
+            measure: {'values': [_number(value) for value in values]}
+            for measure, values in zip(MEASURES, columns[1:])
+        },
+    }
+
+
+def _downsample(rows, seconds):
+    timestamps, samples = [], []
+    measures = {measure: {'min': [], 'max': [], 'mean': []} for measure in MEASURES}
+
+    def flush(bucket, count, lows, highs, sums, counts):
+        timestamps.append((_EPOCH + timedelta(seconds=bucket * seconds)).isoformat())
+        samples.append(count)
+        for index, measure in enumerate(MEASURES):
+            columns = measures[measure]
+            columns['min'].append(lows[index])
+            columns['max'].append(highs[index])
+            columns['mean'].append(round(sums[index] / counts[index], 2) if counts[index] else None)
+
+    current = None
+    for recorded_at, *values in rows:
+        bucket = int((recorded_at - _EPOCH).total_seconds() // seconds)
+        if bucket != current:
+            if current is not None:
+                flush(current, count, lows, highs, sums, counts)
+            current, count = bucket, 0
+            lows, highs = [None] * len(MEASURES), [None] * len(MEASURES)
+            sums, counts = [0.0] * len(MEASURES), [0] * len(MEASURES)
+        count += 1
+        for index, value in enumerate(values):
+            if value is None:
+                continue
+            value = float(value)
+            if lows[index] is None or value < lows[index]:
+                lows[index] = value
+            if highs[index] is None or value > highs[index]:
+                highs[index] = value
+            sums[index] += value
+            counts[index] += 1
+    if current is not None:
+        flush(current, count, lows, highs, sums, counts)
+    return {'timestamps': timestamps, 'samples': samples, 'measures': measures}
+
+
+def vitals_trend(patient_id, start=None, end=None, points=DEFAULT_POINTS, bucket_seconds=None):
+    """
+    A patient's vitals recorded in [start, end), oldest first, as columns
+    Downsampled to buckets of bucket_seconds, or to about points buckets
+    when there are more readings than that
+    """
+    vitals = VitalSign.objects.filter(patient_id=patient_id)
+    if start is not None:
+        vitals = vitals.filter(recorded_at__gte=start)
+    if end is not None:
+        vitals = vitals.filter(recorded_at__lt=end)
+    rows = list(vitals.order_by('recorded_at').values_list('recorded_at', *MEASURES))
+
+    if not rows:
+        trend = {'timestamps': [], 'samples': [], 'measures': {measure: {'values': []} for measure in MEASURES}}
+    elif bucket_seconds is None and len(rows) <= points:
+        trend = _raw(rows)
+    else:
+        bucket_seconds = bucket_seconds or _bucket_seconds(rows, points)
+        trend = _downsample(rows, bucket_seconds)
+    return {
+        'count': len(rows),
+        'bucket_seconds': bucket_seconds if rows else None,
+        **trend,
+    }
@@ -0,0 +1,8 @@
+# Load the Celery app with Django so TASK_BACKEND=celery can send tasks;
+# without celery installed tasks run on the local executor
+try:
+    from .celery import app as celery_app
+except ImportError:
+    celery_app = None
+
+__all__ = ('celery_app',)
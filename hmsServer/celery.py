@@ -0,0 +1,30 @@
+"""
+Celery application, used when TASK_BACKEND=celery
+
+    celery -A hmsServer worker -l info
+    celery -A hmsServer beat -l info       # periodic tasks (CELERY_BEAT_SCHEDULE)
+
+Celery only carries task envelopes; retries and idempotency are handled by
+hmsServer.tasks.execute, so every backend behaves the same way
+"""
+import os
+
+from celery import Celery
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'hmsServer.settings')
+
+app = Celery('hmsServer')
+app.config_from_object('django.conf:settings', namespace='CELERY')
+
+
+@app.task(name='hmsServer.run_task', ignore_result=True)
+def run_task(envelope):
+    from hmsServer.tasks import execute
+    execute(envelope)
+
+
+@app.task(name='hmsServer.run_periodic', ignore_result=True)
+def run_periodic(name):
+    # Beat sends the task name; each run gets a fresh idempotency key
+    from hmsServer.tasks import enqueue
+    enqueue(name)
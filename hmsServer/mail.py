@@ -0,0 +1,252 @@
+"""
+Outbound email queue
+
+queue_email() stores the message (accountant.OutboundEmail) and enqueues a
+drain task, so a request never waits on the SMTP server. The drain sends
+everything that is due over one connection from EMAIL_BACKEND:
+- one SMTP/TLS handshake per batch instead of per message
+- a failed message is retried EMAIL_RETRY_BACKOFF * 2 ** (attempt - 1)
+  seconds later, up to EMAIL_MAX_ATTEMPTS, then marked failed with the error
+- rows are claimed with a token, so concurrent drains never send one twice;
+  a row left "sending" by a crashed worker is claimed again after
+  EMAIL_SENDING_TIMEOUT seconds
+- queue_email(expires_at=...) is for content that goes stale, such as
+  verification codes: it is neither sent nor retried after that time, but
+  marked failed
+- queue_email(key=...) stores a key only once, however often it is called
+- queue_emails() stores a whole bulk send with a few INSERTs
+
+For tests, EMAIL_BACKEND=django.core.mail.backends.locmem.EmailBackend
+(mail.outbox) or ...filebased.EmailBackend with EMAIL_FILE_PATH.
+"""
+import logging
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Min, Q
+from django.utils import timezone
+
+from hmsServer.tasks import task
+
+logger = logging.getLogger(__name__)
+
+
+def queue_email(to, subject, body, html_body='', from_email=None, key=None, expires_at=None):
+    """
+    Store an email for delivery and wake the queue up; to is an address or
+    a list of them. Returns the OutboundEmail
+    """
+    from accountant.models import OutboundEmail
+
+    recipients = [to] if isinstance(to, str) else list(to)
+    fields = {
+        'to': ','.join(recipients),
+        'subject': subject,
+        'body': body,
+        'html_body': html_body,
+        'from_email': from_email or settings.DEFAULT_FROM_EMAIL or '',
+        'expires_at': expires_at,
+    }
+    if key is None:
+        email = OutboundEmail.objects.create(**fields)
+    else:
+        try:
+            with transaction.atomic():
+                email, created = OutboundEmail.objects.get_or_create(key=key, defaults=fields)
+        except IntegrityError:
+            # Queued concurrently under the same key
+            email, created = OutboundEmail.objects.get(key=key), False
+        if not created:
+            return email
+
+    deliver_queued_emails.delay()
+    return email
+
+
+def queue_emails(emails, batch_size=500):
+    """
+    Bulk version of queue_email; emails are dicts of its arguments.
+    Emails whose key is already queued are skipped. Returns the number queued
+    """
+    from accountant.models import OutboundEmail
+
+    rows = []
+    for email in emails:
+        to = email['to']
+        rows.append(OutboundEmail(
+            key=email.get('key'),
+            to=to if isinstance(to, str) else ','.join(to),
+            subject=email['subject'],
+            body=email['body'],
+            html_body=email.get('html_body', ''),
+            from_email=email.get('from_email') or settings.DEFAULT_FROM_EMAIL or '',
+            expires_at=email.get('expires_at'),
+        ))
+    if not rows:
+        return 0
+
+    keys = [row.key for row in rows if row.key is not None]
+    existing = set()
+    for start in range(0, len(keys), batch_size):
+        existing.update(
+            OutboundEmail.objects.filter(key__in=keys[start:start + batch_size]).values_list('key', flat=True)
+        )
+    rows = [row for row in rows if row.key is None or row.key not in existing]
+    # ignore_conflicts covers keys queued concurrently since the check
+    OutboundEmail.objects.bulk_create(rows, batch_size=batch_size, ignore_conflicts=True)
+
+    if rows:
+        deliver_queued_emails.delay()
+    return len(rows)
+
+
+def _due():
+    from accountant.models import OutboundEmail
+
+    now = timezone.now()
+    stale = now - timedelta(seconds=settings.EMAIL_SENDING_TIMEOUT)
+    return OutboundEmail.objects.filter(
+        Q(status__in=['queued', 'retrying'], next_attempt_at__lte=now)
+        | Q(status='sending', updated_at__lt=stale)
+    ).exclude(expires_at__lte=now)
+
+
+def _drop_expired():
+    """Mark the emails that expired before they could be sent failed; returns how many"""
+    from accountant.models import OutboundEmail
+
+    now = timezone.now()
+    stale = now - timedelta(seconds=settings.EMAIL_SENDING_TIMEOUT)
+    expired = OutboundEmail.objects.filter(
+        Q(status__in=['queued', 'retrying']) | Q(status='sending', updated_at__lt=stale),
+        expires_at__lte=now,
+    ).update(status='failed', last_error='Expired before it could be sent', updated_at=now)
+    if expired:
+        logger.warning("%s emails expired before they could be sent", expired)
+    return expired
+
+
+def _claim(batch_size):
+    """Mark up to batch_size due emails as sending under a fresh token"""
+    from accountant.models import OutboundEmail
+
+    ids = list(_due().order_by('next_attempt_at').values_list('pk', flat=True)[:batch_size])
+    if not ids:
+        return []
+    token = uuid.uuid4().hex
+    # The due condition is checked again, so a row another drain took in between is left to it
+    _due().filter(pk__in=ids).update(status='sending', claim=token, updated_at=timezone.now())
+    return list(OutboundEmail.objects.filter(claim=token, status='sending'))
+
+
+def _message(email, connection):
+    message = EmailMultiAlternatives(
+        subject=email.subject,
+        body=email.body,
+        from_email=email.from_email or None,
+        to=email.to.split(','),
+        connection=connection,
+    )
+    if email.html_body:
+        message.attach_alternative(email.html_body, 'text/html')
+    return message
+
+
+def _record_failure(email, exc):
+    from accountant.models import OutboundEmail
+
+    attempts = email.attempts + 1
+    delay = settings.EMAIL_RETRY_BACKOFF * 2 ** (attempts - 1)
+    retry_at = timezone.now() + timedelta(seconds=delay)
+    if attempts >= settings.EMAIL_MAX_ATTEMPTS:
+        logger.error("Email %s failed after %s attempts: %r", email.pk, attempts, exc)
+        changes = {'status': 'failed'}
+    elif email.expires_at is not None and retry_at >= email.expires_at:
+        logger.error("Email %s failed (attempt %s) and expires before a retry: %r", email.pk, attempts, exc)
+        changes = {'status': 'failed'}
+    else:
+        logger.warning("Email %s failed (attempt %s), retrying in %ss: %r", email.pk, attempts, delay, exc)
+        changes = {'status': 'retrying', 'next_attempt_at': retry_at}
+    OutboundEmail.objects.filter(pk=email.pk).update(
+        attempts=attempts, last_error=repr(exc), updated_at=timezone.now(), **changes
+    )
+
+
+def send_queued_emails(batch_size=None):
+    """
+    Send every email that is due, batch_size (EMAIL_BATCH_SIZE) per
+    connection. Returns {'sent': n, 'failed': n} - failed counts attempts
+    that failed, retried or not
+    """
+    from accountant.models import OutboundEmail
+
+    batch_size = batch_size or settings.EMAIL_BATCH_SIZE
+    result = {'sent': 0, 'failed': 0}
+    _drop_expired()
+
+    while True:
+        batch = _claim(batch_size)
+        if not batch:
+            break
+
+        connection = get_connection(fail_silently=False)
+        try:
+            connection.open()
+        except Exception as exc:
+            # Server unreachable: the whole batch waits for its retry
+            for email in batch:
+                _record_failure(email, exc)
+            result['failed'] += len(batch)
+            break
+
+        try:
+            for email in batch:
+                try:
+                    connection.send_messages([_message(email, connection)])
+                except Exception as exc:
+                    _record_failure(email, exc)
+                    result['failed'] += 1
+                else:
+                    now = timezone.now()
+                    OutboundEmail.objects.filter(pk=email.pk).update(
+                        status='sent', attempts=email.attempts + 1, last_error='',
+                        sent_at=now, updated_at=now,
+                    )
+                    result['sent'] += 1
+        finally:
+            connection.close()
+
+    if result['sent'] or result['failed']:
+        logger.info("Email queue: %(sent)s sent, %(failed)s failed", result)
+    return result
+
+
+def queue_stats(failures=20):
+    """Emails per status, and the latest failed ones with their errors"""
+    from accountant.models import OutboundEmail
+
+    counts = dict.fromkeys((choice for choice, _ in OutboundEmail.STATUS_CHOICES), 0)
+    for row in OutboundEmail.objects.values('status').annotate(n=Count('id')).order_by():
+        counts[row['status']] = row['n']
+    latest_failures = OutboundEmail.objects.filter(status__in=['retrying', 'failed']).order_by('-updated_at').values(
+        'id', 'subject', 'status', 'attempts', 'last_error', 'next_attempt_at', 'updated_at'
+    )[:failures]
+    return {'counts': counts, 'failures': list(latest_failures)}
+
+
+@task()
+def deliver_queued_emails():
+    send_queued_emails()
+
+    # Come back when the earliest retry is due
+    from accountant.models import OutboundEmail
+
+    next_retry = OutboundEmail.objects.filter(status='retrying').aggregate(at=Min('next_attempt_at'))['at']
+    if next_retry is not None:
+        countdown = max((next_retry - timezone.now()).total_seconds(), 0)
+        deliver_queued_emails.delay(
+            idempotency_key=f"email-retry:{next_retry.isoformat()}", countdown=countdown
+        )
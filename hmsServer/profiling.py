@@ -0,0 +1,312 @@
+"""
+Per-request timing and opt-in profiling
+
+- RequestTimingMiddleware splits each request's wall time into DB,
+  serialization (DRF serializers + JSON rendering), signal handlers and
+  channel-layer sends; whatever is left is reported as "app"
+- buckets are exclusive: a query run while a serializer is building its
+  output counts as DB time, not serialization time
+- a rolling window of timings per endpoint feeds the p50/p95/p99 summary
+- requests sent with "X-Profile: 1" are profiled with pyinstrument (or
+  cProfile when it is not installed) when PROFILING_HEADER_ENABLED is on
+"""
+import contextvars
+import cProfile
+import functools
+import io
+import pstats
+import random
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+
+from hmsServer.query_budget import endpoint_name
+
+try:
+    from pyinstrument import Profiler
+except ImportError:
+    Profiler = None
+
+BUCKETS = ('db', 'serialization', 'signals', 'channels')
+
+_current = contextvars.ContextVar('request_timings', default=None)
+
+
+class RequestTimings:
+    """Exclusive time per bucket for one request"""
+
+    def __init__(self):
+        self.totals = dict.fromkeys(BUCKETS, 0.0)
+        self._stack = []
+
+    def enter(self):
+        self._stack.append(0.0)
+
+    def exit(self, bucket, elapsed):
+        child_time = self._stack.pop()
+        self.totals[bucket] += elapsed - child_time
+        if self._stack:
+            self._stack[-1] += elapsed
+
+
+class span:
+    """Attribute the time spent inside the block to a bucket of the current request"""
+
+    def __init__(self, bucket):
+        self.bucket = bucket
+
+    def __enter__(self):
+        self.timings = _current.get()
+        if self.timings is not None:
+            self.timings.enter()
+            self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.timings is not None:
+            self.timings.exit(self.bucket, time.perf_counter() - self.start)
+        return False
+
+
+def _db_wrapper(execute, sql, params, many, context):
+    with span('db'):
+        return execute(sql, params, many, context)
+
+
+@contextmanager
+def _capture_db():
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(_db_wrapper))
+        yield
+
+
+# Hooks into DRF, django.dispatch and the channel layer
+
+_installed = False
+_install_lock = threading.Lock()
+
+
+def _timed_property(prop, bucket):
+    @functools.wraps(prop.fget)
+    def getter(self):
+        with span(bucket):
+            return prop.fget(self)
+    return property(getter)
+
+
+def _timed_method(method, bucket):
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        with span(bucket):
+            return method(*args, **kwargs)
+    return wrapper
+
+
+def _timed_coroutine(method, bucket):
+    @functools.wraps(method)
+    async def wrapper(*args, **kwargs):
+        with span(bucket):
+            return await method(*args, **kwargs)
+    return wrapper
+
+
+def install():
+    """
+    Wrap the hot paths we time. Runs once per process; the wrappers cost a
+    context variable lookup when no request is being timed
+    """
+    global _installed
+    with _install_lock:
+        if _installed:
+            return
+
+        from django.dispatch import Signal
+        from rest_framework import serializers
+        from rest_framework.renderers import JSONRenderer
+
+        serializers.Serializer.data = _timed_property(serializers.Serializer.data, 'serialization')
+        serializers.ListSerializer.data = _timed_property(serializers.ListSerializer.data, 'serialization')
+        JSONRenderer.render = _timed_method(JSONRenderer.render, 'serialization')
+        Signal.send = _timed_method(Signal.send, 'signals')
+        Signal.send_robust = _timed_method(Signal.send_robust, 'signals')
+
+        try:
+            from channels.layers import get_channel_layer
+            layer = get_channel_layer()
+        except Exception:
+            layer = None
+        if layer is not None:
+            layer.group_send = _timed_coroutine(layer.group_send, 'channels')
+            layer.send = _timed_coroutine(layer.send, 'channels')
+
+        _installed = True
+
+
+# Rolling window of recent request timings per endpoint
+
+_windows = {}
+_windows_lock = threading.Lock()
+
+
+def _record(endpoint, total_ms, bucket_ms):
+    size = getattr(settings, 'PROFILING_WINDOW', 500)
+    with _windows_lock:
+        window = _windows.get(endpoint)
+        if window is None:
+            window = _windows[endpoint] = deque(maxlen=size)
+        window.append((total_ms, bucket_ms))
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not values:
+        return 0.0
+    index = max(0, min(len(values) - 1, int(round(pct / 100 * len(values))) - 1))
+    return values[index]
+
+
+def get_timing_summary():
+    """p50/p95/p99 latency and mean time per bucket for every endpoint seen"""
+    with _windows_lock:
+        snapshot = {endpoint: list(window) for endpoint, window in _windows.items()}
+
+    summary = {}
+    for endpoint, samples in snapshot.items():
+        totals = sorted(sample[0] for sample in samples)
+        count = len(samples)
+        summary[endpoint] = {
+            'samples': count,
+            'p50_ms': round(percentile(totals, 50), 2),
+            'p95_ms': round(percentile(totals, 95), 2),
+            'p99_ms': round(percentile(totals, 99), 2),
+            'max_ms': round(totals[-1], 2),
+            'mean_ms': {
+                bucket: round(sum(sample[1][bucket] for sample in samples) / count, 2)
+                for bucket in BUCKETS + ('app',)
+            },
+        }
+    return summary
+
+
+def reset_timing_summary():
+    with _windows_lock:
+        _windows.clear()
+
+
+# Most recent opt-in profiles, newest last
+
+_profiles = deque(maxlen=20)
+_profiles_lock = threading.Lock()
+
+
+def _should_profile(request):
+    if not getattr(settings, 'PROFILING_HEADER_ENABLED', False):
+        return False
+    if request.headers.get('X-Profile', '').lower() not in ('1', 'true', 'cprofile'):
+        return False
+    return random.random() < getattr(settings, 'PROFILING_SAMPLE_RATE', 1.0)
+
+
+def _run_profiled(request, get_response):
+    """Run the request under a profiler and return (response, engine, text report)"""
+    if Profiler is not None and request.headers.get('X-Profile', '').lower() != 'cprofile':
+        profiler = Profiler()
+        profiler.start()
+        try:
+            response = get_response(request)
+        finally:
+            profiler.stop()
+        return response, 'pyinstrument', profiler.output_text(unicode=False, color=False)
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        response = get_response(request)
+    finally:
+        profiler.disable()
+    output = io.StringIO()
+    pstats.Stats(profiler, stream=output).sort_stats('cumulative').print_stats(40)
+    return response, 'cprofile', output.getvalue()
+
+
+def _store_profile(endpoint, engine, total_ms, report):
+    profile_id = uuid.uuid4().hex[:12]
+    with _profiles_lock:
+        _profiles.append({
+            'id': profile_id,
+            'endpoint': endpoint,
+            'engine': engine,
+            'duration_ms': round(total_ms, 2),
+            'created_at': timezone.now().isoformat(),
+            'report': report,
+        })
+    return profile_id
+
+
+def get_profiles():
+    """Most recent captured profiles first, without the report text"""
+    with _profiles_lock:
+        profiles = list(_profiles)
+    return [
+        {key: value for key, value in profile.items() if key != 'report'}
+        for profile in reversed(profiles)
+    ]
+
+
+def get_profile(profile_id):
+    with _profiles_lock:
+        for profile in _profiles:
+            if profile['id'] == profile_id:
+                return dict(profile)
+    return None
+
+
+class RequestTimingMiddleware:
+    """
+    Times every request and records the breakdown per endpoint
+    - DEBUG responses carry a Server-Timing header with the breakdown
+    - profiled responses carry X-Profile-Id, readable from the
+      request-timings admin endpoint
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        install()
+
+    def __call__(self, request):
+        timings = RequestTimings()
+        token = _current.set(timings)
+        profiled = _should_profile(request)
+        start = time.perf_counter()
+        try:
+            with _capture_db():
+                if profiled:
+                    response, engine, report = _run_profiled(request, self.get_response)
+                else:
+                    response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        total_ms = (time.perf_counter() - start) * 1000
+
+        bucket_ms = {bucket: seconds * 1000 for bucket, seconds in timings.totals.items()}
+        bucket_ms['app'] = max(0.0, total_ms - sum(bucket_ms.values()))
+        endpoint = endpoint_name(request)
+        _record(endpoint, total_ms, bucket_ms)
+
+        if profiled:
+            response['X-Profile-Id'] = _store_profile(endpoint, engine, total_ms, report)
+
+        if settings.DEBUG:
+            response['Server-Timing'] = ', '.join(
+                f"{name};dur={duration:.1f}" for name, duration in bucket_ms.items()
+            ) + f", total;dur={total_ms:.1f}"
+
+        return response
+
@@ -0,0 +1,197 @@
+"""
+SQL query budgets and N+1 detection
+
+- QueryRecorder counts, times and fingerprints every statement run while
+  it is installed on the database connections
+- QueryBudgetMiddleware records that per endpoint and compares it with the
+  budget the view declared through @query_budget(n)
+- assert_max_queries() is the same check for tests
+"""
+import logging
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+_IN_LIST = re.compile(r'\(\s*%s(?:\s*,\s*%s)*\s*\)')
+_WHITESPACE = re.compile(r'\s+')
+
+
+class QueryBudgetExceeded(Exception):
+    """Raised when QUERY_BUDGET_RAISE is on and a view runs more queries than declared"""
+
+
+def fingerprint(sql):
+    """Normalize a statement so the same query with different parameters matches"""
+    return _WHITESPACE.sub(' ', _IN_LIST.sub('(...)', sql)).strip()
+
+
+class QueryRecorder:
+    """Counts and times SQL statements executed on every configured connection"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.fingerprints = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+            self.fingerprints[fingerprint(sql)] += 1
+
+    @contextmanager
+    def capture(self):
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(self))
+            yield self
+
+    @property
+    def duplicates(self):
+        """Statements that ran more than once, the usual sign of an N+1 loop"""
+        return {sql: count for sql, count in self.fingerprints.most_common() if count > 1}
+
+    @property
+    def duplicate_count(self):
+        return sum(count - 1 for count in self.duplicates.values())
+
+    def report(self, limit=5):
+        lines = [f"{self.count} queries in {self.duration * 1000:.1f}ms"]
+        for sql, count in list(self.duplicates.items())[:limit]:
+            lines.append(f"  {count}x {sql[:200]}")
+        return '\n'.join(lines)
+
+
+def query_budget(max_queries):
+    """
+    Declare the most SQL queries a view may run per request
+    Apply it above @api_view so the budget sits on the final view function
+    """
+    def decorator(view_func):
+        view_func.query_budget = max_queries
+        return view_func
+    return decorator
+
+
+# Per-endpoint counters kept for the lifetime of the process
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def _record(endpoint, recorder, budget, exceeded):
+    with _stats_lock:
+        stats = _stats.setdefault(endpoint, {
+            'requests': 0,
+            'queries': 0,
+            'max_queries': 0,
+            'duplicate_queries': 0,
+            'db_time_ms': 0.0,
+            'budget': budget,
+            'over_budget': 0,
+        })
+        stats['requests'] += 1
+        stats['queries'] += recorder.count
+        stats['max_queries'] = max(stats['max_queries'], recorder.count)
+        stats['duplicate_queries'] += recorder.duplicate_count
+        stats['db_time_ms'] += recorder.duration * 1000
+        stats['budget'] = budget
+        if exceeded:
+            stats['over_budget'] += 1
+
+
+def get_query_stats():
+    """Snapshot of the per-endpoint counters with averages filled in"""
+    with _stats_lock:
+        snapshot = {endpoint: dict(stats) for endpoint, stats in _stats.items()}
+    for stats in snapshot.values():
+        stats['avg_queries'] = round(stats['queries'] / stats['requests'], 2)
+        stats['avg_db_time_ms'] = round(stats['db_time_ms'] / stats['requests'], 2)
+        stats['db_time_ms'] = round(stats['db_time_ms'], 2)
+    return snapshot
+
+
+def reset_query_stats():
+    with _stats_lock:
+        _stats.clear()
+
+
+# Requests that matched no URL pattern (404 probes) share one entry, so the counters stay bounded
+UNRESOLVED = '<unresolved>'
+
+
+def endpoint_name(request):
+    """METHOD + URL pattern, so /patients/4 and /patients/5 share one entry"""
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return UNRESOLVED
+    return f"{request.method} /{match.route.lstrip('/')}"
+
+
+class QueryBudgetMiddleware:
+    """
+    Records query count, duplicate statements and DB time for every request
+    - over budget: logs a warning, or raises QueryBudgetExceeded when
+      QUERY_BUDGET_RAISE is on (useful in development and CI)
+    - DEBUG responses carry X-Query-Count and X-DB-Time-ms headers
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = QueryRecorder()
+        with recorder.capture():
+            response = self.get_response(request)
+
+        budget = getattr(request, '_query_budget', None)
+        exceeded = budget is not None and recorder.count > budget
+        endpoint = endpoint_name(request)
+        _record(endpoint, recorder, budget, exceeded)
+
+        if settings.DEBUG:
+            response['X-Query-Count'] = str(recorder.count)
+            response['X-DB-Time-ms'] = f"{recorder.duration * 1000:.1f}"
+
+        if exceeded:
+            message = f"{endpoint} exceeded its query budget of {budget}: {recorder.report()}"
+            if getattr(settings, 'QUERY_BUDGET_RAISE', False):
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._query_budget = getattr(
+            view_func, 'query_budget', getattr(settings, 'QUERY_BUDGET_DEFAULT', None)
+        )
+        return None
+
+
+@contextmanager
+def assert_max_queries(max_queries, max_duplicates=None):
+    """
+    Test helper: fail when the block runs more than max_queries statements
+    (or more than max_duplicates repeated ones)
+
+        with assert_max_queries(6):
+            client.get('/api/hms/test-requests')
+    """
+    recorder = QueryRecorder()
+    with recorder.capture():
+        yield recorder
+    if recorder.count > max_queries:
+        raise AssertionError(f"Expected at most {max_queries} queries, got {recorder.report()}")
+    if max_duplicates is not None and recorder.duplicate_count > max_duplicates:
+        raise AssertionError(
+            f"Expected at most {max_duplicates} repeated queries, got {recorder.report()}"
+        )
@@ -0,0 +1,71 @@
+"""
+EXPLAIN-based checks for the hot query shapes
+
+- plan_problems() runs EXPLAIN on a queryset and returns the full table
+  scans (and, on SQLite, the temporary sorts) in its plan
+- assert_indexed() is the test helper; accountant/tests.py runs it over
+  the queries behind the busiest endpoints (hot_queries() of the
+  check_query_plans command, which checks them against a real database)
+"""
+import re
+from contextlib import contextmanager
+
+from django.db import connections, transaction
+
+# SQLite: "SCAN healthManagement_testrequest" (a scan "USING INDEX" or
+# "USING COVERING INDEX" walks an index, which is fine)
+_SQLITE_SCAN = re.compile(r'\bSCAN (\w+)(?! USING (?:COVERING )?INDEX)\s*$')
+_SQLITE_SORT = re.compile(r'USE TEMP B-TREE FOR (?:ORDER BY|RIGHT PART OF ORDER BY)')
+# PostgreSQL: "Seq Scan on healthmanagement_testrequest"
+_POSTGRES_SCAN = re.compile(r'Seq Scan on (\w+)')
+
+
+@contextmanager
+def _prefer_indexes(connection):
+    """
+    On PostgreSQL a seq scan is the cheapest plan for the small tables of a
+    test database; disable it so the plan shows whether an index exists
+    """
+    if connection.vendor != 'postgresql':
+        yield
+        return
+    with transaction.atomic(using=connection.alias):
+        with connection.cursor() as cursor:
+            cursor.execute("SET LOCAL enable_seqscan = off")
+        yield
+
+
+def plan_problems(queryset, allow_scans=(), allow_sort=False):
+    """
+    Full table scans and temporary sorts in the plan of queryset
+    - allow_scans lists tables that may be scanned (small lookup tables)
+    - allow_sort accepts a sort of the matched rows, for queries whose
+      result is bounded anyway (one day of appointments)
+    Returns (plan text, list of problems)
+    """
+    connection = connections[queryset.db]
+    with _prefer_indexes(connection):
+        plan = queryset.explain()
+
+    problems = []
+    for line in plan.splitlines():
+        if connection.vendor == 'sqlite':
+            match = _SQLITE_SCAN.search(line)
+            if not allow_sort and _SQLITE_SORT.search(line):
+                problems.append(f"temporary sort: {line.strip()}")
+        else:
+            match = _POSTGRES_SCAN.search(line)
+        if match and match.group(1) not in allow_scans:
+            problems.append(f"full scan of {match.group(1)}")
+    return plan, problems
+
+
+def assert_indexed(queryset, allow_scans=(), allow_sort=False):
+    """
+    Test helper: fail when the query's plan scans a whole table
+
+        assert_indexed(VitalSign.objects.filter(patient_id=1).order_by('-recorded_at'))
+    """
+    plan, problems = plan_problems(queryset, allow_scans, allow_sort)
+    if problems:
+        raise AssertionError(f"{'; '.join(problems)}\n{plan}")
@@ -0,0 +1,199 @@
+"""
+Background tasks
+
+Work that does not have to finish before the response is sent
+(notification fan-out, emails, WebSocket pushes) is declared with @task
+and enqueued with .delay(). TASK_BACKEND picks where it runs:
+- "local":  a thread pool inside this process (default, no broker needed);
+  work still queued there is lost when the process stops
+- "celery": the Celery workers (celery -A hmsServer worker)
+- "eager":  inline, at enqueue time (tests, scripts)
+
+- tasks are enqueued when the current transaction commits, and take ids
+  rather than model instances
+- a task enqueued with an idempotency key is recorded in
+  accountant.TaskRun; a key that already completed is skipped, so
+  duplicate enqueues and broker redeliveries do no harm. Tasks without one
+  (WebSocket pushes, fired on every save) write nothing to the database
+- a failing run is retried max_retries times, retry_backoff ** attempt
+  seconds apart
+- the correlation ID of the request that enqueued the task is bound while
+  it runs
+"""
+import functools
+import importlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from hmsServer.log import correlation_scope, get_correlation_id
+
+logger = logging.getLogger(__name__)
+
+_registry = {}
+
+
+class Task:
+    def __init__(self, func, name, max_retries, retry_backoff):
+        self.func = func
+        self.name = name
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        functools.update_wrapper(self, func)
+
+    def __call__(self, *args, **kwargs):
+        # Plain call: run now, without queueing or bookkeeping
+        return self.func(*args, **kwargs)
+
+    def delay(self, *args, idempotency_key=None, countdown=0, **kwargs):
+        """Enqueue the task, to start countdown seconds from now; returns its idempotency key (None without one)"""
+        return enqueue(self.name, args, kwargs, idempotency_key, countdown)
+
+
+def task(name=None, max_retries=3, retry_backoff=2):
+    """Register a function as a background task"""
+    def decorator(func):
+        registered = Task(func, name or f"{func.__module__}.{func.__name__}", max_retries, retry_backoff)
+        _registry[registered.name] = registered
+        return registered
+    return decorator
+
+
+def enqueue(name, args=(), kwargs=None, idempotency_key=None, countdown=0):
+    envelope = {
+        'name': name,
+        'args': list(args),
+        'kwargs': kwargs or {},
+        'key': idempotency_key,
+        'correlation_id': get_correlation_id(),
+        'attempt': 1,
+    }
+    # The task must see what the enqueuing transaction wrote
+    transaction.on_commit(lambda: _submit(envelope, countdown))
+    return envelope['key']
+
+
+# Backends
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _local_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'TASK_LOCAL_WORKERS', 4),
+                thread_name_prefix='task',
+            )
+        return _executor
+
+
+def _run_local(envelope):
+    try:
+        execute(envelope)
+    except Exception:
+        logger.exception("Task %s crashed", envelope['name'])
+    finally:
+        # Worker threads keep no connections between tasks
+        connections.close_all()
+
+
+def _submit(envelope, delay=0):
+    backend = getattr(settings, 'TASK_BACKEND', 'local')
+
+    if backend == 'eager':
+        # Retries and countdowns run straight away
+        execute(envelope)
+    elif backend == 'celery':
+        from hmsServer import celery_app
+        if celery_app is None:
+            raise ImproperlyConfigured("TASK_BACKEND=celery but celery is not installed")
+        celery_app.send_task('hmsServer.run_task', args=[envelope], countdown=delay or None)
+    elif backend == 'local':
+        if delay:
+            timer = threading.Timer(delay, _local_executor().submit, args=(_run_local, envelope))
+            timer.daemon = True
+            timer.start()
+        else:
+            _local_executor().submit(_run_local, envelope)
+    else:
+        raise ImproperlyConfigured(f"Unknown TASK_BACKEND '{backend}', expected local, celery or eager")
+
+
+# Execution
+
+def _get_task(name):
+    if name not in _registry:
+        # Workers may not have imported the module that declares it yet
+        importlib.import_module(name.rsplit('.', 1)[0])
+    return _registry[name]
+
+
+def execute(envelope):
+    """
+    Run one attempt of a task envelope; schedules the retry when it fails.
+    With an idempotency key, skips it when the key already completed or
+    another worker holds it
+    Returns the resulting status ("skipped" when not run)
+    """
+    from accountant.models import TaskRun
+
+    task = _get_task(envelope['name'])
+    if envelope['key'] is None:
+        return _attempt(task, envelope, None)
+
+    run, _ = TaskRun.objects.get_or_create(key=envelope['key'], defaults={'name': task.name})
+
+    # Claim the run; a "running" one is only taken over once its lease expired
+    lease_expired = timezone.now() - timedelta(seconds=getattr(settings, 'TASK_LEASE_SECONDS', 300))
+    claimed = TaskRun.objects.filter(pk=run.pk).exclude(status='done').filter(
+        ~Q(status='running') | Q(updated_at__lt=lease_expired)
+    ).update(status='running', attempts=F('attempts') + 1, updated_at=timezone.now())
+    if not claimed:
+        logger.info("Task %s skipped, key %s already done or running", task.name, envelope['key'])
+        return 'skipped'
+    return _attempt(task, envelope, TaskRun.objects.filter(pk=run.pk))
+
+
+def _attempt(task, envelope, run):
+    """Call the task, recording the outcome on run (a TaskRun queryset) when it has one"""
+    def record(status, error=''):
+        if run is not None:
+            run.update(status=status, last_error=error, updated_at=timezone.now())
+
+    with correlation_scope(envelope.get('correlation_id')):
+        try:
+            task.func(*envelope['args'], **envelope['kwargs'])
+        except Exception as exc:
+            attempt = envelope['attempt']
+            if attempt <= task.max_retries:
+                delay = task.retry_backoff ** attempt
+                record('retrying', repr(exc))
+                logger.warning(
+                    "Task %s failed (attempt %s), retrying in %ss", task.name, attempt, delay, exc_info=True
+                )
+                _submit({**envelope, 'attempt': attempt + 1}, delay)
+                return 'retrying'
+            record('failed', repr(exc))
+            logger.exception("Task %s failed after %s attempts", task.name, attempt)
+            return 'failed'
+
+    record('done')
+    return 'done'
+
+
+def prune_task_runs(days=7):
+    """Delete finished runs older than days; returns the number deleted"""
+    from accountant.models import TaskRun
+
+    cutoff = timezone.now() - timedelta(days=days)
+    return TaskRun.objects.filter(status__in=['done', 'failed'], updated_at__lt=cutoff).delete()[0]
@@ -0,0 +1,164 @@
+"""
+Shared filtering and cursor pagination for list endpoints
+
+Every list view goes through the same two helpers so the query
+parameters behave the same way everywhere:
+- field filters:  ?status=paid&patient_id=4&date_from=2025-01-01
+- ordering:       ?ordering=-created_at (only whitelisted fields, which
+                  must be NOT NULL: the cursor compares values, and NULLs
+                  never compare)
+- page size:      ?limit=50 (capped at MAX_PAGE_SIZE)
+- next page:      ?cursor=<next_cursor from the previous response>
+- exact total:    ?include_count=true (adds total_count, costs a COUNT query)
+"""
+import base64
+import binascii
+import json
+
+from django.core.exceptions import FieldDoesNotExist
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import BooleanField, Q
+from rest_framework.exceptions import ValidationError
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+TRUE_VALUES = ('true', '1', 'yes')
+FALSE_VALUES = ('false', '0', 'no')
+
+
+class InvalidQueryParameter(ValidationError):
+    """Raised for a bad filter, ordering, limit or cursor value (HTTP 400)"""
+
+
+def _is_true(value):
+    return str(value).lower() in TRUE_VALUES
+
+
+def _is_boolean_lookup(model, lookup):
+    try:
+        field = model._meta.get_field(lookup.split('__')[0])
+    except FieldDoesNotExist:
+        return False
+    return isinstance(field, BooleanField)
+
+
+def filter_queryset(request, queryset, filter_fields):
+    """
+    Apply whitelisted query parameter filters to a queryset
+    - filter_fields maps a query parameter name to an ORM lookup
+    - lookups ending in __in accept comma separated values
+    - true/false strings are converted to booleans
+    """
+    for param, lookup in (filter_fields or {}).items():
+        value = request.query_params.get(param)
+        if value is None or value == '':
+            continue
+
+        if lookup.endswith('__in'):
+            value = [item for item in value.split(',') if item]
+        elif _is_boolean_lookup(queryset.model, lookup) and value.lower() in TRUE_VALUES + FALSE_VALUES:
+            value = value.lower() in TRUE_VALUES
+
+        try:
+            queryset = queryset.filter(**{lookup: value})
+        except (ValueError, TypeError, DjangoValidationError):
+            raise InvalidQueryParameter({param: f"Invalid value '{request.query_params.get(param)}'"})
+
+    return queryset
+
+
+def _encode_cursor(ordering, value, pk):
+    payload = json.dumps({'o': ordering, 'v': value, 'pk': pk})
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def _decode_cursor(cursor):
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+        return payload['o'], payload['v'], int(payload['pk'])
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        raise InvalidQueryParameter({'cursor': 'Invalid cursor'})
+
+
+def _get_ordering(request, queryset, ordering_fields, default_ordering):
+    """Resolve ?ordering= against the whitelist and return (ordering, model field)"""
+    ordering = request.query_params.get('ordering') or default_ordering
+    name = ordering.lstrip('-')
+
+    if name not in ordering_fields:
+        allowed = ', '.join(sorted(ordering_fields))
+        raise InvalidQueryParameter({'ordering': f"Ordering must be one of: {allowed}"})
+
+    try:
+        field = queryset.model._meta.get_field(ordering_fields[name])
+    except FieldDoesNotExist:
+        raise InvalidQueryParameter({'ordering': f"Cannot order by '{name}'"})
+    if field.null:
+        # Rows with NULL would fall out of every page after the first
+        raise InvalidQueryParameter({'ordering': f"Cannot order by '{name}'"})
+
+    return ordering, field
+
+
+def get_page_size(request):
+    """Read ?limit= and keep it within 1..MAX_PAGE_SIZE"""
+    limit = request.query_params.get('limit')
+    if not limit:
+        return DEFAULT_PAGE_SIZE
+    try:
+        limit = int(limit)
+    except ValueError:
+        raise InvalidQueryParameter({'limit': 'Limit must be a number'})
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+
+def paginate(request, queryset, serializer_class, ordering_fields, default_ordering, context=None):
+    """
+    Order and cursor-paginate a queryset, then serialize the page
+    - keyset pagination on (ordering field, pk) so deep pages stay cheap
+    - fetches limit + 1 rows to know whether there is a next page
+    Returns (data, meta) where meta has count, next_cursor and
+    total_count when ?include_count=true is passed
+    """
+    ordering, field = _get_ordering(request, queryset, ordering_fields, default_ordering)
+    descending = ordering.startswith('-')
+    limit = get_page_size(request)
+
+    total_count = queryset.count() if _is_true(request.query_params.get('include_count')) else None
+
+    cursor = request.query_params.get('cursor')
+    if cursor:
+        cursor_ordering, raw_value, pk = _decode_cursor(cursor)
+        if cursor_ordering != ordering:
+            raise InvalidQueryParameter({'cursor': 'Cursor does not match the requested ordering'})
+        try:
+            value = field.to_python(raw_value)
+        except DjangoValidationError:
+            raise InvalidQueryParameter({'cursor': 'Invalid cursor'})
+
+        if descending:
+            queryset = queryset.filter(Q(**{f'{field.name}__lt': value}) | Q(**{field.name: value, 'pk__lt': pk}))
+        else:
+            queryset = queryset.filter(Q(**{f'{field.name}__gt': value}) | Q(**{field.name: value, 'pk__gt': pk}))
+
+    prefix = '-' if descending else ''
+    rows = list(queryset.order_by(f'{prefix}{field.name}', f'{prefix}pk')[:limit + 1])
+    has_next = len(rows) > limit
+    rows = rows[:limit]
+
+    next_cursor = None
+    if has_next and rows:
+        last = rows[-1]
+        next_cursor = _encode_cursor(ordering, field.value_to_string(last), last.pk)
+
+    data = serializer_class(rows, many=True, context=context or {'request': request}).data
+
+    meta = {
+        'count': len(data),
+        'next_cursor': next_cursor,
+    }
+    if total_count is not None:
+        meta['total_count'] = total_count
+
+    return data, meta